@@ -60,7 +60,7 @@ class BuildResult(object):
     def __init__(self, logs=None, fail_reason=None, image_id=None,
                  annotations=None, labels=None, skip_layer_squash=False):
         """
-        :param logs: iterable of log lines (without newlines)
+        :param logs: iterable of log lines (without newlines), e.g. LogStore
         :param fail_reason: str, description of failure or None if successful
         :param image_id: str, ID of built container image
         :param annotations: dict, data captured during build step which
@@ -0,0 +1,286 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+checkpoints of build, so that a retried build may skip plugins
+
+Only plugins marked as resumable are checkpointed. When resuming, such
+plugin is skipped if the hash of its inputs (its arguments, its code and the
+resources it reads, see Plugin.reads) is the same as in the checkpoint; its
+result, the workspaces it writes and the Dockerfile (if it writes it) are
+restored from the checkpoint instead.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+
+import six
+
+from atomic_reactor.plugin import (RESOURCE_DOCKERFILE, RESOURCE_SOURCE, RESOURCE_BUILDER,
+                                   RESOURCE_FILES, RESOURCE_TAG_CONF, RESOURCE_PUSH_CONF,
+                                   RESOURCE_EXPORTED_IMAGE)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+WORKSPACE_PREFIX = 'workspace:'
+RESULTS_PREFIX = 'results:'
+WORKFLOW_RESOURCES = {
+    RESOURCE_FILES: 'files',
+    RESOURCE_TAG_CONF: 'tag_conf',
+    RESOURCE_PUSH_CONF: 'push_conf',
+    RESOURCE_EXPORTED_IMAGE: 'exported_image_sequence',
+}
+
+
+class UnhashableInput(Exception):
+    """ Plugin input can't be hashed, plugin can't be resumed """
+
+
+def _json_default(value):
+    # objects kept in workflow, e.g. TagConf, are hashed by their attributes
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if hasattr(value, '__dict__'):
+        return {'class': type(value).__name__, 'attributes': vars(value)}
+    raise TypeError('%r is not JSON serializable' % (value, ))
+
+
+def _hash_value(value):
+    try:
+        data = json.dumps(value, sort_keys=True, default=_json_default)
+    except (TypeError, ValueError) as ex:
+        raise UnhashableInput(repr(ex))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _read_dockerfile(workflow):
+    with open(workflow.builder.df_path) as f:
+        return f.read()
+
+
+def _get_plugin_results(workflow, plugin_key):
+    for results in (workflow.prebuild_results, workflow.buildstep_result,
+                    workflow.prepub_results, workflow.postbuild_results,
+                    workflow.exit_results):
+        if plugin_key in results:
+            return results[plugin_key]
+    return None
+
+
+def _get_base_image_id(workflow):
+    # the same base image name may point to another image when build is resumed
+    if not workflow.builder.base_image:
+        return None
+    try:
+        return workflow.base_image_inspect['Id']
+    except KeyError:
+        # base image isn't available locally (yet)
+        return None
+    except Exception as ex:
+        raise UnhashableInput("can't inspect base image: %r" % ex)
+
+
+def _check_keys(value):
+    """
+    :raises: TypeError if any dict in value has non-str key, JSON would turn
+             it into str and it couldn't be restored
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, six.string_types):
+                raise TypeError('key %r is not str' % (key, ))
+            _check_keys(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _check_keys(item)
+
+
+def _get_resource_value(workflow, resource):
+    if resource == RESOURCE_DOCKERFILE:
+        return _read_dockerfile(workflow)
+    if resource == RESOURCE_SOURCE:
+        source = workflow.source
+        return (source.provider, source.uri, source.dockerfile_path,
+                sorted(source.provider_params.items()),
+                getattr(source, 'commit_id', None))
+    if resource == RESOURCE_BUILDER:
+        base_image = workflow.builder.base_image
+        return (base_image.to_str() if base_image else None, _get_base_image_id(workflow),
+                workflow.builder.image_id)
+    if resource in WORKFLOW_RESOURCES:
+        return getattr(workflow, WORKFLOW_RESOURCES[resource])
+    if resource.startswith(WORKSPACE_PREFIX):
+        return workflow.plugin_workspace.get(resource[len(WORKSPACE_PREFIX):])
+    if resource.startswith(RESULTS_PREFIX):
+        return _get_plugin_results(workflow, resource[len(RESULTS_PREFIX):])
+    raise UnhashableInput('unknown resource %s' % resource)
+
+
+def is_resumable(plugin_class):
+    """
+    can plugin be skipped when resuming build?
+
+    Plugin has to be marked as resumable and has to declare what it reads,
+    all it may write is the Dockerfile and workspaces.
+    """
+    if not getattr(plugin_class, 'resumable', False):
+        return False
+    reads = getattr(plugin_class, 'reads', None)
+    writes = getattr(plugin_class, 'writes', None)
+    if reads is None or writes is None:
+        return False
+    return all(resource == RESOURCE_DOCKERFILE or resource.startswith(WORKSPACE_PREFIX)
+               for resource in writes)
+
+
+class Checkpoint(object):
+    """
+    Results of resumable plugins of build, keyed by hash of their inputs
+
+    Checkpoint is stored as JSON, only plugins whose results and workspaces
+    can be serialized into JSON (and restored, i.e. dicts have only str
+    keys) are checkpointed.
+    """
+
+    def __init__(self, path=None, resume_from=None):
+        """
+        :param path: str, save checkpoint into this file
+        :param resume_from: str, checkpoint file of previous build to resume from
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # (phase, plugin key) -> dict
+        self.plugins = {}
+        self.resumed = {}
+        if resume_from:
+            self.resumed = self.load(resume_from)
+
+    @staticmethod
+    def load(path):
+        """
+        :return: dict, plugins of checkpoint in file, empty if it can't be loaded
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError) as ex:
+            logger.warning("can't load checkpoint %s, not resuming: %r", path, ex)
+            return {}
+
+        try:
+            if data['version'] != CHECKPOINT_VERSION:
+                raise ValueError('version %r' % data['version'])
+            plugins = {}
+            for entry in data['plugins']:
+                entry = dict(entry)
+                plugins[(entry.pop('phase'), entry.pop('plugin'))] = entry
+        except (KeyError, TypeError, ValueError) as ex:
+            logger.warning("unknown format of checkpoint %s, not resuming: %r", path, ex)
+            return {}
+        logger.info("resuming from checkpoint %s", path)
+        return plugins
+
+    def save(self):
+        if not self.path:
+            return
+
+        with self._lock:
+            plugins = [dict(entry, phase=phase, plugin=plugin_key)
+                       for (phase, plugin_key), entry in sorted(self.plugins.items())]
+        data = {'version': CHECKPOINT_VERSION, 'plugins': plugins}
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, sort_keys=True)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as ex:
+            logger.warning("can't save checkpoint %s: %r", self.path, ex)
+        else:
+            logger.debug("saved checkpoint %s", self.path)
+
+    @staticmethod
+    def get_input_hash(workflow, plugin_class, plugin_conf):
+        """
+        :return: str, hash of plugin inputs, None if plugin can't be resumed
+        """
+        if not is_resumable(plugin_class):
+            return None
+
+        inputs = hashlib.sha256()
+        try:
+            inputs.update(plugin_class.key.encode('utf-8'))
+            inputs.update(json.dumps(plugin_conf, sort_keys=True, default=repr).encode('utf-8'))
+            with open(inspect.getsourcefile(plugin_class), 'rb') as f:
+                inputs.update(f.read())
+            for resource in sorted(plugin_class.reads):
+                inputs.update(resource.encode('utf-8'))
+                inputs.update(_hash_value(_get_resource_value(workflow, resource)).encode())
+        except (UnhashableInput, IOError, OSError, TypeError) as ex:
+            logger.debug("can't hash inputs of plugin %s: %r", plugin_class.key, ex)
+            return None
+        return inputs.hexdigest()
+
+    def resume_plugin(self, workflow, phase, plugin_class, input_hash, plugin_conf=None):
+        """
+        restore outputs of plugin from checkpoint, if its inputs didn't change
+        and its result can still be used (see Plugin.can_resume)
+
+        :return: tuple (bool, whether plugin was resumed; plugin result)
+        """
+        entry = self.resumed.get((phase, plugin_class.key))
+        if entry is None or entry['input_hash'] != input_hash:
+            return False, None
+        if not plugin_class.can_resume(entry['result'], plugin_conf or {}):
+            logger.info("result of plugin %s in checkpoint can't be used anymore, "
+                        "not resuming it", plugin_class.key)
+            return False, None
+
+        logger.info("resuming plugin %s from checkpoint", plugin_class.key)
+        if entry['dockerfile'] is not None:
+            with open(workflow.builder.df_path, 'w') as f:
+                f.write(entry['dockerfile'])
+        workflow.plugin_workspace.update(entry['workspace'])
+        with self._lock:
+            self.plugins[(phase, plugin_class.key)] = entry
+        return True, entry['result']
+
+    def add_plugin(self, workflow, phase, plugin_class, input_hash, result):
+        """
+        record outputs of finished plugin
+        """
+        writes = plugin_class.writes
+        entry = {
+            'input_hash': input_hash,
+            'result': result,
+            'dockerfile': None,
+            'workspace': {},
+        }
+        try:
+            if RESOURCE_DOCKERFILE in writes:
+                entry['dockerfile'] = _read_dockerfile(workflow)
+            for resource in writes:
+                if resource.startswith(WORKSPACE_PREFIX):
+                    key = resource[len(WORKSPACE_PREFIX):]
+                    if key in workflow.plugin_workspace:
+                        entry['workspace'][key] = workflow.plugin_workspace[key]
+            _check_keys(entry)
+            # copy, so that later changes of workspace don't leak in; also
+            # makes sure it can be saved
+            entry = json.loads(json.dumps(entry))
+        except Exception as ex:
+            logger.debug("can't checkpoint plugin %s: %r", plugin_class.key, ex)
+            return
+
+        with self._lock:
+            self.plugins[(phase, plugin_class.key)] = entry
@@ -0,0 +1,200 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+cache of file checksums
+
+The same artifacts are hashed by several plugins during a build (metadata
+of exported images, koji outputs, log files). ChecksumCache keeps checksums
+of files keyed by their identity: device, inode, size and mtime, so an
+entry is never used for a file which was modified or replaced. Only
+algorithms not computed yet are computed, all of them in one read of the
+file. Checksums may also be kept with the file itself, in an extended
+attribute or in a sidecar file, to survive the process.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+PERSIST_XATTR = 'xattr'
+PERSIST_SIDECAR = 'sidecar'
+XATTR_NAME = 'user.atomic_reactor.checksums'
+SIDECAR_SUFFIX = '.checksums'
+BLOCK_SIZE = 1024 ** 2  # bytes
+
+
+def get_file_key(path):
+    """
+    :return: tuple (device, inode, size, mtime in ns) identifying content of file
+    """
+    stat = os.stat(path)
+    # st_mtime_ns isn't available on Python 2
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 10 ** 9)
+    return (stat.st_dev, stat.st_ino, stat.st_size, mtime_ns)
+
+
+def compute_checksums(path, algorithms):
+    """
+    :param path: str
+    :param algorithms: iterable of str, hashlib algorithms, e.g. md5, sha256
+    :return: dict, e.g. {'md5sum': '...'}
+    """
+    hashers = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    if not hashers:
+        return {}
+    with open(path, 'rb') as f:
+        buf = f.read(BLOCK_SIZE)
+        while buf:
+            for hasher in hashers.values():
+                hasher.update(buf)
+            buf = f.read(BLOCK_SIZE)
+    return {algorithm + 'sum': hasher.hexdigest() for algorithm, hasher in hashers.items()}
+
+
+class ChecksumCache(object):
+    """
+    Checksums of files, valid as long as files don't change
+    """
+
+    def __init__(self, persist=None):
+        """
+        :param persist: str, also keep checksums with files: PERSIST_XATTR in
+                        extended attribute, PERSIST_SIDECAR in file next to
+                        them; None to keep them in memory only
+        """
+        if persist not in (None, PERSIST_XATTR, PERSIST_SIDECAR):
+            raise ValueError("unknown checksum cache persistence {!r}".format(persist))
+        self.persist = persist
+        # file key -> {'md5sum': ..., ...}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, path, key):
+        """
+        :return: dict, checksums stored with file, empty if there are none for key
+        """
+        try:
+            if self.persist == PERSIST_XATTR:
+                data = os.getxattr(path, XATTR_NAME)
+            elif self.persist == PERSIST_SIDECAR:
+                with open(path + SIDECAR_SUFFIX, 'rb') as f:
+                    data = f.read()
+            else:
+                return {}
+            stored = json.loads(data.decode('utf-8'))
+        except (AttributeError, IOError, OSError, ValueError) as ex:
+            if getattr(ex, 'errno', None) not in (errno.ENOENT, errno.ENODATA):
+                logger.debug("failed to load checksums of %s: %r", path, ex)
+            return {}
+
+        if tuple(stored.get('key', ())) != key:
+            # file changed since
+            return {}
+        return stored.get('checksums', {})
+
+    def _store(self, path, key, checksums):
+        if not self.persist:
+            return
+        data = json.dumps({'key': key, 'checksums': checksums}, sort_keys=True).encode('utf-8')
+        try:
+            if self.persist == PERSIST_XATTR:
+                # doesn't change mtime of file
+                os.setxattr(path, XATTR_NAME, data)
+            else:
+                with open(path + SIDECAR_SUFFIX, 'wb') as f:
+                    f.write(data)
+        except (AttributeError, IOError, OSError) as ex:
+            # e.g. extended attributes not supported by filesystem or Python 2
+            logger.debug("failed to store checksums of %s: %r", path, ex)
+
+    def get_checksums(self, path, algorithms):
+        """
+        :param path: str
+        :param algorithms: list of str, hashlib algorithms, e.g. md5, sha256
+        :return: dict, e.g. {'md5sum': '...', 'sha256sum': '...'}
+        """
+        if not algorithms:
+            return {}
+        key = get_file_key(path)
+        with self._lock:
+            known = dict(self._entries.get(key, {}))
+        missing = [algorithm for algorithm in algorithms if algorithm + 'sum' not in known]
+        if missing and self.persist:
+            stored = self._load(path, key)
+            if stored:
+                with self._lock:
+                    entry = self._entries.setdefault(key, {})
+                    entry.update(stored)
+                    known = dict(entry)
+                missing = [algorithm for algorithm in algorithms
+                           if algorithm + 'sum' not in known]
+
+        if missing:
+            self.misses += 1
+            logger.debug("computing %s of %s", ', '.join(missing), path)
+            computed = compute_checksums(path, missing)
+            if get_file_key(path) == key:
+                known = self.add(path, computed, key=key)
+            else:
+                logger.debug("%s changed while it was hashed, not caching checksums", path)
+                known.update(computed)
+        else:
+            self.hits += 1
+            logger.debug("checksums of %s are cached", path)
+
+        return {algorithm + 'sum': known[algorithm + 'sum'] for algorithm in algorithms}
+
+    def add(self, path, checksums, key=None):
+        """
+        remember checksums computed elsewhere, e.g. while file was written
+
+        :param path: str
+        :param checksums: dict, e.g. {'md5sum': '...'}
+        :param key: tuple, key of file, looked up if None
+        :return: dict, all checksums known for file
+        """
+        key = key or get_file_key(path)
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            entry.update(checksums)
+            known = dict(entry)
+        self._store(path, key, known)
+        return known
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_checksum_cache = ChecksumCache()
+
+
+def set_checksum_cache(cache):
+    """
+    :param cache: ChecksumCache used by get_checksums
+    """
+    global _checksum_cache
+    _checksum_cache = cache
+
+
+def get_checksum_cache():
+    """
+    :return: ChecksumCache
+    """
+    return _checksum_cache
@@ -92,7 +92,7 @@ def construct_kwargs(**kwargs):
 
 def cli_inside_build(args):
     build_inside(input_method=args.input, input_args=args.input_arg,
-                 substitutions=args.substitute)
+                 substitutions=args.substitute, resume_from=args.resume_from)
 
 
 class CLI(object):
@@ -191,6 +191,9 @@ class CLI(object):
         self.ib_parser.add_argument("--substitute", action='append',
                                     help="substitute values in build json (key=value, or "
                                          "plugin_type.plugin_name.key=value)")
+        self.ib_parser.add_argument("--resume-from", action='store', metavar='CHECKPOINT',
+                                    help="checkpoint file of previous build, resumable "
+                                    "plugins whose inputs didn't change are skipped")
         self.ib_parser.set_defaults(func=cli_inside_build)
 
     def generate_source_types_subparsers(self):
@@ -0,0 +1,415 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+multi-threaded compression of exported images
+
+gzip and lzma modules compress on a single core. The writers here split
+data into blocks and compress them in a thread pool (zlib and lzma release
+the GIL while compressing), the compressed blocks are written in order:
+
+ParallelGzipWriter works like pigz, blocks are raw deflate streams ended
+by a sync flush, primed with the last 32 KiB of the previous block, and
+stitched into a single gzip member.
+
+ParallelXzWriter compresses every block into a separate xz stream;
+concatenated streams are a valid .xz file (like output of `xz -T`).
+
+zstd compresses using threads of libzstd, if the zstandard module is
+installed.
+
+Throughput of methods and thread counts can be compared by running:
+
+    python -m atomic_reactor.compression image.tar
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import logging
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+import zlib
+from collections import deque
+
+import six
+
+try:
+    # if we import "lzma" first, we get pyliblzma on Py2, but we want backports.lzma
+    #  so first try to import backports.lzma on Py2 and then 'lzma' on Py3
+    from backports import lzma
+except ImportError:
+    import lzma
+
+try:
+    import zstandard
+except ImportError:
+    # optional, zstd method is not available
+    zstandard = None
+
+from atomic_reactor.concurrency import AsyncExecutor
+
+logger = logging.getLogger(__name__)
+
+METHOD_GZIP = 'gzip'
+METHOD_LZMA = 'lzma'
+METHOD_ZSTD = 'zstd'
+
+# method -> (file extension, default level, (min level, max level))
+METHODS = {
+    METHOD_GZIP: ('gz', 6, (1, 9)),
+    METHOD_LZMA: ('xz', 6, (0, 9)),
+    METHOD_ZSTD: ('zst', 3, (1, 22)),
+}
+
+GZIP_WINDOW_SIZE = 32 * 1024  # bytes, dictionary carried over to next block
+# zdict of compressobj isn't available on Python 2
+GZIP_USE_DICTIONARY = six.PY3
+
+
+# more threads rarely speed up compression of an image, while memory needed grows
+MAX_DEFAULT_THREADS = 8
+
+
+def get_default_threads():
+    """
+    :return: int, number of CPUs, at most MAX_DEFAULT_THREADS
+    """
+    try:
+        return min(multiprocessing.cpu_count(), MAX_DEFAULT_THREADS)
+    except NotImplementedError:
+        return 1
+
+
+class ParallelCompressor(object):
+    """
+    Base of writers compressing blocks of data concurrently
+
+    Written data is compressed into fileobj, which isn't closed by close().
+    Subclasses implement _compress_block() and may write a header and
+    a trailer around the blocks.
+    """
+
+    DEFAULT_BLOCK_SIZE = 1024 ** 2  # bytes
+    DEFAULT_MAX_PENDING_BYTES = 256 * 1024 ** 2
+
+    def __init__(self, fileobj, level, threads=None, block_size=None, max_pending_bytes=None):
+        """
+        :param fileobj: file-like object open for writing bytes
+        :param level: int, compression level
+        :param threads: int, number of blocks compressed at once, see get_default_threads
+                        if None
+        :param block_size: int, bytes of uncompressed data in one block
+        :param max_pending_bytes: int, uncompressed bytes of blocks submitted but
+                                  not written yet; at least one block is always
+                                  pending
+        """
+        self.fileobj = fileobj
+        self.level = level
+        self.threads = threads or get_default_threads()
+        self.block_size = block_size or self.DEFAULT_BLOCK_SIZE
+        self.max_pending_bytes = max_pending_bytes or self.DEFAULT_MAX_PENDING_BYTES
+        # uncompressed bytes written
+        self.size = 0
+        self.closed = False
+        self._blocks = 0
+        self._buffer = []
+        self._buffered = 0
+        # (AsyncResult, uncompressed size) of blocks being compressed, in order of blocks
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._executor = AsyncExecutor(max_workers=self.threads)
+
+    def _get_block_context(self, block):
+        """
+        called for blocks in order, before they are compressed
+
+        :return: context of block passed to _compress_block, number of block by default
+        """
+        return self._blocks
+
+    def _compress_block(self, block, context, last):
+        """
+        called concurrently
+
+        :param block: bytes
+        :param context: value returned by _get_block_context for block
+        :param last: bool, whether this is the final block
+        :return: bytes, compressed block
+        """
+        raise NotImplementedError
+
+    def _submit(self, block, last=False):
+        context = self._get_block_context(block)
+        result = self._executor.submit(self._compress_block, block, context, last)
+        self._pending.append((result, len(block)))
+        self._pending_bytes += len(block)
+        self._blocks += 1
+        # keep threads busy, but don't hold more than max_pending_bytes in memory
+        while len(self._pending) > 1 and self._pending_bytes > self.max_pending_bytes:
+            self._write_pending()
+
+    def _write_pending(self):
+        """
+        wait for oldest block to be compressed and write it
+        """
+        result, size = self._pending.popleft()
+        self._pending_bytes -= size
+        self.fileobj.write(result.get())
+
+    def write(self, data):
+        """
+        :param data: bytes
+        :return: int, count of bytes written
+        """
+        if self.closed:
+            raise ValueError("write to closed compressor")
+        if not isinstance(data, six.binary_type):
+            data = bytes(data)
+        self.size += len(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            buffered = b''.join(self._buffer)
+            start = 0
+            while len(buffered) - start >= self.block_size:
+                self._submit(buffered[start:start + self.block_size])
+                start += self.block_size
+            self._buffer = [buffered[start:]]
+            self._buffered = len(buffered) - start
+        return len(data)
+
+    def _write_trailer(self):
+        pass
+
+    def close(self):
+        """
+        compress remaining data and wait for all blocks to be written
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._submit(b''.join(self._buffer), last=True)
+            self._buffer = []
+            while self._pending:
+                self._write_pending()
+            self._write_trailer()
+        finally:
+            self._executor.shutdown()
+
+    def abort(self):
+        """
+        stop compressing, output is incomplete
+        """
+        self.closed = True
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ParallelGzipWriter(ParallelCompressor):
+    """
+    gzip compression of blocks in parallel, in the style of pigz
+
+    Usage:
+
+        with open(path, 'wb') as f, ParallelGzipWriter(f, threads=8) as writer:
+            writer.write(data)
+    """
+
+    def __init__(self, fileobj, level=METHODS[METHOD_GZIP][1], threads=None, block_size=None,
+                 filename='', mtime=None, max_pending_bytes=None):
+        """
+        :param filename: str, original file name stored in gzip header
+        :param mtime: int, modification time stored in gzip header, current time if None
+        """
+        super(ParallelGzipWriter, self).__init__(fileobj, level, threads=threads,
+                                                 block_size=block_size,
+                                                 max_pending_bytes=max_pending_bytes)
+        self._crc = zlib.crc32(b'')
+        self._previous_tail = b''
+        self._write_header(filename, int(time.time()) if mtime is None else mtime)
+
+    def _write_header(self, filename, mtime):
+        # RFC 1952
+        filename = os.path.basename(filename)
+        if filename.endswith('.gz'):
+            filename = filename[:-len('.gz')]
+        filename = filename.encode('latin-1', 'replace')
+        flags = 0x08 if filename else 0  # FNAME
+        xfl = 2 if self.level == 9 else 4 if self.level == 1 else 0
+        self.fileobj.write(b'\x1f\x8b\x08' + struct.pack('<BLBB', flags, mtime, xfl, 255))
+        if filename:
+            self.fileobj.write(filename + b'\0')
+
+    def _get_block_context(self, block):
+        self._crc = zlib.crc32(block, self._crc)
+        # data preceding block is used as dictionary, like in single stream
+        dictionary = self._previous_tail
+        self._previous_tail = block[-GZIP_WINDOW_SIZE:]
+        return dictionary
+
+    def _compress_block(self, block, dictionary, last):
+        if dictionary and GZIP_USE_DICTIONARY:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                          zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY,
+                                          dictionary)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(block)
+        # sync flush ends block on byte boundary without ending deflate stream,
+        # so that next block can be appended
+        return compressed + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def _write_trailer(self):
+        self.fileobj.write(struct.pack('<LL', self._crc & 0xffffffff, self.size & 0xffffffff))
+
+
+class ParallelXzWriter(ParallelCompressor):
+    """
+    xz compression of blocks in parallel, every block is separate xz stream
+    """
+
+    # preset 6 uses 8 MiB dictionary, xz -T uses blocks 3 times as large
+    DEFAULT_BLOCK_SIZE = 24 * 1024 ** 2  # bytes
+
+    def __init__(self, fileobj, level=METHODS[METHOD_LZMA][1], threads=None, block_size=None,
+                 max_pending_bytes=None):
+        super(ParallelXzWriter, self).__init__(fileobj, level, threads=threads,
+                                               block_size=block_size,
+                                               max_pending_bytes=max_pending_bytes)
+
+    def _compress_block(self, block, index, last):
+        if not block and index > 0:
+            # empty stream isn't needed, unless there's no other one
+            return b''
+        return lzma.compress(block, format=lzma.FORMAT_XZ, preset=self.level)
+
+
+class ZstdWriter(object):
+    """
+    zstd compression using threads of libzstd
+    """
+
+    def __init__(self, fileobj, level=METHODS[METHOD_ZSTD][1], threads=None):
+        if zstandard is None:
+            raise RuntimeError('zstd compression requires the zstandard module')
+        self.fileobj = fileobj
+        self.size = 0
+        self.closed = False
+        compressor = zstandard.ZstdCompressor(level=level,
+                                              threads=threads or get_default_threads())
+        self._writer = compressor.stream_writer(fileobj)
+
+    def write(self, data):
+        self.size += len(data)
+        self._writer.write(data)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.flush(zstandard.FLUSH_FRAME)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def get_compressor(fileobj, method, level=None, threads=None, filename=''):
+    """
+    :param fileobj: file-like object open for writing bytes, not closed by compressor
+    :param method: str, one of METHODS
+    :param level: int, compression level, default of method if None
+    :param threads: int, threads used for compression, see get_default_threads if None
+    :param filename: str, name of compressed file, stored in gzip header
+    :return: file-like compressor, close() it to complete output
+    """
+    if method not in METHODS:
+        raise RuntimeError('Unsupported compression format {0}'.format(method))
+    _, default_level, (min_level, max_level) = METHODS[method]
+    if level is None:
+        level = default_level
+    if not min_level <= level <= max_level:
+        raise RuntimeError('{0} compression level must be between {1} and {2}, not {3}'
+                           .format(method, min_level, max_level, level))
+
+    if method == METHOD_GZIP:
+        return ParallelGzipWriter(fileobj, level=level, threads=threads, filename=filename)
+    elif method == METHOD_LZMA:
+        return ParallelXzWriter(fileobj, level=level, threads=threads)
+    return ZstdWriter(fileobj, level=level, threads=threads)
+
+
+def benchmark(path, method, level=None, threads=None, chunk_size=1024 ** 2):
+    """
+    compress file into temporary file
+
+    :return: dict, {'seconds': float, 'size': int, 'compressed_size': int,
+                    'throughput': float (uncompressed MiB/s)}
+    """
+    with tempfile.TemporaryFile() as output, open(path, 'rb') as f:
+        start = time.time()
+        with get_compressor(output, method, level=level, threads=threads) as compressor:
+            data = f.read(chunk_size)
+            while data:
+                compressor.write(data)
+                data = f.read(chunk_size)
+        seconds = time.time() - start
+        compressed_size = output.tell()
+
+    size = os.path.getsize(path)
+    return {
+        'seconds': seconds,
+        'size': size,
+        'compressed_size': compressed_size,
+        'throughput': size / 1024.0 ** 2 / max(seconds, 1e-6),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='compare throughput of compression methods')
+    parser.add_argument('path', help='file to compress, e.g. output of docker save')
+    parser.add_argument('--method', action='append', choices=sorted(METHODS),
+                        help='compression method, may be repeated (default: all available)')
+    parser.add_argument('--level', type=int, help='compression level (default of method)')
+    parser.add_argument('--threads', type=int, action='append',
+                        help='thread count, may be repeated (default: 1 and number of CPUs)')
+    args = parser.parse_args(args)
+
+    methods = args.method or [method for method in sorted(METHODS)
+                              if method != METHOD_ZSTD or zstandard is not None]
+    thread_counts = args.threads or sorted({1, get_default_threads()})
+    print('{:<6} {:>7} {:>9} {:>10} {:>7}'.format('method', 'threads', 'seconds', 'MiB/s',
+                                                  'ratio'))
+    for method in methods:
+        for threads in thread_counts:
+            result = benchmark(args.path, method, level=args.level, threads=threads)
+            ratio = result['compressed_size'] / float(max(result['size'], 1))
+            print('{:<6} {:>7} {:>9.2f} {:>10.1f} {:>7.3f}'.format(
+                method, threads, result['seconds'], result['throughput'], ratio))
+
+
+if __name__ == '__main__':
+    main()
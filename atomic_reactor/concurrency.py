@@ -0,0 +1,108 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+shared executor for fanning out blocking calls
+
+Plugins spend most of their time waiting: for HTTP responses from
+registries, for ODCS composes and koji tasks to finish. AsyncExecutor lets
+them start many such waits at once and collect the results later, instead
+of every plugin creating its own thread pool. One executor is owned by each
+plugins runner and shared by its plugins (see Plugin.executor).
+"""
+
+from __future__ import absolute_import
+
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ASYNC_WORKERS = 8
+
+
+class AsyncExecutor(object):
+    """
+    Thread pool running blocking calls in the background
+
+    Usage:
+
+        results = [executor.submit(session.get, url) for url in urls]
+        responses = [result.get() for result in results]
+    """
+
+    def __init__(self, max_workers=DEFAULT_ASYNC_WORKERS):
+        """
+        :param max_workers: int, number of calls which may run at once
+        """
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pool = None
+        self._shutdown = False
+
+    def _get_pool(self):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("executor was shut down, can't schedule new calls")
+            if self._pool is None:
+                logger.debug("starting executor with %d workers", self.max_workers)
+                self._pool = ThreadPool(self.max_workers)
+            return self._pool
+
+    def submit(self, func, *args, **kwargs):
+        """
+        schedule func(*args, **kwargs) to be called in background
+
+        :return: AsyncResult, its get() returns value returned by func or
+                 raises exception raised by func
+        :raises: RuntimeError if executor was shut down
+        """
+        return self._get_pool().apply_async(func, args, kwargs)
+
+    def map(self, func, iterable):
+        """
+        call func for every item of iterable concurrently, wait for all calls
+
+        :return: list, values returned by func, in order of items
+        :raises: first exception raised by func, once all calls finished
+        """
+        results = [self.submit(func, item) for item in iterable]
+        values = []
+        first_exception = None
+        for result in results:
+            try:
+                values.append(result.get())
+            except Exception as ex:
+                values.append(None)
+                if first_exception is None:
+                    first_exception = ex
+        if first_exception is not None:
+            raise first_exception
+        return values
+
+    def shutdown(self):
+        """
+        wait for scheduled calls and stop worker threads, no calls may be
+        scheduled afterwards
+        """
+        with self._lock:
+            self._shutdown = True
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+_default_executor = AsyncExecutor()
+
+
+def get_default_executor():
+    """
+    :return: AsyncExecutor, process-wide executor used outside plugins runners
+    """
+    return _default_executor
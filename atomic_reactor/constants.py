@@ -13,6 +13,7 @@ DOCKERFILE_FILENAME = 'Dockerfile'
 BUILD_JSON = 'build.json'
 BUILD_JSON_ENV = 'BUILD_JSON'
 RESULTS_JSON = 'results.json'
+TRACE_JSON = 'trace.json'
 
 CONTAINER_SHARE_PATH = '/run/share/'
 CONTAINER_SHARE_SOURCE_SUBDIR = 'source'
@@ -20,6 +21,7 @@ CONTAINER_SECRET_PATH = ''
 CONTAINER_BUILD_JSON_PATH = os.path.join(CONTAINER_SHARE_PATH, BUILD_JSON)
 CONTAINER_RESULTS_JSON_PATH = os.path.join(CONTAINER_SHARE_PATH, RESULTS_JSON)
 CONTAINER_DOCKERFILE_PATH = os.path.join(CONTAINER_SHARE_PATH, DOCKERFILE_FILENAME)
+CONTAINER_TRACE_JSON_PATH = os.path.join(CONTAINER_SHARE_PATH, TRACE_JSON)
 
 CONTAINER_IMAGEBUILDER_BUILD_METHOD = 'imagebuilder'
 CONTAINER_DOCKERPY_BUILD_METHOD = 'docker_api'
@@ -120,6 +122,8 @@ MEDIA_TYPE_DOCKER_V2_SCHEMA2 = "application/vnd.docker.distribution.manifest.v2+
 MEDIA_TYPE_DOCKER_V2_MANIFEST_LIST = "application/vnd.docker.distribution.manifest.list.v2+json"
 MEDIA_TYPE_OCI_V1 = "application/vnd.oci.image.manifest.v1+json"
 MEDIA_TYPE_OCI_V1_INDEX = "application/vnd.oci.image.index.v1+json"
+MEDIA_TYPE_DOCKER_V2_CONFIG = "application/vnd.docker.container.image.v1+json"
+MEDIA_TYPE_DOCKER_V2_LAYER_GZIP = "application/vnd.docker.image.rootfs.diff.tar.gzip"
 
 REPO_CONTAINER_CONFIG = 'container.yaml'
 REPO_CONTENT_SETS_CONFIG = 'content_sets.yml'
@@ -31,13 +31,17 @@ import requests
 import time
 import docker
 import atomic_reactor.util
+from copy import deepcopy
 from docker.errors import APIError
 from functools import wraps
 
 from atomic_reactor.constants import CONTAINER_SHARE_PATH, CONTAINER_SHARE_SOURCE_SUBDIR,\
         BUILD_JSON, DOCKER_SOCKET_PATH, DOCKER_MAX_RETRIES, DOCKER_BACKOFF_FACTOR,\
         DOCKER_CLIENT_STATUS_RETRY
+from atomic_reactor.docker_stream import decode_json_stream
+from atomic_reactor.image_catalog import ImageCatalog, DEFAULT_CATALOG_TTL
 from atomic_reactor.source import get_source_instance_for
+from atomic_reactor.tracing import traced_methods, SPAN_DOCKER
 from atomic_reactor.util import (
     ImageName, clone_git_repo, figure_out_build_file, Dockercfg)
 
@@ -263,14 +267,16 @@ class WrappedDocker(object):
             return orig_attr
 
 
+@traced_methods(SPAN_DOCKER)
 class DockerTasker(LastLogger):
     def __init__(self, base_url=None, retry_times=DOCKER_MAX_RETRIES,
-                 timeout=120, **kwargs):
+                 timeout=120, image_catalog_ttl=DEFAULT_CATALOG_TTL, **kwargs):
         """
         Constructor
 
         :param base_url: str, docker connection URL
         :param timeout: int, timeout for docker client
+        :param image_catalog_ttl: float, seconds after which all images are listed again
         """
         super(DockerTasker, self).__init__(**kwargs)
 
@@ -286,6 +292,9 @@ class DockerTasker(LastLogger):
         client_kwargs['retry'] = self.retry_times
 
         self.d = WrappedDocker(**client_kwargs)
+        self.image_catalog = ImageCatalog(self.d, ttl=image_catalog_ttl)
+        self._info = None
+        self._version = None
 
     def retry_generator(self, function, *args, **kwargs):
         retry_times = int(kwargs.pop('retry_times', self.retry_times))
@@ -339,9 +348,18 @@ class DockerTasker(LastLogger):
         """
         logger.info("building image '%s' from path '%s'", image, path)
         response = self.d.build(path=path, tag=image.to_str(),
-                                nocache=not use_cache, decode=True,
+                                nocache=not use_cache, decode=False,
                                 rm=remove_im, forcerm=True, pull=False)  # returns generator
-        return response
+        self.image_catalog.invalidate(image)
+        return self._invalidate_when_finished(decode_json_stream(response), image)
+
+    def _invalidate_when_finished(self, response, image):
+        try:
+            for item in response:
+                yield item
+        finally:
+            # image got tagged once build finished
+            self.image_catalog.invalidate(image)
 
     def build_image_from_git(self, url, image, git_path=None, git_commit=None,
                              copy_dockerfile_to=None,
@@ -445,7 +463,7 @@ class DockerTasker(LastLogger):
 
     def get_image_info_by_image_id(self, image_id):
         """
-        using `docker images`, provide information about an image
+        using image catalog (filled by `docker images`), provide information about an image
 
         :param image_id: str, hash of image to get info
         :return: str or None
@@ -459,18 +477,14 @@ class DockerTasker(LastLogger):
         #  u'RepoTags': [u'buildroot-fedora:latest'],
         #  u'Size': 0,
         #  u'VirtualSize': 856564160}
-        images = self.d.images()
-        try:
-            image_dict = [i for i in images if i['Id'] == image_id][0]
-        except IndexError:
+        image_dict = self.image_catalog.get_by_id(image_id)
+        if image_dict is None:
             logger.info("image not found")
-            return None
-        else:
-            return image_dict
+        return image_dict
 
     def get_image_info_by_image_name(self, image, exact_tag=True):
         """
-        using `docker images`, provide information about an image
+        using image catalog (filled by `docker images`), provide information about an image
 
         :param image: ImageName, name of image
         :param exact_tag: bool, if false then return info for all images of the
@@ -487,14 +501,15 @@ class DockerTasker(LastLogger):
         #  u'RepoTags': [u'buildroot-fedora:latest'],
         #  u'Size': 0,
         #  u'VirtualSize': 856564160}
-        images = self.d.images(name=image.to_str(tag=False))
         if exact_tag:
             # tag is specified, we are looking for the exact image
-            for found_image in images:
-                if image.to_str(explicit_tag=True) in found_image['RepoTags']:
-                    logger.debug("image '%s' found", image)
-                    return [found_image]
+            found_image = self.image_catalog.get_by_name(image)
+            if found_image is not None:
+                logger.debug("image '%s' found", image)
+                return [found_image]
             images = []  # image not found
+        else:
+            images = self.image_catalog.get_by_repo(image)
 
         logger.debug("%d matching images found", len(images))
         return images
@@ -513,13 +528,14 @@ class DockerTasker(LastLogger):
             command_result = self.retry_generator(self.d.pull,
                                                   image.to_str(tag=False),
                                                   tag=image.tag, insecure_registry=insecure,
-                                                  decode=True, stream=True)
+                                                  decode=False, stream=True)
         except TypeError:
             # because changing api is fun
             command_result = self.retry_generator(self.d.pull,
                                                   image.to_str(tag=False),
-                                                  tag=image.tag, decode=True, stream=True)
+                                                  tag=image.tag, decode=False, stream=True)
 
+        self.image_catalog.invalidate(image)
         self.last_logs = command_result.logs
         return image.to_str()
 
@@ -547,6 +563,7 @@ class DockerTasker(LastLogger):
                 logger.error("failed to tag image")
                 raise RuntimeError("Failed to tag image '%s': target_image = '%s'" %
                                    image.to_str(), target_image)
+            self.image_catalog.add_name(image, target_image)
         else:
             logger.debug('image already tagged correctly, nothing to do')
         return target_image.to_str()  # this will be the proper name, not just repo/img
@@ -592,12 +609,12 @@ class DockerTasker(LastLogger):
             command_result = self.retry_generator(self.d.push,
                                                   image.to_str(tag=False),
                                                   tag=image.tag, insecure_registry=insecure,
-                                                  decode=True, stream=True)
+                                                  decode=False, stream=True)
         except TypeError:
             # because changing api is fun
             command_result = self.retry_generator(self.d.push,
                                                   image.to_str(tag=False),
-                                                  tag=image.tag, decode=True, stream=True)
+                                                  tag=image.tag, decode=False, stream=True)
 
         self.last_logs = command_result.logs
         return command_result.parsed_logs
@@ -625,6 +642,9 @@ class DockerTasker(LastLogger):
         """
         return detailed metadata about provided image (see 'man docker-inspect')
 
+        results are cached until the image, or the name it is inspected by,
+        changes (see ImageCatalog)
+
         :param image_id: str or ImageName, id or name of the image
         :return: dict
         """
@@ -632,7 +652,7 @@ class DockerTasker(LastLogger):
         logger.debug("image_id = '%s'", image_id)
         if isinstance(image_id, ImageName):
             image_id = image_id.to_str()
-        image_metadata = self.d.inspect_image(image_id)
+        image_metadata = self.image_catalog.inspect(image_id)
         return image_metadata
 
     def remove_image(self, image_id, force=False, noprune=False):
@@ -649,6 +669,7 @@ class DockerTasker(LastLogger):
         if isinstance(image_id, ImageName):
             image_id = image_id.to_str()
         self.d.remove_image(image_id, force=force, noprune=noprune)  # returns None
+        self.image_catalog.remove(image_id)
 
     def remove_container(self, container_id, force=False):
         """
@@ -713,21 +734,28 @@ class DockerTasker(LastLogger):
         logger.debug("image exists: %s", response)
         return response
 
-    def get_info(self):
+    def get_info(self, refresh=False):
         """
         get info about used docker environment
 
+        :param refresh: bool, query docker even if info was already obtained
         :return: dict, json output of `docker info`
         """
-        return self.d.info()
+        if self._info is None or refresh:
+            self._info = self.d.info()
+        # callers may modify it, cached info has to stay intact
+        return deepcopy(self._info)
 
-    def get_version(self):
+    def get_version(self, refresh=False):
         """
         get version of used docker environment
 
+        :param refresh: bool, query docker even if version was already obtained
         :return: dict, json output of `docker version`
         """
-        return self.d.version()
+        if self._version is None or refresh:
+            self._version = self.d.version()
+        return deepcopy(self._version)
 
     def get_volumes_for_container(self, container_id, skip_empty_source=True):
         """
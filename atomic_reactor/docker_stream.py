@@ -0,0 +1,378 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+decoding of JSON streams returned by docker build, pull and push
+
+Docker sends concatenated JSON objects, usually one per line, split into
+chunks at arbitrary places. JSONStreamDecoder decodes them incrementally
+from raw bytes, without re-scanning or copying the buffered data for every
+object. get_event() turns decoded items into structured events and
+ProgressLogger logs progress of layers at limited rate; get_instruction_timings()
+makes a report of how long every Dockerfile instruction took out of them.
+
+Decoding speed may be compared with decoder of docker-py by running:
+
+    python -m atomic_reactor.docker_stream [file with raw docker output]
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import codecs
+import json
+import logging
+import re
+import time
+from collections import namedtuple
+
+import six
+from docker.utils.json_stream import json_stream
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROGRESS_INTERVAL = 5  # seconds
+WHITESPACE = re.compile(r'\s*')
+STEP_RE = re.compile(r'^Step (\d+)(?:/(\d+))? : (.*)')
+STEP_IMAGE_RE = re.compile(r'^---> ([0-9a-f]{12,64})$')
+USING_CACHE = '---> Using cache'
+
+EVENT_STEP = 'step'
+EVENT_STEP_CACHED = 'step_cached'
+EVENT_STEP_IMAGE = 'step_image'
+EVENT_LAYER_STARTED = 'layer_started'
+EVENT_LAYER_PROGRESS = 'layer_progress'
+EVENT_LAYER_DONE = 'layer_done'
+EVENT_ERROR = 'error'
+
+LAYER_STARTED_STATUSES = ('Pulling fs layer', 'Preparing')
+LAYER_DONE_STATUSES = ('Pull complete', 'Already exists', 'Pushed', 'Layer already exists',
+                       'Image already exists')
+
+# time: float, when item was decoded
+# layer: str, layer id of layer events
+# step, steps: int, number of Dockerfile instruction and count of them (None if
+#              not known) for step events
+# message: str, instruction of step, status of layer, (short) id of image
+#          resulting from step or error message
+StreamEvent = namedtuple('StreamEvent', ['kind', 'time', 'layer', 'step', 'steps', 'message'])
+
+
+class JSONStreamDecoder(object):
+    """
+    Incremental decoder of concatenated JSON objects
+
+    Usage:
+
+        decoder = JSONStreamDecoder()
+        for chunk in chunks:
+            for item in decoder.feed(chunk):
+                ...
+        for item in decoder.close():
+            ...
+    """
+
+    def __init__(self):
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = u''
+
+    def _decode_objects(self, text):
+        """
+        :return: tuple (list of objects decoded from start of text, index of rest)
+        """
+        items = []
+        index = 0
+        length = len(text)
+        while True:
+            index = WHITESPACE.match(text, index).end()
+            if index == length:
+                break
+            if text[index] != u'{':
+                # docker sends objects only, e.g. timestamp of log line isn't JSON
+                break
+            try:
+                item, index = self._json_decoder.raw_decode(text, index)
+            except ValueError:
+                break
+            items.append(item)
+        return items, index
+
+    def _decode_line(self, line):
+        """
+        :return: list, objects on line if it consists of JSON objects only,
+                 otherwise whole line as str
+        """
+        try:
+            item = self._json_decoder.decode(line)
+        except ValueError:
+            # more objects on single line, or not JSON at all
+            items, index = self._decode_objects(line)
+            if items and index == len(line):
+                return items
+        else:
+            if isinstance(item, dict):
+                return [item]
+        return [line]
+
+    def feed(self, data):
+        """
+        :param data: bytes or str, next chunk of stream
+        :return: list of decoded items; lines which aren't JSON objects are
+                 returned as str
+        """
+        if isinstance(data, six.binary_type):
+            data = self._text_decoder.decode(data)
+        buffer = self._buffer + data if self._buffer else data
+        end = buffer.rfind(u'\n')
+        if end == -1:
+            # docker may not separate objects by new lines at all
+            items, index = self._decode_objects(buffer)
+            self._buffer = buffer[index:]
+            return items
+
+        items = []
+        # JSON sent by docker doesn't contain new lines, all of these are complete
+        for line in buffer[:end].split(u'\n'):
+            line = line.strip()
+            if line:
+                items.extend(self._decode_line(line))
+        self._buffer = buffer[end + 1:]
+        return items
+
+    def close(self):
+        """
+        :return: list, remaining data as str, if there's any
+        """
+        rest = self._buffer + self._text_decoder.decode(b'', final=True)
+        self._buffer = u''
+        rest = rest.strip()
+        return self._decode_line(rest) if rest else []
+
+
+def decode_json_stream(stream):
+    """
+    decode stream of docker output incrementally
+
+    :param stream: iterable of bytes or str chunks; already decoded items
+                   (e.g. dicts) are passed through
+    :return: generator of decoded items
+    """
+    decoder = JSONStreamDecoder()
+    for chunk in stream:
+        if isinstance(chunk, (six.binary_type, six.text_type)):
+            for item in decoder.feed(chunk):
+                yield item
+        else:
+            for item in decoder.close():
+                yield item
+            yield chunk
+    for item in decoder.close():
+        yield item
+
+
+def get_event(item, now=None):
+    """
+    :param item: dict or str, decoded item of docker output
+    :param now: float, time of event, current time if None
+    :return: StreamEvent, None if item isn't interesting
+    """
+    if not isinstance(item, dict):
+        return None
+    now = time.time() if now is None else now
+
+    if item.get('error') or item.get('errorDetail'):
+        message = item.get('error') or item['errorDetail'].get('message')
+        return StreamEvent(EVENT_ERROR, now, None, None, None, message)
+
+    stream = item.get('stream')
+    if stream:
+        match = STEP_RE.match(stream.strip())
+        if match:
+            step, steps, instruction = match.groups()
+            return StreamEvent(EVENT_STEP, now, None, int(step),
+                               int(steps) if steps else None, instruction)
+        if stream.strip() == USING_CACHE:
+            return StreamEvent(EVENT_STEP_CACHED, now, None, None, None, None)
+        match = STEP_IMAGE_RE.match(stream.strip())
+        if match:
+            return StreamEvent(EVENT_STEP_IMAGE, now, None, None, None, match.group(1))
+        return None
+
+    layer = item.get('id')
+    status = item.get('status')
+    if not layer or not status:
+        return None
+    if item.get('progressDetail'):
+        return StreamEvent(EVENT_LAYER_PROGRESS, now, layer, None, None,
+                           item.get('progress') or status)
+    if status in LAYER_STARTED_STATUSES:
+        return StreamEvent(EVENT_LAYER_STARTED, now, layer, None, None, status)
+    if status in LAYER_DONE_STATUSES or status.startswith('Mounted from'):
+        return StreamEvent(EVENT_LAYER_DONE, now, layer, None, None, status)
+    return None
+
+
+class ProgressLogger(object):
+    """
+    Log events, progress of every layer at most once per interval
+    """
+
+    def __init__(self, interval=DEFAULT_PROGRESS_INTERVAL, log=logger):
+        """
+        :param interval: float, seconds between progress records of layer
+        :param log: logging.Logger
+        """
+        self.interval = interval
+        self.log = log
+        # layer -> time of last progress record
+        self._logged = {}
+
+    def handle(self, event):
+        """
+        :param event: StreamEvent
+        """
+        if event.kind == EVENT_LAYER_PROGRESS:
+            last = self._logged.get(event.layer)
+            if last is not None and event.time - last < self.interval:
+                return
+            self._logged[event.layer] = event.time
+            self.log.debug("layer %s: %s", event.layer, event.message)
+        elif event.kind in (EVENT_LAYER_STARTED, EVENT_LAYER_DONE):
+            self._logged.pop(event.layer, None)
+            self.log.debug("layer %s: %s", event.layer, event.message)
+
+
+def get_instruction_timings(events, end_time, history=None):
+    """
+    make report of Dockerfile instructions from events of docker build
+
+    Every step lasts until the next one starts, the last one until end_time.
+
+    :param events: iterable of StreamEvent
+    :param end_time: float, when build finished
+    :param history: list of dicts, `docker history` of built image, to look
+                    up sizes of layers created by instructions
+    :return: list of dicts, one for every step, in order of steps:
+             {'step': int, 'instruction': str, 'duration': float (seconds),
+              'cached': bool, 'image_id': str or None, 'size': int or None}
+    """
+    timings = []
+    started = []
+    for event in events:
+        if event.kind == EVENT_STEP:
+            timings.append({
+                'step': event.step,
+                'instruction': event.message,
+                'duration': None,
+                'cached': False,
+                'image_id': None,
+                'size': None,
+            })
+            started.append(event.time)
+        elif timings and event.kind == EVENT_STEP_CACHED:
+            timings[-1]['cached'] = True
+        elif timings and event.kind == EVENT_STEP_IMAGE:
+            timings[-1]['image_id'] = event.message
+
+    for index, timing in enumerate(timings):
+        finished = started[index + 1] if index + 1 < len(timings) else end_time
+        timing['duration'] = round(max(finished - started[index], 0), 3)
+
+    sizes = {}
+    for layer in history or []:
+        layer_id = layer.get('Id', '')
+        if layer_id.startswith('sha256:'):
+            layer_id = layer_id[len('sha256:'):]
+        sizes[layer_id] = layer.get('Size')
+    for timing in timings:
+        image_id = timing['image_id']
+        if not image_id or timing['instruction'].upper().startswith('FROM '):
+            # history of FROM step belongs to parent image
+            continue
+        for layer_id, size in sizes.items():
+            if layer_id.startswith(image_id):
+                timing['size'] = size
+                break
+
+    return timings
+
+
+def make_pull_stream(layers=20, progress=1000):
+    """
+    :return: bytes, output of docker pull of image with layers, progress
+             records per layer
+    """
+    lines = [{'status': 'Pulling from fedora', 'id': 'latest'}]
+    for layer in range(layers):
+        lines.append({'status': 'Pulling fs layer', 'progressDetail': {}, 'id': 'l%d' % layer})
+    for current in range(progress):
+        for layer in range(layers):
+            bar = '=' * (current * 50 // progress)
+            lines.append({'status': 'Downloading', 'id': 'l%d' % layer,
+                          'progressDetail': {'current': current, 'total': progress},
+                          'progress': '[%s>%s] %d' % (bar, ' ' * 50, current)})
+    for layer in range(layers):
+        lines.append({'status': 'Pull complete', 'progressDetail': {}, 'id': 'l%d' % layer})
+    return u''.join(json.dumps(line) + u'\r\n' for line in lines).encode('utf-8')
+
+
+def split_stream(data, chunk_size):
+    """
+    :param chunk_size: int, bytes of chunk, 0 to split data into lines
+    :return: list of bytes
+    """
+    if not chunk_size:
+        return data.splitlines(True)
+    return [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+
+def benchmark(data, chunk_size):
+    """
+    decode data split into chunks by JSONStreamDecoder and by docker-py
+
+    :return: dict, {'items': int, 'seconds': float, 'docker_py_seconds': float}
+    """
+    chunks = split_stream(data, chunk_size)
+    start = time.time()
+    items = sum(1 for _ in decode_json_stream(chunks))
+    seconds = time.time() - start
+    start = time.time()
+    for _ in json_stream(chunks):
+        pass
+    return {
+        'items': items,
+        'seconds': seconds,
+        'docker_py_seconds': time.time() - start,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='compare speed of decoding docker output')
+    parser.add_argument('path', nargs='?',
+                        help='file with raw output of docker build, pull or push '
+                             '(default: generated output of pull)')
+    parser.add_argument('--chunk-size', type=int, action='append',
+                        help='bytes of chunk, 0 for line per chunk, may be repeated '
+                             '(default: 0, 4096 and 65536)')
+    args = parser.parse_args(args)
+
+    if args.path:
+        with open(args.path, 'rb') as f:
+            data = f.read()
+    else:
+        data = make_pull_stream()
+    print('{:>10} {:>8} {:>9} {:>10}'.format('chunk', 'items', 'seconds', 'docker-py'))
+    for chunk_size in args.chunk_size or [0, 4096, 65536]:
+        result = benchmark(data, chunk_size)
+        print('{:>10} {:>8} {:>9.3f} {:>10.3f}'.format(
+            chunk_size or 'line', result['items'], result['seconds'],
+            result['docker_py_seconds']))
+
+
+if __name__ == '__main__':
+    main()
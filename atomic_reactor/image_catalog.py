@@ -0,0 +1,380 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+index of images available in docker daemon
+
+Listing images on a host with thousands of them is expensive, so the
+catalog lists all images once and answers lookups by id, repo:tag and digest
+from dictionaries. Changes made through DockerTasker update it incrementally
+(tag, remove) or mark the repository stale so that only that repository is
+listed again (pull, build). Changes made by others are noticed from docker
+events; the whole catalog is reloaded once it is older than its TTL anyway.
+
+Results of `docker inspect` are kept as well, keyed by image id, and are
+dropped on the same occasions as names they were looked up by change; names
+are forgotten once they are older than TTL, like the catalog.
+"""
+
+from __future__ import absolute_import
+
+import copy
+import logging
+import threading
+import time
+
+from atomic_reactor.util import ImageName
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_TTL = 30  # seconds
+NONE_NAMES = ('<none>:<none>', '<none>@<none>')
+
+
+def _normalize_id(image_id):
+    if ':' not in image_id:
+        # older versions of the daemon do not include the prefix
+        return 'sha256:{}'.format(image_id)
+    return image_id
+
+
+def _get_repo(name):
+    return ImageName.parse(name).to_str(tag=False)
+
+
+def _to_name(image):
+    """
+    :param image: str or ImageName
+    :return: str, repo:tag or repo@digest
+    """
+    if not isinstance(image, ImageName):
+        image = ImageName.parse(image)
+    return image.to_str(explicit_tag=True)
+
+
+class ImageCatalog(object):
+    """
+    Images of docker daemon indexed by id, name and digest
+
+    Entries are dicts in the format of `docker images` output.
+    """
+
+    def __init__(self, docker_client, ttl=DEFAULT_CATALOG_TTL, watch_events=True):
+        """
+        :param docker_client: docker.APIClient (or WrappedDocker)
+        :param ttl: float, seconds after which whole catalog is listed again
+        :param watch_events: bool, invalidate catalog on docker events
+        """
+        self.d = docker_client
+        self.ttl = ttl
+        self.watch_events = watch_events
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._events_thread = None
+        # image id -> inspect data
+        self._inspected = {}
+        # name (or short id) image was inspected by -> image id
+        self._inspected_names = {}
+        self._inspected_names_since = time.time()
+        # incremented whenever inspect data are forgotten
+        self._inspected_generation = 0
+        self._clear()
+
+    def _clear(self):
+        # image id -> entry
+        self._images = {}
+        # repo:tag, repo@digest and bare digest -> image id
+        self._names = {}
+        # repo -> set of names
+        self._repos = {}
+        # repositories which have to be listed again before lookups
+        self._stale_repos = set()
+        # repositories already listed because of lookup miss
+        self._checked_repos = set()
+
+    def _names_of(self, entry):
+        names = list(entry.get('RepoTags') or []) + list(entry.get('RepoDigests') or [])
+        return [name for name in names if name not in NONE_NAMES]
+
+    def _add(self, entry):
+        image_id = _normalize_id(entry['Id'])
+        self._remove_id(image_id)
+        self._images[image_id] = entry
+        for name in self._names_of(entry):
+            self._index_name(name, image_id)
+            if '@' in name:
+                # digests are unique, look them up without repository too
+                self._names[name.split('@', 1)[1]] = image_id
+
+    def _index_name(self, name, image_id):
+        self._names[name] = image_id
+        self._repos.setdefault(_get_repo(name), set()).add(name)
+
+    def _unindex_name(self, name):
+        self._names.pop(name, None)
+        names = self._repos.get(_get_repo(name))
+        if names is not None:
+            names.discard(name)
+
+    def _remove_id(self, image_id):
+        entry = self._images.pop(image_id, None)
+        if entry is None:
+            return None
+        for name in self._names_of(entry):
+            if self._names.get(name) == image_id:
+                self._unindex_name(name)
+            if '@' in name:
+                self._names.pop(name.split('@', 1)[1], None)
+        return entry
+
+    def _load(self):
+        logger.debug("listing all images")
+        images = self.d.images()
+        self._clear()
+        for entry in images:
+            self._add(entry)
+        self._loaded_at = time.time()
+        self._clear_inspected_names()
+        logger.debug("image catalog holds %d images", len(self._images))
+        self._start_watching_events()
+
+    def _refresh_repo(self, repo):
+        logger.debug("listing images of repository '%s'", repo)
+        images = self.d.images(name=repo)
+        for name in list(self._repos.get(repo, ())):
+            self._unindex_name(name)
+        for entry in images:
+            self._add(entry)
+        self._stale_repos.discard(repo)
+        self._checked_repos.add(repo)
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.time() - self._loaded_at > self.ttl:
+            self._load()
+
+    def _ensure_fresh_repo(self, repo):
+        self._ensure_loaded()
+        if repo in self._stale_repos:
+            self._refresh_repo(repo)
+
+    def get_by_id(self, image_id):
+        """
+        :param image_id: str, id of image, with or without 'sha256:' prefix
+        :return: dict, entry of image, None if it is not available
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self._stale_repos:
+                # any of them may have new images
+                for repo in list(self._stale_repos):
+                    self._refresh_repo(repo)
+            return self._images.get(_normalize_id(image_id))
+
+    def get_by_name(self, image):
+        """
+        :param image: str or ImageName, repo:tag, repo@digest or bare digest
+        :return: dict, entry of image, None if it is not available
+        """
+        if not isinstance(image, ImageName) and image.startswith('sha256:'):
+            name = image
+            repo = None
+        else:
+            name = _to_name(image)
+            repo = _get_repo(name)
+
+        with self._lock:
+            if repo is not None:
+                self._ensure_fresh_repo(repo)
+            else:
+                self._ensure_loaded()
+            image_id = self._names.get(name)
+            if image_id is None and repo is not None and repo not in self._checked_repos:
+                # may have been created behind our back (e.g. by imagebuilder)
+                # before its event arrived
+                self._refresh_repo(repo)
+                image_id = self._names.get(name)
+            if image_id is None:
+                return None
+            return self._images.get(image_id)
+
+    def get_by_repo(self, image):
+        """
+        :param image: str or ImageName, tag is ignored
+        :return: list of dicts, entries of all images of repository
+        """
+        repo = _get_repo(_to_name(image))
+        with self._lock:
+            self._ensure_fresh_repo(repo)
+            ids = set(self._names[name] for name in self._repos.get(repo, ()))
+            return [self._images[image_id] for image_id in ids]
+
+    def inspect(self, image):
+        """
+        `docker inspect` image, unless it was already inspected
+
+        :param image: str or ImageName, id or name of image
+        :return: dict, copy of inspect data
+        """
+        if isinstance(image, ImageName):
+            image = image.to_str()
+        with self._lock:
+            # names may move to other images, noticed from events
+            self._start_watching_events()
+            if time.time() - self._inspected_names_since > self.ttl:
+                self._clear_inspected_names()
+            image_id = self._inspected_names.get(image, _normalize_id(image))
+            data = self._inspected.get(image_id)
+            generation = self._inspected_generation
+        if data is None:
+            data = self.d.inspect_image(image)
+            image_id = _normalize_id(data['Id'])
+            with self._lock:
+                # image may have changed while it was being inspected
+                if generation == self._inspected_generation:
+                    self._inspected[image_id] = data
+                    if _normalize_id(image) != image_id:
+                        self._inspected_names[image] = image_id
+        else:
+            logger.debug("using cached inspect data of image '%s'", image)
+        return copy.deepcopy(data)
+
+    def _clear_inspected_names(self):
+        self._inspected_names.clear()
+        self._inspected_names_since = time.time()
+
+    def _forget_inspected(self, image=None, repo=None):
+        self._inspected_generation += 1
+        if image is None and repo is None:
+            self._inspected.clear()
+            self._clear_inspected_names()
+            return
+        if image is not None:
+            image = str(image)
+            image_id = self._inspected_names.pop(image, _normalize_id(image))
+            # RepoTags of image changed
+            self._inspected.pop(image_id, None)
+            repo = repo or _get_repo(_to_name(image))
+        for name in list(self._inspected_names):
+            if _get_repo(_to_name(name)) == repo:
+                del self._inspected_names[name]
+
+    def add_name(self, image, target_image):
+        """
+        record that image was tagged
+
+        :param image: str or ImageName, id or name of tagged image
+        :param target_image: str or ImageName, new name of image
+        """
+        with self._lock:
+            self._forget_inspected(image)
+            self._forget_inspected(repo=_get_repo(_to_name(target_image)))
+            if self._loaded_at is None:
+                return
+            entry = self._images.get(_normalize_id(str(image)))
+            if entry is None:
+                image_id = self._names.get(_to_name(image))
+                entry = self._images.get(image_id) if image_id else None
+            target_name = _to_name(target_image)
+            if entry is None:
+                self.invalidate(target_name)
+                return
+
+            old_id = self._names.get(target_name)
+            if old_id is not None and old_id != _normalize_id(entry['Id']):
+                # name moved from another image
+                old_entry = self._remove_id(old_id)
+                old_entry = dict(old_entry, RepoTags=[name for name in old_entry['RepoTags']
+                                                      if name != target_name])
+                self._add(old_entry)
+            repo_tags = list(entry.get('RepoTags') or [])
+            if target_name not in repo_tags:
+                self._add(dict(entry, RepoTags=repo_tags + [target_name]))
+
+    def remove(self, image):
+        """
+        record that image was removed
+
+        :param image: str or ImageName, id or name of removed image
+        """
+        with self._lock:
+            self._forget_inspected(image)
+            if self._loaded_at is None:
+                return
+            if self._remove_id(_normalize_id(str(image))) is not None:
+                return
+
+            name = _to_name(image)
+            image_id = self._names.get(name)
+            if image_id is None:
+                return
+            entry = self._remove_id(image_id)
+            repo_tags = [tag for tag in entry.get('RepoTags') or [] if tag != name]
+            repo_digests = [digest for digest in entry.get('RepoDigests') or []
+                            if digest != name]
+            if repo_tags:
+                # image is only untagged while it has other names
+                self._add(dict(entry, RepoTags=repo_tags, RepoDigests=repo_digests))
+
+    def invalidate(self, image=None):
+        """
+        mark repository of image stale, or whole catalog if image is None
+
+        :param image: str or ImageName, name of image
+        """
+        with self._lock:
+            if image is None:
+                self._forget_inspected()
+                self._loaded_at = None
+                self._clear()
+            else:
+                repo = _get_repo(_to_name(image))
+                self._forget_inspected(repo=repo)
+                self._stale_repos.add(repo)
+
+    def handle_event(self, event):
+        """
+        update catalog according to docker event
+
+        :param event: dict, decoded event
+        """
+        if event.get('Type', 'image') != 'image':
+            return
+        action = event.get('Action') or event.get('status')
+        actor = event.get('Actor') or {}
+        actor_id = actor.get('ID') or event.get('id')
+        name = (actor.get('Attributes') or {}).get('name')
+
+        with self._lock:
+            # even when images weren't listed, inspect data may be kept
+            if action == 'tag':
+                if name and self._names.get(_to_name(name)) != _normalize_id(actor_id or ''):
+                    self.invalidate(name)
+            elif action == 'pull':
+                self.invalidate(name or actor_id)
+            elif action in ('untag', 'delete'):
+                if actor_id and (_normalize_id(actor_id) in self._images or
+                                 _normalize_id(actor_id) in self._inspected):
+                    self.invalidate()
+            elif action in ('import', 'load'):
+                self.invalidate()
+
+    def _watch_events(self):
+        try:
+            for event in self.d.events(decode=True, filters={'type': 'image'}):
+                self.handle_event(event)
+        except Exception as ex:
+            # e.g. read timeout when nothing happens for long time; TTL still applies
+            logger.debug("stopped watching docker events: %r", ex)
+
+    def _start_watching_events(self):
+        if not self.watch_events:
+            return
+        if self._events_thread is not None and self._events_thread.is_alive():
+            return
+        self._events_thread = threading.Thread(target=self._watch_events)
+        self._events_thread.daemon = True
+        self._events_thread.start()
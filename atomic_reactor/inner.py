@@ -14,7 +14,6 @@ import logging
 import tempfile
 import signal
 import docker
-import threading
 import os
 import time
 
@@ -32,9 +31,15 @@ from atomic_reactor.plugin import (
 )
 from atomic_reactor.source import get_source_instance_for
 from atomic_reactor.constants import INSPECT_ROOTFS, INSPECT_ROOTFS_LAYERS
-from atomic_reactor.constants import CONTAINER_DEFAULT_BUILD_METHOD
-from atomic_reactor.util import ImageName
+from atomic_reactor.constants import CONTAINER_DEFAULT_BUILD_METHOD, CONTAINER_TRACE_JSON_PATH
+from atomic_reactor.util import ImageName, clear_registry_sessions
 from atomic_reactor.build import BuildResult
+from atomic_reactor.checksum_cache import ChecksumCache, set_checksum_cache
+from atomic_reactor.registry_cache import (RegistryCache, set_registry_cache,
+                                           DEFAULT_REGISTRY_CACHE_SIZE)
+from atomic_reactor.tracing import tracer
+from atomic_reactor.checkpoint import Checkpoint
+from atomic_reactor.resource_monitor import ResourceMonitor
 from atomic_reactor import get_logging_encoding
 
 
@@ -256,62 +261,6 @@ class PushConf(object):
         return self.docker_registries + self.pulp_registries
 
 
-class FSWatcher(threading.Thread):
-    """
-    Poll the filesystem every second in the background and keep a record of highest usage.
-    """
-
-    def __init__(self, *args, **kwargs):
-        super(FSWatcher, self).__init__(*args, **kwargs)
-        self.daemon = True  # exits whenever the process exits
-        self._lock = threading.Lock()
-        self._done = False
-        self._data = {}
-
-    def run(self):
-        """ Overrides parent method to implement thread's functionality. """
-        while True:  # make sure to run at least once before exiting
-            with self._lock:
-                self._update(self._data)
-            if self._done:
-                break
-            time.sleep(1)
-
-    def get_usage_data(self):
-        """ Safely retrieve the most up to date results. """
-        with self._lock:
-            data_copy = self._data.copy()
-        return data_copy
-
-    def finish(self):
-        """ Signal background thread to exit next time it wakes up. """
-        with self._lock:  # just to be tidy; lock not really needed to set a boolean
-            self._done = True
-
-    @staticmethod
-    def _update(data):
-        try:
-            st = os.statvfs("/")
-        except Exception as e:
-            return e  # just for tests; we don't really need return value
-
-        mb = 1000 ** 2  # sadly storage is generally expressed in decimal units
-        new_data = dict(
-            mb_free=st.f_bfree * st.f_frsize / mb,
-            mb_total=st.f_blocks * st.f_frsize / mb,
-            mb_used=(st.f_blocks - st.f_bfree) * st.f_frsize / mb,
-            inodes_free=st.f_ffree,
-            inodes_total=st.f_files,
-            inodes_used=st.f_files - st.f_ffree,
-        )
-        for key in ["mb_total", "mb_used", "inodes_total", "inodes_used"]:
-            data[key] = max(new_data[key], data.get(key, 0))
-        for key in ["mb_free", "inodes_free"]:
-            data[key] = min(new_data[key], data.get(key, float("inf")))
-
-        return new_data
-
-
 class DockerBuildWorkflow(object):
     """
     This class defines a workflow for building images:
@@ -327,7 +276,12 @@ class DockerBuildWorkflow(object):
     def __init__(self, source, image, prebuild_plugins=None, prepublish_plugins=None,
                  postbuild_plugins=None, exit_plugins=None, plugin_files=None,
                  openshift_build_selflink=None, client_version=None,
-                 buildstep_plugins=None, **kwargs):
+                 buildstep_plugins=None, max_plugin_workers=None, profile_plugins=False,
+                 profile_plugins_pstats=False, trace=False, trace_file=None,
+                 checkpoint_file=None, resume_from=None, plugin_timeout=None,
+                 build_timeout=None, registry_cache_dir=None,
+                 registry_cache_size=DEFAULT_REGISTRY_CACHE_SIZE,
+                 checksum_cache_persist=None, **kwargs):
         """
         :param source: dict, where/how to get source code to put in image
         :param image: str, tag for built image ([registry/]image_name[:tag])
@@ -339,6 +293,30 @@ class DockerBuildWorkflow(object):
             on openshift) without the actual hostname/IP address
         :param client_version: str, osbs-client version used to render build json
         :param buildstep_plugins: dict, arguments for build-step plugins
+        :param max_plugin_workers: int, maximum number of plugins of one phase which
+            may run concurrently, only plugins declaring resources they use are run
+            concurrently (see Plugin.reads)
+        :param profile_plugins: bool, measure CPU time, memory, I/O and number of HTTP
+            and docker API calls of every plugin, see atomic_reactor.profiling
+        :param profile_plugins_pstats: bool, also write cProfile statistics of every
+            plugin into source workdir (requires profile_plugins)
+        :param trace: bool, record spans of plugins, docker, registry, koji and pulp calls
+            and write them as Chrome trace event JSON at the end of build
+        :param trace_file: str, path of trace file, defaults to CONTAINER_TRACE_JSON_PATH
+        :param checkpoint_file: str, save checkpoint with results of resumable plugins
+            into this file after every phase
+        :param resume_from: str, checkpoint file of previous build: resumable plugins
+            whose inputs didn't change are not run again
+        :param plugin_timeout: int, seconds after which a plugin is given up on, may be
+            overridden by 'timeout' key of plugin request
+        :param build_timeout: int, seconds after which remaining plugins are given up on
+            and the build fails, exit plugins are still run
+        :param registry_cache_dir: str, keep manifests and config blobs fetched from
+            registries by digest in this directory, may be shared by builds on the host
+        :param registry_cache_size: int, bytes registry_cache_dir may take
+        :param checksum_cache_persist: str, 'xattr' or 'sidecar': keep checksums of
+            artifacts also in their extended attributes or in files next to them,
+            checksums are cached in memory only if None
         """
         self.source = get_source_instance_for(source, tmpdir=tempfile.mkdtemp())
         self.image = image
@@ -358,18 +336,40 @@ class DockerBuildWorkflow(object):
         self.plugins_timestamps = {}
         self.plugins_durations = {}
         self.plugins_errors = {}
+        self.profile_plugins = profile_plugins
+        self.profile_plugins_pstats = profile_plugins_pstats
+        # plugin key -> summary from PluginProfiler
+        self.plugins_profiles = {}
+        self.trace = trace
+        self.trace_file = trace_file or CONTAINER_TRACE_JSON_PATH
+        self.checkpoint = None
+        if checkpoint_file or resume_from:
+            self.checkpoint = Checkpoint(path=checkpoint_file, resume_from=resume_from)
         self.autorebuild_canceled = False
         self.build_canceled = False
         self.plugin_failed = False
         self.plugin_files = plugin_files
-        self.fs_watcher = FSWatcher()
+        self.max_plugin_workers = max_plugin_workers
+        self.plugin_timeout = plugin_timeout
+        self.build_timeout = build_timeout
+        self.registry_cache_dir = registry_cache_dir
+        self.registry_cache_size = registry_cache_size
+        self.checksum_cache_persist = checksum_cache_persist
+        # time (time.time()) by which plugins up to post-build have to finish
+        self.deadline = None
+        self.resource_monitor = ResourceMonitor()
 
         self.kwargs = kwargs
 
         self.builder = None
         self.built_image_inspect = None
         self.layer_sizes = []
+        # Dockerfile instructions with their duration, cache usage and size
+        # of layer, see docker_stream.get_instruction_timings
+        self.instruction_timings = []
         self._base_image_inspect = None
+        # name of base image _base_image_inspect belongs to
+        self._base_image_inspected_as = None
         self.default_image_build_method = CONTAINER_DEFAULT_BUILD_METHOD
 
         self.pulled_base_images = set()
@@ -410,10 +410,14 @@ class DockerBuildWorkflow(object):
     # inspect base image lazily just before it's needed - pre plugins may change the base image
     @property
     def base_image_inspect(self):
+        if (self._base_image_inspected_as is not None and
+                self._base_image_inspected_as != str(self.builder.base_image)):
+            self._base_image_inspect = None
         if self._base_image_inspect is None:
             try:
                 self._base_image_inspect = self.builder.tasker.inspect_image(
                     self.builder.base_image)
+                self._base_image_inspected_as = str(self.builder.base_image)
             except docker.errors.NotFound:
                 # If the base image cannot be found throw KeyError - as this property should behave
                 # like a dict
@@ -424,21 +428,62 @@ class DockerBuildWorkflow(object):
         self.build_canceled = True
         raise BuildCanceledException("Build was canceled")
 
+    def save_checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+
+    def export_trace(self):
+        tracer.disable()
+        try:
+            tracer.export(self.trace_file)
+        except (IOError, OSError) as ex:
+            logger.warning("failed to write trace into %s: %r", self.trace_file, ex)
+        else:
+            logger.info("trace of build written into %s", self.trace_file)
+
+    def start_resource_monitor(self):
+        self.resource_monitor.add_path('workdir', self.source.workdir)
+        try:
+            docker_root = self.builder.tasker.get_info().get('DockerRootDir')
+        except Exception as ex:
+            logger.debug("can't find out docker storage path: %r", ex)
+        else:
+            # docker storage is usually not available inside build container
+            if docker_root and os.path.isdir(docker_root):
+                self.resource_monitor.add_path('docker', docker_root)
+        self.resource_monitor.start()
+
     def build_docker_image(self):
         """
         build docker image
 
         :return: BuildResult
         """
+        if self.trace:
+            tracer.clear()
+            tracer.enable()
+
+        if self.build_timeout:
+            self.deadline = time.time() + self.build_timeout
+
+        if self.registry_cache_dir:
+            set_registry_cache(RegistryCache(self.registry_cache_dir,
+                                             max_size=self.registry_cache_size))
+        # artifacts of this build are hashed at most once
+        set_checksum_cache(ChecksumCache(persist=self.checksum_cache_persist))
+
         self.builder = InsideBuilder(self.source, self.image)
         try:
-            self.fs_watcher.start()
+            self.start_resource_monitor()
             signal.signal(signal.SIGTERM, self.throw_canceled_build_exception)
             # time to run pre-build plugins, so they can access cloned repo
             logger.info("running pre-build plugins")
             prebuild_runner = PreBuildPluginsRunner(self.builder.tasker, self,
                                                     self.prebuild_plugins_conf,
-                                                    plugin_files=self.plugin_files)
+                                                    plugin_files=self.plugin_files,
+                                                    max_workers=self.max_plugin_workers,
+                                                    plugin_timeout=self.plugin_timeout,
+                                                    deadline=self.deadline)
             try:
                 prebuild_runner.run()
             except PluginFailedException as ex:
@@ -448,11 +493,14 @@ class DockerBuildWorkflow(object):
                 logger.info(str(ex))
                 self.autorebuild_canceled = True
                 raise
+            self.save_checkpoint()
 
             logger.info("running buildstep plugins")
             buildstep_runner = BuildStepPluginsRunner(self.builder.tasker, self,
                                                       self.buildstep_plugins_conf,
-                                                      plugin_files=self.plugin_files)
+                                                      plugin_files=self.plugin_files,
+                                                      plugin_timeout=self.plugin_timeout,
+                                                      deadline=self.deadline)
             try:
                 self.build_result = buildstep_runner.run()
 
@@ -470,12 +518,16 @@ class DockerBuildWorkflow(object):
             # run prepublish plugins
             prepublish_runner = PrePublishPluginsRunner(self.builder.tasker, self,
                                                         self.prepublish_plugins_conf,
-                                                        plugin_files=self.plugin_files)
+                                                        plugin_files=self.plugin_files,
+                                                        max_workers=self.max_plugin_workers,
+                                                        plugin_timeout=self.plugin_timeout,
+                                                        deadline=self.deadline)
             try:
                 prepublish_runner.run()
             except PluginFailedException as ex:
                 logger.error("one or more prepublish plugins failed: %s", ex)
                 raise
+            self.save_checkpoint()
 
             if self.build_result.is_image_available():
                 self.built_image_inspect = self.builder.inspect_built_image()
@@ -490,12 +542,16 @@ class DockerBuildWorkflow(object):
 
             postbuild_runner = PostBuildPluginsRunner(self.builder.tasker, self,
                                                       self.postbuild_plugins_conf,
-                                                      plugin_files=self.plugin_files)
+                                                      plugin_files=self.plugin_files,
+                                                      max_workers=self.max_plugin_workers,
+                                                      plugin_timeout=self.plugin_timeout,
+                                                      deadline=self.deadline)
             try:
                 postbuild_runner.run()
             except PluginFailedException as ex:
                 logger.error("one or more postbuild plugins failed: %s", ex)
                 raise
+            self.save_checkpoint()
 
             return self.build_result
         except Exception as ex:
@@ -506,7 +562,9 @@ class DockerBuildWorkflow(object):
             signal.signal(signal.SIGTERM, lambda *args: None)
             exit_runner = ExitPluginsRunner(self.builder.tasker, self,
                                             self.exit_plugins_conf,
-                                            plugin_files=self.plugin_files)
+                                            plugin_files=self.plugin_files,
+                                            max_workers=self.max_plugin_workers,
+                                            plugin_timeout=self.plugin_timeout)
             try:
                 exit_runner.run(keep_going=True)
             except PluginFailedException as ex:
@@ -514,14 +572,22 @@ class DockerBuildWorkflow(object):
                 raise
             finally:
                 self.source.remove_tmpdir()
-                self.fs_watcher.finish()
+                self.resource_monitor.finish()
+                self.save_checkpoint()
+                if self.trace:
+                    self.export_trace()
+                # don't keep connections to registries open after build
+                clear_registry_sessions()
+                set_registry_cache(None)
 
             signal.signal(signal.SIGTERM, signal.SIG_DFL)
 
 
-def build_inside(input_method, input_args=None, substitutions=None):
+def build_inside(input_method, input_args=None, substitutions=None, resume_from=None):
     """
     use requested input plugin to load configuration and then initiate build
+
+    :param resume_from: str, checkpoint file of previous build to resume from
     """
     def process_keyvals(keyvals):
         """ ["key=val", "x=y"] -> {"key": "val", "x": "y"} """
@@ -556,6 +622,9 @@ def build_inside(input_method, input_args=None, substitutions=None):
     if not isinstance(build_json, dict):
         raise RuntimeError("Input plugin did not return valid build json: {}".format(build_json))
 
+    if resume_from:
+        build_json['resume_from'] = resume_from
+
     dbw = DockerBuildWorkflow(**build_json)
     build_result = dbw.build_docker_image()
     if not build_result or build_result.is_failed():
@@ -13,8 +13,11 @@ import koji
 import logging
 import os
 import time
+from functools import wraps
 
+from atomic_reactor.concurrency import get_default_executor
 from atomic_reactor.constants import DEFAULT_DOWNLOAD_BLOCK_SIZE
+from atomic_reactor.tracing import tracer, SPAN_KOJI
 
 logger = logging.getLogger(__name__)
 
@@ -94,6 +97,14 @@ def koji_login(session,
     return result
 
 
+def _traced_call_method(call_method):
+    @wraps(call_method)
+    def wrapper(name, *args, **kwargs):
+        with tracer.span('koji.%s' % name, SPAN_KOJI):
+            return call_method(name, *args, **kwargs)
+    return wrapper
+
+
 def create_koji_session(hub_url, auth_info=None):
     """
     Creates and returns a Koji session. If auth_info
@@ -104,6 +115,9 @@ def create_koji_session(hub_url, auth_info=None):
     :return: koji.ClientSession instance
     """
     session = koji.ClientSession(hub_url, opts={'krb_rdns': False})
+    if tracer.enabled and hasattr(session, '_callMethod'):
+        # all hub calls, including multicalls, go through _callMethod
+        session._callMethod = _traced_call_method(session._callMethod)
 
     if auth_info is not None:
         koji_login(session, **auth_info)
@@ -112,22 +126,39 @@ def create_koji_session(hub_url, auth_info=None):
 
 
 class TaskWatcher(object):
-    def __init__(self, session, task_id, poll_interval=5):
+    def __init__(self, session, task_id, poll_interval=5, sleep=None):
+        """
+        :param sleep: function waiting between polls, time.sleep by default;
+                      Plugin.sleep stops waiting once plugin is canceled
+        """
         self.session = session
         self.task_id = task_id
         self.poll_interval = poll_interval
+        self.sleep = sleep
         self.state = 'CANCELED'
 
     def wait(self):
         logger.debug("waiting for koji task %r to finish", self.task_id)
+        sleep = self.sleep or time.sleep
         while not self.session.taskFinished(self.task_id):
-            time.sleep(self.poll_interval)
+            sleep(self.poll_interval)
 
         logger.debug("koji task is finished, getting info")
         task_info = self.session.getTaskInfo(self.task_id, request=True)
         self.state = koji.TASK_STATES[task_info['state']]
         return self.state
 
+    def wait_async(self, executor=None):
+        """
+        like wait(), but waits in background, so that many tasks may be
+        waited for at once
+
+        :param executor: AsyncExecutor, defaults to the process-wide one
+        :return: AsyncResult, its get() returns the final state of task
+        """
+        executor = executor or get_default_executor()
+        return executor.submit(self.wait)
+
     def failed(self):
         return self.state in ['CANCELED', 'FAILED']
 
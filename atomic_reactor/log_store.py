@@ -0,0 +1,171 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+bounded storage of command logs
+
+Pulling a big image or running a long build produces hundreds of thousands
+of log entries. LogStore keeps only the most recent ones in memory and
+spills older ones to a compressed temporary file, so memory used doesn't
+grow with length of logs. Repeated entries (like progress of a layer) may
+be collapsed into one, see LogStore.append.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import gzip
+import json
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TAIL_SIZE = 1000
+
+
+class LogStore(object):
+    """
+    Sequence of log entries (str lines, or json-serializable items), only
+    its tail is kept in memory
+
+    Usage:
+
+        logs = LogStore(spill_dir=workdir)
+        for line in lines:
+            logs.append(line)
+        ...
+        for line in logs:
+            print(line)
+    """
+
+    def __init__(self, tail_size=DEFAULT_TAIL_SIZE, spill_dir=None, json_entries=False):
+        """
+        :param tail_size: int, number of most recent entries kept in memory
+        :param spill_dir: str, directory for file with older entries,
+                          default temporary directory if None
+        :param json_entries: bool, entries are json-serializable items
+                             rather than lines
+        """
+        self.tail_size = tail_size
+        self.spill_dir = spill_dir
+        self.json_entries = json_entries
+        # of [entry, collapse key] lists, so that an entry can be replaced in place
+        self._tail = collections.deque()
+        # collapse key -> its tail cell
+        self._collapsible = {}
+        self._spill_file = None
+        self._spill_writer = None
+        self._spilled = 0
+
+    def append(self, entry, collapse_key=None):
+        """
+        add entry at the end of logs
+
+        :param entry: str or json-serializable item
+        :param collapse_key: hashable, replace (in place) the entry previously
+                             appended with the same key, if it's still in memory
+        """
+        if collapse_key is not None:
+            cell = self._collapsible.get(collapse_key)
+            if cell is not None:
+                cell[0] = entry
+                return
+
+        cell = [entry, collapse_key]
+        self._tail.append(cell)
+        if collapse_key is not None:
+            self._collapsible[collapse_key] = cell
+        if len(self._tail) > self.tail_size:
+            self._spill(self._tail.popleft())
+
+    def release(self, matches):
+        """
+        stop collapsing entries into those appended with matching collapse keys
+
+        :param matches: callable, gets collapse key, returns bool
+        """
+        for key in [key for key in self._collapsible if matches(key)]:
+            del self._collapsible[key]
+
+    def _encode(self, entry):
+        if self.json_entries:
+            entry = json.dumps(entry)
+        return entry.encode('utf-8') + b'\n'
+
+    def _decode(self, data):
+        entry = data.decode('utf-8').rstrip('\n')
+        if self.json_entries:
+            return json.loads(entry)
+        return entry
+
+    def _spill(self, cell):
+        collapse_key = cell[1]
+        if collapse_key is not None and self._collapsible.get(collapse_key) is cell:
+            del self._collapsible[collapse_key]
+
+        if self._spill_writer is None:
+            if self._spill_file is None:
+                # removed as soon as it's closed
+                self._spill_file = tempfile.NamedTemporaryFile(dir=self.spill_dir,
+                                                               prefix='logs-', suffix='.gz')
+                logger.debug("spilling older log entries to %s", self._spill_file.name)
+            # every writing session appends new gzip member
+            self._spill_writer = gzip.GzipFile(fileobj=self._spill_file, mode='ab')
+        self._spill_writer.write(self._encode(cell[0]))
+        self._spilled += 1
+
+    def __iter__(self):
+        tail = [cell[0] for cell in self._tail]
+        if self._spilled:
+            if self._spill_writer is not None:
+                # finish gzip member, so that it can be read
+                self._spill_writer.close()
+                self._spill_writer = None
+            self._spill_file.flush()
+            spilled = self._spilled
+            with gzip.open(self._spill_file.name, 'rb') as reader:
+                for data in reader:
+                    if not spilled:
+                        break
+                    spilled -= 1
+                    yield self._decode(data)
+        for entry in tail:
+            yield entry
+
+    def __len__(self):
+        return self._spilled + len(self._tail)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "LogStore(%d entries, %d on disk)" % (len(self), self._spilled)
+
+    def tail(self, count=None):
+        """
+        :param count: int, number of entries, all kept in memory if None
+        :return: list, most recent entries
+        """
+        entries = [cell[0] for cell in self._tail]
+        if count is not None:
+            entries = entries[-count:] if count else []
+        return entries
+
+    def close(self):
+        """ drop all entries and remove the spill file """
+        if self._spill_writer is not None:
+            self._spill_writer.close()
+            self._spill_writer = None
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        self._tail.clear()
+        self._collapsible.clear()
+        self._spilled = 0
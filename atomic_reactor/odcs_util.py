@@ -6,6 +6,7 @@ This software may be modified and distributed under the terms
 of the BSD license. See the LICENSE file for details.
 """
 
+from atomic_reactor.concurrency import get_default_executor
 from atomic_reactor.util import get_retrying_requests_session
 
 import logging
@@ -149,3 +150,17 @@ class ODCSClient(object):
                     time.sleep(slow_retry)
                 else:
                     time.sleep(burst_retry)
+
+    def wait_for_compose_async(self, compose_id, executor=None, **kwargs):
+        """Wait for compose request to finalize in background
+
+        Takes the same keyword arguments as wait_for_compose().
+
+        :param compose_id: int, compose ID to wait for
+        :param executor: AsyncExecutor, defaults to the process-wide one
+
+        :return: AsyncResult, its get() returns updated status of compose
+                 or raises RuntimeError as wait_for_compose() does
+        """
+        executor = executor or get_default_executor()
+        return executor.submit(self.wait_for_compose, compose_id, **kwargs)
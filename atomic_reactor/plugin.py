@@ -10,21 +10,34 @@ definition of plugin system
 
 plugins are supposed to be run when image is built and we need to extract some information
 """
-import copy
+import ast
 import logging
 import os
+import threading
 import traceback
 import imp
 import datetime
+import sys
 import inspect
 import time
-from six import PY2
+from multiprocessing.pool import ThreadPool
+from six import PY2, reraise
+from six.moves import builtins, queue
 
+from atomic_reactor import constants as constants_module
 from atomic_reactor.build import BuildResult
+from atomic_reactor.concurrency import AsyncExecutor, DEFAULT_ASYNC_WORKERS, get_default_executor
+from atomic_reactor.profiling import PluginProfiler
+from atomic_reactor.tracing import tracer, SPAN_PLUGIN
 from atomic_reactor.util import process_substitutions
 from dockerfile_parse import DockerfileParser
 
 MODULE_EXTENSIONS = ('.py', '.pyc', '.pyo')
+# seconds canceled plugin has to stop before runner moves on without it
+CANCEL_GRACE_PERIOD = 10
+# seconds between checks of plugins running in other threads, so that signals
+# (build cancellation) are handled promptly, on Python 2 too
+FINISHED_POLL_INTERVAL = 1
 logger = logging.getLogger(__name__)
 
 
@@ -50,6 +63,76 @@ class InappropriateBuildStepError(Exception):
     """Requested build step is not appropriate"""
 
 
+class PluginTimeoutException(Exception):
+    """Plugin didn't finish in time"""
+
+
+# Workflow resources plugins may read or write
+RESOURCE_DOCKERFILE = 'dockerfile'  # content of the Dockerfile
+RESOURCE_SOURCE = 'source'  # build directory, other than the Dockerfile
+RESOURCE_BUILDER = 'builder'  # builder state: base image, image id, is_built, ...
+RESOURCE_FILES = 'files'  # workflow.files
+RESOURCE_TAG_CONF = 'tag_conf'
+RESOURCE_PUSH_CONF = 'push_conf'
+RESOURCE_EXPORTED_IMAGE = 'exported_image_sequence'
+# errors, durations and timestamps of plugins, written by runner for every plugin
+RESOURCE_PLUGINS_METADATA = 'plugins_metadata'
+
+
+def workspace_resource(plugin_key):
+    """ name of resource for workflow.plugin_workspace[plugin_key] """
+    return 'workspace:%s' % plugin_key
+
+
+def results_resource(plugin_key):
+    """ name of resource for results of plugin plugin_key """
+    return 'results:%s' % plugin_key
+
+
+def get_plugin_dependencies(plugin_classes):
+    """
+    Figure out which plugins have to finish before each plugin may start
+
+    Plugin depends on all plugins configured before it which write any resource
+    it reads or writes, or which read any resource it writes. Every plugin
+    implicitly writes its results and RESOURCE_PLUGINS_METADATA, so a plugin
+    reading the latter depends on all plugins configured before it and vice
+    versa, as do plugins which don't declare their resources.
+
+    :param plugin_classes: list of plugin classes, in configured order
+    :return: list of sets, indices of plugins each plugin depends on
+    """
+    declarations = []
+    for plugin_class in plugin_classes:
+        reads = getattr(plugin_class, 'reads', None)
+        writes = getattr(plugin_class, 'writes', None)
+        if reads is None or writes is None:
+            declarations.append(None)
+            continue
+        reads = set(reads)
+        if RESOURCE_PLUGINS_METADATA in reads:
+            # barrier, like plugin without declarations
+            declarations.append(None)
+            continue
+        writes = set(writes)
+        writes.add(results_resource(plugin_class.key))
+        declarations.append((reads, writes))
+
+    dependencies = []
+    for index, declared in enumerate(declarations):
+        depends_on = set()
+        for previous_index, previous in enumerate(declarations[:index]):
+            if declared is None or previous is None:
+                depends_on.add(previous_index)
+                continue
+            reads, writes = declared
+            previous_reads, previous_writes = previous
+            if (previous_writes & (reads | writes)) or (previous_reads & writes):
+                depends_on.add(previous_index)
+        dependencies.append(depends_on)
+    return dependencies
+
+
 class Plugin(object):
     """ abstract plugin class """
 
@@ -59,6 +142,18 @@ class Plugin(object):
     key = None
     # by default, if plugin fails (raises exc), execution continues
     is_allowed_to_fail = True
+    # workflow resources (see RESOURCE_* and *_resource() below) this plugin
+    # reads and writes; runner uses them to figure out which plugins may run
+    # concurrently, None means unknown: such plugin never runs alongside others
+    reads = None
+    writes = None
+    # whether all this plugin does is captured by its result, the Dockerfile and
+    # workspaces it writes, so that it can be skipped when resuming from checkpoint
+    # of previous build if its inputs didn't change (see atomic_reactor.checkpoint)
+    resumable = False
+    # time (time.time()) by which the plugin has to finish, set by runner;
+    # long-running plugins should check it (see check_deadline)
+    deadline = None
 
     def __init__(self, *args, **kwargs):
         """
@@ -67,6 +162,75 @@ class Plugin(object):
         self.log = logging.getLogger("atomic_reactor.plugins." + self.key)
         self.args = args
         self.kwargs = kwargs
+        # set once plugin is asked to stop, see cancel()
+        self._cancel_event = threading.Event()
+        self._cancel_exception = None
+
+    @property
+    def executor(self):
+        """
+        AsyncExecutor for fanning out blocking calls (HTTP requests, waiting
+        for koji tasks and ODCS composes), shared by plugins of the runner
+        """
+        executor = getattr(self, '_executor', None)
+        return executor or get_default_executor()
+
+    @executor.setter
+    def executor(self, executor):
+        self._executor = executor
+
+    def remaining_time(self):
+        """
+        :return: float, seconds left until plugin deadline, None if there's none
+        """
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.time())
+
+    def cancel(self, exception=None):
+        """
+        ask plugin to stop, e.g. when its deadline passed or build was canceled:
+        check_deadline() raises exception from now on and sleep() wakes up
+
+        :param exception: exception raised by check_deadline(),
+                          PluginTimeoutException if None
+        """
+        if exception is None:
+            exception = PluginTimeoutException("plugin '%s' was canceled" % self.key)
+        self._cancel_exception = exception
+        self._cancel_event.set()
+
+    @property
+    def canceled(self):
+        return self._cancel_event.is_set()
+
+    def check_deadline(self):
+        """
+        stop plugin once it was canceled or its deadline passed: runner doesn't
+        wait for the plugin any more by then, so loops polling or retrying
+        should call this (or sleep())
+
+        :raises: exception plugin was canceled with, PluginTimeoutException
+                 if deadline passed
+        """
+        if self._cancel_event.is_set():
+            raise self._cancel_exception
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise PluginTimeoutException("plugin '%s' ran out of time" % self.key)
+
+    def sleep(self, seconds):
+        """
+        time.sleep() for polling loops, it is cut short once the plugin is
+        canceled or its deadline passes
+
+        :param seconds: float
+        :raises: see check_deadline
+        """
+        remaining = self.remaining_time()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._cancel_event.wait(seconds)
+        self.check_deadline()
 
     def __str__(self):
         return "%s" % self.key
@@ -74,6 +238,20 @@ class Plugin(object):
     def __repr__(self):
         return "Plugin(key='%s')" % self.key
 
+    @classmethod
+    def can_resume(cls, result, plugin_conf):
+        """
+        can result of resumable plugin restored from checkpoint still be used?
+
+        Override when the result refers to something which may be gone by
+        the time build is resumed, e.g. expired ODCS composes.
+
+        :param result: result of plugin from checkpoint
+        :param plugin_conf: dict, arguments of plugin
+        :return: bool, False to run plugin again
+        """
+        return True
+
     def run(self):
         """
         each plugin has to implement this method -- it is used to run the plugin actually
@@ -107,6 +285,362 @@ class BuildPlugin(Plugin):
         super(BuildPlugin, self).__init__(*args, **kwargs)
 
 
+_unknown_key = object()
+
+
+class PluginClasses(dict):
+    """
+    Mapping of plugin keys to plugin classes of one type, plugin modules are
+    loaded lazily: only when the plugin is requested, or when all plugins
+    are listed
+    """
+
+    def __init__(self, registry, plugin_class, files):
+        """
+        :param registry: PluginRegistry instance
+        :param plugin_class: class, plugin class to filter (e.g. PreBuildPlugin)
+        :param files: list of str, plugin files in order of precedence (last wins)
+        """
+        super(PluginClasses, self).__init__()
+        self._registry = registry
+        self._plugin_class = plugin_class
+        self._files = files
+        self._all_loaded = False
+        self._index = registry.get_index(plugin_class, files)
+        if self._index is None:
+            # some file can't be indexed: only importing it tells what's in there
+            self._load_all()
+
+    def _load_all(self):
+        if self._all_loaded:
+            return
+        for path in self._files:
+            for plugin_key, binding in self._registry.get_plugin_classes(path,
+                                                                         self._plugin_class):
+                dict.__setitem__(self, plugin_key, binding)
+        self._all_loaded = True
+
+    def __missing__(self, plugin_key):
+        path = None if self._all_loaded else self._index.get(plugin_key)
+        if path is None:
+            raise KeyError(plugin_key)
+        found = [binding for key, binding in
+                 self._registry.get_plugin_classes(path, self._plugin_class)
+                 if key == plugin_key]
+        if not found:
+            # index was wrong, e.g. the file can't be imported
+            self._load_all()
+            return dict.__getitem__(self, plugin_key)
+        dict.__setitem__(self, plugin_key, found[-1])
+        return found[-1]
+
+    def __contains__(self, plugin_key):
+        if self._all_loaded:
+            return dict.__contains__(self, plugin_key)
+        return plugin_key in self._index
+
+    def get(self, plugin_key, default=None):
+        try:
+            return self[plugin_key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        self._load_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._load_all()
+        return dict.__len__(self)
+
+    def keys(self):
+        self._load_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+
+class PluginRegistry(object):
+    """
+    Process-wide cache of plugin files: each file is imported at most once
+    (as long as it doesn't change) and plugin keys are found by parsing the
+    source, without importing it; only files with classes inheriting from
+    classes defined outside plugin files are imported right away
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # path -> (mtime, result of _get_names())
+        self._names = {}
+        # path -> (mtime, module)
+        self._modules = {}
+        # (plugin class, constructor) -> (argument names, whether it takes **kwargs)
+        self._signatures = {}
+        self.imports_count = 0
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def get_module(self, path):
+        """
+        import plugin module from file, once
+
+        :return: module, or None if it can't be loaded
+        """
+        mtime = self._mtime(path)
+        with self._lock:
+            cached = self._modules.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            logger.debug("load file '%s'", path)
+            module_name = os.path.basename(path).rsplit('.', 1)[0]
+            try:
+                f_module = imp.load_source(module_name, path)
+            except (IOError, OSError, ImportError, SyntaxError) as ex:
+                logger.warning("can't load module '%s': %r", path, ex)
+                f_module = None
+            self.imports_count += 1
+            self._modules[path] = (mtime, f_module)
+            return f_module
+
+    def get_plugin_classes(self, path, plugin_class):
+        """
+        import plugin file and find plugins of given type defined in it
+
+        :return: list of (plugin key, plugin class) tuples
+        """
+        f_module = self.get_module(path)
+        if f_module is None:
+            return []
+
+        found = []
+        for name in dir(f_module):
+            binding = getattr(f_module, name, None)
+            try:
+                # if you try to compare binding and PostBuildPlugin, python won't match them
+                # if you call this script directly b/c:
+                # ! <class 'plugins.plugin_rpmqa.PostBuildRPMqaPlugin'> <= <class
+                # '__main__.PostBuildPlugin'>
+                # but
+                # <class 'plugins.plugin_rpmqa.PostBuildRPMqaPlugin'> <= <class
+                # 'atomic_reactor.plugin.PostBuildPlugin'>
+                is_sub = issubclass(binding, plugin_class)
+            except TypeError:
+                is_sub = False
+            if binding and is_sub and plugin_class.__name__ != binding.__name__:
+                found.append((binding.key, binding))
+        return found
+
+    def _get_names(self, path):
+        """
+        parse plugin file and find classes it defines or imports from other
+        plugin files, at module level
+
+        :return: tuple (dict, name -> ('class', base class names, key node),
+                 ('import', path, name) or ('other', ); dict, name -> value node
+                 of module level assignments), or None if the file can't be parsed
+        """
+        mtime = self._mtime(path)
+        with self._lock:
+            cached = self._names.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            try:
+                with open(path, 'rb') as f:
+                    tree = ast.parse(f.read(), path)
+            except (IOError, OSError, SyntaxError, ValueError, TypeError) as ex:
+                logger.debug("can't parse plugin file '%s': %r", path, ex)
+                self._names[path] = (mtime, None)
+                return None
+
+            plugins_dir = os.path.dirname(os.path.abspath(__file__))
+            plugins_dir = os.path.join(plugins_dir, 'plugins')
+            names = {}
+            constants = {}
+            statements = list(tree.body)
+            while statements:
+                node = statements.pop(0)
+                if isinstance(node, ast.Assign):
+                    for target in node.targets:
+                        if isinstance(target, ast.Name):
+                            constants[target.id] = node.value
+                            names[target.id] = ('other', )
+                elif isinstance(node, ast.ImportFrom):
+                    module = node.module or ''
+                    if not module.startswith('atomic_reactor.plugins.'):
+                        continue
+                    module_path = os.path.join(plugins_dir,
+                                               module.split('.', 2)[2] + '.py')
+                    for alias in node.names:
+                        names[alias.asname or alias.name] = ('import', module_path,
+                                                             alias.name)
+                elif isinstance(node, ast.ClassDef):
+                    bases = [base.id if isinstance(base, ast.Name) else
+                             getattr(base, 'attr', None) for base in node.bases]
+                    key_node = None
+                    for stmt in node.body:
+                        if (isinstance(stmt, ast.Assign) and
+                                any(isinstance(target, ast.Name) and target.id == 'key'
+                                    for target in stmt.targets)):
+                            key_node = stmt.value
+                    names[node.name] = ('class', bases, key_node)
+                elif isinstance(node, ast.FunctionDef):
+                    names[node.name] = ('other', )
+                else:
+                    # module level try/except, if, with...
+                    for attr in ('body', 'orelse', 'handlers', 'finalbody'):
+                        statements[:0] = getattr(node, attr, None) or []
+
+            self._names[path] = (mtime, (names, constants))
+            return names, constants
+
+    def _resolve(self, path, name, seen=()):
+        """
+        :return: tuple (path, name, definition) where name is defined, or None
+        """
+        if (path, name) in seen:
+            return None
+        parsed = self._get_names(path)
+        if parsed is None or name not in parsed[0]:
+            return None
+        definition = parsed[0][name]
+        if definition[0] == 'import':
+            return self._resolve(definition[1], definition[2], seen + ((path, name), ))
+        return path, name, definition
+
+    def _has_unknown_base(self, path, name, seen=()):
+        """
+        :return: bool, whether class inherits from a class which can't be
+                 found statically, e.g. one defined outside of plugin files
+        """
+        resolved = self._resolve(path, name)
+        if resolved is None:
+            return not (isinstance(globals().get(name), type) or
+                        isinstance(getattr(builtins, name or '', None), type))
+        if resolved[2][0] != 'class' or resolved[:2] in seen:
+            return False
+        return any(self._has_unknown_base(resolved[0], base, seen + (resolved[:2], ))
+                   for base in resolved[2][1])
+
+    def _is_subclass(self, path, name, plugin_class, seen=()):
+        resolved = self._resolve(path, name)
+        if resolved is None:
+            builtin = globals().get(name)
+            return (isinstance(builtin, type) and issubclass(builtin, Plugin) and
+                    issubclass(builtin, plugin_class))
+        if resolved[2][0] != 'class' or resolved[:2] in seen:
+            return False
+        return any(self._is_subclass(resolved[0], base, plugin_class, seen + (resolved[:2], ))
+                   for base in resolved[2][1])
+
+    def _get_key(self, path, name, seen=()):
+        """
+        :return: plugin key, or _unknown_key if it can't be figured out
+        """
+        resolved = self._resolve(path, name)
+        if resolved is None:
+            builtin = globals().get(name)
+            return getattr(builtin, 'key', _unknown_key)
+        path, name, definition = resolved
+        if definition[0] != 'class' or (path, name) in seen:
+            return _unknown_key
+        _, bases, key_node = definition
+        seen += ((path, name), )
+        if key_node is None:
+            for base in bases:
+                if self._is_subclass(path, base, Plugin):
+                    return self._get_key(path, base, seen)
+            return _unknown_key
+        if isinstance(key_node, ast.Name):
+            constants = self._get_names(path)[1]
+            if key_node.id not in constants:
+                return getattr(constants_module, key_node.id, _unknown_key)
+            key_node = constants[key_node.id]
+        if isinstance(key_node, ast.Attribute) and isinstance(key_node.value, ast.Name):
+            if key_node.attr != 'key':
+                return _unknown_key
+            return self._get_key(path, key_node.value.id, seen)
+        try:
+            return ast.literal_eval(key_node)
+        except ValueError:
+            return _unknown_key
+
+    def get_index(self, plugin_class, files):
+        """
+        find plugins of given type in files, without importing them
+
+        :param plugin_class: class, plugin class to filter (e.g. PreBuildPlugin)
+        :param files: list of str, plugin files in order of precedence (last wins)
+        :return: dict, plugin key -> path, or None if some file can't be indexed
+        """
+        index = {}
+        for path in files:
+            parsed = self._get_names(path)
+            if parsed is None:
+                return None
+            if any(definition[0] == 'class' and self._has_unknown_base(path, name)
+                   for name, definition in parsed[0].items()):
+                # only importing the file tells whether such class is a plugin
+                logger.debug("can't index plugin file '%s' statically, importing it", path)
+                for plugin_key, _ in self.get_plugin_classes(path, plugin_class):
+                    index[plugin_key] = path
+                continue
+            for name in parsed[0]:
+                resolved = self._resolve(path, name)
+                if resolved is None:
+                    # imported from a plugin file which doesn't define it
+                    return None
+                if (resolved[2][0] != 'class' or resolved[1] == plugin_class.__name__ or
+                        not self._is_subclass(path, name, plugin_class)):
+                    continue
+                plugin_key = self._get_key(path, name)
+                if plugin_key is _unknown_key:
+                    logger.debug("can't figure out key of plugin %s in '%s'", name, path)
+                    return None
+                if plugin_key is not None:
+                    index[plugin_key] = path
+        return index
+
+    def get_constructor_signature(self, plugin_class):
+        """
+        :return: tuple (set of argument names of plugin class constructor,
+                 whether the constructor takes **kwargs)
+        """
+        with self._lock:
+            # __init__ is part of the key so that mocking it is noticed
+            cache_key = (plugin_class, plugin_class.__init__)
+            try:
+                return self._signatures[cache_key]
+            except KeyError:
+                pass
+
+            if PY2:
+                sig = inspect.getargspec(plugin_class.__init__)
+                kwargs = sig.keywords
+            else:
+                sig = inspect.getfullargspec(plugin_class.__init__)
+                kwargs = sig.varkw
+
+            signature = (set(sig.args), bool(kwargs))
+            self._signatures[cache_key] = signature
+            return signature
+
+
+plugin_registry = PluginRegistry()
+
+
 class PluginsRunner(object):
 
     def __init__(self, plugin_class_name, plugins_conf, *args, **kwargs):
@@ -115,10 +649,24 @@ class PluginsRunner(object):
 
         :param plugin_class_name: str, name of plugin class to filter (e.g. 'PreBuildPlugin')
         :param plugins_conf: dict, configuration for plugins
+        :param max_workers: int, number of plugins which may run concurrently
+        :param async_workers: int, number of blocking calls plugins may run
+                              at once on the shared executor
+        :param plugin_timeout: int, seconds each plugin may run, may be overridden
+                               by 'timeout' key of plugin request
+        :param deadline: float, time (time.time()) by which all plugins have to finish
         """
+        self.plugin_class_name = plugin_class_name
         self.plugins_results = getattr(self, "plugins_results", {})
         self.plugins_conf = plugins_conf or []
         self.plugin_files = kwargs.get("plugin_files", [])
+        self.max_workers = kwargs.get("max_workers") or 1
+        self.executor = AsyncExecutor(kwargs.get("async_workers") or DEFAULT_ASYNC_WORKERS)
+        self.plugin_timeout = kwargs.get("plugin_timeout")
+        self.deadline = kwargs.get("deadline")
+        # plugin instances being run, to be canceled when build is canceled
+        self._running_plugins = set()
+        self._running_lock = threading.Lock()
         self.plugin_classes = self.load_plugins(plugin_class_name)
 
     def load_plugins(self, plugin_class_name):
@@ -135,31 +683,7 @@ class PluginsRunner(object):
             logger.debug("loading additional plugins from files '%s'", self.plugin_files)
             files += self.plugin_files
         plugin_class = globals()[plugin_class_name]
-        plugin_classes = {}
-        for f in files:
-            logger.debug("load file '%s'", f)
-            module_name = os.path.basename(f).rsplit('.', 1)[0]
-            try:
-                f_module = imp.load_source(module_name, f)
-            except (IOError, OSError, ImportError, SyntaxError) as ex:
-                logger.warning("can't load module '%s': %r", f, ex)
-                continue
-            for name in dir(f_module):
-                binding = getattr(f_module, name, None)
-                try:
-                    # if you try to compare binding and PostBuildPlugin, python won't match them
-                    # if you call this script directly b/c:
-                    # ! <class 'plugins.plugin_rpmqa.PostBuildRPMqaPlugin'> <= <class
-                    # '__main__.PostBuildPlugin'>
-                    # but
-                    # <class 'plugins.plugin_rpmqa.PostBuildRPMqaPlugin'> <= <class
-                    # 'atomic_reactor.plugin.PostBuildPlugin'>
-                    is_sub = issubclass(binding, plugin_class)
-                except TypeError:
-                    is_sub = False
-                if binding and is_sub and plugin_class.__name__ != binding.__name__:
-                    plugin_classes[binding.key] = binding
-        return plugin_classes
+        return PluginClasses(plugin_registry, plugin_class, files)
 
     def create_instance_from_plugin(self, plugin_class, plugin_conf):
         """
@@ -175,12 +699,279 @@ class PluginsRunner(object):
     def on_plugin_failed(self, plugin=None, exception=None):
         pass
 
+    def on_plugin_started(self, plugin):
+        pass
+
+    def on_plugin_finished(self, plugin):
+        pass
+
     def save_plugin_timestamp(self, plugin, timestamp):
         pass
 
     def save_plugin_duration(self, plugin, duration):
         pass
 
+    def get_plugin_profiler(self, plugin):
+        """
+        :return: PluginProfiler instance to measure resources used by plugin,
+                 or None if plugins aren't profiled
+        """
+        return None
+
+    def save_plugin_profile(self, plugin, profile):
+        pass
+
+    def get_plugin_deadline(self, plugin_name):
+        """
+        :return: float, time (time.time()) by which plugin has to finish,
+                 None if it may run as long as it needs
+        """
+        timeout = self.plugin_timeout
+        for plugin_request in self.plugins_conf:
+            if isinstance(plugin_request, dict) and plugin_request.get('name') == plugin_name:
+                timeout = plugin_request.get('timeout', timeout)
+                break
+
+        deadline = self.deadline
+        if timeout:
+            plugin_deadline = time.time() + timeout
+            if deadline is None or plugin_deadline < deadline:
+                deadline = plugin_deadline
+        return deadline
+
+    def _run_traced(self, plugin_name, plugin_instance, profiler):
+        """
+        run plugin in current thread, profiled and within trace span
+
+        cProfile and spans are bound to the thread which runs the plugin
+        """
+        if profiler is not None:
+            profiler.start()
+        try:
+            with tracer.span(plugin_name, SPAN_PLUGIN, phase=self.__class__.__name__):
+                return plugin_instance.run()
+        finally:
+            if profiler is not None:
+                try:
+                    profiler.stop()
+                except Exception:
+                    logger.exception("failed to stop plugin profiler")
+
+    def _stop_plugin(self, plugin_instance, thread, exception):
+        """
+        cancel plugin and give it a while to stop
+
+        :param exception: exception the plugin was canceled with
+        """
+        plugin_instance.cancel(exception)
+        try:
+            thread.join(CANCEL_GRACE_PERIOD)
+        except RuntimeError:
+            # canceled while thread was being started, plugin stops right away
+            return
+        if thread.is_alive():
+            logger.warning("plugin '%s' didn't stop in %ds after it was canceled, "
+                           "not waiting for it", plugin_instance.key, CANCEL_GRACE_PERIOD)
+
+    def _run_plugin_instance(self, plugin_name, plugin_instance, profiler=None):
+        """
+        run plugin, if it has a deadline, run it in another thread and cancel
+        it once the deadline passes (see Plugin.cancel), it's given
+        CANCEL_GRACE_PERIOD to notice and stop
+
+        :raises: PluginTimeoutException if deadline passed
+        """
+        deadline = plugin_instance.deadline
+        if deadline is None:
+            return self._run_traced(plugin_name, plugin_instance, profiler)
+
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            raise PluginTimeoutException("no time left to run plugin '%s'" % plugin_instance.key)
+
+        outcome = {}
+
+        def run():
+            try:
+                outcome['response'] = self._run_traced(plugin_name, plugin_instance, profiler)
+            except BaseException:
+                outcome['exc_info'] = sys.exc_info()
+
+        thread = threading.Thread(target=run, name='plugin-%s' % plugin_instance.key)
+        # don't keep process alive because of abandoned plugin
+        thread.daemon = True
+        try:
+            thread.start()
+            # signal arriving just before a long join() would only be handled
+            # once it returns, don't wait longer than FINISHED_POLL_INTERVAL
+            while thread.is_alive() and time.time() < deadline:
+                thread.join(min(FINISHED_POLL_INTERVAL, max(0, deadline - time.time())))
+        except BaseException as ex:
+            # BuildCanceledException raised by signal handler, plugin has to stop too
+            self._stop_plugin(plugin_instance, thread, ex)
+            raise
+        if thread.is_alive():
+            exception = PluginTimeoutException("plugin '%s' didn't finish in %ds"
+                                               % (plugin_instance.key, timeout))
+            self._stop_plugin(plugin_instance, thread, exception)
+            raise exception
+        if 'exc_info' in outcome:
+            reraise(*outcome['exc_info'])
+        return outcome['response']
+
+    def cancel_running_plugins(self, exception):
+        """
+        cancel all plugins of this runner which are running
+
+        :param exception: exception the plugins are canceled with
+        """
+        with self._running_lock:
+            plugin_instances = list(self._running_plugins)
+        for plugin_instance in plugin_instances:
+            logger.info("canceling plugin '%s'", plugin_instance.key)
+            plugin_instance.cancel(exception)
+
+    def _resolve_plugin_request(self, plugin_request, keep_going=False):
+        """
+        look up plugin class and configuration for plugin request
+
+        :param plugin_request: dict, item of plugins configuration
+        :param keep_going: bool, whether to keep going after unexpected failure
+        :return: tuple (plugin name, plugin class, plugin configuration,
+                 whether plugin is allowed to fail), or None if the request
+                 should be skipped
+        """
+        try:
+            plugin_name = plugin_request['name']
+        except (TypeError, KeyError):
+            msg = "invalid plugin request, no key 'name': %s" % plugin_request
+            exc = None if keep_going else PluginFailedException(msg)
+            self.on_plugin_failed('?', exc)
+            logger.error(msg)
+            if keep_going:
+                return None
+            raise exc
+
+        plugin_conf = plugin_request.get("args", {})
+        try:
+            plugin_class = self.plugin_classes[plugin_name]
+        except KeyError:
+            if plugin_request.get('required', True):
+                msg = ("no such plugin: '%s', did you set "
+                       "the correct plugin type?") % plugin_name
+                exc = PluginFailedException(msg)
+                self.on_plugin_failed(plugin_name, exc)
+                logger.error(msg)
+                raise exc
+            else:
+                # This plugin is marked as not being required
+                logger.warning("plugin '%s' requested but not available",
+                               plugin_name)
+                return None
+        try:
+            plugin_is_allowed_to_fail = plugin_request['is_allowed_to_fail']
+        except (TypeError, KeyError):
+            plugin_is_allowed_to_fail = getattr(plugin_class, "is_allowed_to_fail", True)
+
+        return plugin_name, plugin_class, plugin_conf, plugin_is_allowed_to_fail
+
+    def _execute_plugin(self, plugin_name, plugin_class, plugin_conf):
+        """
+        create instance of plugin and run it, exceptions raised by the plugin
+        are not propagated but returned
+
+        :return: tuple (plugin response, exception raised by plugin or None)
+        """
+        logger.debug("running plugin '%s'", plugin_name)
+        start_time = datetime.datetime.now()
+
+        profiler = self.get_plugin_profiler(plugin_class.key)
+
+        plugin_response = None
+        exception = None
+        self.on_plugin_started(plugin_class.key)
+        plugin_instance = None
+        try:
+            plugin_instance = self.create_instance_from_plugin(plugin_class, plugin_conf)
+            plugin_instance.executor = self.executor
+            plugin_instance.deadline = self.get_plugin_deadline(plugin_name)
+            with self._running_lock:
+                self._running_plugins.add(plugin_instance)
+            self.save_plugin_timestamp(plugin_class.key, start_time)
+            plugin_response = self._run_plugin_instance(plugin_name, plugin_instance, profiler)
+        except (AutoRebuildCanceledException, InappropriateBuildStepError) as ex:
+            exception = ex
+        except Exception as ex:
+            logger.debug(traceback.format_exc())
+            exception = ex
+        finally:
+            with self._running_lock:
+                self._running_plugins.discard(plugin_instance)
+        self.on_plugin_finished(plugin_class.key)
+
+        # profile of plugin which didn't stop isn't complete
+        if profiler is not None and profiler.get_summary() is not None:
+            try:
+                self.save_plugin_profile(plugin_class.key, profiler.get_summary())
+            except Exception:
+                logger.exception("failed to save plugin profile")
+
+        try:
+            finish_time = datetime.datetime.now()
+            duration = finish_time - start_time
+            seconds = duration.total_seconds()
+            logger.debug("plugin '%s' finished in %ds", plugin_name, seconds)
+            self.save_plugin_duration(plugin_class.key, seconds)
+        except Exception:
+            logger.exception("failed to save plugin duration")
+
+        return plugin_response, exception
+
+    def _handle_plugin_exception(self, plugin_class, exception, plugin_is_allowed_to_fail,
+                                 failed_msgs, keep_going=False, buildstep_phase=False):
+        """
+        decide what an exception raised by a plugin means for the rest of the run
+
+        :return: bool, True if the plugin response should not be stored
+        :raises: PluginFailedException if no further plugins should run
+        """
+        if isinstance(exception, AutoRebuildCanceledException):
+            # if auto rebuild is canceled, then just reraise
+            # NOTE: We need to reraise explicitly, so that it isn't turned into
+            #   PluginFailedException below (calling methods would then need to parse
+            #   exception message to see if AutoRebuildCanceledException was raised here)
+            raise exception
+
+        if isinstance(exception, InappropriateBuildStepError):
+            logger.debug('Build step %s is not appropriate', plugin_class.key)
+            if not buildstep_phase:
+                raise exception
+            # don't put None, in results for InappropriateBuildStepError
+            return True
+
+        msg = "plugin '%s' raised an exception: %r" % (plugin_class.key, exception)
+        if not plugin_is_allowed_to_fail:
+            self.on_plugin_failed(plugin_class.key, exception)
+
+        if plugin_is_allowed_to_fail or keep_going:
+            logger.warning(msg)
+            logger.info("error is not fatal, continuing...")
+            if not plugin_is_allowed_to_fail:
+                failed_msgs.append(msg)
+        else:
+            logger.error(msg)
+            raise PluginFailedException(msg)
+
+        return False
+
+    @staticmethod
+    def _raise_failed_msgs(failed_msgs):
+        if len(failed_msgs) == 1:
+            raise PluginFailedException(failed_msgs[0])
+        elif len(failed_msgs) > 1:
+            raise PluginFailedException("Multiple plugins raised an exception: " +
+                                        str(failed_msgs))
+
     def run(self, keep_going=False, buildstep_phase=False):
         """
         run all requested plugins
@@ -191,52 +982,29 @@ class PluginsRunner(object):
                                 not be executed after a plugin completes
                                 (only used for build-step plugins)
         """
+        try:
+            return self._run(keep_going=keep_going, buildstep_phase=buildstep_phase)
+        finally:
+            self.executor.shutdown()
+
+    def _run(self, keep_going=False, buildstep_phase=False):
+        if self.max_workers > 1 and not buildstep_phase:
+            return self._run_concurrently(keep_going=keep_going)
+
         failed_msgs = []
         plugin_successful = False
         plugin_response = None
         for plugin_request in self.plugins_conf:
             plugin_successful = False
-            try:
-                plugin_name = plugin_request['name']
-            except (TypeError, KeyError):
-                msg = "invalid plugin request, no key 'name': %s" % plugin_request
-                exc = None if keep_going else PluginFailedException(msg)
-                self.on_plugin_failed('?', exc)
-                logger.error(msg)
-                if keep_going:
-                    continue
-                raise exc
-
-            plugin_conf = plugin_request.get("args", {})
-            try:
-                plugin_class = self.plugin_classes[plugin_name]
-            except KeyError:
-                if plugin_request.get('required', True):
-                    msg = ("no such plugin: '%s', did you set "
-                           "the correct plugin type?") % plugin_name
-                    exc = PluginFailedException(msg)
-                    self.on_plugin_failed(plugin_name, exc)
-                    logger.error(msg)
-                    raise exc
-                else:
-                    # This plugin is marked as not being required
-                    logger.warning("plugin '%s' requested but not available",
-                                   plugin_name)
-                    continue
-            try:
-                plugin_is_allowed_to_fail = plugin_request['is_allowed_to_fail']
-            except (TypeError, KeyError):
-                plugin_is_allowed_to_fail = getattr(plugin_class, "is_allowed_to_fail", True)
-
-            logger.debug("running plugin '%s'", plugin_name)
-            start_time = datetime.datetime.now()
+            plugin = self._resolve_plugin_request(plugin_request, keep_going=keep_going)
+            if plugin is None:
+                continue
+            plugin_name, plugin_class, plugin_conf, plugin_is_allowed_to_fail = plugin
 
-            plugin_response = None
+            plugin_response, exception = self._execute_plugin(plugin_name, plugin_class,
+                                                              plugin_conf)
             skip_response = False
-            try:
-                plugin_instance = self.create_instance_from_plugin(plugin_class, plugin_conf)
-                self.save_plugin_timestamp(plugin_class.key, start_time)
-                plugin_response = plugin_instance.run()
+            if exception is None:
                 plugin_successful = True
                 if buildstep_phase:
                     assert isinstance(plugin_response, BuildResult)
@@ -249,46 +1017,12 @@ class PluginsRunner(object):
                         plugin_successful = False
                         self.plugins_results[plugin_class.key] = plugin_response
                         break
-
-            except AutoRebuildCanceledException as ex:
-                # if auto rebuild is canceled, then just reraise
-                # NOTE: We need to catch and reraise explicitly, so that the below except clause
-                #   doesn't catch this and make PluginFailedException out of it in the end
-                #   (calling methods would then need to parse exception message to see if
-                #   AutoRebuildCanceledException was raised here)
-                raise
-            except InappropriateBuildStepError:
-                logger.debug('Build step %s is not appropriate', plugin_class.key)
-                # don't put None, in results for InappropriateBuildStepError
-                skip_response = True
-                if not buildstep_phase:
-                    raise
-            except Exception as ex:
-                msg = "plugin '%s' raised an exception: %r" % (plugin_class.key, ex)
-                logger.debug(traceback.format_exc())
-                if not plugin_is_allowed_to_fail:
-                    self.on_plugin_failed(plugin_class.key, ex)
-
-                if plugin_is_allowed_to_fail or keep_going:
-                    logger.warning(msg)
-                    logger.info("error is not fatal, continuing...")
-                    if not plugin_is_allowed_to_fail:
-                        failed_msgs.append(msg)
-                else:
-                    logger.error(msg)
-                    raise PluginFailedException(msg)
-
-                plugin_response = ex
-
-            try:
-                if start_time:
-                    finish_time = datetime.datetime.now()
-                    duration = finish_time - start_time
-                    seconds = duration.total_seconds()
-                    logger.debug("plugin '%s' finished in %ds", plugin_name, seconds)
-                    self.save_plugin_duration(plugin_class.key, seconds)
-            except Exception:
-                logger.exception("failed to save plugin duration")
+            else:
+                skip_response = self._handle_plugin_exception(
+                    plugin_class, exception, plugin_is_allowed_to_fail, failed_msgs,
+                    keep_going=keep_going, buildstep_phase=buildstep_phase)
+                if not skip_response:
+                    plugin_response = exception
 
             if not skip_response:
                 self.plugins_results[plugin_class.key] = plugin_response
@@ -298,11 +1032,7 @@ class PluginsRunner(object):
                              'after first successful plugin')
                 break
 
-        if len(failed_msgs) == 1:
-            raise PluginFailedException(failed_msgs[0])
-        elif len(failed_msgs) > 1:
-            raise PluginFailedException("Multiple plugins raised an exception: " +
-                                        str(failed_msgs))
+        self._raise_failed_msgs(failed_msgs)
 
         if not plugin_successful and buildstep_phase and not plugin_response:
             self.on_plugin_failed("BuildStepPlugin", "No appropriate build step")
@@ -310,6 +1040,123 @@ class PluginsRunner(object):
 
         return self.plugins_results
 
+    def _run_concurrently(self, keep_going=False):
+        """
+        run requested plugins on a thread pool
+
+        A plugin is started as soon as all plugins it depends on (see
+        get_plugin_dependencies) have finished. Once a plugin fails fatally,
+        no further plugins are started, the running ones are waited for and
+        the failure is raised. When the runner itself is interrupted, e.g.
+        the build is canceled, no further plugins are started, the running
+        ones are canceled and the interruption is re-raised.
+
+        :param keep_going: bool, whether to keep going after unexpected failure
+        """
+        plugins = []
+        for plugin_request in self.plugins_conf:
+            plugin = self._resolve_plugin_request(plugin_request, keep_going=keep_going)
+            if plugin is not None:
+                plugins.append(plugin)
+
+        if not plugins:
+            return self.plugins_results
+
+        dependencies = get_plugin_dependencies([plugin[1] for plugin in plugins])
+        failed_msgs = []
+        pending = list(range(len(plugins)))
+        running = set()
+        finished = set()
+        fatal_exception = None
+        finished_queue = queue.Queue()
+        # set when runner is canceled, plugins not started by then are not run
+        stopping = threading.Event()
+
+        def execute(index):
+            plugin_name, plugin_class, plugin_conf, _ = plugins[index]
+            if stopping.is_set():
+                finished_queue.put((index, None, None))
+                return
+            try:
+                result = self._execute_plugin(plugin_name, plugin_class, plugin_conf)
+            except BaseException as ex:
+                result = (None, ex)
+            finished_queue.put((index, ) + result)
+
+        pool = ThreadPool(min(self.max_workers, len(plugins)))
+        try:
+            while pending or running:
+                if fatal_exception is None:
+                    for index in [i for i in pending if dependencies[i] <= finished]:
+                        pending.remove(index)
+                        running.add(index)
+                        pool.apply_async(execute, (index, ))
+
+                if not running:
+                    break
+
+                try:
+                    # blocking get() can't be interrupted by signals on Python 2
+                    index, plugin_response, exception = \
+                        finished_queue.get(timeout=FINISHED_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                running.remove(index)
+                finished.add(index)
+
+                _, plugin_class, _, plugin_is_allowed_to_fail = plugins[index]
+                if exception is not None:
+                    try:
+                        if self._handle_plugin_exception(plugin_class, exception,
+                                                         plugin_is_allowed_to_fail, failed_msgs,
+                                                         keep_going=keep_going):
+                            continue
+                    except Exception as ex:
+                        if fatal_exception is None:
+                            logger.info("not starting remaining plugins, waiting for "
+                                        "running plugins to finish")
+                            fatal_exception = ex
+                        continue
+                    plugin_response = exception
+
+                self.plugins_results[plugin_class.key] = plugin_response
+        except BaseException as ex:
+            # e.g. BuildCanceledException raised by signal handler
+            logger.info("runner was interrupted by %r, canceling running plugins", ex)
+            stopping.set()
+            pool.close()
+            self.cancel_running_plugins(ex)
+            self._wait_for_plugins(finished_queue, running)
+            pool.terminate()
+            raise
+
+        pool.close()
+        pool.join()
+        if fatal_exception is not None:
+            raise fatal_exception
+
+        self._raise_failed_msgs(failed_msgs)
+        return self.plugins_results
+
+    @staticmethod
+    def _wait_for_plugins(finished_queue, running):
+        """
+        wait at most CANCEL_GRACE_PERIOD for canceled plugins to stop
+
+        :param finished_queue: Queue of (index, response, exception) of finished plugins
+        :param running: set of indexes of running plugins
+        """
+        stop_by = time.time() + CANCEL_GRACE_PERIOD
+        while running and time.time() < stop_by:
+            try:
+                index = finished_queue.get(timeout=FINISHED_POLL_INTERVAL)[0]
+            except queue.Empty:
+                continue
+            running.discard(index)
+        if running:
+            logger.warning("%d canceled plugins didn't stop in %ds, not waiting for them",
+                           len(running), CANCEL_GRACE_PERIOD)
+
 
 class BuildPluginsRunner(PluginsRunner):
     def __init__(self, dt, workflow, plugin_class_name, plugins_conf, *args, **kwargs):
@@ -330,54 +1177,85 @@ class BuildPluginsRunner(PluginsRunner):
         if plugin and exception:
             self.workflow.plugins_errors[plugin] = repr(exception)
 
+    def on_plugin_started(self, plugin):
+        self.workflow.resource_monitor.plugin_started(plugin)
+
+    def on_plugin_finished(self, plugin):
+        self.workflow.resource_monitor.plugin_finished(plugin)
+
     def save_plugin_timestamp(self, plugin, timestamp):
         self.workflow.plugins_timestamps[plugin] = timestamp.isoformat()
 
     def save_plugin_duration(self, plugin, duration):
         self.workflow.plugins_durations[plugin] = duration
 
-    def _translate_special_values(self, obj_to_translate):
+    def get_plugin_profiler(self, plugin):
+        if not self.workflow.profile_plugins:
+            return None
+
+        pstats_path = None
+        if self.workflow.profile_plugins_pstats:
+            pstats_path = os.path.join(self.workflow.source.workdir,
+                                       'plugin-%s.pstats' % plugin)
+        return PluginProfiler(pstats_path=pstats_path)
+
+    def save_plugin_profile(self, plugin, profile):
+        self.workflow.plugins_profiles[plugin] = profile
+
+    def _execute_plugin(self, plugin_name, plugin_class, plugin_conf):
+        checkpoint = self.workflow.checkpoint
+        input_hash = None
+        if checkpoint is not None:
+            input_hash = checkpoint.get_input_hash(self.workflow, plugin_class, plugin_conf)
+        if input_hash is not None:
+            resumed, plugin_response = checkpoint.resume_plugin(
+                self.workflow, self.plugin_class_name, plugin_class, input_hash, plugin_conf)
+            if resumed:
+                return plugin_response, None
+
+        plugin_response, exception = super(BuildPluginsRunner, self)._execute_plugin(
+            plugin_name, plugin_class, plugin_conf)
+
+        if (input_hash is not None and exception is None and
+                not isinstance(plugin_response, Exception)):
+            checkpoint.add_plugin(self.workflow, self.plugin_class_name, plugin_class,
+                                  input_hash, plugin_response)
+        return plugin_response, exception
+
+    def _translate_special_values(self, obj_to_translate, translation_dict=None):
         """
         you may want to write plugins for values which are not known before build:
         e.g. id of built image, base image name,... this method will therefore
         translate some reserved values to the runtime values
         """
-        translation_dict = {
-            'BUILT_IMAGE_ID': self.workflow.builder.image_id,
-            'BUILD_DOCKERFILE_PATH': self.workflow.builder.source.dockerfile_path,
-            'BUILD_SOURCE_PATH':  self.workflow.builder.source.path,
-        }
+        if translation_dict is None:
+            translation_dict = {
+                'BUILT_IMAGE_ID': self.workflow.builder.image_id,
+                'BUILD_DOCKERFILE_PATH': self.workflow.builder.source.dockerfile_path,
+                'BUILD_SOURCE_PATH':  self.workflow.builder.source.path,
+            }
 
-        if self.workflow.builder.base_image:
-            translation_dict['BASE_IMAGE'] = self.workflow.builder.base_image.to_str()
+            if self.workflow.builder.base_image:
+                translation_dict['BASE_IMAGE'] = self.workflow.builder.base_image.to_str()
 
         if isinstance(obj_to_translate, dict):
             # Recurse into dicts
-            translated_dict = copy.deepcopy(obj_to_translate)
-            for key, value in obj_to_translate.items():
-                translated_dict[key] = self._translate_special_values(value)
-
-            return translated_dict
+            return {key: self._translate_special_values(value, translation_dict)
+                    for key, value in obj_to_translate.items()}
         elif isinstance(obj_to_translate, list):
             # Iterate over lists
-            return [self._translate_special_values(elem)
+            return [self._translate_special_values(elem, translation_dict)
                     for elem in obj_to_translate]
         else:
             return translation_dict.get(obj_to_translate, obj_to_translate)
 
     def _remove_unknown_args(self, plugin_class, plugin_conf):
-        if PY2:
-            sig = inspect.getargspec(plugin_class.__init__)
-            kwargs = sig.keywords
-        else:
-            sig = inspect.getfullargspec(plugin_class.__init__)
-            kwargs = sig.varkw
+        args, kwargs = plugin_registry.get_constructor_signature(plugin_class)
 
         # Constructor defines **kwargs, it'll take any parameter
         if kwargs:
             return plugin_conf
 
-        args = set(sig.args)
         known_plugin_conf = {}
         for key, value in plugin_conf.items():
             if key not in args:
@@ -7,10 +7,13 @@ of the BSD license. See the LICENSE file for details.
 """
 from __future__ import print_function, unicode_literals
 
+import time
+
 import docker
 from atomic_reactor.plugin import BuildStepPlugin
 from atomic_reactor.util import wait_for_command
 from atomic_reactor.build import BuildResult
+from atomic_reactor.docker_stream import get_instruction_timings
 
 
 class DockerApiPlugin(BuildStepPlugin):
@@ -35,6 +38,7 @@ class DockerApiPlugin(BuildStepPlugin):
             BuildResult
             built_image_info
             image_id
+            workflow.instruction_timings
         """
         builder = self.workflow.builder
 
@@ -43,11 +47,15 @@ class DockerApiPlugin(BuildStepPlugin):
 
         self.log.debug('build is submitted, waiting for it to finish')
         try:
-            command_result = wait_for_command(logs_gen)
+            # logs of long builds are spilled to workdir rather than kept in memory
+            command_result = wait_for_command(logs_gen, spill_dir=self.workflow.source.workdir)
         except docker.errors.APIError as ex:
             return BuildResult(logs=[], fail_reason=ex.explanation)
 
+        finished = time.time()
+
         if command_result.is_failed():
+            self.record_instruction_timings(command_result.events, finished)
             return BuildResult(logs=command_result.logs,
                                fail_reason=command_result.error)
         else:
@@ -56,4 +64,27 @@ class DockerApiPlugin(BuildStepPlugin):
                 # Older versions of the daemon do not include the prefix
                 image_id = 'sha256:{}'.format(image_id)
 
+            self.record_instruction_timings(command_result.events, finished, image_id)
             return BuildResult(logs=command_result.logs, image_id=image_id)
+
+    def record_instruction_timings(self, events, finished, image_id=None):
+        """
+        store how long every Dockerfile instruction took in workflow
+
+        :param events: list of StreamEvent, from docker build output
+        :param finished: float, when build finished
+        :param image_id: str, built image, to look up sizes of layers in
+        """
+        history = None
+        if image_id:
+            try:
+                history = self.tasker.d.history(image_id)
+            except docker.errors.APIError:
+                self.log.warning("failed to get history of image %s, "
+                                 "sizes of layers will not be reported", image_id)
+
+        timings = get_instruction_timings(events, finished, history)
+        self.workflow.instruction_timings = timings
+        for timing in sorted(timings, key=lambda timing: -timing['duration']):
+            self.log.info("step %s took %.1fs%s: %s", timing['step'], timing['duration'],
+                          ' (cached)' if timing['cached'] else '', timing['instruction'])
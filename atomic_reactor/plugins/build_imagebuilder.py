@@ -12,7 +12,7 @@ import time
 from six import PY2
 import os
 
-from atomic_reactor.util import get_exported_image_metadata
+from atomic_reactor.util import get_exported_image_metadata, HashingWriter
 from atomic_reactor.plugin import BuildStepPlugin
 from atomic_reactor.build import BuildResult
 from atomic_reactor.constants import CONTAINER_IMAGEBUILDER_BUILD_METHOD
@@ -75,6 +75,8 @@ class ImagebuilderPlugin(BuildStepPlugin):
                 fail_reason="image build failed (rc={}): {}".format(ib_process.returncode, err),
             )
 
+        # image was tagged behind the back of docker tasker
+        self.tasker.image_catalog.invalidate(image)
         image_id = builder.get_built_image_info()['Id']
         if ':' not in image_id:
             # Older versions of the daemon do not include the prefix
@@ -83,9 +85,10 @@ class ImagebuilderPlugin(BuildStepPlugin):
         # since we need no squash, export the image for local operations like squash would have
         self.log.info("fetching image %s from docker", image)
         output_path = os.path.join(self.workflow.source.workdir, EXPORTED_SQUASHED_IMAGE_NAME)
-        with open(output_path, "w") as image_file:
+        with HashingWriter(output_path) as image_file:
             image_file.write(self.tasker.d.get_image(image).data)
-        img_metadata = get_exported_image_metadata(output_path, IMAGE_TYPE_DOCKER_ARCHIVE)
+        img_metadata = get_exported_image_metadata(output_path, IMAGE_TYPE_DOCKER_ARCHIVE,
+                                                   image_file.checksums)
         self.workflow.exported_image_sequence.append(img_metadata)
 
         return BuildResult(logs=output, image_id=image_id, skip_layer_squash=True)
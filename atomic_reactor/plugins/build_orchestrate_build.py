@@ -9,7 +9,6 @@ from __future__ import unicode_literals, division
 
 from collections import namedtuple
 from copy import deepcopy
-from multiprocessing.pool import ThreadPool
 
 import json
 import os
@@ -877,25 +876,35 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
             raise RuntimeError("No enabled platform to build on")
         self.set_build_image()
 
-        thread_pool = ThreadPool(len(self.platforms))
-        result = thread_pool.map_async(self.select_and_start_cluster, self.platforms)
+        # every call waits for its worker build to finish
+        if len(self.platforms) > self.executor.max_workers:
+            self.log.warning('%d platforms but only %d async workers, some worker builds '
+                             'will only start once others finish',
+                             len(self.platforms), self.executor.max_workers)
+        results = [self.executor.submit(self.select_and_start_cluster, platform)
+                   for platform in self.platforms]
 
         try:
-            result.get()
+            for result in results:
+                # short waits, so that build cancellation (signal) isn't delayed
+                while not result.ready():
+                    result.wait(1)
+                result.get()
         # Always clean up worker builds on any error to avoid
         # runaway worker builds (includes orchestrator build cancellation)
         except Exception:
-            thread_pool.terminate()
             self.log.info('build cancelled, cancelling worker builds')
-            if self.worker_builds:
-                ThreadPool(len(self.worker_builds)).map(
-                    lambda bi: bi.cancel_build(), self.worker_builds)
-            while not result.ready():
-                result.wait(1)
+            # not on executor, its workers may all be busy waiting for the builds
+            for build_info in list(self.worker_builds):
+                try:
+                    build_info.cancel_build()
+                except Exception:
+                    self.log.exception('%s - failed to cancel worker build',
+                                       build_info.platform)
+            for result in results:
+                while not result.ready():
+                    result.wait(1)
             raise
-        else:
-            thread_pool.close()
-            thread_pool.join()
 
         annotations = {'worker-builds': {
             build_info.platform: build_info.get_annotations()
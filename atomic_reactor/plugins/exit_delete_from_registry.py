@@ -9,10 +9,12 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import unicode_literals
 
 from copy import deepcopy
+import threading
+
 import requests
 
-from atomic_reactor.plugin import ExitPlugin, PluginFailedException
-from atomic_reactor.util import RegistrySession, registry_hostname
+from atomic_reactor.plugin import ExitPlugin, PluginFailedException, RESOURCE_PUSH_CONF
+from atomic_reactor.util import get_registry_session, registry_hostname
 from atomic_reactor.plugins.pre_reactor_config import get_registries
 from atomic_reactor.constants import PLUGIN_GROUP_MANIFESTS_KEY
 from requests.exceptions import HTTPError, RetryError, Timeout
@@ -25,6 +27,9 @@ class DeleteFromRegistryPlugin(ExitPlugin):
 
     key = "delete_from_registry"
     is_allowed_to_fail = False
+    reads = (RESOURCE_PUSH_CONF, )
+    # deleted registries are removed from push_conf
+    writes = (RESOURCE_PUSH_CONF, )
 
     def __init__(self, tasker, workflow, registries=None):
         """
@@ -74,39 +79,64 @@ class DeleteFromRegistryPlugin(ExitPlugin):
 
         return None
 
-    def handle_registry(self, session, push_conf_registry, deleted_digests):
-        registry_noschema = registry_hostname(session.registry)
-        deleted = False
-
+    def get_registry_deletions(self, session, push_conf_registry, planned_digests):
+        """
+        :param planned_digests: set, digests which are going to be deleted already,
+                                updated with digests of returned deletions
+        :return: list of (RegistrySession, repository, digest) to delete
+        """
+        deletions = []
         for tag, digests in push_conf_registry.digests.items():
             digest = digests.default
-            if digest in deleted_digests:
+            if digest in planned_digests:
                 # Manifest schema version 2 uses the same digest
                 # for all tags
                 self.log.info('digest already deleted %s', digest)
-                deleted = True
                 continue
 
-            repo = tag.split(':')[0]
-            url = self.make_url(repo, digest)
-            manifest = self.make_manifest(registry_noschema, repo, digest)
+            planned_digests.add(digest)
+            deletions.append((session, tag.split(':')[0], digest))
 
-            if self.request_delete(session, url, manifest):
-                deleted_digests.add(digest)
-                deleted = True
+        return deletions
 
-        return deleted
+    def get_manifest_list_deletions(self, session, planned_digests):
+        """
+        manifest lists are deleted from every registry, their digests are
+        added to planned_digests, so that they aren't deleted again as
+        digests of workers or pushed images
 
-    def delete_manifest_lists(self, session, registry_noschema, deleted_digests):
+        :param planned_digests: set, digests which are going to be deleted already,
+                                updated with digests of returned deletions
+        :return: list of (RegistrySession, repository, digest) to delete
+        """
         manifest_list_digests = self.workflow.postbuild_results.get(PLUGIN_GROUP_MANIFESTS_KEY)
         if not manifest_list_digests:
-            return
+            return []
 
+        deletions = []
         for repo, digest in manifest_list_digests.items():
-            url = self.make_url(repo, digest.default)
-            manifest = self.make_manifest(registry_noschema, repo, digest.default)
-            self.request_delete(session, url, manifest)
-            deleted_digests.add(digest.default)
+            planned_digests.add(digest.default)
+            deletions.append((session, repo, digest.default))
+        return deletions
+
+    def delete_manifests(self, deletions, deleted_digests):
+        """
+        delete manifests concurrently
+
+        :param deletions: list of (RegistrySession, repository, digest)
+        :param deleted_digests: set, digests of deleted manifests are added to it
+        """
+        lock = threading.Lock()
+
+        def delete(deletion):
+            session, repo, digest = deletion
+            url = self.make_url(repo, digest)
+            manifest = self.make_manifest(registry_hostname(session.registry), repo, digest)
+            if self.request_delete(session, url, manifest):
+                with lock:
+                    deleted_digests.add(digest)
+
+        self.executor.map(delete, deletions)
 
     def get_worker_digests(self):
         """
@@ -133,37 +163,37 @@ class DeleteFromRegistryPlugin(ExitPlugin):
 
         return worker_digests
 
-    def handle_worker_digests(self, session, worker_digests, deleted_digests):
-        registry_noschema = registry_hostname(session.registry)
-
-        if registry_noschema not in worker_digests:
-            return False
-
-        # Remove manifest list first to avoid broken lists in case an error occurs
-        self.delete_manifest_lists(session, registry_noschema, deleted_digests)
-
-        digests = worker_digests[registry_noschema]
+    def get_worker_deletions(self, session, digests, planned_digests):
+        """
+        :param digests: list of dicts, worker digests pushed to registry of session
+        :param planned_digests: set, digests which are going to be deleted already,
+                                updated with digests of returned deletions
+        :return: list of (RegistrySession, repository, digest) to delete
+        """
+        deletions = []
         for digest in digests:
-            if digest['digest'] in deleted_digests:
+            if digest['digest'] in planned_digests:
                 # Manifest schema version 2 uses the same digest
                 # for all tags
                 self.log.info('digest already deleted %s', digest['digest'])
-                return True
-
-            url = self.make_url(digest['repository'], digest['digest'])
-            manifest = self.make_manifest(registry_noschema, digest['repository'],
-                                          digest['digest'])
+                continue
 
-            if self.request_delete(session, url, manifest):
-                deleted_digests.add(digest['digest'])
+            planned_digests.add(digest['digest'])
+            deletions.append((session, digest['repository'], digest['digest']))
 
-        return True
+        return deletions
 
     def run(self):
         deleted_digests = set()
 
         worker_digests = self.get_worker_digests()
 
+        # deletions are collected for all registries first (in order, so that
+        # every digest is deleted only once) and then run concurrently
+        planned_digests = set()
+        manifest_list_deletions = []
+        deletions = []
+        pushed_registries = []
         for registry, registry_conf in self.registries.items():
             registry_noschema = registry_hostname(registry)
 
@@ -183,11 +213,18 @@ class DeleteFromRegistryPlugin(ExitPlugin):
 
             secret_path = registry_conf.get('secret')
 
-            session = RegistrySession(registry, insecure=insecure, dockercfg_path=secret_path)
+            session = get_registry_session(registry, insecure=insecure,
+                                           dockercfg_path=secret_path,
+                                           pool_size=self.executor.max_workers)
 
             # orchestrator builds use worker_digests
-            orchestrator_delete = self.handle_worker_digests(session, worker_digests,
-                                                             deleted_digests)
+            orchestrator_delete = registry_noschema in worker_digests
+            if orchestrator_delete:
+                manifest_list_deletions.extend(self.get_manifest_list_deletions(session,
+                                                                                planned_digests))
+                deletions.extend(self.get_worker_deletions(session,
+                                                           worker_digests[registry_noschema],
+                                                           planned_digests))
 
             if not push_conf_registry:
                 # only warn if we're not running in the orchestrator
@@ -197,7 +234,18 @@ class DeleteFromRegistryPlugin(ExitPlugin):
                 continue
 
             # worker node and manifests use push_conf_registry
-            if self.handle_registry(session, push_conf_registry, deleted_digests):
+            deletions.extend(self.get_registry_deletions(session, push_conf_registry,
+                                                         planned_digests))
+            pushed_registries.append(push_conf_registry)
+
+        # Remove manifest lists first to avoid broken lists in case an error occurs
+        self.delete_manifests(manifest_list_deletions, deleted_digests)
+        deleted_digests.update(digest for _, _, digest in manifest_list_deletions)
+        self.delete_manifests(deletions, deleted_digests)
+
+        for push_conf_registry in pushed_registries:
+            if any(digests.default in deleted_digests
+                   for digests in push_conf_registry.digests.values()):
                 # delete these temp registries
                 self.workflow.push_conf.remove_docker_registry(push_conf_registry)
 
@@ -13,7 +13,9 @@ import os
 import time
 
 from atomic_reactor import start_time as atomic_reactor_start_time
-from atomic_reactor.plugin import ExitPlugin
+from atomic_reactor.plugin import (ExitPlugin, RESOURCE_BUILDER, RESOURCE_DOCKERFILE,
+                                   RESOURCE_PUSH_CONF, RESOURCE_SOURCE, RESOURCE_TAG_CONF,
+                                   results_resource)
 from atomic_reactor.source import GitSource
 from atomic_reactor.plugins.build_orchestrate_build import (get_worker_build_info,
                                                             get_koji_upload_dir)
@@ -76,6 +78,9 @@ class KojiImportPlugin(ExitPlugin):
 
     key = PLUGIN_KOJI_IMPORT_PLUGIN_KEY
     is_allowed_to_fail = False
+    reads = (RESOURCE_DOCKERFILE, RESOURCE_SOURCE, RESOURCE_BUILDER, RESOURCE_TAG_CONF,
+             RESOURCE_PUSH_CONF, results_resource(PLUGIN_PULP_PULL_KEY))
+    writes = ()
 
     def __init__(self, tasker, workflow, kojihub=None, url=None,
                  verify_ssl=True, use_auth=True,
@@ -19,7 +19,9 @@ import copy
 
 from atomic_reactor import __version__ as atomic_reactor_version
 from atomic_reactor import start_time as atomic_reactor_start_time
-from atomic_reactor.plugin import ExitPlugin
+from atomic_reactor.plugin import (ExitPlugin, RESOURCE_BUILDER, RESOURCE_DOCKERFILE,
+                                   RESOURCE_EXPORTED_IMAGE, RESOURCE_PUSH_CONF, RESOURCE_SOURCE,
+                                   RESOURCE_TAG_CONF)
 from atomic_reactor.source import GitSource
 from atomic_reactor.plugins.post_rpmqa import PostBuildRPMqaPlugin
 from atomic_reactor.plugins.pre_add_filesystem import AddFilesystemPlugin
@@ -86,6 +88,9 @@ class KojiPromotePlugin(ExitPlugin):
 
     key = PLUGIN_KOJI_PROMOTE_PLUGIN_KEY
     is_allowed_to_fail = False
+    reads = (RESOURCE_DOCKERFILE, RESOURCE_SOURCE, RESOURCE_BUILDER, RESOURCE_TAG_CONF,
+             RESOURCE_PUSH_CONF, RESOURCE_EXPORTED_IMAGE)
+    writes = ()
 
     def __init__(self, tasker, workflow, kojihub=None, url=None,
                  verify_ssl=True, use_auth=True,
@@ -298,7 +303,11 @@ class KojiPromotePlugin(ExitPlugin):
         docker_logs = NamedTemporaryFile(prefix="docker-%s" % self.build_id,
                                          suffix=".log",
                                          mode='wb')
-        docker_logs.write("\n".join(self.workflow.build_result.logs).encode('utf-8'))
+        # logs may be too long to be joined in memory
+        for index, line in enumerate(self.workflow.build_result.logs):
+            if index:
+                docker_logs.write(b"\n")
+            docker_logs.write(line.encode('utf-8'))
         docker_logs.flush()
         output.append(Output(file=docker_logs,
                              metadata=self.get_output_metadata(docker_logs.name,
@@ -486,6 +495,9 @@ class KojiPromotePlugin(ExitPlugin):
 
         if not config:
             del metadata['extra']['docker']['config']
+        if self.workflow.instruction_timings:
+            metadata['extra']['docker']['instruction_timings'] = \
+                self.workflow.instruction_timings
 
         # Add the 'docker save' image to the output
         image = add_buildroot_id(output)
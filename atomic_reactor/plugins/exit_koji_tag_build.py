@@ -10,7 +10,7 @@ from __future__ import unicode_literals
 
 from atomic_reactor.constants import PLUGIN_KOJI_TAG_BUILD_KEY
 from atomic_reactor.koji_util import tag_koji_build
-from atomic_reactor.plugin import ExitPlugin
+from atomic_reactor.plugin import ExitPlugin, results_resource
 from atomic_reactor.plugins.exit_koji_import import KojiImportPlugin
 from atomic_reactor.plugins.exit_koji_promote import KojiPromotePlugin
 from atomic_reactor.plugins.pre_reactor_config import get_koji_session
@@ -34,6 +34,9 @@ class KojiTagBuildPlugin(ExitPlugin):
 
     key = PLUGIN_KOJI_TAG_BUILD_KEY
     is_allowed_to_fail = False
+    # tags the build imported by koji_import or koji_promote
+    reads = (results_resource(KojiImportPlugin.key), results_resource(KojiPromotePlugin.key))
+    writes = ()
 
     def __init__(self, tasker, workflow, target, kojihub=None,
                  koji_ssl_certs=None, koji_proxy_user=None,
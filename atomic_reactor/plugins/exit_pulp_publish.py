@@ -43,13 +43,15 @@ from __future__ import print_function, unicode_literals
 from atomic_reactor.constants import PLUGIN_PULP_PUBLISH_KEY
 from atomic_reactor.plugins.build_orchestrate_build import get_worker_build_info
 from atomic_reactor.plugins.pre_reactor_config import get_pulp_session
-from atomic_reactor.plugin import ExitPlugin
+from atomic_reactor.plugin import ExitPlugin, RESOURCE_TAG_CONF
 from atomic_reactor.util import ImageName
 
 
 class PulpPublishPlugin(ExitPlugin):
     key = PLUGIN_PULP_PUBLISH_KEY
     is_allowed_to_fail = False
+    reads = (RESOURCE_TAG_CONF, )
+    writes = ()
 
     def __init__(self, tasker, workflow, pulp_registry_name=None,
                  pulp_secret_path=None, username=None, password=None,
@@ -8,7 +8,7 @@ of the BSD license. See the LICENSE file for details.
 
 Remove built image (this only makes sense if you store the image in some registry first)
 """
-from atomic_reactor.plugin import ExitPlugin
+from atomic_reactor.plugin import ExitPlugin, RESOURCE_BUILDER, workspace_resource
 
 from docker.errors import APIError
 
@@ -25,6 +25,9 @@ def defer_removal(workflow, image):
 
 class GarbageCollectionPlugin(ExitPlugin):
     key = "remove_built_image"
+    reads = (workspace_resource(key), )
+    # removes built and pulled images, others may still need them
+    writes = (RESOURCE_BUILDER, )
 
     def __init__(self, tasker, workflow, remove_pulled_base_image=True):
         """
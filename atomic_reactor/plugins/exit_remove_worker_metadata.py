@@ -5,7 +5,7 @@ All rights reserved.
 This software may be modified and distributed under the terms
 of the BSD license. See the LICENSE file for details.
 """
-from atomic_reactor.plugin import ExitPlugin
+from atomic_reactor.plugin import ExitPlugin, workspace_resource
 from atomic_reactor.constants import PLUGIN_REMOVE_WORKER_METADATA_KEY
 from osbs.exceptions import OsbsResponseException
 
@@ -23,6 +23,8 @@ class RemoveWorkerMetadataPlugin(ExitPlugin):
     """
 
     key = PLUGIN_REMOVE_WORKER_METADATA_KEY
+    reads = (workspace_resource(key), )
+    writes = ()
 
     def run(self):
         """
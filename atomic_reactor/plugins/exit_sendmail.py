@@ -18,7 +18,7 @@ try:
 except ImportError:
     from urllib.parse import urljoin
 
-from atomic_reactor.plugin import ExitPlugin, PluginFailedException
+from atomic_reactor.plugin import ExitPlugin, PluginFailedException, results_resource
 from atomic_reactor.plugins.pre_check_and_set_rebuild import is_rebuild
 from atomic_reactor.plugins.exit_koji_import import KojiImportPlugin
 from atomic_reactor.plugins.exit_koji_promote import KojiPromotePlugin
@@ -50,6 +50,10 @@ class SendMailPlugin(ExitPlugin):
         }]
     """
     key = "sendmail"
+    # notification includes koji build and metadata stored in OpenShift
+    reads = (results_resource(KojiImportPlugin.key), results_resource(KojiPromotePlugin.key),
+             results_resource(StoreMetadataInOSv3Plugin.key))
+    writes = ()
 
     # symbolic constants for states
     MANUAL_SUCCESS = 'manual_success'
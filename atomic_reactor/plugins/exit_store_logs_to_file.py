@@ -17,6 +17,8 @@ __all__ = ('StoreLogsToFilePlugin', )
 
 class StoreLogsToFilePlugin(ExitPlugin):
     key = "store_logs_to_file"
+    reads = ()
+    writes = ()
 
     def __init__(self, tasker, workflow, file_path):
         """
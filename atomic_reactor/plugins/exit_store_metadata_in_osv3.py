@@ -23,14 +23,24 @@ from atomic_reactor.constants import (PLUGIN_KOJI_IMPORT_PLUGIN_KEY,
                                       PLUGIN_ADD_FILESYSTEM_KEY,
                                       PLUGIN_BUILD_ORCHESTRATE_KEY,
                                       PLUGIN_GROUP_MANIFESTS_KEY,
+                                      PLUGIN_PULP_PULL_KEY,
                                       MEDIA_TYPE_DOCKER_V1)
-from atomic_reactor.plugin import ExitPlugin
+from atomic_reactor.plugin import (ExitPlugin, RESOURCE_BUILDER, RESOURCE_DOCKERFILE,
+                                   RESOURCE_PLUGINS_METADATA, RESOURCE_PUSH_CONF,
+                                   RESOURCE_SOURCE, RESOURCE_TAG_CONF, results_resource)
 from atomic_reactor.util import get_build_json
 
 
 class StoreMetadataInOSv3Plugin(ExitPlugin):
     key = "store_metadata_in_osv3"
     is_allowed_to_fail = False
+    # stores errors, durations and timestamps of all plugins run before it
+    reads = (RESOURCE_DOCKERFILE, RESOURCE_SOURCE, RESOURCE_BUILDER, RESOURCE_TAG_CONF,
+             RESOURCE_PUSH_CONF, RESOURCE_PLUGINS_METADATA,
+             results_resource(PLUGIN_KOJI_IMPORT_PLUGIN_KEY),
+             results_resource(PLUGIN_KOJI_PROMOTE_PLUGIN_KEY),
+             results_resource(PLUGIN_PULP_PULL_KEY))
+    writes = ()
 
     def __init__(self, tasker, workflow, url=None, verify_ssl=True, use_auth=True):
         """
@@ -147,22 +157,35 @@ class StoreMetadataInOSv3Plugin(ExitPlugin):
         return pullspecs
 
     def get_plugin_metadata(self):
-        return {
-            "errors": self.workflow.plugins_errors,
-            "timestamps": self.workflow.plugins_timestamps,
-            "durations": self.workflow.plugins_durations,
+        # copies, other exit plugins may be running alongside
+        metadata = {
+            "errors": dict(self.workflow.plugins_errors),
+            "timestamps": dict(self.workflow.plugins_timestamps),
+            "durations": dict(self.workflow.plugins_durations),
         }
+        if self.workflow.plugins_profiles:
+            metadata["profiles"] = dict(self.workflow.plugins_profiles)
+        return metadata
 
     def get_filesystem_metadata(self):
         data = {}
         try:
-            data = self.workflow.fs_watcher.get_usage_data()
+            data = self.workflow.resource_monitor.get_usage_data()
             self.log.debug("filesystem metadata: %s", data)
         except Exception:
             self.log.exception("Error getting filesystem stats")
 
         return data
 
+    def get_resources_metadata(self):
+        data = {}
+        try:
+            data = self.workflow.resource_monitor.get_report()
+        except Exception:
+            self.log.exception("Error getting resource usage")
+
+        return data
+
     def make_labels(self):
         labels = {}
 
@@ -235,8 +258,12 @@ class StoreMetadataInOSv3Plugin(ExitPlugin):
             "digests": json.dumps(self.get_pullspecs(self.get_digests())),
             "plugins-metadata": json.dumps(self.get_plugin_metadata()),
             "filesystem": json.dumps(self.get_filesystem_metadata()),
+            "resources": json.dumps(self.get_resources_metadata()),
         }
 
+        if self.workflow.instruction_timings:
+            annotations['instruction-timings'] = json.dumps(self.workflow.instruction_timings)
+
         help_result = self.workflow.prebuild_results.get(AddHelpPlugin.key)
         if isinstance(help_result, dict) and 'help_file' in help_result and 'status' in help_result:
             if help_result['status'] == AddHelpPlugin.NO_HELP_FILE_FOUND:
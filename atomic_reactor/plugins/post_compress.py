@@ -6,19 +6,13 @@ This software may be modified and distributed under the terms
 of the BSD license. See the LICENSE file for details.
 """
 
-import gzip
-try:
-    # if we import "lzma" first, we get pyliblzma on Py2, but we want backports.lzma
-    #  so first try to import backports.lzma on Py2 and then 'lzma' on Py3
-    from backports import lzma
-except ImportError:
-    import lzma
 import os
 
+from atomic_reactor.compression import get_compressor, METHODS
 from atomic_reactor.constants import (EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE,
                                       IMAGE_TYPE_DOCKER_ARCHIVE)
 from atomic_reactor.plugin import PostBuildPlugin
-from atomic_reactor.util import get_exported_image_metadata, human_size
+from atomic_reactor.util import get_exported_image_metadata, human_size, HashingWriter
 
 
 class CompressPlugin(PostBuildPlugin):
@@ -28,11 +22,15 @@ class CompressPlugin(PostBuildPlugin):
             "name": "compress",
             "args": {
                     "method": "gzip",
+                    "level": 6,
+                    "threads": 8,
                     "load_exported_image": true
             }
     }]
 
-    Currently supported compression methods are gzip and lzma; gzip is default.
+    Currently supported compression methods are gzip, lzma and zstd (requires
+    the zstandard module); gzip is default. Blocks of the image are compressed
+    by multiple threads, see atomic_reactor.compression.
     By default, the plugin doesn't work on exported image, you have to explicitly
     ask for it by using `load_exported_image: true`.
     """
@@ -40,39 +38,47 @@ class CompressPlugin(PostBuildPlugin):
     is_allowed_to_fail = False
 
     # TODO: add remove_former_image?
-    def __init__(self, tasker, workflow, load_exported_image=False, method='gzip'):
+    def __init__(self, tasker, workflow, load_exported_image=False, method='gzip',
+                 level=None, threads=None):
         """
         :param tasker: DockerTasker instance
         :param workflow: DockerBuildWorkflow instance
         :param load_exported_image: bool, when running squash plugin with `dont_load=True`,
                                     you may load the exported tar with this switch
+        :param method: str, gzip, lzma or zstd
+        :param level: int, compression level, 6 for gzip and lzma and 3 for zstd by default
+        :param threads: int, number of threads compressing the image, number of CPUs
+                        (at most 8) by default
         """
         super(CompressPlugin, self).__init__(tasker, workflow)
         self.load_exported_image = load_exported_image
         self.method = method
+        self.level = level
+        self.threads = threads
         self.uncompressed_size = 0
+        self.checksums = None
 
     def _compress_image_stream(self, stream):
+        if self.method not in METHODS:
+            raise RuntimeError('Unsupported compression format {0}'.format(self.method))
         outfile = os.path.join(self.workflow.source.workdir,
                                EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE)
-        if self.method == 'gzip':
-            outfile = outfile.format('gz')
-            fp = gzip.open(outfile, 'wb', compresslevel=6)
-        elif self.method == 'lzma':
-            outfile = outfile.format('xz')
-            fp = lzma.open(outfile, 'wb')
-        else:
-            raise RuntimeError('Unsupported compression format {0}'.format(self.method))
+        outfile = outfile.format(METHODS[self.method][0])
 
         _chunk_size = 1024**2  # 1 MB chunk size for reading/writing
         self.log.info('compressing image %s to %s using %s method',
                       self.workflow.image, outfile, self.method)
-        data = stream.read(_chunk_size)
-        while data != b'':
-            fp.write(data)
-            data = stream.read(_chunk_size)
+        # compressed image is hashed while it's written
+        with HashingWriter(outfile) as writer:
+            with get_compressor(writer, self.method, level=self.level, threads=self.threads,
+                                filename=outfile) as fp:
+                data = stream.read(_chunk_size)
+                while data != b'':
+                    fp.write(data)
+                    data = stream.read(_chunk_size)
 
-        self.uncompressed_size = stream.tell()
+        self.uncompressed_size = fp.size
+        self.checksums = writer.checksums
 
         return outfile
 
@@ -90,7 +96,7 @@ class CompressPlugin(PostBuildPlugin):
             self.log.info('fetching image %s from docker', image)
             with self.tasker.d.get_image(image) as image_stream:
                 outfile = self._compress_image_stream(image_stream)
-        metadata = get_exported_image_metadata(outfile, image_type)
+        metadata = get_exported_image_metadata(outfile, image_type, self.checksums)
 
         if self.uncompressed_size != 0:
             metadata['uncompressed_size'] = self.uncompressed_size
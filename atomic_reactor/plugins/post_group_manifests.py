@@ -20,7 +20,7 @@ from atomic_reactor.plugin import PostBuildPlugin, PluginFailedException
 from atomic_reactor.plugins.pre_reactor_config import (get_group_manifests,
                                                        get_platform_descriptors,
                                                        get_registries)
-from atomic_reactor.util import (RegistrySession, registry_hostname, ManifestDigest,
+from atomic_reactor.util import (get_registry_session, registry_hostname, ManifestDigest,
                                  get_manifest_media_type)
 from atomic_reactor.constants import (PLUGIN_GROUP_MANIFESTS_KEY, MEDIA_TYPE_DOCKER_V2_SCHEMA2,
                                       MEDIA_TYPE_DOCKER_V2_MANIFEST_LIST, MEDIA_TYPE_OCI_V1,
@@ -78,6 +78,8 @@ class GroupManifestsPlugin(PostBuildPlugin):
 
         self.registries = get_registries(self.workflow, deepcopy(registries or {}))
         self.worker_registries = {}
+        # (registry, repository, digest) of blobs already linked
+        self._linked_blobs = set()
 
     def get_manifest(self, session, repository, ref):
         """
@@ -124,15 +126,10 @@ class GroupManifestsPlugin(PostBuildPlugin):
             # we're starting an upload - but we've checked that above
             raise RuntimeError("Blob mount had unexpected status {}".format(result.status_code))
 
-    def link_manifest_references_into_repository(self, session, manifest, media_type,
-                                                 source_repo, target_repo):
+    def get_manifest_references(self, manifest, media_type):
         """
-        Links all the blobs referenced by the manifest from source_repo into target_repo.
+        Returns digests of all the blobs referenced by the manifest.
         """
-
-        if source_repo == target_repo:
-            return
-
         parsed = json.loads(manifest.decode('utf-8'))
 
         references = []
@@ -144,9 +141,58 @@ class GroupManifestsPlugin(PostBuildPlugin):
             # manifest list support could be added here, but isn't needed currently, since
             # we never copy a manifest list as a whole between repositories
             raise RuntimeError("Unhandled media-type {}".format(media_type))
+        return references
+
+    def link_blobs_into_repositories(self, session, links):
+        """
+        Links blobs concurrently, every blob is linked into a repository only once
+        (even when it's referenced by manifests of several platforms).
 
-        for digest in references:
-            self.link_blob_into_repository(session, digest, source_repo, target_repo)
+        :param links: iterable of (digest, source_repo, target_repo) tuples
+        """
+        pending = []
+        for digest, source_repo, target_repo in links:
+            key = (session.registry, target_repo, digest)
+            if source_repo == target_repo or key in self._linked_blobs:
+                continue
+            self._linked_blobs.add(key)
+            pending.append((digest, source_repo, target_repo))
+
+        self.executor.map(lambda link: self.link_blob_into_repository(session, *link), pending)
+
+    def link_manifest_references_into_repository(self, session, manifest, media_type,
+                                                 source_repo, target_repo):
+        """
+        Links all the blobs referenced by the manifest from source_repo into target_repo.
+        """
+
+        if source_repo == target_repo:
+            return
+
+        references = self.get_manifest_references(manifest, media_type)
+        self.link_blobs_into_repositories(session, [(digest, source_repo, target_repo)
+                                                    for digest in references])
+
+    def put_manifest(self, session, manifest, media_type, target_repo, ref):
+        """
+        Uploads the manifest into target_repo, under a digest or a tag; the blobs
+        it references have to be in target_repo already.
+        """
+        url = '/v2/{}/manifests/{}'.format(target_repo, ref)
+        headers = {'Content-Type': media_type}
+        response = session.put(url, data=manifest, headers=headers)
+        response.raise_for_status()
+
+    def put_manifests(self, session, uploads):
+        """
+        Uploads manifests concurrently.
+
+        :param uploads: list of (manifest, media_type, target_repo, ref) tuples
+        """
+        for _, _, target_repo, ref in uploads:
+            self.log.debug("%s: Storing manifest (or list) as %s %s",
+                           session.registry, target_repo, ref)
+        self.executor.map(lambda upload: self.put_manifest(session, *upload), uploads)
 
     def store_manifest_in_repository(self, session, manifest, media_type,
                                      source_repo, target_repo, digest=None, tag=None):
@@ -168,11 +214,7 @@ class GroupManifestsPlugin(PostBuildPlugin):
 
         self.link_manifest_references_into_repository(session, manifest, media_type,
                                                       source_repo, target_repo)
-
-        url = '/v2/{}/manifests/{}'.format(target_repo, ref)
-        headers = {'Content-Type': media_type}
-        response = session.put(url, data=manifest, headers=headers)
-        response.raise_for_status()
+        self.put_manifest(session, manifest, media_type, target_repo, ref)
 
     def build_list(self, manifests):
         """
@@ -243,19 +285,33 @@ class GroupManifestsPlugin(PostBuildPlugin):
         # Now push the manifest list to the registry once per each tag
         self.log.info("%s: Tagging manifest list", session.registry)
 
+        # Referenced manifests potentially come from different repos, their blobs
+        # and then the manifests themselves have to be copied into every target
+        # repo before the list is
+        target_repos = []
         for image in self.workflow.tag_conf.images:
             target_repo = image.to_str(registry=False, tag=False)
-            # We have to call store_manifest_in_repository directly for each
-            # referenced manifest, since they potentially come from different repos
+            if target_repo not in target_repos:
+                target_repos.append(target_repo)
+
+        links = []
+        uploads = []
+        for target_repo in target_repos:
             for manifest in manifests:
-                self.store_manifest_in_repository(session,
-                                                  manifest['content'],
-                                                  manifest['media_type'],
-                                                  manifest['repository'],
-                                                  target_repo,
-                                                  digest=manifest['digest'])
-            self.store_manifest_in_repository(session, list_json, list_type,
-                                              target_repo, target_repo, tag=image.tag)
+                if manifest['repository'] == target_repo:
+                    continue
+                references = self.get_manifest_references(manifest['content'],
+                                                          manifest['media_type'])
+                links.extend((digest, manifest['repository'], target_repo)
+                             for digest in references)
+                uploads.append((manifest['content'], manifest['media_type'], target_repo,
+                                manifest['digest']))
+        self.link_blobs_into_repositories(session, links)
+        self.put_manifests(session, uploads)
+
+        self.put_manifests(session, [(list_json, list_type,
+                                      image.to_str(registry=False, tag=False), image.tag)
+                                     for image in self.workflow.tag_conf.images])
         # Get the digest of the manifest list using one of the tags
         registry_image = self.workflow.tag_conf.unique_images[0]
         _, digest_str, _, _ = self.get_manifest(session,
@@ -297,14 +353,20 @@ class GroupManifestsPlugin(PostBuildPlugin):
 
         push_conf_registry = self.workflow.push_conf.add_docker_registry(session.registry,
                                                                          insecure=session.insecure)
+        references = self.get_manifest_references(image_manifest, media_type)
+        uploads = []
+        links = []
         for image in self.workflow.tag_conf.images:
             target_repo = image.to_str(registry=False, tag=False)
-            self.store_manifest_in_repository(session, image_manifest, media_type,
-                                              source_repo, target_repo, tag=image.tag)
+            links.extend((reference, source_repo, target_repo) for reference in references)
+            uploads.append((image_manifest, media_type, target_repo, image.tag))
 
             # add a tag for any plugins running later that expect it
             push_conf_registry.digests[image.tag] = digests
 
+        self.link_blobs_into_repositories(session, links)
+        self.put_manifests(session, uploads)
+
     def sort_annotations(self):
         """
         Return a map of maps to look up a single "worker digest" that has information
@@ -358,7 +420,8 @@ class GroupManifestsPlugin(PostBuildPlugin):
         insecure = registry_conf.get('insecure', False)
         secret_path = registry_conf.get('secret')
 
-        return RegistrySession(registry, insecure=insecure, dockercfg_path=secret_path)
+        return get_registry_session(registry, insecure=insecure, dockercfg_path=secret_path,
+                                    pool_size=self.executor.max_workers)
 
     def run(self):
         digests = dict()
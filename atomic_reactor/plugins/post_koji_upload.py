@@ -270,7 +270,11 @@ class KojiUploadPlugin(PostBuildPlugin):
         build_logs = NamedTemporaryFile(prefix="buildstep-%s" % self.build_id,
                                         suffix=".log",
                                         mode='wb')
-        build_logs.write("\n".join(self.workflow.build_result.logs).encode('utf-8'))
+        # logs may be too long to be joined in memory
+        for index, line in enumerate(self.workflow.build_result.logs):
+            if index:
+                build_logs.write(b"\n")
+            build_logs.write(line.encode('utf-8'))
         build_logs.flush()
         filename = "{platform}-build.log".format(platform=self.platform)
         return [Output(file=build_logs,
@@ -435,6 +439,9 @@ class KojiUploadPlugin(PostBuildPlugin):
 
         if not config:
             del metadata['extra']['docker']['config']
+        if self.workflow.instruction_timings:
+            metadata['extra']['docker']['instruction_timings'] = \
+                self.workflow.instruction_timings
         if not typed_digests:
             del metadata['extra']['docker']['digests']
 
@@ -28,7 +28,7 @@ from atomic_reactor.util import get_manifest_digests
 from atomic_reactor.plugins.pre_reactor_config import (get_prefer_schema1_digest,
                                                        get_platform_to_goarch_mapping)
 import requests
-from time import time, sleep
+from time import time
 
 
 class CraneTimeoutError(Exception):
@@ -109,7 +109,7 @@ class PulpPullPlugin(ExitPlugin, PostBuildPlugin):
                                         .format(self.timeout))
 
             self.log.info("not found; will try again in %ss", self.retry_delay)
-            sleep(self.retry_delay)
+            self.sleep(self.retry_delay)
 
     def run(self):
         # Only run if the build was successful
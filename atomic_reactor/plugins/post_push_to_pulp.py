@@ -107,7 +107,8 @@ class PulpPushPlugin(PostBuildPlugin):
         # Strip existing layers from the tar and repack it
         remove_layers = [str(os.path.join(x, 'layer.tar')) for x in existing_imageids]
 
-        commands = {'.xz': 'xzcat', '.gz': 'zcat', '.bz2': 'bzcat', '.tar': 'cat'}
+        commands = {'.xz': 'xzcat', '.gz': 'zcat', '.bz2': 'bzcat', '.zst': 'zstdcat',
+                    '.tar': 'cat'}
         unpacker = commands.get(file_extension, None)
         self.log.debug("using unpacker %s for extension %s", unpacker, file_extension)
         if unpacker is None:
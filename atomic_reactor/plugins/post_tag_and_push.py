@@ -6,15 +6,20 @@ This software may be modified and distributed under the terms
 of the BSD license. See the LICENSE file for details.
 """
 
+from collections import OrderedDict
 from copy import deepcopy
 import re
+import shutil
 import subprocess
+import tempfile
 
 from atomic_reactor.constants import IMAGE_TYPE_DOCKER_ARCHIVE, IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR
 from atomic_reactor.plugin import PostBuildPlugin
 from atomic_reactor.plugins.exit_remove_built_image import defer_removal
 from atomic_reactor.plugins.pre_reactor_config import get_registries
-from atomic_reactor.util import (get_manifest_digests, get_config_from_registry, Dockercfg)
+from atomic_reactor.registry_push import RegistryPusher, read_docker_archive, read_oci_layout
+from atomic_reactor.util import (get_manifest_digests, get_config_from_registry, Dockercfg,
+                                 get_registry_session, query_registry, ManifestDigest)
 
 
 __all__ = ('TagAndPushPlugin', )
@@ -28,7 +33,7 @@ class TagAndPushPlugin(PostBuildPlugin):
     key = "tag_and_push"
     is_allowed_to_fail = False
 
-    def __init__(self, tasker, workflow, registries=None):
+    def __init__(self, tasker, workflow, registries=None, native_push=False, push_once=False):
         """
         constructor
 
@@ -41,11 +46,20 @@ class TagAndPushPlugin(PostBuildPlugin):
                               plain HTTP.
                             * "secret" optional string - path to the secret, which stores
                               email, login and password for remote registry
+        :param native_push: bool, push exported image (docker-archive or OCI image layout)
+                            to registries directly rather than with docker or skopeo; image
+                            is uploaded to every repository once and other tags are added
+                            by uploading its manifest under them
+        :param push_once: bool, push image with docker or skopeo to every repository once
+                          and add other tags by uploading its manifest under them; schema 1
+                          digests are not reported for these tags
         """
         # call parent constructor
         super(TagAndPushPlugin, self).__init__(tasker, workflow)
 
         self.registries = get_registries(self.workflow, deepcopy(registries or {}))
+        self.native_push = native_push
+        self.push_once = push_once
 
     def need_skopeo_push(self):
         if len(self.workflow.exported_image_sequence) > 0:
@@ -97,12 +111,111 @@ class TagAndPushPlugin(PostBuildPlugin):
             e.cmd = log_cmd  # hide credentials
             raise
 
-    def run(self):
-        pushed_images = []
+    def get_native_push_image(self):
+        """
+        :return: dict, metadata of the most recent exported image which can be
+                 pushed natively, None if there's none
+        """
+        for image in reversed(self.workflow.exported_image_sequence):
+            if image['type'] == IMAGE_TYPE_OCI:
+                return image
+            if image['type'] == IMAGE_TYPE_DOCKER_ARCHIVE and 'uncompressed_size' not in image:
+                return image
+        return None
+
+    def push_natively(self, image, registry_images, insecure, docker_push_secret):
+        """
+        push image to every repository once, with all its tags
+
+        :param image: PushableImage
+        :param registry_images: list of ImageName, all in the same registry
+        """
+        registry = registry_images[0].registry
+        session = get_registry_session(registry, insecure=insecure,
+                                       dockercfg_path=docker_push_secret,
+                                       pool_size=self.executor.max_workers)
+        pusher = RegistryPusher(session, executor=self.executor)
+
+        repositories = OrderedDict()
+        for registry_image in registry_images:
+            repository = registry_image.to_str(registry=False, tag=False)
+            repositories.setdefault(repository, []).append(registry_image.tag)
+
+        mount_from = None
+        for repository, tags in repositories.items():
+            pusher.push(image, repository, tags, mount_from=mount_from)
+            # blobs of image are in the registry now
+            mount_from = mount_from or repository
+
+    def retag_images(self, retagged, push_conf_registry, insecure, docker_push_secret):
+        """
+        tag images already pushed to a registry by uploading their manifests
+        under other tags, concurrently
+
+        :param retagged: list of tuples (ImageName to tag, ImageName pushed to the
+                         same repository, its ManifestDigest)
+        :param push_conf_registry: DockerRegistry, image digests are added to it
+        """
+        registry = push_conf_registry.uri
+        session = get_registry_session(registry, insecure=insecure,
+                                       dockercfg_path=docker_push_secret,
+                                       pool_size=self.executor.max_workers)
+        pusher = RegistryPusher(session, executor=self.executor)
+
+        # pushed image -> (manifest, media type)
+        manifests = {}
+        for _, first_image, first_digests in retagged:
+            if first_image in manifests:
+                continue
+            version = 'oci' if first_digests.oci else 'v2'
+            response = query_registry(session, first_image, digest=first_digests[version],
+                                      version=version)
+            manifests[first_image] = (response.content, response.headers['Content-Type'])
+
+        def retag(item):
+            image, first_image, _ = item
+            manifest, media_type = manifests[first_image]
+            pusher.put_manifest(image.to_str(registry=False, tag=False), image.tag,
+                                manifest, media_type)
+
+        self.log.info("%s: tagging %d images by uploading manifests", registry, len(retagged))
+        self.executor.map(retag, retagged)
+
+        for image, _, first_digests in retagged:
+            # schema 1 manifests contain tag, registry creates a different one for every tag
+            digests = ManifestDigest((version, digest) for version, digest in first_digests.items()
+                                     if version != 'v1')
+            push_conf_registry.digests[image.to_str(registry=False)] = digests
 
+    def run(self):
         if not self.workflow.tag_conf.unique_images:
             self.workflow.tag_conf.add_unique_image(self.workflow.image)
 
+        native_image = None
+        tmpdir = None
+        if self.native_push:
+            metadata = self.get_native_push_image()
+            if metadata is None:
+                self.log.info("no exported image to push natively, pushing with docker")
+            elif metadata['type'] == IMAGE_TYPE_OCI:
+                native_image = read_oci_layout(metadata['path'], metadata.get('ref_name'))
+            else:
+                tmpdir = tempfile.mkdtemp(dir=self.workflow.source.workdir)
+                native_image = read_docker_archive(metadata['path'], tmpdir,
+                                                   executor=self.executor)
+
+        try:
+            return self.tag_and_push(native_image)
+        finally:
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir)
+
+    def tag_and_push(self, native_image=None):
+        """
+        :param native_image: PushableImage, pushed instead of the built image when set
+        :return: list of ImageName, pushed images
+        """
+        pushed_images = []
         config_manifest_digest = None
         config_manifest_type = None
         config_registry_image = None
@@ -114,24 +227,46 @@ class TagAndPushPlugin(PostBuildPlugin):
             docker_push_secret = registry_conf.get('secret', None)
             self.log.info("Registry %s secret %s", registry, docker_push_secret)
 
+            registry_images = []
             for image in self.workflow.tag_conf.images:
                 if image.registry:
                     raise RuntimeError("Image name must not contain registry: %r" % image.registry)
 
                 registry_image = image.copy()
                 registry_image.registry = registry
-                if self.need_skopeo_push():
-                    self.push_with_skopeo(registry_image, insecure, docker_push_secret)
-                else:
-                    self.tasker.tag_and_push_image(self.workflow.builder.image_id,
-                                                   registry_image, insecure=insecure,
-                                                   force=True, dockercfg=docker_push_secret)
-                    defer_removal(self.workflow, registry_image)
+                registry_images.append(registry_image)
+
+            if native_image is not None and registry_images:
+                self.push_natively(native_image, registry_images, insecure, docker_push_secret)
+
+            # repository -> image pushed there first
+            first_images = {}
+            # images tagged by uploading manifest of first image of their repository
+            retagged = []
+            for registry_image in registry_images:
+                repository = registry_image.to_str(registry=False, tag=False)
+                first_image = first_images.setdefault(repository, registry_image)
+                if self.push_once and native_image is None and first_image is not registry_image:
+                    first_digests = push_conf_registry.digests[first_image.to_str(registry=False)]
+                    if first_digests.v2 or first_digests.oci:
+                        retagged.append((registry_image, first_image, first_digests))
+                        pushed_images.append(registry_image)
+                        continue
+
+                if native_image is None:
+                    if self.need_skopeo_push():
+                        self.push_with_skopeo(registry_image, insecure, docker_push_secret)
+                    else:
+                        self.tasker.tag_and_push_image(self.workflow.builder.image_id,
+                                                       registry_image, insecure=insecure,
+                                                       force=True, dockercfg=docker_push_secret)
+                        defer_removal(self.workflow, registry_image)
 
                 pushed_images.append(registry_image)
 
                 digests = get_manifest_digests(registry_image, registry,
-                                               insecure, docker_push_secret)
+                                               insecure, docker_push_secret,
+                                               use_head=True, executor=self.executor)
                 tag = registry_image.to_str(registry=False)
                 push_conf_registry.digests[tag] = digests
 
@@ -144,6 +279,9 @@ class TagAndPushPlugin(PostBuildPlugin):
                         config_manifest_type = 'oci'
                     config_registry_image = registry_image
 
+            if retagged:
+                self.retag_images(retagged, push_conf_registry, insecure, docker_push_secret)
+
             if config_manifest_digest:
                 push_conf_registry.config = get_config_from_registry(
                     config_registry_image, registry, config_manifest_digest, insecure,
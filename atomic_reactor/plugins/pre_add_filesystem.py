@@ -28,7 +28,8 @@ import os
 
 from atomic_reactor.constants import (DEFAULT_DOWNLOAD_BLOCK_SIZE, PLUGIN_ADD_FILESYSTEM_KEY,
                                       PLUGIN_CHECK_AND_SET_PLATFORMS_KEY)
-from atomic_reactor.plugin import PreBuildPlugin, BuildCanceledException
+from atomic_reactor.plugin import (PreBuildPlugin, BuildCanceledException,
+                                   PluginTimeoutException)
 from atomic_reactor.plugins.exit_remove_built_image import defer_removal
 from atomic_reactor.plugins.pre_reactor_config import get_koji_session
 from atomic_reactor.koji_util import TaskWatcher, stream_task_output
@@ -303,10 +304,11 @@ class AddFilesystemPlugin(PreBuildPlugin):
         task_id, filesystem_regex = self.build_filesystem(image_build_conf)
 
         try:
-            task = TaskWatcher(self.session, task_id, self.poll_interval)
+            # waiting stops once plugin is canceled
+            task = TaskWatcher(self.session, task_id, self.poll_interval, sleep=self.sleep)
             task.wait()
-        except BuildCanceledException:
-            self.log.info("Build was canceled, canceling task %s", task_id)
+        except (BuildCanceledException, PluginTimeoutException) as ex:
+            self.log.info("%r, canceling task %s", ex, task_id)
             try:
                 self.session.cancelTask(task_id)
                 self.log.info('task %s canceled', task_id)
@@ -8,10 +8,10 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import unicode_literals
 
-from atomic_reactor.plugin import PreBuildPlugin
+from atomic_reactor.plugin import PreBuildPlugin, RESOURCE_DOCKERFILE, workspace_resource
 from atomic_reactor.util import df_parser
 from osbs.utils import Labels
-from atomic_reactor.plugins.pre_reactor_config import get_koji_session
+from atomic_reactor.plugins.pre_reactor_config import ReactorConfigPlugin, get_koji_session
 
 
 class BumpReleasePlugin(PreBuildPlugin):
@@ -22,6 +22,10 @@ class BumpReleasePlugin(PreBuildPlugin):
 
     key = "bump_release"
     is_allowed_to_fail = False  # We really want to stop the process
+    reads = (RESOURCE_DOCKERFILE, workspace_resource(ReactorConfigPlugin.key))
+    writes = (RESOURCE_DOCKERFILE, )
+    # release wasn't used if the build failed, it's fine to use it again
+    resumable = True
 
     # The target parameter is no longer used by this plugin. It's
     # left as an optional parameter to allow a graceful transition
@@ -14,8 +14,8 @@ import os
 
 from atomic_reactor import util
 from atomic_reactor.constants import DEFAULT_DOWNLOAD_BLOCK_SIZE
-from atomic_reactor.plugin import PreBuildPlugin
-from atomic_reactor.plugins.pre_reactor_config import (get_koji_session,
+from atomic_reactor.plugin import PreBuildPlugin, RESOURCE_SOURCE, workspace_resource
+from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin, get_koji_session,
                                                        get_koji_path_info,
                                                        get_artifacts_allowed_domains)
 from collections import namedtuple
@@ -69,6 +69,9 @@ class FetchMavenArtifactsPlugin(PreBuildPlugin):
 
     key = 'fetch_maven_artifacts'
     is_allowed_to_fail = False
+    reads = (RESOURCE_SOURCE, workspace_resource(ReactorConfigPlugin.key))
+    # downloads go to DOWNLOAD_DIR which is only used by the build step
+    writes = ()
 
     NVR_REQUESTS_FILENAME = 'fetch-artifacts-koji.yaml'
     URL_REQUESTS_FILENAME = 'fetch-artifacts-url.yaml'
@@ -8,9 +8,9 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import print_function, unicode_literals
 
 from atomic_reactor.constants import INSPECT_CONFIG
-from atomic_reactor.plugin import PreBuildPlugin
+from atomic_reactor.plugin import PreBuildPlugin, RESOURCE_BUILDER, workspace_resource
 from atomic_reactor.constants import PLUGIN_KOJI_PARENT_KEY
-from atomic_reactor.plugins.pre_reactor_config import get_koji_session
+from atomic_reactor.plugins.pre_reactor_config import ReactorConfigPlugin, get_koji_session
 from osbs.utils import Labels
 
 import time
@@ -38,6 +38,9 @@ class KojiParentPlugin(PreBuildPlugin):
 
     key = PLUGIN_KOJI_PARENT_KEY
     is_allowed_to_fail = False
+    reads = (RESOURCE_BUILDER, workspace_resource(ReactorConfigPlugin.key))
+    writes = ()
+    resumable = True
 
     def __init__(self, tasker, workflow, koji_hub=None, koji_ssl_certs_dir=None,
                  poll_interval=DEFAULT_POLL_INTERVAL, poll_timeout=DEFAULT_POLL_TIMEOUT):
@@ -103,7 +106,7 @@ class KojiParentPlugin(PreBuildPlugin):
             if self.has_parent_image_build():
                 self.log.info('Parent image Koji build found')
                 break
-            time.sleep(self.poll_interval)
+            self.sleep(self.poll_interval)
 
     def start_polling_timer(self):
         self._poll_start = time.time()
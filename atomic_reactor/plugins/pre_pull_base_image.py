@@ -13,13 +13,14 @@ from __future__ import unicode_literals
 
 import docker
 
-from atomic_reactor.plugin import PreBuildPlugin
+from atomic_reactor.plugin import (PreBuildPlugin, RESOURCE_BUILDER, results_resource,
+                                   workspace_resource)
 from atomic_reactor.util import (get_build_json, get_manifest_list,
                                  get_config_from_registry, ImageName)
 from atomic_reactor.constants import (PLUGIN_BUILD_ORCHESTRATE_KEY,
                                       PLUGIN_CHECK_AND_SET_PLATFORMS_KEY)
 from atomic_reactor.core import RetryGeneratorException
-from atomic_reactor.plugins.pre_reactor_config import (get_source_registry,
+from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin, get_source_registry,
                                                        get_platform_to_goarch_mapping)
 from requests.exceptions import HTTPError, RetryError, Timeout
 from osbs.utils import RegistryURI
@@ -28,6 +29,10 @@ from osbs.utils import RegistryURI
 class PullBaseImagePlugin(PreBuildPlugin):
     key = "pull_base_image"
     is_allowed_to_fail = False
+    reads = (RESOURCE_BUILDER,
+             results_resource(PLUGIN_CHECK_AND_SET_PLATFORMS_KEY),
+             workspace_resource(ReactorConfigPlugin.key))
+    writes = (RESOURCE_BUILDER, )
 
     def __init__(self, tasker, workflow, parent_registry=None, parent_registry_insecure=False,
                  check_platforms=False):
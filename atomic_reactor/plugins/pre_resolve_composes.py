@@ -16,10 +16,12 @@ from atomic_reactor.constants import (PLUGIN_KOJI_PARENT_KEY, PLUGIN_RESOLVE_COM
                                       REPO_CONTENT_SETS_CONFIG, PLUGIN_BUILD_ORCHESTRATE_KEY,
                                       PLUGIN_CHECK_AND_SET_PLATFORMS_KEY)
 
-from atomic_reactor.plugin import PreBuildPlugin
+from atomic_reactor.plugin import (PreBuildPlugin, RESOURCE_SOURCE, results_resource,
+                                   workspace_resource)
 from atomic_reactor.plugins.build_orchestrate_build import override_build_kwarg
-from atomic_reactor.plugins.pre_check_and_set_rebuild import is_rebuild
-from atomic_reactor.plugins.pre_reactor_config import (get_config,
+from atomic_reactor.plugins.pre_check_and_set_rebuild import (CheckAndSetRebuildPlugin,
+                                                              is_rebuild)
+from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin, get_config,
                                                        get_odcs_session,
                                                        get_koji_session, get_koji)
 
@@ -27,6 +29,22 @@ ODCS_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 MINIMUM_TIME_TO_EXPIRE = timedelta(hours=2).total_seconds()
 
 
+def needs_renewal(compose_info, minimum_time_to_expire):
+    """
+    :param compose_info: dict, ODCS compose
+    :param minimum_time_to_expire: int, seconds compose has to be available for
+    :return: bool, whether compose is removed or expires too soon
+    """
+    if compose_info['state_name'] == 'removed':
+        return True
+
+    time_to_expire = datetime.strptime(compose_info['time_to_expire'],
+                                       ODCS_DATETIME_FORMAT)
+    now = datetime.utcnow()
+    seconds_left = (time_to_expire - now).total_seconds()
+    return seconds_left <= minimum_time_to_expire
+
+
 class ResolveComposesPlugin(PreBuildPlugin):
     """Request a new, or use existing, ODCS compose
 
@@ -36,6 +54,15 @@ class ResolveComposesPlugin(PreBuildPlugin):
 
     key = PLUGIN_RESOLVE_COMPOSES_KEY
     is_allowed_to_fail = False
+    reads = (RESOURCE_SOURCE,
+             results_resource(CheckAndSetRebuildPlugin.key),
+             results_resource(PLUGIN_CHECK_AND_SET_PLATFORMS_KEY),
+             results_resource(PLUGIN_KOJI_PARENT_KEY),
+             workspace_resource(ReactorConfigPlugin.key))
+    # composes are forwarded to worker builds through build kwargs overrides
+    writes = (workspace_resource(PLUGIN_BUILD_ORCHESTRATE_KEY), )
+    # composes are kept around for a while, no need to wait for them again
+    resumable = True
 
     def __init__(self, tasker, workflow,
                  odcs_url=None,
@@ -218,28 +245,37 @@ class ResolveComposesPlugin(PreBuildPlugin):
 
     def wait_for_composes(self):
         self.log.debug('Waiting for ODCS composes to be available: %s', self.compose_ids)
-        self.composes_info = []
-        for compose_id in self.compose_ids:
-            compose_info = self.odcs_client.wait_for_compose(compose_id)
+        # client is created lazily, create it before the threads race to do so
+        odcs_client = self.odcs_client
+        # composes are generated in parallel, wait for all of them at once
+        self.composes_info = self.executor.map(
+            lambda compose_id: self._wait_for_compose(odcs_client, compose_id),
+            self.compose_ids)
+        self.compose_ids = [item['id'] for item in self.composes_info]
 
-            if self._needs_renewal(compose_info):
-                compose_info = self.odcs_client.renew_compose(compose_id)
-                compose_id = compose_info['id']
-                compose_info = self.odcs_client.wait_for_compose(compose_id)
+    def _wait_for_compose(self, odcs_client, compose_id):
+        compose_info = odcs_client.wait_for_compose(compose_id)
 
-            self.composes_info.append(compose_info)
+        if self._needs_renewal(compose_info):
+            compose_info = odcs_client.renew_compose(compose_id)
+            compose_id = compose_info['id']
+            compose_info = odcs_client.wait_for_compose(compose_id)
 
-        self.compose_ids = [item['id'] for item in self.composes_info]
+        return compose_info
 
     def _needs_renewal(self, compose_info):
-        if compose_info['state_name'] == 'removed':
-            return True
+        return needs_renewal(compose_info, self.minimum_time_to_expire)
 
-        time_to_expire = datetime.strptime(compose_info['time_to_expire'],
-                                           ODCS_DATETIME_FORMAT)
-        now = datetime.utcnow()
-        seconds_left = (time_to_expire - now).total_seconds()
-        return seconds_left <= self.minimum_time_to_expire
+    @classmethod
+    def can_resume(cls, result, plugin_conf):
+        # composes are only ever renewed, time to expire from the checkpoint
+        # is the earliest they may be gone
+        if not result:
+            return True
+        minimum_time_to_expire = plugin_conf.get('minimum_time_to_expire',
+                                                 MINIMUM_TIME_TO_EXPIRE)
+        return not any(needs_renewal(compose_info, minimum_time_to_expire)
+                       for compose_info in result['composes'])
 
     def resolve_signing_intent(self):
         """Determine the correct signing intent
@@ -23,7 +23,7 @@ from atomic_reactor.constants import IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR
 from atomic_reactor.plugin import PrePublishPlugin
 from atomic_reactor.plugins.pre_flatpak_create_dockerfile import get_flatpak_source_info
 from atomic_reactor.rpm_util import parse_rpm_output
-from atomic_reactor.util import get_exported_image_metadata
+from atomic_reactor.util import get_exported_image_metadata, HashingWriter
 
 
 # Returns flatpak's name for the current arch
@@ -419,11 +419,13 @@ class FlatpakCreateOciPlugin(PrePublishPlugin):
         self.log.info('OCI image is available as %s', outfile)
 
         tarred_outfile = outfile + '.tar'
-        with tarfile.TarFile(tarred_outfile, "w") as tf:
-            for f in os.listdir(outfile):
-                tf.add(os.path.join(outfile, f), f)
+        with HashingWriter(tarred_outfile) as writer:
+            with tarfile.TarFile(fileobj=writer, mode="w") as tf:
+                for f in os.listdir(outfile):
+                    tf.add(os.path.join(outfile, f), f)
 
-        metadata = get_exported_image_metadata(tarred_outfile, IMAGE_TYPE_OCI_TAR)
+        metadata = get_exported_image_metadata(tarred_outfile, IMAGE_TYPE_OCI_TAR,
+                                               writer.checksums)
         metadata['ref_name'] = ref_name
         self.workflow.exported_image_sequence.append(metadata)
 
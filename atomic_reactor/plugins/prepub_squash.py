@@ -105,6 +105,8 @@ class PrePublishSquashPlugin(PrePublishPlugin):
 
         if not self.dont_load:
             self.workflow.builder.image_id = new_id
+            # loading may have moved tags of any image
+            self.tasker.image_catalog.invalidate()
 
         if self.save_archive:
             metadata.update(get_exported_image_metadata(output_path, IMAGE_TYPE_DOCKER_ARCHIVE))
@@ -0,0 +1,220 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+resource usage profiling of plugins
+
+All the numbers, except the pstats dump, are measured for the whole process:
+when plugins run concurrently (see max_plugin_workers), each of them is
+attributed also what the others did in the meantime.
+"""
+
+from __future__ import absolute_import
+
+import cProfile
+import logging
+import threading
+
+import docker
+import requests
+
+try:
+    import resource
+except ImportError:
+    # not available on this platform
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+logger = logging.getLogger(__name__)
+
+PROC_IO_PATH = '/proc/self/io'
+# number of allocation sites reported
+TOP_ALLOCATIONS = 10
+
+_lock = threading.Lock()
+_call_counts = {'http': 0, 'docker': 0}
+_original_send = None
+_tracemalloc_users = 0
+# whether tracemalloc was started here, so it should be stopped here
+_tracemalloc_started = False
+
+if hasattr(docker, 'APIClient'):
+    _docker_client_class = docker.APIClient
+else:
+    _docker_client_class = docker.Client
+
+
+def _counting_send(session, *args, **kwargs):
+    kind = 'docker' if isinstance(session, _docker_client_class) else 'http'
+    with _lock:
+        _call_counts[kind] += 1
+    return _original_send(session, *args, **kwargs)
+
+
+def install_call_counters():
+    """
+    start counting HTTP requests made through requests sessions,
+    requests of docker API client are counted separately
+    """
+    global _original_send
+    with _lock:
+        if _original_send is None:
+            _original_send = requests.Session.send
+            requests.Session.send = _counting_send
+
+
+def get_call_counts():
+    """
+    :return: dict, number of calls made so far, 'http' and 'docker' keys
+    """
+    with _lock:
+        return dict(_call_counts)
+
+
+def read_proc_io(path=PROC_IO_PATH):
+    """
+    read I/O statistics of this process
+
+    :return: dict, e.g. {'rchar': 123, 'read_bytes': 4096, ...}, empty if not available
+    """
+    stats = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                try:
+                    stats[key.strip()] = int(value)
+                except ValueError:
+                    continue
+    except (IOError, OSError) as ex:
+        logger.debug("can't read %s: %r", path, ex)
+    return stats
+
+
+def _get_rusage():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF)
+
+
+class PluginProfiler(object):
+    """
+    Measure resources used while a plugin runs
+
+    Usage:
+
+        profiler = PluginProfiler()
+        profiler.start()
+        ...
+        profiler.stop()
+        summary = profiler.get_summary()
+    """
+
+    def __init__(self, pstats_path=None, trace_allocations=True):
+        """
+        :param pstats_path: str, dump cProfile statistics into this file
+        :param trace_allocations: bool, find out where memory was allocated
+                                  using tracemalloc (python 3 only)
+        """
+        self.pstats_path = pstats_path
+        self.trace_allocations = trace_allocations and tracemalloc is not None
+        self._profile = None
+        self._start = {}
+        self._summary = None
+        self._snapshot = None
+
+    def start(self):
+        global _tracemalloc_users, _tracemalloc_started
+        install_call_counters()
+
+        if self.trace_allocations:
+            with _lock:
+                if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracemalloc_started = True
+                _tracemalloc_users += 1
+            self._snapshot = tracemalloc.take_snapshot()
+
+        self._start = {
+            'rusage': _get_rusage(),
+            'io': read_proc_io(),
+            'calls': get_call_counts(),
+        }
+
+        if self.pstats_path:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        global _tracemalloc_users, _tracemalloc_started
+        if self._profile is not None:
+            self._profile.disable()
+
+        rusage = _get_rusage()
+        io = read_proc_io()
+        calls = get_call_counts()
+
+        summary = {
+            'http_calls': calls['http'] - self._start['calls']['http'],
+            'docker_api_calls': calls['docker'] - self._start['calls']['docker'],
+        }
+
+        start_rusage = self._start['rusage']
+        if rusage is not None and start_rusage is not None:
+            summary['cpu_user'] = rusage.ru_utime - start_rusage.ru_utime
+            summary['cpu_system'] = rusage.ru_stime - start_rusage.ru_stime
+            # kilobytes on linux
+            summary['max_rss_delta'] = rusage.ru_maxrss - start_rusage.ru_maxrss
+
+        start_io = self._start['io']
+        summary['io'] = {key: value - start_io[key]
+                         for key, value in io.items() if key in start_io}
+
+        if self._snapshot is not None:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ])
+            with _lock:
+                _tracemalloc_users -= 1
+                if _tracemalloc_users == 0 and _tracemalloc_started:
+                    tracemalloc.stop()
+                    _tracemalloc_started = False
+
+            stats = snapshot.compare_to(self._snapshot, 'lineno')
+            stats = [stat for stat in stats if stat.size_diff > 0]
+            stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+            summary['top_allocations'] = [
+                {
+                    'location': '%s:%s' % (stat.traceback[0].filename,
+                                           stat.traceback[0].lineno),
+                    'size': stat.size_diff,
+                    'count': stat.count_diff,
+                }
+                for stat in stats[:TOP_ALLOCATIONS]
+            ]
+            self._snapshot = None
+
+        if self._profile is not None:
+            try:
+                self._profile.dump_stats(self.pstats_path)
+                summary['pstats'] = self.pstats_path
+            except (IOError, OSError) as ex:
+                logger.warning("can't write profile to %s: %r", self.pstats_path, ex)
+            self._profile = None
+
+        self._summary = summary
+
+    def get_summary(self):
+        """
+        :return: dict, resources used by plugin, None if not stopped yet
+        """
+        return self._summary
@@ -13,6 +13,8 @@ import re
 import warnings
 from collections import namedtuple
 
+from atomic_reactor.tracing import traced_methods, SPAN_PULP
+
 try:
     import dockpulp
 
@@ -43,6 +45,7 @@ class PulpLogWrapper(object):
 PulpLog = PulpLogWrapper()
 
 
+@traced_methods(SPAN_PULP)
 class PulpHandler(object):
     CER = 'pulp.cer'
     KEY = 'pulp.key'
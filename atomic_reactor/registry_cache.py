@@ -0,0 +1,206 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+content-addressed cache of registry objects
+
+Manifests and blobs referenced by digest never change, so once fetched they
+can be kept on disk and shared by all builds running on the host. Every
+entry is a file named by its digest, holding media type on the first line
+followed by the content; content is verified against the digest both when
+stored and when read. Files are written atomically (rename), reading one
+refreshes its mtime and the least recently used ones are removed once the
+cache grows over its size limit, so concurrent builds may share the
+directory without locking. Size of the cache is only estimated from what
+this process stored, the directory is walked when the estimate exceeds
+the limit.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_CACHE_SIZE = 512 * 1024 ** 2  # bytes
+DIGEST_RE = re.compile(r'^(sha256|sha384|sha512):([0-9a-f]{64,128})$')
+TMP_PREFIX = '.tmp-'
+ENTRY_MODE = 0o644
+# cache is shrunk to this fraction of its size limit, so that it isn't
+# walked again by the next put()
+EVICT_TO = 0.9
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError as ex:
+        # another build may have removed it already
+        if ex.errno != errno.ENOENT:
+            raise
+
+
+class RegistryCache(object):
+    """
+    Directory of registry objects (manifests, config blobs) keyed by digest
+    """
+
+    def __init__(self, path, max_size=DEFAULT_REGISTRY_CACHE_SIZE):
+        """
+        :param path: str, cache directory, created if it doesn't exist
+        :param max_size: int, bytes the cache may take before least recently
+                         used entries are removed
+        """
+        self.path = path
+        self.max_size = max_size
+        # estimated bytes taken by entries, None until cache is walked
+        self._size = None
+        self._size_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_path(self, digest):
+        """
+        :return: (path of entry, hashlib object) or (None, None) if digest isn't supported
+        """
+        match = DIGEST_RE.match(digest or '')
+        if not match:
+            return None, None
+        algorithm, hexdigest = match.groups()
+        return (os.path.join(self.path, algorithm, hexdigest[:2], hexdigest),
+                hashlib.new(algorithm))
+
+    @staticmethod
+    def _matches(digest, hasher, content):
+        hasher.update(content)
+        return digest.split(':', 1)[1] == hasher.hexdigest()
+
+    def get(self, digest):
+        """
+        :param digest: str, e.g. 'sha256:...'
+        :return: tuple (bytes content, str media type), None if not cached
+        """
+        path, hasher = self._get_path(digest)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError) as ex:
+            if ex.errno != errno.ENOENT:
+                logger.warning("failed to read %s from registry cache: %r", digest, ex)
+            self.misses += 1
+            return None
+
+        media_type, _, content = data.partition(b'\n')
+        if not self._matches(digest, hasher, content):
+            logger.warning("cached content of %s doesn't match its digest, removing it", digest)
+            _remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            # most recently used entries are evicted last
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        logger.debug("registry cache hit for %s", digest)
+        return content, media_type.decode('utf-8')
+
+    def put(self, digest, content, media_type):
+        """
+        :param digest: str, e.g. 'sha256:...'
+        :param content: bytes
+        :param media_type: str, Content-Type of object
+        :return: bool, whether content was stored
+        """
+        path, hasher = self._get_path(digest)
+        if path is None or not self._matches(digest, hasher, content):
+            # e.g. signed schema 1 manifests
+            logger.debug("not caching %s, content doesn't match digest", digest)
+            return False
+
+        dirname = os.path.dirname(path)
+        try:
+            os.makedirs(dirname)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        header = (media_type or '').encode('utf-8') + b'\n'
+        f = tempfile.NamedTemporaryFile(dir=dirname, prefix=TMP_PREFIX, delete=False)
+        try:
+            with f:
+                f.write(header)
+                f.write(content)
+            # temporary files are private, entries are read by other builds
+            os.chmod(f.name, ENTRY_MODE)
+            os.rename(f.name, path)
+        except Exception:
+            _remove(f.name)
+            raise
+
+        with self._size_lock:
+            if self._size is not None:
+                self._size += len(header) + len(content)
+            full = self._size is None or self._size > self.max_size
+        if full:
+            self.evict()
+        return True
+
+    def evict(self):
+        """
+        walk the cache and if it doesn't fit in max_size, remove least
+        recently used entries until it takes EVICT_TO of max_size
+        """
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if filename.startswith(TMP_PREFIX):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.max_size:
+            for _, size, path in sorted(entries):
+                logger.debug("removing %s from registry cache", path)
+                _remove(path)
+                total -= size
+                if total <= self.max_size * EVICT_TO:
+                    break
+        with self._size_lock:
+            self._size = total
+
+
+_registry_cache = None
+
+
+def set_registry_cache(cache):
+    """
+    :param cache: RegistryCache used for registry queries by digest, None to disable
+    """
+    global _registry_cache
+    _registry_cache = cache
+
+
+def get_registry_cache():
+    """
+    :return: RegistryCache, None if registry objects aren't cached
+    """
+    return _registry_cache
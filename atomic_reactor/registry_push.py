@@ -0,0 +1,308 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+native push of exported images to registries
+
+Pushing through docker or skopeo uploads the whole image again for every
+tag, one layer after another. RegistryPusher talks Docker Registry HTTP API
+V2 directly instead: existence of all blobs is checked at once, only the
+missing ones are uploaded, in parallel and in chunks (or mounted from
+another repository of the registry), the manifest is uploaded once and
+all the other tags are added by uploading the same manifest under them.
+
+Images are read from `docker save` output (read_docker_archive, layers get
+compressed while preparing the push) or from OCI image layout
+(read_oci_layout).
+"""
+
+from __future__ import absolute_import
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tarfile
+from collections import namedtuple, OrderedDict
+
+from six.moves.urllib.parse import urlencode, urljoin, urlparse
+
+from atomic_reactor.concurrency import get_default_executor
+from atomic_reactor.constants import (MEDIA_TYPE_DOCKER_V2_SCHEMA2, MEDIA_TYPE_DOCKER_V2_CONFIG,
+                                      MEDIA_TYPE_DOCKER_V2_LAYER_GZIP)
+from atomic_reactor.util import HashingWriter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 ** 2  # bytes
+OCI_REF_NAME_ANNOTATION = 'org.opencontainers.image.ref.name'
+
+# digest: str, e.g. 'sha256:...'
+# size: int, bytes
+# path, offset: str, int, file containing the blob and where in it the blob starts
+Blob = namedtuple('Blob', ['digest', 'size', 'media_type', 'path', 'offset'])
+
+# manifest: bytes, exactly as it's going to be uploaded
+# blobs: list of Blob, config and layers referenced by manifest
+PushableImage = namedtuple('PushableImage', ['manifest', 'media_type', 'blobs'])
+
+
+def _compress_layer(archive_path, member, output_path):
+    """
+    gzip layer tarball from docker-archive
+
+    :return: Blob, compressed layer
+    """
+    with open(archive_path, 'rb') as archive, \
+            HashingWriter(output_path, algorithms=['sha256']) as writer:
+        archive.seek(member.offset_data)
+        # no file name and no time in gzip header, so that digest of layer
+        # depends on its content only
+        with gzip.GzipFile(filename='', mode='wb', fileobj=writer,
+                           compresslevel=6, mtime=0) as compressed:
+            remaining = member.size
+            while remaining:
+                data = archive.read(min(remaining, 1024 ** 2))
+                if not data:
+                    raise RuntimeError("docker-archive {} is truncated".format(archive_path))
+                compressed.write(data)
+                remaining -= len(data)
+
+    digest = 'sha256:' + writer.hexdigest('sha256')
+    logger.debug("compressed layer %s to %s (%d bytes)", member.name, digest, writer.size)
+    return Blob(digest, writer.size, MEDIA_TYPE_DOCKER_V2_LAYER_GZIP, output_path, 0)
+
+
+def read_docker_archive(path, tmpdir, executor=None):
+    """
+    prepare image saved by `docker save` for push, its layers are
+    compressed (concurrently) into tmpdir
+
+    :param path: str, uncompressed docker-archive
+    :param tmpdir: str, directory for compressed layers, caller removes it
+    :param executor: AsyncExecutor, defaults to the process-wide one
+    :return: PushableImage with schema 2 manifest
+    """
+    executor = executor or get_default_executor()
+    try:
+        tar = tarfile.open(path, 'r:')
+    except tarfile.ReadError:
+        raise RuntimeError("{} is not an uncompressed docker-archive".format(path))
+    with tar:
+        members = {member.name: member for member in tar.getmembers()}
+        archive_manifest = json.loads(tar.extractfile('manifest.json').read().decode('utf-8'))
+
+    if len(archive_manifest) != 1:
+        raise RuntimeError("docker-archive {} contains {} images, expected one"
+                           .format(path, len(archive_manifest)))
+    archive_manifest = archive_manifest[0]
+
+    config_member = members[archive_manifest['Config']]
+    with open(path, 'rb') as archive:
+        archive.seek(config_member.offset_data)
+        config_digest = 'sha256:' + hashlib.sha256(archive.read(config_member.size)).hexdigest()
+    config = Blob(config_digest, config_member.size, MEDIA_TYPE_DOCKER_V2_CONFIG,
+                  path, config_member.offset_data)
+
+    # the same layer may be listed more than once
+    layer_names = list(OrderedDict.fromkeys(archive_manifest['Layers']))
+    compressed = executor.map(
+        lambda index: _compress_layer(path, members[layer_names[index]],
+                                      os.path.join(tmpdir, 'layer-{}.tar.gz'.format(index))),
+        range(len(layer_names)))
+    layers = dict(zip(layer_names, compressed))
+
+    manifest = {
+        'schemaVersion': 2,
+        'mediaType': MEDIA_TYPE_DOCKER_V2_SCHEMA2,
+        'config': {
+            'mediaType': config.media_type,
+            'size': config.size,
+            'digest': config.digest,
+        },
+        'layers': [{
+            'mediaType': layers[name].media_type,
+            'size': layers[name].size,
+            'digest': layers[name].digest,
+        } for name in archive_manifest['Layers']],
+    }
+    manifest = json.dumps(manifest, indent=3, sort_keys=True).encode('utf-8')
+    return PushableImage(manifest, MEDIA_TYPE_DOCKER_V2_SCHEMA2, [config] + list(compressed))
+
+
+def read_oci_layout(path, ref_name=None):
+    """
+    prepare image in OCI image layout for push
+
+    :param path: str, OCI image layout directory
+    :param ref_name: str, reference name of image in layout, may be None if
+                     layout contains only one image
+    :return: PushableImage with manifest from the layout
+    """
+    def get_blob_path(digest):
+        algorithm, hexdigest = digest.split(':', 1)
+        return os.path.join(path, 'blobs', algorithm, hexdigest)
+
+    with open(os.path.join(path, 'index.json')) as f:
+        index = json.load(f)
+
+    descriptors = index.get('manifests', [])
+    if ref_name is not None:
+        descriptors = [d for d in descriptors
+                       if d.get('annotations', {}).get(OCI_REF_NAME_ANNOTATION) == ref_name]
+    if len(descriptors) != 1:
+        raise RuntimeError("OCI image layout {} doesn't contain exactly one image {}"
+                           .format(path, ref_name or ''))
+    descriptor = descriptors[0]
+
+    with open(get_blob_path(descriptor['digest']), 'rb') as f:
+        manifest = f.read()
+    parsed = json.loads(manifest.decode('utf-8'))
+
+    blobs = []
+    for blob in [parsed['config']] + parsed['layers']:
+        if blob.get('urls'):
+            # non-distributable layer, not uploaded to registries
+            continue
+        blobs.append(Blob(blob['digest'], blob['size'], blob['mediaType'],
+                          get_blob_path(blob['digest']), 0))
+
+    return PushableImage(manifest, descriptor['mediaType'], blobs)
+
+
+class RegistryPusher(object):
+    """
+    Push of images to a registry
+
+    Usage:
+
+        pusher = RegistryPusher(get_registry_session(registry))
+        image = read_oci_layout(path, ref_name)
+        digest = pusher.push(image, 'namespace/repo', ['latest', '1.0'])
+    """
+
+    def __init__(self, session, executor=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param session: RegistrySession
+        :param executor: AsyncExecutor for uploads, defaults to the process-wide one
+        :param chunk_size: int, bytes of blob uploaded by one request
+        """
+        self.session = session
+        self.executor = executor or get_default_executor()
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _get_upload_url(url, location):
+        """
+        :param url: str, URL of request which returned location
+        :param location: str, Location header, absolute or relative to url
+        :return: str, absolute URL or URL relative to registry
+        """
+        if urlparse(location).scheme:
+            # may point to another host, e.g. storage of registry
+            return location
+        return urljoin(url, location)
+
+    def blob_exists(self, repository, digest):
+        """
+        :return: bool, whether repository contains the blob
+        """
+        url = '/v2/{}/blobs/{}'.format(repository, digest)
+        response = self.session.head(url)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def upload_blob(self, repository, blob, mount_from=None):
+        """
+        upload blob into repository, mount it from another repository if possible
+
+        :param repository: str
+        :param blob: Blob
+        :param mount_from: str, repository of the same registry which may contain the blob
+        """
+        url = '/v2/{}/blobs/uploads/'.format(repository)
+        if mount_from and mount_from != repository:
+            url += '?' + urlencode([('mount', blob.digest), ('from', mount_from)])
+        response = self.session.post(url)
+        if response.status_code == 201:
+            logger.debug("%s: mounted blob %s from %s into %s", self.session.registry,
+                         blob.digest, mount_from, repository)
+            return
+        response.raise_for_status()
+        if response.status_code != 202:
+            raise RuntimeError("Unable to start upload of blob {} into {}: {}"
+                               .format(blob.digest, repository, response.status_code))
+
+        logger.debug("%s: uploading blob %s (%d bytes) into %s", self.session.registry,
+                     blob.digest, blob.size, repository)
+        location = self._get_upload_url(url, response.headers['Location'])
+        with open(blob.path, 'rb') as f:
+            f.seek(blob.offset)
+            start = 0
+            data = f.read(min(blob.size, self.chunk_size))
+            while start + len(data) < blob.size:
+                headers = {
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Range': '{}-{}'.format(start, start + len(data) - 1),
+                }
+                response = self.session.patch(location, data=data, headers=headers)
+                response.raise_for_status()
+                location = self._get_upload_url(location, response.headers['Location'])
+                start += len(data)
+                data = f.read(min(blob.size - start, self.chunk_size))
+                if not data:
+                    raise RuntimeError("{} is truncated, can't upload blob {}"
+                                       .format(blob.path, blob.digest))
+
+        # last chunk completes upload
+        location += ('&' if '?' in location else '?') + urlencode([('digest', blob.digest)])
+        headers = {'Content-Type': 'application/octet-stream'}
+        response = self.session.put(location, data=data, headers=headers)
+        response.raise_for_status()
+        if response.status_code != 201:
+            raise RuntimeError("Unable to complete upload of blob {} into {}: {}"
+                               .format(blob.digest, repository, response.status_code))
+
+    def put_manifest(self, repository, ref, manifest, media_type):
+        """
+        :param ref: str, tag or digest
+        :return: str, digest of manifest
+        """
+        url = '/v2/{}/manifests/{}'.format(repository, ref)
+        response = self.session.put(url, data=manifest, headers={'Content-Type': media_type})
+        response.raise_for_status()
+        return 'sha256:' + hashlib.sha256(manifest).hexdigest()
+
+    def push(self, image, repository, tags, mount_from=None):
+        """
+        push image into repository once and tag it with all tags
+
+        :param image: PushableImage
+        :param repository: str, e.g. 'namespace/repo'
+        :param tags: list of str
+        :param mount_from: str, repository of the same registry the image was
+                           pushed to before, its blobs are mounted from there
+        :return: str, digest of manifest
+        """
+        blobs = list(OrderedDict((blob.digest, blob) for blob in image.blobs).values())
+        exists = self.executor.map(lambda blob: self.blob_exists(repository, blob.digest),
+                                   blobs)
+        missing = [blob for blob, blob_exists in zip(blobs, exists) if not blob_exists]
+        logger.info("%s: pushing %s, %d of %d blobs missing", self.session.registry,
+                    repository, len(missing), len(blobs))
+        self.executor.map(lambda blob: self.upload_blob(repository, blob, mount_from), missing)
+
+        digest = self.put_manifest(repository, tags[0], image.manifest, image.media_type)
+        self.executor.map(lambda tag: self.put_manifest(repository, tag, image.manifest,
+                                                        image.media_type),
+                          tags[1:])
+        logger.info("%s: pushed %s@%s as %s", self.session.registry, repository, digest,
+                    ', '.join(tags))
+        return digest
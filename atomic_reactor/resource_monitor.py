@@ -0,0 +1,287 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+sampling of resources used during build
+
+ResourceMonitor samples disk usage of watched filesystems (root, build
+workdir, docker storage), RSS and CPU time of this process and network
+traffic in the background. Every sample is tagged with the plugins running
+at the time, so that peaks can be attributed to plugins. Samples are also
+taken when a plugin starts and finishes, so even short plugins get theirs.
+"""
+
+from __future__ import absolute_import, division
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 1
+# maximum number of points of time series in report
+MAX_SERIES_POINTS = 60
+PROC_STATM_PATH = '/proc/self/statm'
+PROC_NET_DEV_PATH = '/proc/self/net/dev'
+MB = 1000 ** 2  # sadly storage is generally expressed in decimal units
+
+
+def get_disk_usage(path):
+    """
+    :return: dict, usage of filesystem path is on (mb_used, mb_free, ...),
+             None if it can't be found out
+    """
+    try:
+        st = os.statvfs(path)
+    except (OSError, AttributeError):
+        return None
+
+    return dict(
+        mb_free=st.f_bfree * st.f_frsize / MB,
+        mb_total=st.f_blocks * st.f_frsize / MB,
+        mb_used=(st.f_blocks - st.f_bfree) * st.f_frsize / MB,
+        inodes_free=st.f_ffree,
+        inodes_total=st.f_files,
+        inodes_used=st.f_files - st.f_ffree,
+    )
+
+
+def get_rss(path=PROC_STATM_PATH):
+    """
+    :return: int, resident set size of this process in bytes, None if not available
+    """
+    try:
+        with open(path) as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def get_network_bytes(path=PROC_NET_DEV_PATH):
+    """
+    :return: tuple (bytes received, bytes sent) by all interfaces except loopback,
+             None if not available
+    """
+    received = sent = 0
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        return None
+
+    # two lines of header, then "iface: rx_bytes packets ... tx_bytes ..."
+    for line in lines[2:]:
+        iface, _, counters = line.partition(':')
+        counters = counters.split()
+        if iface.strip() == 'lo' or len(counters) < 9:
+            continue
+        try:
+            received += int(counters[0])
+            sent += int(counters[8])
+        except ValueError:
+            continue
+    return received, sent
+
+
+def get_cpu_time():
+    """
+    :return: float, user and system CPU seconds of this process and its
+             waited-for children
+    """
+    return sum(os.times()[:4])
+
+
+class ResourceMonitor(threading.Thread):
+    """
+    Sample resources used by build in the background
+
+    Usage:
+
+        monitor = ResourceMonitor()
+        monitor.add_path('workdir', workdir)
+        monitor.start()
+        ...
+        monitor.plugin_started('squash')
+        ...
+        monitor.plugin_finished('squash')
+        ...
+        monitor.finish()
+        report = monitor.get_report()
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        """
+        :param interval: float, seconds between samples
+        """
+        super(ResourceMonitor, self).__init__()
+        self.daemon = True  # exits whenever the process exits
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._paths = {'root': '/'}
+        self._running = set()
+        self._samples = []
+        self._last = None
+        # min/max usage of root filesystem
+        self._fs_data = {}
+        # plugin key -> peaks while it ran
+        self._peaks = {}
+
+    def add_path(self, name, path):
+        """
+        watch disk usage of filesystem path is on
+
+        :param name: str, name of path in report, e.g. 'workdir'
+        :param path: str
+        """
+        with self._lock:
+            self._paths[name] = path
+
+    def run(self):
+        """ Overrides parent method to implement thread's functionality. """
+        while True:  # make sure to run at least once before exiting
+            self.sample()
+            if self._done.wait(self.interval):
+                break
+
+    def finish(self):
+        """ Signal background thread to exit. """
+        self._done.set()
+
+    def plugin_started(self, plugin):
+        # what happened until now is attributed to plugins running so far
+        self.sample()
+        with self._lock:
+            self._running.add(plugin)
+
+    def plugin_finished(self, plugin):
+        self.sample()
+        with self._lock:
+            self._running.discard(plugin)
+
+    def sample(self):
+        """ record current usage of resources """
+        now = time.time()
+        cpu = get_cpu_time()
+        rss = get_rss()
+        network = get_network_bytes()
+        with self._lock:
+            paths = dict(self._paths)
+        disks = {name: get_disk_usage(path) for name, path in paths.items()}
+
+        with self._lock:
+            sample = {
+                'time': now,
+                'plugins': sorted(self._running),
+                'rss_mb': None if rss is None else rss / MB,
+                'cpu': None,
+                'net_rx_mb': None,
+                'net_tx_mb': None,
+                'disk_mb': {name: usage['mb_used']
+                            for name, usage in disks.items() if usage is not None},
+            }
+            if self._last is not None:
+                last_time, last_cpu, last_network = self._last
+                if now > last_time:
+                    # cores used on average since last sample
+                    sample['cpu'] = (cpu - last_cpu) / (now - last_time)
+                if network is not None and last_network is not None:
+                    sample['net_rx_mb'] = (network[0] - last_network[0]) / MB
+                    sample['net_tx_mb'] = (network[1] - last_network[1]) / MB
+            self._last = (now, cpu, network)
+            self._samples.append(sample)
+
+            if disks.get('root') is not None:
+                self._update_fs_data(disks['root'])
+            for plugin in sample['plugins']:
+                self._update_peaks(self._peaks.setdefault(plugin, {}), sample)
+
+        return sample
+
+    def _update_fs_data(self, usage):
+        data = self._fs_data
+        for key in ["mb_total", "mb_used", "inodes_total", "inodes_used"]:
+            data[key] = max(usage[key], data.get(key, 0))
+        for key in ["mb_free", "inodes_free"]:
+            data[key] = min(usage[key], data.get(key, float("inf")))
+
+    @staticmethod
+    def _update_peaks(peaks, sample):
+        for key in ('rss_mb', 'cpu'):
+            if sample[key] is not None:
+                peaks[key] = max(sample[key], peaks.get(key, 0))
+        for key in ('net_rx_mb', 'net_tx_mb'):
+            if sample[key] is not None:
+                peaks[key] = peaks.get(key, 0) + sample[key]
+        disk_peaks = peaks.setdefault('disk_mb', {})
+        for name, used in sample['disk_mb'].items():
+            disk_peaks[name] = max(used, disk_peaks.get(name, 0))
+
+    def get_usage_data(self):
+        """
+        :return: dict, highest usage of root filesystem, e.g. {'mb_used': 123, ...}
+        """
+        with self._lock:
+            return self._fs_data.copy()
+
+    def get_report(self, max_points=MAX_SERIES_POINTS):
+        """
+        :param max_points: int, maximum number of points of time series
+        :return: dict, 'peaks': plugin key -> highest RSS, CPU cores and disk usage
+                 and total network traffic while it ran; 'series': samples merged
+                 into at most max_points points (highest values, summed traffic)
+        """
+        with self._lock:
+            samples = list(self._samples)
+            peaks = {plugin: dict(values, disk_mb=dict(values.get('disk_mb', {})))
+                     for plugin, values in self._peaks.items()}
+
+        series = {
+            'time': [],
+            'plugins': [],
+            'rss_mb': [],
+            'cpu': [],
+            'net_rx_mb': [],
+            'net_tx_mb': [],
+            'disk_mb': {},
+        }
+        if samples:
+            start = samples[0]['time']
+            bucket_size = -(-len(samples) // max_points)  # ceiling division
+            for index in range(0, len(samples), bucket_size):
+                self._add_point(series, samples[index:index + bucket_size], start)
+
+        return {'peaks': peaks, 'series': series}
+
+    @staticmethod
+    def _add_point(series, bucket, start):
+        def highest(values):
+            values = [value for value in values if value is not None]
+            return max(values) if values else None
+
+        def total(values):
+            values = [value for value in values if value is not None]
+            return sum(values) if values else None
+
+        point = len(series['time'])
+        series['time'].append(round(bucket[-1]['time'] - start, 1))
+        series['plugins'].append(sorted(set(plugin for sample in bucket
+                                            for plugin in sample['plugins'])))
+        series['rss_mb'].append(highest(sample['rss_mb'] for sample in bucket))
+        series['cpu'].append(highest(sample['cpu'] for sample in bucket))
+        series['net_rx_mb'].append(total(sample['net_rx_mb'] for sample in bucket))
+        series['net_tx_mb'].append(total(sample['net_tx_mb'] for sample in bucket))
+        names = set(name for sample in bucket for name in sample['disk_mb'])
+        for name in names:
+            values = series['disk_mb'].setdefault(name, [None] * point)
+            values.append(highest(sample['disk_mb'].get(name) for sample in bucket))
+        for name, values in series['disk_mb'].items():
+            if name not in names:
+                values.append(None)
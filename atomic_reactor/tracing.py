@@ -0,0 +1,188 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+lightweight tracing of build
+
+Spans are recorded as "complete" events of the Chrome trace event format,
+the exported file can be opened in chrome://tracing or https://ui.perfetto.dev,
+spans of one thread are nested by their timestamps.
+"""
+
+from __future__ import absolute_import
+
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SPAN_PLUGIN = 'plugin'
+SPAN_DOCKER = 'docker'
+SPAN_REGISTRY = 'registry'
+SPAN_KOJI = 'koji'
+SPAN_PULP = 'pulp'
+
+
+def _now():
+    """ timestamp in microseconds, as trace events want it """
+    return time.time() * 1000000
+
+
+class Tracer(object):
+    """
+    Collect spans of work done during build
+
+    Tracer is disabled until enable() is called, recording spans is then
+    a no-op.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._events = []
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self._events = []
+
+    def add_span(self, name, category, start, end, args=None):
+        """
+        record finished span
+
+        :param name: str, name of span, e.g. method name
+        :param category: str, kind of span, one of SPAN_*
+        :param start: float, start time (time.time())
+        :param end: float, end time (time.time())
+        :param args: dict, details shown with the span
+        """
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start * 1000000,
+            'dur': (end - start) * 1000000,
+            'pid': os.getpid(),
+            'tid': threading.current_thread().ident,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """
+        context manager recording span of work done in its block
+
+        :param name: str, name of span, e.g. method name
+        :param category: str, kind of span, one of SPAN_*
+        :param args: details shown with the span, must be JSON serializable
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = time.time()
+        try:
+            yield
+        except BaseException as ex:
+            args['exception'] = repr(ex)
+            raise
+        finally:
+            self.add_span(name, category, start, time.time(), args)
+
+    def get_events(self):
+        with self._lock:
+            return list(self._events)
+
+    def export(self, path):
+        """
+        write recorded spans into file as Chrome trace event JSON
+
+        :param path: str, path of file
+        """
+        events = self.get_events()
+        logger.debug("writing %d trace events into %s", len(events), path)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+tracer = Tracer()
+
+
+def traced(category, name=None):
+    """
+    decorator recording span for every call of decorated function
+
+    When the function returns a generator, the span lasts until the
+    generator is exhausted.
+
+    :param category: str, kind of span, one of SPAN_*
+    :param name: str, name of span, defaults to name of function
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+
+            start = time.time()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as ex:
+                tracer.add_span(span_name, category, start, time.time(),
+                                {'exception': repr(ex)})
+                raise
+
+            if inspect.isgenerator(result):
+                return _traced_generator(result, span_name, category, start)
+            tracer.add_span(span_name, category, start, time.time())
+            return result
+
+        return wrapper
+    return decorator
+
+
+def _traced_generator(generator, name, category, start):
+    try:
+        for item in generator:
+            yield item
+    finally:
+        tracer.add_span(name, category, start, time.time())
+
+
+def traced_methods(category, prefix=None):
+    """
+    class decorator recording spans for calls of all public methods
+    defined in the class
+
+    :param category: str, kind of span, one of SPAN_*
+    :param prefix: str, prefix of span names, defaults to class name
+    """
+    def decorator(cls):
+        span_prefix = prefix or cls.__name__
+        for attr_name, value in list(vars(cls).items()):
+            if attr_name.startswith('_') or not inspect.isfunction(value):
+                continue
+            setattr(cls, attr_name,
+                    traced(category, '%s.%s' % (span_prefix, attr_name))(value))
+        return cls
+    return decorator
@@ -17,21 +17,24 @@ import re
 from pipes import quote
 import requests
 from requests.exceptions import ConnectionError, SSLError, HTTPError, RetryError, Timeout
-from requests.adapters import HTTPAdapter
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 from requests.packages.urllib3.util import Retry
 import shutil
 import subprocess
 import tempfile
+import threading
 import logging
 import uuid
 import yaml
 import codecs
 import string
 import time
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from copy import deepcopy
 
-from six.moves.urllib.parse import urlparse
+import six
+from six.moves import queue
+from six.moves.urllib.parse import urlparse, parse_qs
 
 from atomic_reactor.constants import (DOCKERFILE_FILENAME, REPO_CONTAINER_CONFIG, TOOLS_USED,
                                       INSPECT_CONFIG,
@@ -41,6 +44,13 @@ from atomic_reactor.constants import (DOCKERFILE_FILENAME, REPO_CONTAINER_CONFIG
                                       MEDIA_TYPE_DOCKER_V2_SCHEMA1, MEDIA_TYPE_DOCKER_V2_SCHEMA2,
                                       MEDIA_TYPE_DOCKER_V2_MANIFEST_LIST, MEDIA_TYPE_OCI_V1,
                                       MEDIA_TYPE_OCI_V1_INDEX, GIT_MAX_RETRIES, GIT_BACKOFF_FACTOR)
+from atomic_reactor.checksum_cache import get_checksum_cache
+from atomic_reactor.concurrency import get_default_executor
+from atomic_reactor.docker_stream import (decode_json_stream, get_event, ProgressLogger,
+                                          EVENT_LAYER_PROGRESS)
+from atomic_reactor.log_store import LogStore
+from atomic_reactor.registry_cache import get_registry_cache
+from atomic_reactor.tracing import tracer, SPAN_REGISTRY
 
 from dockerfile_parse import DockerfileParser
 from pkg_resources import resource_stream
@@ -186,24 +196,46 @@ def figure_out_build_file(absolute_path, local_path=None):
 
 
 class CommandResult(object):
-    def __init__(self):
-        self._logs = []
-        self._parsed_logs = []
+    def __init__(self, spill_dir=None):
+        """
+        :param spill_dir: str, directory for logs which don't fit in memory
+        """
+        self._logs = LogStore(spill_dir=spill_dir)
+        self._parsed_logs = LogStore(spill_dir=spill_dir, json_entries=True)
+        self._events = []
+        self._progress_logger = ProgressLogger()
         self._error = None
         self._error_detail = None
 
     def parse_item(self, item):
         """
-        :param item: dict, decoded log data
+        :param item: dict, decoded log data; str (e.g. line of plain text
+                     log) or any other value is logged as it is
         """
+        progress_key = None
+        if isinstance(item, dict) and item.get('id'):
+            if item.get('progressDetail'):
+                # only the latest progress of layer is interesting
+                progress_key = (item['id'], item.get('status'))
+            else:
+                # e.g. 'Download complete', following progress is new
+                layer_id = item['id']
+                self._parsed_logs.release(lambda key: key[0] == layer_id)
+
         # append here just in case .get bellow fails
-        self._parsed_logs.append(item)
+        self._parsed_logs.append(item, collapse_key=progress_key)
+
+        event = get_event(item)
+        if event is not None:
+            self._progress_logger.handle(event)
+            if event.kind != EVENT_LAYER_PROGRESS:
+                self._events.append(event)
 
         # make sure the log item is a dictionary object
         if isinstance(item, dict):
             lines = item.get("stream", "")
         else:
-            lines = item
+            lines = item if isinstance(item, six.string_types) else six.text_type(item)
             item = None
 
         for line in lines.splitlines():
@@ -220,12 +252,26 @@ class CommandResult(object):
 
     @property
     def parsed_logs(self):
+        """
+        :return: LogStore, iterable of decoded log items, progress of layer
+                 collapsed into its latest item
+        """
         return self._parsed_logs
 
     @property
     def logs(self):
+        """
+        :return: LogStore, iterable of log lines
+        """
         return self._logs
 
+    @property
+    def events(self):
+        """
+        :return: list of StreamEvent, steps, layers started and done and errors
+        """
+        return self._events
+
     @property
     def error(self):
         return self._error
@@ -238,15 +284,17 @@ class CommandResult(object):
         return bool(self.error) or bool(self.error_detail)
 
 
-def wait_for_command(logs_generator):
+def wait_for_command(logs_generator, spill_dir=None):
     """
     Create a CommandResult from given iterator
 
+    :param logs_generator: iterable of raw (bytes) docker output or decoded items
+    :param spill_dir: str, directory for logs which don't fit in memory
     :return: CommandResult
     """
     logger.info("wait_for_command")
-    cr = CommandResult()
-    for item in logs_generator:
+    cr = CommandResult(spill_dir=spill_dir)
+    for item in decode_json_stream(logs_generator):
         cr.parse_item(item)
 
     logger.info("no more logs")
@@ -471,40 +519,116 @@ def get_checksums(path, algorithms):
     """
     Compute a checksum(s) of given file using specified algorithms.
 
+    Checksums are cached (see atomic_reactor.checksum_cache), every file
+    is hashed by every algorithm at most once while it isn't modified.
+
     :param path: path to file
-    :param algorithms: list of cryptographic hash functions, currently supported: md5, sha256
+    :param algorithms: list of cryptographic hash functions, e.g. md5, sha256
     :return: dictionary
     """
-    if not algorithms:
-        return {}
-
-    compute_md5 = 'md5' in algorithms
-    compute_sha256 = 'sha256' in algorithms
-
-    if compute_md5:
-        md5 = hashlib.md5()
-    if compute_sha256:
-        sha256 = hashlib.sha256()
-    blocksize = 65536
-    with open(path, mode='rb') as f:
-        buf = f.read(blocksize)
-        while len(buf) > 0:
-            if compute_md5:
-                md5.update(buf)
-            if compute_sha256:
-                sha256.update(buf)
-            buf = f.read(blocksize)
-
-    checksums = {}
-    if compute_md5:
-        checksums['md5sum'] = md5.hexdigest()
-        logger.debug('md5sum: %s', checksums['md5sum'])
-    if compute_sha256:
-        checksums['sha256sum'] = sha256.hexdigest()
-        logger.debug('sha256sum: %s', checksums['sha256sum'])
+    checksums = get_checksum_cache().get_checksums(path, algorithms)
+    for key, value in sorted(checksums.items()):
+        logger.debug('%s: %s', key, value)
     return checksums
 
 
+class HashingWriter(object):
+    """
+    Binary file which computes checksums and size of data while it's written
+
+    Writing of exported images is limited by compression and disk, hashing is
+    done by a background thread meanwhile, so that the file doesn't have to
+    be read once more to get its checksums.
+
+    Usage:
+
+        with HashingWriter(path) as writer:
+            writer.write(data)
+        metadata = get_exported_image_metadata(path, image_type, writer.checksums)
+    """
+
+    # chunks of data waiting to be hashed; bounds memory taken by them
+    QUEUE_SIZE = 64
+
+    def __init__(self, path, algorithms=('md5', 'sha256')):
+        """
+        :param path: str, file to write, it's truncated
+        :param algorithms: iterable of str, hashlib algorithms, e.g. md5, sha256
+        """
+        self.name = path
+        self.mode = 'wb'
+        self.size = 0
+        self._hashers = OrderedDict((algorithm, hashlib.new(algorithm))
+                                    for algorithm in algorithms)
+        self._file = open(path, 'wb')
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._hash, name='hashing-writer')
+        self._thread.daemon = True
+        self._thread.start()
+        self.closed = False
+
+    def _hash(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            for hasher in self._hashers.values():
+                hasher.update(data)
+
+    def write(self, data):
+        """
+        :param data: bytes
+        :return: int, count of bytes written
+        """
+        if self.closed:
+            raise ValueError("write to closed file {}".format(self.name))
+        if not isinstance(data, six.binary_type):
+            # e.g. memoryview from gzip, may be reused by caller once we return
+            data = bytes(data)
+        if not data:
+            return 0
+        self._file.write(data)
+        self._queue.put(data)
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def hexdigest(self, algorithm):
+        """
+        :param algorithm: str, one of algorithms, file must be closed
+        :return: str
+        """
+        if not self.closed:
+            raise RuntimeError("{} is still being written".format(self.name))
+        return self._hashers[algorithm].hexdigest()
+
+    @property
+    def checksums(self):
+        """
+        :return: dict, checksums in the format of get_checksums, e.g. {'md5sum': '...'}
+        """
+        return {algorithm + 'sum': self.hexdigest(algorithm) for algorithm in self._hashers}
+
+
 def get_docker_architecture(tasker):
     docker_version = tasker.get_version()
     host_arch = docker_version['Arch']
@@ -513,12 +637,23 @@ def get_docker_architecture(tasker):
     return (host_arch, docker_version['Version'])
 
 
-def get_exported_image_metadata(path, image_type):
+def get_exported_image_metadata(path, image_type, checksums=None):
+    """
+    :param path: str, exported image
+    :param image_type: str, one of IMAGE_TYPE_* constants
+    :param checksums: dict, md5sum and sha256sum of image computed while it
+                      was written (HashingWriter.checksums), image is read
+                      to compute them if None
+    :return: dict, metadata of image for exported_image_sequence
+    """
     logger.info('getting metadata for exported image %s (%s)', path, image_type)
     metadata = {'path': path, 'type': image_type}
     if image_type != IMAGE_TYPE_OCI:
         metadata['size'] = os.path.getsize(path)
         logger.debug('size: %d bytes', metadata['size'])
+        if checksums:
+            # later get_checksums calls don't have to read the image
+            get_checksum_cache().add(path, checksums)
         metadata.update(get_checksums(path, ['md5', 'sha256']))
     return metadata
 
@@ -645,11 +780,70 @@ class Dockercfg(object):
             return {}
 
 
+# https://docs.docker.com/registry/spec/auth/token/
+TOKEN_DEFAULT_EXPIRATION = 60  # seconds
+# tokens are renewed a bit before they expire, so that they don't expire in flight
+TOKEN_EXPIRATION_MARGIN = 5  # seconds
+AUTH_CHALLENGE_PARAM_RE = re.compile(r'(\w+)="([^"]*)"')
+REPOSITORY_URL_RE = re.compile(r'^/v2/(.+?)/(?:manifests|blobs|tags)/')
+ABSOLUTE_URL_RE = re.compile(r'^https?://')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class BearerAuth(requests.auth.AuthBase):
+    """
+    Authentication by token of token-auth registries
+    """
+
+    def __init__(self, token):
+        self.token = token
+
+    def __call__(self, request):
+        request.headers['Authorization'] = 'Bearer ' + self.token
+        return request
+
+
+def parse_scopes(scopes):
+    """
+    :param scopes: iterable of str, e.g. 'repository:namespace/repo:pull,push'
+    :return: dict, resource (e.g. 'repository:namespace/repo') -> set of actions
+    """
+    parsed = {}
+    for scope in scopes:
+        resource, _, actions = scope.rpartition(':')
+        parsed.setdefault(resource, set()).update(actions.split(','))
+    return parsed
+
+
+def scopes_cover(granted, needed):
+    """
+    :param granted: dict, scopes of token, see parse_scopes
+    :param needed: dict, scopes required by request, see parse_scopes
+    :return: bool, whether token with granted scopes may be used for request
+    """
+    for resource, actions in needed.items():
+        granted_actions = granted.get(resource, set())
+        if '*' not in granted_actions and not actions <= granted_actions:
+            return False
+    return True
+
+
 class RegistrySession(object):
-    def __init__(self, registry, insecure=False, dockercfg_path=None):
+    def __init__(self, registry, insecure=False, dockercfg_path=None,
+                 pool_size=DEFAULT_POOLSIZE):
+        """
+        :param registry: str, URI for registry, if URI schema is not provided,
+                              https:// will be used (or http://, if insecure
+                              and https doesn't work)
+        :param insecure: bool, when True registry's cert is not verified
+        :param dockercfg_path: str, dirname of .dockercfg location
+        :param pool_size: int, number of connections kept open to registry
+        """
         self.registry = registry
         self._resolved = None
         self.insecure = insecure
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
 
         self.auth = None
         if dockercfg_path:
@@ -671,20 +865,171 @@ class RegistrySession(object):
                 # with https then fallback
                 self._fallback = 'http://{}'.format(self.registry)
 
-        self.session = get_retrying_requests_session()
+        self.session = get_retrying_requests_session(pool_maxsize=pool_size)
+        # sessions replaced by bigger ones, may still be used by running requests
+        self._replaced_sessions = []
 
-    def _do(self, f, relative_url, *args, **kwargs):
-        kwargs['auth'] = self.auth
-        kwargs['verify'] = not self.insecure
-        if self._fallback:
+        # (realm, service) once registry asked for bearer token
+        self._token_realm = None
+        # (realm, service, scopes) -> (token, expiration time, parsed scopes)
+        self._tokens = {}
+        # held while fetching token, so that concurrent requests share one fetch
+        self._token_lock = threading.Lock()
+
+    def ensure_pool_size(self, pool_size):
+        """
+        keep at least pool_size connections open to registry
+
+        :param pool_size: int, number of requests expected to run at once
+        """
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+            logger.debug("growing connection pool for %s to %d", self.registry, pool_size)
+            # adapters of session in use by other threads are not remounted,
+            # new session replaces it instead
+            self._replaced_sessions.append(self.session)
+            self.session = get_retrying_requests_session(pool_maxsize=pool_size)
+            self.pool_size = pool_size
+
+    def close(self):
+        """
+        close connections of this session and of sessions it replaced
+        """
+        with self._lock:
+            sessions = self._replaced_sessions + [self.session]
+            self._replaced_sessions = []
+        for session in sessions:
+            session.close()
+
+    @staticmethod
+    def _get_scopes(method, relative_url):
+        """
+        :return: list of str, token scopes request will most likely need
+        """
+        # URL may be absolute, e.g. Location of blob upload
+        match = REPOSITORY_URL_RE.match(urlparse(relative_url).path)
+        if not match:
+            return []
+        if method in ('GET', 'HEAD'):
+            actions = 'pull'
+        elif method in ('POST', 'PUT', 'PATCH'):
+            actions = 'pull,push'
+        else:
+            # let registry tell what it needs
+            return []
+        scopes = ['repository:{}:{}'.format(match.group(1), actions)]
+        # blob mounted from another repository
+        for mount_from in parse_qs(urlparse(relative_url).query).get('from', []):
+            scopes.append('repository:{}:pull'.format(mount_from))
+        return scopes
+
+    def _fetch_token(self, realm, service, scopes):
+        """
+        :return: tuple (str token, int seconds till it expires)
+        """
+        params = [('service', service)] if service else []
+        params.extend(('scope', scope) for scope in scopes)
+        logger.debug("fetching token for %s from %s", ' '.join(scopes) or self.registry, realm)
+        response = self.session.get(realm, params=params, auth=self.auth,
+                                    verify=not self.insecure)
+        response.raise_for_status()
+        data = response.json()
+        return (data.get('token') or data['access_token'],
+                data.get('expires_in') or TOKEN_DEFAULT_EXPIRATION)
+
+    def _get_token(self, realm, service, scopes, refused=None):
+        """
+        get token covering scopes, fetch it only if no cached token does
+
+        :param refused: str, token registry didn't accept, it isn't used again
+        :return: str
+        """
+        needed = parse_scopes(scopes)
+        with self._token_lock:
+            now = time.time()
+            for key, (token, expiration, granted) in list(self._tokens.items()):
+                if expiration <= now or token == refused:
+                    del self._tokens[key]
+                elif key[:2] == (realm, service) and scopes_cover(granted, needed):
+                    return token
+
+            token, expires_in = self._fetch_token(realm, service, scopes)
+            expiration = now + expires_in - TOKEN_EXPIRATION_MARGIN
+            self._tokens[(realm, service, tuple(sorted(scopes)))] = (token, expiration, needed)
+            return token
+
+    @staticmethod
+    def _get_origin(url):
+        parsed = urlparse(url)
+        scheme = parsed.scheme.lower()
+        return scheme, parsed.hostname, parsed.port or DEFAULT_PORTS.get(scheme)
+
+    def _is_registry_url(self, relative_url):
+        """
+        :return: bool, whether URL (relative or absolute, e.g. Location of blob
+                 upload) points to the registry, so that credentials may be sent
+        """
+        if not ABSOLUTE_URL_RE.match(relative_url):
+            return True
+        return self._get_origin(relative_url) == self._get_origin(self._base)
+
+    def _get_auth(self, scopes):
+        if self._token_realm is None or not scopes:
+            return self.auth
+        realm, service = self._token_realm
+        return BearerAuth(self._get_token(realm, service, scopes))
+
+    def _send(self, f, relative_url, *args, **kwargs):
+        if ABSOLUTE_URL_RE.match(relative_url):
+            # e.g. Location returned by registry
+            return f(relative_url, *args, **kwargs)
+        # session may be shared by threads, look at the scheme only once
+        base, fallback = self._base, self._fallback
+        if fallback:
             try:
-                res = f(self._base + relative_url, *args, **kwargs)
+                res = f(base + relative_url, *args, **kwargs)
                 self._fallback = None  # don't fallback after one success
                 return res
             except (SSLError, ConnectionError):
-                self._base = self._fallback
-                self._fallback = None
-        return f(self._base + relative_url, *args, **kwargs)
+                with self._lock:
+                    if self._fallback:
+                        logger.debug("falling back to %s", fallback)
+                        self._base = fallback
+                        self._fallback = None
+                base = fallback
+        return f(base + relative_url, *args, **kwargs)
+
+    def _do(self, f, relative_url, *args, **kwargs):
+        method = getattr(f, '__name__', '').upper()
+        kwargs['verify'] = not self.insecure
+        span_name = '%s %s' % (method, relative_url)
+        with tracer.span(span_name, SPAN_REGISTRY, registry=self.registry):
+            if not self._is_registry_url(relative_url):
+                # e.g. upload to storage behind registry, never send it credentials
+                kwargs['auth'] = None
+                return self._send(f, relative_url, *args, **kwargs)
+
+            # once registry is known to use token auth, token is sent right away
+            scopes = self._get_scopes(method, relative_url)
+            kwargs['auth'] = self._get_auth(scopes)
+            response = self._send(f, relative_url, *args, **kwargs)
+
+            if response.status_code != requests.codes.unauthorized:
+                return response
+            challenge = response.headers.get('WWW-Authenticate', '')
+            if not challenge.lower().startswith('bearer '):
+                return response
+
+            params = dict(AUTH_CHALLENGE_PARAM_RE.findall(challenge))
+            realm, service = params.get('realm'), params.get('service')
+            self._token_realm = (realm, service)
+            if params.get('scope'):
+                scopes = list(OrderedDict.fromkeys(params['scope'].split(' ') + scopes))
+            refused = getattr(kwargs['auth'], 'token', None)
+            kwargs['auth'] = BearerAuth(self._get_token(realm, service, scopes,
+                                                        refused=refused))
+            return self._send(f, relative_url, *args, **kwargs)
 
     def get(self, relative_url, data=None, **kwargs):
         return self._do(self.session.get, relative_url, **kwargs)
@@ -698,9 +1043,78 @@ class RegistrySession(object):
     def put(self, relative_url, data=None, **kwargs):
         return self._do(self.session.put, relative_url, data=data, **kwargs)
 
+    def patch(self, relative_url, data=None, **kwargs):
+        return self._do(self.session.patch, relative_url, data=data, **kwargs)
+
     def delete(self, relative_url, **kwargs):
         return self._do(self.session.delete, relative_url, **kwargs)
 
+    def get_async(self, relative_url, executor=None, **kwargs):
+        """
+        like get(), but the request is made in background
+
+        :param relative_url: str, URL relative to registry
+        :param executor: AsyncExecutor, defaults to the process-wide one
+        :return: AsyncResult, its get() returns the response
+        """
+        executor = executor or get_default_executor()
+        return executor.submit(self.get, relative_url, **kwargs)
+
+    def head_async(self, relative_url, executor=None, **kwargs):
+        """
+        like head(), but the request is made in background
+
+        :param relative_url: str, URL relative to registry
+        :param executor: AsyncExecutor, defaults to the process-wide one
+        :return: AsyncResult, its get() returns the response
+        """
+        executor = executor or get_default_executor()
+        return executor.submit(self.head, relative_url, **kwargs)
+
+
+# (registry, insecure, dockercfg_path) -> RegistrySession
+_registry_sessions = {}
+_registry_sessions_lock = threading.Lock()
+
+
+def get_registry_session(registry, insecure=False, dockercfg_path=None, pool_size=None):
+    """
+    get RegistrySession shared by the whole process
+
+    Sessions are reused by everything talking to the same registry with the
+    same credentials, so that connections to it are kept open, credentials
+    are read once and scheme of an insecure registry is probed only once.
+
+    :param registry: str, URI for registry, see RegistrySession
+    :param insecure: bool, when True registry's cert is not verified
+    :param dockercfg_path: str, dirname of .dockercfg location
+    :param pool_size: int, number of requests expected to run at once
+    :return: RegistrySession
+    """
+    key = (registry, insecure, dockercfg_path)
+    with _registry_sessions_lock:
+        session = _registry_sessions.get(key)
+        if session is None:
+            session = RegistrySession(registry, insecure=insecure,
+                                      dockercfg_path=dockercfg_path,
+                                      pool_size=max(pool_size or 0, DEFAULT_POOLSIZE))
+            _registry_sessions[key] = session
+            return session
+    if pool_size:
+        session.ensure_pool_size(pool_size)
+    return session
+
+
+def clear_registry_sessions():
+    """
+    close and forget all sessions returned by get_registry_session
+    """
+    with _registry_sessions_lock:
+        sessions = list(_registry_sessions.values())
+        _registry_sessions.clear()
+    for session in sessions:
+        session.close()
+
 
 class ManifestDigest(dict):
     """Wrapper for digests for a docker manifest."""
@@ -761,7 +1175,8 @@ def get_digests_map_from_annotations(digests_str):
     return digests
 
 
-def query_registry(registry_session, image, digest=None, version='v1', is_blob=False):
+def query_registry(registry_session, image, digest=None, version='v1', is_blob=False,
+                   head=False):
     """Return manifest digest for image.
 
     :param registry_session: RegistrySession
@@ -769,6 +1184,7 @@ def query_registry(registry_session, image, digest=None, version='v1', is_blob=F
     :param digest: str, digest of the image manifest
     :param version: str, which manifest schema version to fetch digest
     :param is_blob: bool, read blob config if set to True
+    :param head: bool, only get headers (HEAD request)
 
     :return: requests.Response object
     """
@@ -781,15 +1197,51 @@ def query_registry(registry_session, image, digest=None, version='v1', is_blob=F
 
     headers = {'Accept': (get_manifest_media_type(version))}
     url = '/v2/{}/{}/{}'.format(context, object_type, reference)
+
+    # objects referenced by digest never change
+    cache = get_registry_cache() if digest and not head else None
+    if cache is not None:
+        try:
+            cached = cache.get(digest)
+        except Exception as ex:
+            # cache is only an optimization, registry is still there
+            logger.warning("query_registry: failed to look up %s in cache: %r", digest, ex)
+            cached = None
+        # manifest is looked up again if registry would convert it
+        if cached is not None and (is_blob or cached[1] == headers['Accept']):
+            logger.debug("query_registry: %s found in cache", url)
+            content, media_type = cached
+            return _make_cached_response(registry_session, url, digest, content, media_type)
+
     logger.debug("query_registry: querying {}, headers: {}".format(url, headers))
 
-    response = registry_session.get(url, headers=headers)
+    if head:
+        response = registry_session.head(url, headers=headers)
+    else:
+        response = registry_session.get(url, headers=headers)
     for r in chain(response.history, [response]):
         logger.debug("query_registry: [%s] %s", r.status_code, r.url)
 
     logger.debug("query_registry: response headers: %s", response.headers)
     response.raise_for_status()
 
+    if cache is not None:
+        try:
+            cache.put(digest, response.content, response.headers.get('Content-Type'))
+        except Exception as ex:
+            logger.warning("query_registry: failed to store %s in cache: %r", digest, ex)
+
+    return response
+
+
+def _make_cached_response(registry_session, url, digest, content, media_type):
+    response = requests.Response()
+    response.status_code = requests.codes.ok
+    response.url = registry_session.registry + url
+    response.headers['Content-Type'] = media_type
+    response.headers['Content-Length'] = str(len(content))
+    response.headers['Docker-Content-Digest'] = digest
+    response._content = content
     return response
 
 
@@ -847,11 +1299,12 @@ def manifest_is_media_type(response, media_type):
     return response_h_prefix == request_h_prefix
 
 
-def get_manifest(image, registry_session, version):
+def get_manifest(image, registry_session, version, head=False):
     saved_not_found = None
     media_type = get_manifest_media_type(version)
     try:
-        response = query_registry(registry_session, image, digest=None, version=version)
+        response = query_registry(registry_session, image, digest=None, version=version,
+                                  head=head)
     except (HTTPError, RetryError, Timeout) as ex:
         if ex.response.status_code == requests.codes.not_found:
             saved_not_found = ex
@@ -875,6 +1328,10 @@ def get_manifest(image, registry_session, version):
         else:
             raise
 
+    if head and 'Content-Type' not in response.headers:
+        # media type can't be guessed without content
+        return get_manifest(image, registry_session, version)
+
     if not manifest_is_media_type(response, media_type):
         logger.warning("content does not match expected media type")
         return None, saved_not_found
@@ -882,8 +1339,69 @@ def get_manifest(image, registry_session, version):
     return response, saved_not_found
 
 
+# manifest schema version stored in registry -> versions registry may return
+# when asked for a single one (it converts schema 2 manifests to schema 1 and
+# picks a platform's manifest from manifest lists)
+REACHABLE_MANIFEST_VERSIONS = {
+    'v1': ('v1',),
+    'v2': ('v2', 'v1'),
+    'v2_list': ('v2_list', 'v2', 'v1'),
+    'oci': ('oci',),
+    'oci_index': ('oci_index', 'oci'),
+}
+
+
+def _probe_manifest_version(image, registry_session):
+    """
+    find out which kind of manifest the tag points to: when all media types
+    are accepted, registry returns the manifest as stored
+
+    :return: tuple (version, response), (None, None) if not known
+    """
+    context = '/'.join([x for x in [image.namespace, image.repo] if x])
+    url = '/v2/{}/manifests/{}'.format(context, image.tag or 'latest')
+    accept = ', '.join(ManifestDigest.content_type.values())
+    try:
+        response = registry_session.head(url, headers={'Accept': accept})
+        response.raise_for_status()
+    except (HTTPError, RetryError, Timeout) as ex:
+        logger.debug("failed to probe manifest of %s: %r", image, ex)
+        return None, None
+    if 'Content-Type' not in response.headers:
+        return None, None
+    for version in ManifestDigest.content_type:
+        if manifest_is_media_type(response, get_manifest_media_type(version)):
+            logger.debug("%s points to %s manifest", image, version)
+            return version, response
+    return None, None
+
+
+def _discover_manifests(image, registry_session, versions, executor=None):
+    """
+    get manifests of versions by HEAD requests; versions registry can't return
+    for manifest the tag points to are skipped, the rest is requested concurrently
+
+    :return: list of tuples (response, saved_not_found) as returned by
+             get_manifest, one for each version
+    """
+    stored_version, probe_response = _probe_manifest_version(image, registry_session)
+    results = {}
+    if stored_version in versions:
+        results[stored_version] = (probe_response, None)
+    reachable = REACHABLE_MANIFEST_VERSIONS.get(stored_version, versions)
+    pending = [version for version in versions
+               if version not in results and version in reachable]
+
+    executor = executor or get_default_executor()
+    responses = executor.map(
+        lambda version: get_manifest(image, registry_session, version, head=True), pending)
+    results.update(zip(pending, responses))
+    return [results.get(version, (None, None)) for version in versions]
+
+
 def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
-                         versions=('v1', 'v2', 'v2_list', 'oci', 'oci_index'), require_digest=True):
+                         versions=('v1', 'v2', 'v2_list', 'oci', 'oci_index'), require_digest=True,
+                         use_head=False, executor=None):
     """Return manifest digest for image.
 
     :param image: ImageName, the remote image to inspect
@@ -894,11 +1412,21 @@ def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
     :param versions: tuple, which manifest schema versions to fetch digest
     :param require_digest: bool, when True exception is thrown if no digest is
                                  set in the headers.
+    :param use_head: bool, don't download manifests: find out the kind of
+                     manifest by one HEAD request, then make HEAD requests for
+                     the versions registry can return concurrently
+    :param executor: AsyncExecutor for concurrent requests (with use_head),
+                     defaults to the process-wide one
 
     :return: dict, versions mapped to their digest
     """
 
-    registry_session = RegistrySession(registry, insecure=insecure, dockercfg_path=dockercfg_path)
+    registry_session = get_registry_session(registry, insecure=insecure,
+                                            dockercfg_path=dockercfg_path)
+    if use_head:
+        manifests = _discover_manifests(image, registry_session, versions, executor=executor)
+    else:
+        manifests = (get_manifest(image, registry_session, version) for version in versions)
 
     digests = {}
     # If all of the media types return a 404 NOT_FOUND status, then we rethrow
@@ -907,9 +1435,8 @@ def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
     # This is interesting for the Pulp "retry until the manifest shows up" case.
     all_not_found = True
     saved_not_found = None
-    for version in versions:
+    for version, (response, saved_not_found) in zip(versions, manifests):
         media_type = get_manifest_media_type(version)
-        response, saved_not_found = get_manifest(image, registry_session, version)
 
         if saved_not_found is None:
             all_not_found = False
@@ -951,7 +1478,8 @@ def get_manifest_list(image, registry, insecure=False, dockercfg_path=None):
     :return: response, or None, with manifest list
     """
     version = 'v2_list'
-    registry_session = RegistrySession(registry, insecure=insecure, dockercfg_path=dockercfg_path)
+    registry_session = get_registry_session(registry, insecure=insecure,
+                                            dockercfg_path=dockercfg_path)
     response, _ = get_manifest(image, registry_session, version)
     return response
 
@@ -970,7 +1498,8 @@ def get_config_from_registry(image, registry, digest, insecure=False,
 
     :return: dict, versions mapped to their digest
     """
-    registry_session = RegistrySession(registry, insecure=insecure, dockercfg_path=dockercfg_path)
+    registry_session = get_registry_session(registry, insecure=insecure,
+                                            dockercfg_path=dockercfg_path)
 
     response = query_registry(
         registry_session, image, digest=digest, version=version)
@@ -1146,7 +1675,7 @@ def _http_retries_disabled():
 
 def get_retrying_requests_session(client_statuses=HTTP_CLIENT_STATUS_RETRY,
                                   times=HTTP_MAX_RETRIES, delay=HTTP_BACKOFF_FACTOR,
-                                  method_whitelist=None):
+                                  method_whitelist=None, pool_maxsize=None):
     if _http_retries_disabled():
         times = 0
 
@@ -1156,9 +1685,12 @@ def get_retrying_requests_session(client_statuses=HTTP_CLIENT_STATUS_RETRY,
         status_forcelist=client_statuses,
         method_whitelist=method_whitelist
     )
+    adapter_kwargs = {'max_retries': retry}
+    if pool_maxsize:
+        adapter_kwargs['pool_maxsize'] = pool_maxsize
     session = SessionWithTimeout()
-    session.mount('http://', HTTPAdapter(max_retries=retry))
-    session.mount('https://', HTTPAdapter(max_retries=retry))
+    session.mount('http://', HTTPAdapter(**adapter_kwargs))
+    session.mount('https://', HTTPAdapter(**adapter_kwargs))
 
     return session
 
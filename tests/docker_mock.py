@@ -279,6 +279,8 @@ def mock_docker(build_should_fail=False,
     :param remember_images: keep track of available image tags
     """
     if provided_image_repotags:
+        if not isinstance(provided_image_repotags, list):
+            provided_image_repotags = [provided_image_repotags]
         mock_image['RepoTags'] = provided_image_repotags
     push_result = mock_push_logs if not push_should_fail else mock_push_logs_failed
 
@@ -295,6 +297,7 @@ def mock_docker(build_should_fail=False,
     flexmock(docker.APIClient, containers=lambda **kwargs: mock_containers)
     flexmock(docker.APIClient, create_container=lambda img, **kwargs: mock_containers[0])
     flexmock(docker.APIClient, images=lambda **kwargs: [mock_image])
+    flexmock(docker.APIClient, events=lambda **kwargs: iter([]))
 
     def mock_inspect_image(image_id):
         if inspect_should_fail:
@@ -1,8 +1,11 @@
+import gzip
+import hashlib
 import os
 import tarfile
 
 import pytest
 
+from atomic_reactor.checksum_cache import compute_checksums
 from atomic_reactor.constants import (EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE,
                                       IMAGE_TYPE_DOCKER_ARCHIVE)
 from atomic_reactor.core import DockerTasker
@@ -13,6 +16,11 @@ from atomic_reactor.util import ImageName
 
 from tests.constants import INPUT_IMAGE, MOCK
 
+try:
+    from backports import lzma
+except ImportError:
+    import lzma
+
 try:
     from six import integer_types
 except ImportError:
@@ -85,4 +93,50 @@ class TestCompress(object):
         assert metadata['type'] == IMAGE_TYPE_DOCKER_ARCHIVE
         assert 'uncompressed_size' in metadata
         assert isinstance(metadata['uncompressed_size'], integer_types)
+        # checksums computed while compressing
+        assert metadata['size'] == os.path.getsize(compressed_img)
+        for key, value in compute_checksums(compressed_img, ['md5', 'sha256']).items():
+            assert metadata[key] == value
         assert ", ratio: " in caplog.text()
+
+    @pytest.mark.parametrize('method, level, threads, extension', [
+        ('gzip', 1, 1, 'gz'),
+        ('gzip', None, 4, 'gz'),
+        ('lzma', 0, 2, 'xz'),
+    ])
+    def test_compress_threads(self, tmpdir, method, level, threads, extension):
+        workflow = DockerBuildWorkflow({'provider': 'git', 'uri': 'asd'}, 'test-image')
+        workflow.builder = X()
+        exp_img = os.path.join(str(tmpdir), 'img.tar')
+        with tarfile.open(exp_img, mode='w') as tar:
+            tar.add(__file__, 'layer.tar')
+        workflow.exported_image_sequence.append({'path': exp_img,
+                                                 'type': IMAGE_TYPE_DOCKER_ARCHIVE})
+
+        runner = PostBuildPluginsRunner(
+            None,
+            workflow,
+            [{
+                'name': CompressPlugin.key,
+                'args': {
+                    'method': method,
+                    'level': level,
+                    'threads': threads,
+                    'load_exported_image': True,
+                },
+            }]
+        )
+        runner.run()
+
+        compressed_img = os.path.join(
+            workflow.source.tmpdir,
+            EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE.format(extension))
+        metadata = workflow.exported_image_sequence[-1]
+        assert metadata['path'] == compressed_img
+        assert metadata['uncompressed_size'] == os.path.getsize(exp_img)
+        with open(compressed_img, 'rb') as f:
+            assert metadata['md5sum'] == hashlib.md5(f.read()).hexdigest()
+
+        opener = gzip.open if method == 'gzip' else lzma.open
+        with opener(compressed_img, 'rb') as f, open(exp_img, 'rb') as original:
+            assert f.read() == original.read()
@@ -27,6 +27,8 @@ from tests.fixtures import reactor_config_map  # noqa
 from tempfile import mkdtemp
 import os
 import json
+import threading
+import time
 import requests
 import requests.auth
 
@@ -278,3 +280,102 @@ def test_delete_from_registry_failures(tmpdir, status_code, reactor_config_map):
             assert result[DeleteFromRegistryPlugin.key] == deleted_digests
         else:
             assert result[DeleteFromRegistryPlugin.key] == set([])
+
+
+def test_delete_from_registry_concurrently():
+    if MOCK:
+        mock_docker()
+        mock_get_retry_session()
+
+    tasker = DockerTasker()
+    workflow = DockerBuildWorkflow({"provider": "git", "uri": "asd"}, TEST_IMAGE,
+                                   buildstep_plugins=[{
+                                       'name': OrchestrateBuildPlugin.key,
+                                       'args': {'platforms': "x86_64"},
+                                   }])
+    setattr(workflow, 'builder', X)
+
+    platform_digests = {}
+    for index, platform in enumerate(['x86_64', 'ppc64le', 'aarch64', 's390x']):
+        digest = 'sha256:' + str(index) * 64
+        platform_digests[platform] = {'digests': [
+            {'digest': digest, 'tag': tag, 'repository': 'foo/bar', 'registry': reg}
+            for reg in (DOCKER0_REGISTRY, LOCALHOST_REGISTRY)
+            for tag in ('latest', '1.0')
+        ]}
+    setattr(workflow, 'build_result', Y)
+    setattr(workflow.build_result, 'annotations', {'worker-builds': platform_digests})
+    workflow.postbuild_results[PLUGIN_GROUP_MANIFESTS_KEY] = {
+        'foo/bar': ManifestDigest(v2_list=DIGEST_LIST),
+    }
+
+    events = []
+    lock = threading.Lock()
+
+    def delete(url, **kwargs):
+        with lock:
+            events.append(('start', url))
+        time.sleep(0.01)
+        with lock:
+            events.append(('end', url))
+        return flexmock(status_code=202, ok=True, raise_for_status=lambda: None)
+
+    (flexmock(requests.Session)
+        .should_receive('delete')
+        .replace_with(delete))
+
+    runner = ExitPluginsRunner(tasker, workflow, [{
+        'name': DeleteFromRegistryPlugin.key,
+        'args': {
+            'registries': {DOCKER0_REGISTRY: {}, LOCALHOST_REGISTRY: {}},
+        },
+    }])
+    result = runner.run()
+
+    expected = set([DIGEST_LIST])
+    expected.update(digests['digests'][0]['digest'] for digests in platform_digests.values())
+    assert result[DeleteFromRegistryPlugin.key] == expected
+
+    # every digest deleted once, manifest list of each registry first
+    started = [url for kind, url in events if kind == 'start']
+    assert len(started) == len(set(started)) == 2 + 4
+    lists_deleted = max(index for index, (kind, url) in enumerate(events)
+                        if kind == 'end' and url.endswith(DIGEST_LIST))
+    assert all(url.endswith(DIGEST_LIST) for kind, url in events[:lists_deleted])
+
+
+def test_delete_manifest_list_once():
+    if MOCK:
+        mock_docker()
+        mock_get_retry_session()
+
+    tasker = DockerTasker()
+    workflow = DockerBuildWorkflow({"provider": "git", "uri": "asd"}, TEST_IMAGE,
+                                   buildstep_plugins=[{
+                                       'name': OrchestrateBuildPlugin.key,
+                                       'args': {'platforms': "x86_64"},
+                                   }])
+    setattr(workflow, 'builder', X)
+    setattr(workflow, 'build_result', Y)
+    setattr(workflow.build_result, 'annotations', {'worker-builds': {'x86_64': {'digests': [
+        {'digest': DIGEST1, 'tag': 'latest', 'repository': 'foo/bar',
+         'registry': DOCKER0_REGISTRY},
+    ]}}})
+    # without grouping, image of the only worker is used as manifest list
+    workflow.postbuild_results[PLUGIN_GROUP_MANIFESTS_KEY] = {
+        'foo/bar': ManifestDigest(v2=DIGEST1),
+    }
+
+    url = 'https://' + DOCKER0_REGISTRY + '/v2/foo/bar/manifests/' + DIGEST1
+    (flexmock(requests.Session)
+        .should_receive('delete')
+        .with_args(url, verify=bool, auth=None)
+        .once()
+        .and_return(flexmock(status_code=202, ok=True, raise_for_status=lambda: None)))
+
+    runner = ExitPluginsRunner(tasker, workflow, [{
+        'name': DeleteFromRegistryPlugin.key,
+        'args': {'registries': {DOCKER0_REGISTRY: {}}},
+    }])
+    result = runner.run()
+    assert result[DeleteFromRegistryPlugin.key] == set([DIGEST1])
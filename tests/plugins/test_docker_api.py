@@ -118,6 +118,31 @@ def test_build(is_failed, image_id):
         assert workflow.build_result.image_id.count(':') == 1
 
 
+def test_instruction_timings():
+    flexmock(DockerfileParser, content='df_content')
+    mock_docker()
+    fake_builder = MockInsideBuilder()
+
+    def build_logs(path, image):
+        yield b'{"stream": "Step 1/2 : FROM fedora\\n"}\r\n'
+        yield b'{"stream": " ---> 0123456789ab\\n"}\r\n'
+        yield b'{"stream": "Step 2/2 : RUN make\\n"}\r\n'
+        yield b'{"stream": " ---> abcdef012345\\n"}\r\n'
+
+    fake_builder.tasker.build_image_from_path = build_logs
+    flexmock(fake_builder.tasker.d).should_receive('history').with_args('sha256:some').and_return(
+        [{'Id': 'sha256:abcdef012345' + '0' * 52, 'Size': 1234}])
+    flexmock(InsideBuilder).new_instances(fake_builder)
+    workflow = DockerBuildWorkflow(MOCK_SOURCE, 'test-image')
+    workflow.build_docker_image()
+
+    timings = workflow.instruction_timings
+    assert [(timing['step'], timing['instruction'], timing['cached'], timing['size'])
+            for timing in timings] == [(1, 'FROM fedora', False, None),
+                                       (2, 'RUN make', False, 1234)]
+    assert all(timing['duration'] >= 0 for timing in timings)
+
+
 def test_syntax_error():
     """
     tests reporting of syntax errors
@@ -21,6 +21,7 @@ from tests.constants import SOURCE, INPUT_IMAGE, MOCK, DOCKER0_REGISTRY
 
 from atomic_reactor.core import DockerTasker
 from atomic_reactor.build import BuildResult
+from atomic_reactor.concurrency import AsyncExecutor
 from atomic_reactor.plugin import PostBuildPluginsRunner, PluginFailedException
 from atomic_reactor.inner import DockerBuildWorkflow, TagConf
 from atomic_reactor.util import ImageName, registry_hostname, ManifestDigest
@@ -60,6 +61,8 @@ class MockRegistry(object):
     def __init__(self, registry):
         self.hostname = registry_hostname(registry)
         self.repos = {}
+        # (target repository, digest) of every mount request
+        self.mounts = []
         self._add_pattern(responses.GET, r'/v2/(.*)/manifests/([^/]+)',
                           self._get_manifest)
         self._add_pattern(responses.HEAD, r'/v2/(.*)/manifests/([^/]+)',
@@ -171,6 +174,7 @@ class MockRegistry(object):
     def _mount_blob(self, req, target_name, digest, source_name):
         source_repo = self.get_repo(source_name)
         target_repo = self.get_repo(target_name)
+        self.mounts.append((target_name, digest))
 
         try:
             target_repo['blobs'][digest] = source_repo['blobs'][digest]
@@ -582,6 +586,10 @@ def test_group_manifests(tmpdir, test_name,
                                                   source_manifest, 'x86_64',
                                                   tag)
 
+        # Every blob is linked into a repository only once
+        for registry in mocked_registries.values():
+            assert len(registry.mounts) == len(set(registry.mounts))
+
         # Check that plugin returns ManifestDigest object
         plugin_result = results[GroupManifestsPlugin.key]
         assert isinstance(plugin_result, dict)
@@ -599,3 +607,34 @@ def test_group_manifests(tmpdir, test_name,
         with pytest.raises(PluginFailedException) as ex:
             runner.run()
         assert expected_exception in str(ex)
+
+
+@pytest.mark.parametrize('max_workers', (1, 4))
+@responses.activate  # noqa
+def test_group_manifests_shared_blobs(tmpdir, max_workers):
+    if MOCK:
+        mock_docker()
+
+    registry = MockRegistry(REGISTRY_V2)
+    tasker, workflow = mock_environment(tmpdir, primary_images=['namespace/httpd:2.4'])
+    plugin = GroupManifestsPlugin(tasker, workflow, registries={REGISTRY_V2: {}})
+    plugin.executor = AsyncExecutor(max_workers=max_workers)
+    session = plugin.get_registry_session(REGISTRY_V2)
+
+    base_layer = registry.add_blob('worker-build', 'layer-base')
+    links = []
+    for platform in ('x86_64', 'ppc64le'):
+        layer = registry.add_blob('worker-build', 'layer-' + platform)
+        for target_repo in ('namespace/httpd', 'namespace/other'):
+            links.append((base_layer, 'worker-build', target_repo))
+            links.append((layer, 'worker-build', target_repo))
+    # already there
+    links.append((base_layer, 'namespace/httpd', 'namespace/httpd'))
+
+    plugin.link_blobs_into_repositories(session, links)
+    plugin.link_blobs_into_repositories(session, links)
+
+    assert sorted(registry.mounts) == sorted(set((target_repo, digest)
+                                                 for digest, _, target_repo in links[:-1]))
+    for target_repo in ('namespace/httpd', 'namespace/other'):
+        assert registry.get_blob(target_repo, base_layer) == 'layer-base'
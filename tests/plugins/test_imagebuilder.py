@@ -30,12 +30,13 @@ class MockDocker(object):
         return []
 
     def get_image(self, image_id):
-        return flexmock(data="image data")
+        return flexmock(data=b"image data")
 
 
 class MockDockerTasker(object):
     def __init__(self):
         self.d = MockDocker()
+        self.image_catalog = flexmock(invalidate=lambda image=None: None)
 
     def inspect_image(self, name):
         return {}
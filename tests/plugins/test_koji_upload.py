@@ -1052,6 +1052,22 @@ class TestKojiUpload(object):
         nvr_tag = '{}:{}-{}'.format(name, version, release)
         assert pullspec.endswith(nvr_tag)
 
+    def test_koji_upload_instruction_timings(self, tmpdir, os_env, reactor_config_map):  # noqa
+        osbs = MockedOSBS()
+        session = MockedClientSession('')
+        tasker, workflow = mock_environment(tmpdir, session=session, name='ns/name',
+                                            version='1.0', release='1')
+        timings = [{'step': 1, 'instruction': 'FROM fedora', 'duration': 0.5,
+                    'cached': False, 'image_id': 'abc123def456', 'size': None}]
+        workflow.instruction_timings = timings
+        runner = create_runner(tasker, workflow, reactor_config_map=reactor_config_map)
+        runner.run()
+
+        metadata = get_metadata(workflow, osbs)
+        docker_output, = [output for output in metadata['output']
+                          if output['type'] == 'docker-image']
+        assert docker_output['extra']['docker']['instruction_timings'] == timings
+
     @pytest.mark.parametrize('logs_return_bytes', [
         True,
         False,
@@ -746,6 +746,29 @@ class TestResolveComposes(object):
         else:
             assert plugin_result['composes'] == [old_odcs_compose]
 
+    @pytest.mark.parametrize(('state_name', 'time_to_expire_delta', 'plugin_args', 'resume'), (
+        ('done', timedelta(hours=24), {}, True),
+        ('done', timedelta(hours=1), {}, False),
+        ('done', timedelta(hours=1), {'minimum_time_to_expire': 0}, True),
+        ('removed', timedelta(hours=24), {}, False),
+    ))
+    def test_can_resume(self, state_name, time_to_expire_delta, plugin_args, resume):
+        expiring_compose = ODCS_COMPOSE.copy()
+        expiring_compose.update({
+            'id': ODCS_COMPOSE_ID + 1,
+            'state_name': state_name,
+            'time_to_expire': (datetime.utcnow() +
+                               time_to_expire_delta).strftime(ODCS_DATETIME_FORMAT),
+        })
+        result = {
+            'composes': [ODCS_COMPOSE, expiring_compose],
+            'signing_intent': 'release',
+            'signing_intent_overridden': False,
+        }
+        assert ResolveComposesPlugin.can_resume(result, plugin_args) == resume
+        # plugin was skipped
+        assert ResolveComposesPlugin.can_resume(None, plugin_args)
+
     def test_inject_yum_repos_from_new_compose(self, workflow, reactor_config_map):  # noqa:F811
         self.run_plugin_with_args(workflow, reactor_config_map=reactor_config_map)
         assert self.get_override_yum_repourls(workflow) == [ODCS_COMPOSE_REPOFILE]
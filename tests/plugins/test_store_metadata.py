@@ -217,7 +217,9 @@ CMD blabla"""
     workflow.exit_results = {
         PulpPullPlugin.key: pulp_pull_results,
     }
-    workflow.fs_watcher._data = dict(fs_data=None)
+    workflow.resource_monitor._fs_data = dict(fs_data=None)
+    workflow.instruction_timings = [{'step': 1, 'instruction': 'FROM fedora', 'duration': 1.5,
+                                     'cached': False, 'image_id': None, 'size': None}]
 
     if br_annotations or br_labels:
         workflow.build_result = BuildResult(
@@ -271,6 +273,9 @@ CMD blabla"""
     assert is_string_type(annotations['image-id'])
     assert "filesystem" in annotations
     assert "fs_data" in annotations['filesystem']
+    assert "resources" in annotations
+    assert set(json.loads(annotations['resources'])) == {'peaks', 'series'}
+    assert json.loads(annotations['instruction-timings']) == workflow.instruction_timings
 
     if koji:
         assert "metadata_fragment" in annotations
@@ -343,6 +348,7 @@ CMD blabla"""
 
     plugins_metadata = json.loads(annotations["plugins-metadata"])
     assert "all_rpm_packages" in plugins_metadata["durations"]
+    assert "profiles" not in plugins_metadata
 
     if br_annotations:
         assert annotations['br_annotations'] == expected_br_annotations
@@ -441,6 +447,9 @@ CMD blabla"""
         PostBuildRPMqaPlugin.key: 'foo',
         PLUGIN_KOJI_UPLOAD_PLUGIN_KEY: 'bar',
     }
+    workflow.plugins_profiles = {
+        PostBuildRPMqaPlugin.key: {'cpu_user': 1.5, 'cpu_system': 0.5, 'http_calls': 0},
+    }
 
     runner = ExitPluginsRunner(
         None,
@@ -471,6 +480,7 @@ CMD blabla"""
     plugins_metadata = json.loads(annotations["plugins-metadata"])
     assert "all_rpm_packages" in plugins_metadata["errors"]
     assert "all_rpm_packages" in plugins_metadata["durations"]
+    assert plugins_metadata["profiles"]["all_rpm_packages"]["cpu_user"] == 1.5
 
 
 @pytest.mark.parametrize('koji_plugin', (PLUGIN_KOJI_IMPORT_PLUGIN_KEY,
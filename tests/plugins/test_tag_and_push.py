@@ -9,7 +9,7 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import print_function, unicode_literals
 
 import pytest
-from atomic_reactor.constants import IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR
+from atomic_reactor.constants import IMAGE_TYPE_DOCKER_ARCHIVE, IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR
 from atomic_reactor.core import DockerTasker
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.plugin import PostBuildPluginsRunner, PluginFailedException
@@ -17,10 +17,13 @@ from atomic_reactor.plugins.post_tag_and_push import TagAndPushPlugin
 from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin,
                                                        WORKSPACE_CONF_KEY,
                                                        ReactorConfig)
+from atomic_reactor.registry_push import RegistryPusher
 from atomic_reactor.util import ImageName, ManifestDigest, get_exported_image_metadata
 from tests.constants import LOCALHOST_REGISTRY, TEST_IMAGE, INPUT_IMAGE, MOCK, DOCKER0_REGISTRY
 from tests.fixtures import reactor_config_map  # noqa
 
+import hashlib
+import io
 import json
 import logging
 import os.path
@@ -236,7 +239,8 @@ def test_tag_and_push_plugin(
         if url == manifest_latest_url:
             # For a manifest stored as v2 or v1, the docker registry defaults to
             # returning a v1 manifest if a v2 manifest is not explicitly requested
-            if headers['Accept'] == 'application/vnd.docker.distribution.manifest.v2+json':
+            if 'application/vnd.docker.distribution.manifest.v2+json' in \
+                    headers['Accept'].split(', '):
                 return manifest_response_v2
             else:
                 return manifest_response_v1
@@ -465,7 +469,7 @@ def test_tag_and_push_plugin_oci(
 
     def custom_get(method, url, headers, **kwargs):
         if url == manifest_latest_url:
-            if headers['Accept'] == MEDIA_TYPE:
+            if MEDIA_TYPE in headers['Accept'].split(', '):
                 return manifest_response
             else:
                 return manifest_unacceptable_response
@@ -527,3 +531,211 @@ def test_tag_and_push_plugin_oci(
         assert workflow.push_conf.docker_registries[0].digests[TEST_IMAGE].oci == DIGEST_OCI
 
         assert workflow.push_conf.docker_registries[0].config is config_json
+
+
+def make_exported_image(tmpdir, image_type):
+    """
+    write docker-archive or OCI image layout of image with single empty layer
+    """
+    config = b'{"rootfs": {}}'
+    config_digest = 'sha256:' + hashlib.sha256(config).hexdigest()
+    if image_type == IMAGE_TYPE_DOCKER_ARCHIVE:
+        path = os.path.join(str(tmpdir), 'image.tar')
+        with tarfile.open(path, 'w') as tar:
+            for name, content in [
+                    ('config.json', config),
+                    ('layer/layer.tar', b''),
+                    ('manifest.json', json.dumps([{'Config': 'config.json',
+                                                   'Layers': ['layer/layer.tar']}])
+                     .encode('utf-8'))]:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return path
+
+    path = os.path.join(str(tmpdir), 'oci-image')
+    blobs = os.path.join(path, 'blobs', 'sha256')
+    os.makedirs(blobs)
+    manifest = json.dumps({
+        'schemaVersion': 2,
+        'config': {'mediaType': 'application/vnd.oci.image.config.v1+json',
+                   'digest': config_digest, 'size': len(config)},
+        'layers': [],
+    }).encode('utf-8')
+    manifest_digest = 'sha256:' + hashlib.sha256(manifest).hexdigest()
+    for digest, content in [(config_digest, config), (manifest_digest, manifest)]:
+        with open(os.path.join(blobs, digest.split(':')[1]), 'wb') as f:
+            f.write(content)
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump({'schemaVersion': 2, 'manifests': [{
+            'mediaType': 'application/vnd.oci.image.manifest.v1+json',
+            'digest': manifest_digest,
+            'size': len(manifest),
+            'annotations': {'org.opencontainers.image.ref.name': 'app'},
+        }]}, f)
+    return path
+
+
+@pytest.mark.parametrize(('image_type', 'compressed', 'native'), [
+    (IMAGE_TYPE_DOCKER_ARCHIVE, False, True),
+    (IMAGE_TYPE_DOCKER_ARCHIVE, True, False),
+    (IMAGE_TYPE_OCI, False, True),
+])
+def test_tag_and_push_plugin_native(tmpdir, image_type, compressed, native):
+    if MOCK:
+        mock_docker()
+    else:
+        return
+
+    tasker = DockerTasker()
+    workflow = DockerBuildWorkflow({"provider": "git", "uri": "asd"}, TEST_IMAGE)
+    workflow.tag_conf.add_primary_images(['namespace/image:latest', 'other/image:latest'])
+    workflow.tag_conf.add_unique_image('namespace/image:build-1')
+    setattr(workflow, 'builder', X)
+
+    metadata = {'path': make_exported_image(tmpdir, image_type), 'type': image_type,
+                'ref_name': 'app'}
+    if compressed:
+        metadata['uncompressed_size'] = 1024
+    workflow.exported_image_sequence.append(metadata)
+
+    if not native:
+        # compressed archive is pushed with docker
+        (flexmock(tasker)
+         .should_receive('tag_and_push_image')
+         .times(3))
+
+    pushes = []
+
+    def push(image, repository, tags, mount_from):
+        assert image.blobs
+        pushes.append((repository, tags, mount_from))
+
+    (flexmock(RegistryPusher)
+     .should_receive('push')
+     .replace_with(push))
+
+    manifest_response = requests.Response()
+    (flexmock(manifest_response,
+              status_code=200,
+              raise_for_status=lambda: None,
+              json={'config': {'digest': 'sha256:config'}},
+              headers={'Content-Type': 'application/vnd.docker.distribution.manifest.v2+json',
+                       'Docker-Content-Digest': DIGEST_V2}))
+    not_found_response = requests.Response()
+    flexmock(not_found_response, status_code=404)
+
+    config_response = requests.Response()
+    flexmock(config_response, status_code=200, raise_for_status=lambda: None, json={})
+
+    def custom_request(method, url, headers=None, **kwargs):
+        if '/manifests/' in url and 'manifest.v2+json' in headers['Accept']:
+            return manifest_response
+        if url.endswith('/blobs/sha256:config'):
+            return config_response
+        return not_found_response
+
+    mock_get_retry_session()
+    (flexmock(requests.Session)
+        .should_receive('request')
+        .replace_with(custom_request))
+
+    runner = PostBuildPluginsRunner(tasker, workflow, [{
+        'name': TagAndPushPlugin.key,
+        'args': {
+            'registries': {LOCALHOST_REGISTRY: {'insecure': True}},
+            'native_push': True,
+        },
+    }])
+    output = runner.run()
+
+    assert len(output[TagAndPushPlugin.key]) == 3
+    if native:
+        assert pushes == [
+            ('namespace/image', ['latest', 'build-1'], None),
+            ('other/image', ['latest'], 'namespace/image'),
+        ]
+    else:
+        assert pushes == []
+    digests = workflow.push_conf.docker_registries[0].digests
+    assert digests['namespace/image:build-1'].v2 == DIGEST_V2
+
+
+def test_tag_and_push_plugin_push_once(tmpdir):
+    if MOCK:
+        mock_docker()
+    else:
+        return
+
+    tasker = DockerTasker()
+    workflow = DockerBuildWorkflow({"provider": "git", "uri": "asd"}, TEST_IMAGE)
+    workflow.tag_conf.add_primary_images(['namespace/image:latest', 'namespace/image:1.0',
+                                          'other/image:latest'])
+    workflow.tag_conf.add_unique_image('namespace/image:build-1')
+    setattr(workflow, 'builder', X)
+
+    pushed = []
+    (flexmock(tasker)
+     .should_receive('tag_and_push_image')
+     .replace_with(lambda image_id, image, **kwargs: pushed.append(image.to_str())))
+
+    media_type_v1 = 'application/vnd.docker.distribution.manifest.v1+json'
+    media_type_v2 = 'application/vnd.docker.distribution.manifest.v2+json'
+    manifest = json.dumps({'schemaVersion': 2, 'mediaType': media_type_v2,
+                           'config': {'digest': 'sha256:config'}}).encode('utf-8')
+
+    def make_response(status_code, content=b'', headers=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = content
+        response.headers.update(headers or {})
+        return response
+
+    puts = []
+
+    def custom_request(method, url, headers=None, data=None, **kwargs):
+        if method == 'PUT':
+            puts.append((url, data, headers['Content-Type']))
+            return make_response(201)
+        if url.endswith('/blobs/sha256:config'):
+            return make_response(200, b'{}')
+        accepts = headers['Accept'].split(', ')
+        if media_type_v2 in accepts:
+            return make_response(200, manifest, {'Content-Type': media_type_v2,
+                                                 'Docker-Content-Digest': DIGEST_V2})
+        if media_type_v1 in accepts:
+            return make_response(200, b'{}', {'Content-Type': media_type_v1,
+                                              'Docker-Content-Digest': DIGEST_V1})
+        return make_response(404)
+
+    mock_get_retry_session()
+    (flexmock(requests.Session)
+        .should_receive('request')
+        .replace_with(custom_request))
+
+    runner = PostBuildPluginsRunner(tasker, workflow, [{
+        'name': TagAndPushPlugin.key,
+        'args': {
+            'registries': {LOCALHOST_REGISTRY: {'insecure': True}},
+            'push_once': True,
+        },
+    }])
+    output = runner.run()
+
+    assert [image.to_str(registry=False) for image in output[TagAndPushPlugin.key]] == [
+        'namespace/image:latest', 'namespace/image:1.0', 'other/image:latest',
+        'namespace/image:build-1',
+    ]
+    assert pushed == [LOCALHOST_REGISTRY + '/namespace/image:latest',
+                      LOCALHOST_REGISTRY + '/other/image:latest']
+    assert sorted(puts) == [
+        ('https://{}/v2/namespace/image/manifests/{}'.format(LOCALHOST_REGISTRY, tag),
+         manifest, media_type_v2)
+        for tag in ('1.0', 'build-1')
+    ]
+
+    digests = workflow.push_conf.docker_registries[0].digests
+    assert digests['namespace/image:latest'] == {'v1': DIGEST_V1, 'v2': DIGEST_V2}
+    assert digests['other/image:latest'] == {'v1': DIGEST_V1, 'v2': DIGEST_V2}
+    for tag in ('namespace/image:1.0', 'namespace/image:build-1'):
+        assert digests[tag] == {'v2': DIGEST_V2}
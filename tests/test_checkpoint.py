@@ -0,0 +1,209 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import pickle
+
+from flexmock import flexmock
+import pytest
+
+from atomic_reactor.checkpoint import Checkpoint, is_resumable
+from atomic_reactor.inner import DockerBuildWorkflow
+from atomic_reactor.plugin import (PreBuildPlugin, PreBuildPluginsRunner, PluginsRunner,
+                                   RESOURCE_BUILDER, RESOURCE_DOCKERFILE, workspace_resource)
+from atomic_reactor.util import ImageName
+
+from tests.constants import MOCK_SOURCE
+
+
+class X(object):
+    pass
+
+
+class ResumablePlugin(PreBuildPlugin):
+    key = 'resumable'
+    reads = (RESOURCE_DOCKERFILE, )
+    writes = (RESOURCE_DOCKERFILE, workspace_resource('other'))
+    resumable = True
+    runs = []
+
+    def __init__(self, tasker, workflow, label='1'):
+        super(ResumablePlugin, self).__init__(tasker, workflow)
+        self.label = label
+
+    def run(self):
+        self.runs.append(self.label)
+        with open(self.workflow.builder.df_path, 'a') as f:
+            f.write('LABEL release=%s\n' % self.label)
+        self.workflow.plugin_workspace['other'] = {'override': self.label}
+        return {'release': self.label}
+
+
+class NotResumablePlugin(ResumablePlugin):
+    key = 'not_resumable'
+    resumable = False
+
+
+class BaseImagePlugin(ResumablePlugin):
+    key = 'base_image'
+    reads = (RESOURCE_BUILDER, )
+
+
+def make_workflow(tmpdir, checkpoint_file=None, resume_from=None, base_image_id='base1'):
+    workflow = DockerBuildWorkflow(MOCK_SOURCE, 'test-image',
+                                   checkpoint_file=checkpoint_file,
+                                   resume_from=resume_from)
+    workflow.builder = X()
+    workflow.builder.df_path = str(tmpdir.join('Dockerfile'))
+    workflow.builder.base_image = ImageName.parse('fedora:27')
+    workflow.builder.image_id = None
+    workflow.builder.tasker = flexmock(inspect_image=lambda image: {'Id': base_image_id})
+    workflow.builder.source = flexmock(dockerfile_path=None, path=str(tmpdir))
+    with open(workflow.builder.df_path, 'w') as f:
+        f.write('FROM fedora:27\n')
+    return workflow
+
+
+@pytest.mark.parametrize(('attrs', 'resumable'), [
+    ({}, False),
+    ({'resumable': True}, False),
+    ({'resumable': True, 'reads': (), 'writes': ()}, True),
+    ({'resumable': True, 'reads': (RESOURCE_BUILDER, ), 'writes': (RESOURCE_DOCKERFILE, )}, True),
+    ({'resumable': True, 'reads': (), 'writes': (RESOURCE_BUILDER, )}, False),
+    ({'resumable': False, 'reads': (), 'writes': ()}, False),
+])
+def test_is_resumable(attrs, resumable):
+    plugin_class = type(str('TestPlugin'), (PreBuildPlugin, ), dict(attrs, key='test'))
+    assert is_resumable(plugin_class) == resumable
+
+
+def test_resume(tmpdir):
+    flexmock(PluginsRunner, load_plugins=lambda x: {
+        ResumablePlugin.key: ResumablePlugin,
+        NotResumablePlugin.key: NotResumablePlugin,
+    })
+    checkpoint_file = str(tmpdir.join('checkpoint'))
+    plugins = [{'name': 'resumable', 'args': {'label': '1'}}, {'name': 'not_resumable'}]
+    del ResumablePlugin.runs[:]
+
+    workflow = make_workflow(tmpdir.mkdir('first'), checkpoint_file=checkpoint_file)
+    PreBuildPluginsRunner(None, workflow, plugins).run()
+    workflow.save_checkpoint()
+    assert ResumablePlugin.runs == ['1', '1']
+    with open(workflow.builder.df_path) as f:
+        dockerfile = f.read()
+
+    workflow = make_workflow(tmpdir.mkdir('second'), resume_from=checkpoint_file)
+    results = PreBuildPluginsRunner(None, workflow, plugins).run()
+    # only plugin which isn't resumable ran again
+    assert ResumablePlugin.runs == ['1', '1', '1']
+    assert results['resumable'] == {'release': '1'}
+    with open(workflow.builder.df_path) as f:
+        assert f.read() == dockerfile
+    assert workflow.plugin_workspace['other'] == {'override': '1'}
+
+    # different arguments, run again
+    workflow = make_workflow(tmpdir.mkdir('third'), resume_from=checkpoint_file)
+    PreBuildPluginsRunner(None, workflow,
+                          [{'name': 'resumable', 'args': {'label': '2'}}]).run()
+    assert ResumablePlugin.runs == ['1', '1', '1', '2']
+
+    # different Dockerfile, run again
+    workflow = make_workflow(tmpdir.mkdir('fourth'), resume_from=checkpoint_file)
+    with open(workflow.builder.df_path, 'w') as f:
+        f.write('FROM fedora:28\n')
+    PreBuildPluginsRunner(None, workflow, plugins[:1]).run()
+    assert ResumablePlugin.runs == ['1', '1', '1', '2', '1']
+
+
+def test_resume_from_invalid_checkpoint(tmpdir):
+    checkpoint_file = tmpdir.join('checkpoint')
+    checkpoint_file.write('garbage')
+    assert Checkpoint(resume_from=str(checkpoint_file)).resumed == {}
+    assert Checkpoint(resume_from=str(tmpdir.join('missing'))).resumed == {}
+
+
+def test_checkpoint_is_json(tmpdir):
+    flexmock(PluginsRunner, load_plugins=lambda x: {ResumablePlugin.key: ResumablePlugin})
+    checkpoint_file = str(tmpdir.join('checkpoint'))
+    workflow = make_workflow(tmpdir.mkdir('first'), checkpoint_file=checkpoint_file)
+    PreBuildPluginsRunner(None, workflow, [{'name': 'resumable'}]).run()
+    workflow.save_checkpoint()
+
+    with open(checkpoint_file) as f:
+        data = json.load(f)
+    assert [(entry['phase'], entry['plugin'], entry['result'])
+            for entry in data['plugins']] == [('PreBuildPlugin', 'resumable', {'release': '1'})]
+    resumed = Checkpoint(resume_from=checkpoint_file).resumed
+    assert list(resumed) == [('PreBuildPlugin', 'resumable')]
+
+
+def test_resume_base_image_changed(tmpdir):
+    flexmock(PluginsRunner, load_plugins=lambda x: {BaseImagePlugin.key: BaseImagePlugin})
+    checkpoint_file = str(tmpdir.join('checkpoint'))
+    plugins = [{'name': 'base_image'}]
+    del ResumablePlugin.runs[:]
+
+    workflow = make_workflow(tmpdir.mkdir('first'), checkpoint_file=checkpoint_file)
+    PreBuildPluginsRunner(None, workflow, plugins).run()
+    workflow.save_checkpoint()
+
+    workflow = make_workflow(tmpdir.mkdir('second'), resume_from=checkpoint_file)
+    PreBuildPluginsRunner(None, workflow, plugins).run()
+    assert ResumablePlugin.runs == ['1']
+
+    # same name of base image, but different image
+    workflow = make_workflow(tmpdir.mkdir('third'), resume_from=checkpoint_file,
+                             base_image_id='base2')
+    PreBuildPluginsRunner(None, workflow, plugins).run()
+    assert ResumablePlugin.runs == ['1', '1']
+
+
+def test_resume_result_expired(tmpdir):
+    flexmock(PluginsRunner, load_plugins=lambda x: {ResumablePlugin.key: ResumablePlugin})
+    checkpoint_file = str(tmpdir.join('checkpoint'))
+    plugins = [{'name': 'resumable', 'args': {'label': '1'}}]
+    del ResumablePlugin.runs[:]
+
+    workflow = make_workflow(tmpdir.mkdir('first'), checkpoint_file=checkpoint_file)
+    PreBuildPluginsRunner(None, workflow, plugins).run()
+    workflow.save_checkpoint()
+
+    (flexmock(ResumablePlugin)
+        .should_receive('can_resume')
+        .with_args({'release': '1'}, {'label': '1'})
+        .and_return(False)
+        .once())
+    workflow = make_workflow(tmpdir.mkdir('second'), resume_from=checkpoint_file)
+    PreBuildPluginsRunner(None, workflow, plugins).run()
+    assert ResumablePlugin.runs == ['1', '1']
+
+
+@pytest.mark.parametrize('result', [
+    X(),
+    # JSON would turn the keys into str
+    {None: ['http://example.com/noarch.repo']},
+    {'composes': [{1: 'compose'}]},
+])
+def test_result_not_serializable(tmpdir, result):
+    flexmock(ResumablePlugin).should_receive('run').and_return(result)
+    flexmock(PluginsRunner, load_plugins=lambda x: {ResumablePlugin.key: ResumablePlugin})
+    checkpoint_file = str(tmpdir.join('checkpoint'))
+    workflow = make_workflow(tmpdir, checkpoint_file=checkpoint_file)
+    PreBuildPluginsRunner(None, workflow, [{'name': 'resumable'}]).run()
+    workflow.save_checkpoint()
+    assert Checkpoint(resume_from=checkpoint_file).resumed == {}
+
+
+def test_resume_from_pickle(tmpdir):
+    checkpoint_file = str(tmpdir.join('checkpoint'))
+    with open(checkpoint_file, 'wb') as f:
+        pickle.dump({'version': 1, 'plugins': {}}, f, 2)
+    assert Checkpoint(resume_from=checkpoint_file).resumed == {}
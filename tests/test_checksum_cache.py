@@ -0,0 +1,107 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+
+import pytest
+from flexmock import flexmock
+
+from atomic_reactor import checksum_cache
+from atomic_reactor.checksum_cache import (ChecksumCache, PERSIST_XATTR, PERSIST_SIDECAR,
+                                           SIDECAR_SUFFIX)
+
+MD5_ABC = '900150983cd24fb0d6963f7d28e17f72'
+SHA256_ABC = 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'
+
+
+def write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def count_computations():
+    computations = []
+    compute = checksum_cache.compute_checksums
+
+    def counting_compute(path, algorithms):
+        computations.append(sorted(algorithms))
+        return compute(path, algorithms)
+
+    flexmock(checksum_cache).should_receive('compute_checksums').replace_with(counting_compute)
+    return computations
+
+
+def test_get_checksums(tmpdir):
+    path = str(tmpdir.join('image.tar'))
+    write_file(path, b'abc')
+    computations = count_computations()
+    cache = ChecksumCache()
+
+    assert cache.get_checksums(path, ['md5']) == {'md5sum': MD5_ABC}
+    # only sha256 is computed
+    expected = {'md5sum': MD5_ABC, 'sha256sum': SHA256_ABC}
+    assert cache.get_checksums(path, ['md5', 'sha256']) == expected
+    assert cache.get_checksums(path, ['sha256', 'md5']) == expected
+    assert cache.get_checksums(path, []) == {}
+    assert computations == [['md5'], ['sha256']]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # modified file is hashed again
+    write_file(path, b'abcd')
+    os.utime(path, (0, 0))
+    assert cache.get_checksums(path, ['md5']) == {
+        'md5sum': hashlib.md5(b'abcd').hexdigest()
+    }
+    assert computations == [['md5'], ['sha256'], ['md5']]
+
+
+def test_add(tmpdir):
+    path = str(tmpdir.join('image.tar'))
+    write_file(path, b'abc')
+    computations = count_computations()
+    cache = ChecksumCache()
+
+    cache.add(path, {'md5sum': MD5_ABC})
+    assert cache.get_checksums(path, ['md5']) == {'md5sum': MD5_ABC}
+    assert computations == []
+
+
+@pytest.mark.parametrize('persist', [PERSIST_XATTR, PERSIST_SIDECAR])
+def test_persist(tmpdir, persist):
+    path = str(tmpdir.join('image.tar'))
+    write_file(path, b'abc')
+    if persist == PERSIST_XATTR:
+        try:
+            os.setxattr(path, 'user.test', b'')
+        except (AttributeError, OSError):
+            pytest.skip("extended attributes not supported")
+    computations = count_computations()
+
+    ChecksumCache(persist=persist).get_checksums(path, ['md5', 'sha256'])
+    if persist == PERSIST_SIDECAR:
+        assert os.path.exists(path + SIDECAR_SUFFIX)
+    # checksums are kept with file by another process
+    cache = ChecksumCache(persist=persist)
+    assert cache.get_checksums(path, ['md5']) == {'md5sum': MD5_ABC}
+    assert computations == [['md5', 'sha256']]
+
+    # not used for modified file
+    write_file(path, b'abcd')
+    os.utime(path, (0, 0))
+    assert ChecksumCache(persist=persist).get_checksums(path, ['md5']) == {
+        'md5sum': hashlib.md5(b'abcd').hexdigest()
+    }
+    assert computations == [['md5', 'sha256'], ['md5']]
+
+
+def test_persist_unknown():
+    with pytest.raises(ValueError):
+        ChecksumCache(persist='database')
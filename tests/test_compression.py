@@ -0,0 +1,150 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import gzip
+import io
+import os
+import struct
+import zlib
+
+import pytest
+from flexmock import flexmock
+
+from atomic_reactor import compression
+from atomic_reactor.compression import (ParallelGzipWriter, ParallelXzWriter, get_compressor,
+                                        benchmark, METHOD_GZIP, METHOD_LZMA, METHOD_ZSTD)
+
+try:
+    from backports import lzma
+except ImportError:
+    import lzma
+
+# compressible, but not trivially
+DATA = b''.join(struct.pack('<L', (index * 2654435761) % 4096) for index in range(100000))
+
+
+def write_chunks(writer, data, chunk_size=7777):
+    for start in range(0, len(data), chunk_size):
+        writer.write(data[start:start + chunk_size])
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+@pytest.mark.parametrize('block_size', [1000, 65536, None])
+@pytest.mark.parametrize('data', [DATA, b''])
+def test_gzip(threads, block_size, data):
+    output = io.BytesIO()
+    with ParallelGzipWriter(output, threads=threads, block_size=block_size,
+                            filename='/tmp/compressed.tar.gz', mtime=0) as writer:
+        write_chunks(writer, data)
+    assert writer.size == len(data)
+
+    compressed = output.getvalue()
+    assert gzip.GzipFile(fileobj=io.BytesIO(compressed)).read() == data
+    # single gzip member with original file name
+    assert compressed[3:4] == b'\x08'
+    assert compressed[10:].startswith(b'compressed.tar\0')
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decompressor.decompress(compressed) == data
+    assert decompressor.unused_data == b''
+
+    # output doesn't depend on number of threads
+    again = io.BytesIO()
+    with ParallelGzipWriter(again, threads=1, block_size=block_size,
+                            filename='/tmp/compressed.tar.gz', mtime=0) as writer:
+        writer.write(data)
+    assert again.getvalue() == compressed
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+@pytest.mark.parametrize('block_size', [1000, None])
+@pytest.mark.parametrize('data', [DATA, b''])
+def test_xz(threads, block_size, data):
+    output = io.BytesIO()
+    with ParallelXzWriter(output, level=1, threads=threads, block_size=block_size) as writer:
+        write_chunks(writer, data)
+    assert writer.size == len(data)
+    assert lzma.decompress(output.getvalue()) == data
+    assert lzma.LZMAFile(io.BytesIO(output.getvalue())).read() == data
+
+
+def test_zstd():
+    zstandard = pytest.importorskip('zstandard')
+    output = io.BytesIO()
+    with get_compressor(output, METHOD_ZSTD, threads=2) as writer:
+        write_chunks(writer, DATA)
+    decompressor = zstandard.ZstdDecompressor()
+    assert decompressor.stream_reader(io.BytesIO(output.getvalue())).read() == DATA
+
+
+def test_zstd_not_installed():
+    flexmock(compression, zstandard=None)
+    with pytest.raises(RuntimeError) as exc:
+        get_compressor(io.BytesIO(), METHOD_ZSTD)
+    assert 'zstandard' in str(exc.value)
+
+
+@pytest.mark.parametrize('method, level', [
+    ('spam', None),
+    (METHOD_GZIP, 0),
+    (METHOD_GZIP, 10),
+    (METHOD_LZMA, -1),
+])
+def test_get_compressor_invalid(method, level):
+    with pytest.raises(RuntimeError):
+        get_compressor(io.BytesIO(), method, level=level)
+
+
+@pytest.mark.parametrize(('cpus', 'threads'), [
+    (1, 1),
+    (4, 4),
+    (64, 8),
+])
+def test_get_default_threads(cpus, threads):
+    flexmock(compression.multiprocessing).should_receive('cpu_count').and_return(cpus)
+    assert compression.get_default_threads() == threads
+
+
+@pytest.mark.parametrize(('max_pending_bytes', 'max_pending'), [
+    (5000, 5),
+    (500, 1),
+])
+def test_max_pending_bytes(max_pending_bytes, max_pending):
+    pending = []
+
+    class CountingWriter(ParallelGzipWriter):
+        def _submit(self, block, last=False):
+            super(CountingWriter, self)._submit(block, last=last)
+            pending.append(self._pending_bytes)
+
+    output = io.BytesIO()
+    with CountingWriter(output, threads=8, block_size=1000,
+                        max_pending_bytes=max_pending_bytes) as writer:
+        write_chunks(writer, DATA)
+    assert max(pending) == max_pending * 1000
+    assert gzip.GzipFile(fileobj=io.BytesIO(output.getvalue())).read() == DATA
+
+
+def test_compression_error():
+    flexmock(ParallelGzipWriter).should_receive('_compress_block').and_raise(MemoryError)
+    output = io.BytesIO()
+    with pytest.raises(MemoryError):
+        with ParallelGzipWriter(output, threads=2, block_size=1000) as writer:
+            write_chunks(writer, DATA)
+    assert writer.closed
+
+
+def test_benchmark(tmpdir):
+    path = str(tmpdir.join('image.tar'))
+    with open(path, 'wb') as f:
+        f.write(DATA)
+    result = benchmark(path, METHOD_GZIP, level=1, threads=2)
+    assert result['size'] == os.path.getsize(path)
+    assert 0 < result['compressed_size'] < result['size']
+    assert result['throughput'] > 0
@@ -0,0 +1,67 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import threading
+
+import pytest
+
+from atomic_reactor.concurrency import AsyncExecutor, get_default_executor
+
+
+def test_submit():
+    executor = AsyncExecutor(max_workers=2)
+    barrier = threading.Event()
+
+    def wait_for_barrier(value):
+        assert barrier.wait(10)
+        return value
+
+    # both calls have to be running at once for them to finish
+    first = executor.submit(wait_for_barrier, 1)
+    second = executor.submit(lambda: barrier.set() or 2)
+    assert first.get(10) == 1
+    assert second.get(10) == 2
+
+    failed = executor.submit(int, 'not a number')
+    with pytest.raises(ValueError):
+        failed.get(10)
+
+    executor.shutdown()
+    # pool isn't started again after shutdown
+    with pytest.raises(RuntimeError):
+        executor.submit(int, '3')
+    with pytest.raises(RuntimeError):
+        executor.map(int, ['3'])
+    executor.shutdown()
+
+
+def test_map():
+    executor = AsyncExecutor(max_workers=3)
+    assert executor.map(lambda x: x * 2, range(10)) == list(range(0, 20, 2))
+
+    called = []
+
+    def fail_on_odd(x):
+        called.append(x)
+        if x % 2:
+            raise ValueError(x)
+        return x
+
+    with pytest.raises(ValueError) as exc_info:
+        executor.map(fail_on_odd, range(5))
+    assert exc_info.value.args == (1, )
+    # all calls were made despite the failure
+    assert sorted(called) == list(range(5))
+    executor.shutdown()
+
+
+def test_default_executor():
+    assert get_default_executor() is get_default_executor()
+    assert get_default_executor().submit(len, 'abc').get(10) == 3
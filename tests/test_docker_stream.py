@@ -0,0 +1,214 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import random
+
+from docker.utils.json_stream import json_stream
+from flexmock import flexmock
+import pytest
+
+from atomic_reactor.docker_stream import (JSONStreamDecoder, ProgressLogger, StreamEvent,
+                                          benchmark, decode_json_stream, get_event, main,
+                                          make_pull_stream,
+                                          get_instruction_timings, EVENT_STEP,
+                                          EVENT_STEP_CACHED, EVENT_STEP_IMAGE,
+                                          EVENT_LAYER_STARTED, EVENT_LAYER_PROGRESS,
+                                          EVENT_LAYER_DONE, EVENT_ERROR)
+from atomic_reactor.util import wait_for_command
+
+
+def make_pull_items(layers=20, progress=1000):
+    items = [{'status': 'Pulling from fedora', 'id': '27'}]
+    for layer in range(layers):
+        items.append({'status': 'Pulling fs layer', 'progressDetail': {}, 'id': 'l%d' % layer})
+    for current in range(progress):
+        for layer in range(layers):
+            bar = '=' * (current * 50 // progress)
+            items.append({'status': 'Downloading', 'id': 'l%d' % layer,
+                          'progressDetail': {'current': current, 'total': progress},
+                          'progress': '[%s>%s] \u2192 %d' % (bar, ' ' * 50, current)})
+    for layer in range(layers):
+        items.append({'status': 'Pull complete', 'progressDetail': {}, 'id': 'l%d' % layer})
+    items.append({'status': 'Digest: sha256:123'})
+    return items
+
+
+def split_randomly(data, max_chunk=4096):
+    chunks = []
+    index = 0
+    while index < len(data):
+        size = random.randint(1, max_chunk)
+        chunks.append(data[index:index + size])
+        index += size
+    return chunks
+
+
+def test_decode_chunks():
+    items = make_pull_items(layers=3, progress=20)
+    # multi-byte characters may be split into chunks too
+    data = ''.join(json.dumps(item, ensure_ascii=False) + '\r\n' for item in items)
+    data = data.encode('utf-8')
+    for max_chunk in (1, 7, 100, len(data)):
+        assert list(decode_json_stream(split_randomly(data, max_chunk))) == items
+
+
+def test_decode_not_json():
+    decoder = JSONStreamDecoder()
+    assert decoder.feed(b'{"a": 1}{"b"') == [{'a': 1}]
+    assert decoder.feed(b': 2}\r\nthis is not valid JSON\r\n{"c": ') == [
+        {'b': 2}, 'this is not valid JSON']
+    assert decoder.feed('3}\n') == [{'c': 3}]
+    assert decoder.feed(b'garbage') == []
+    assert decoder.close() == ['garbage']
+    assert decoder.close() == []
+
+
+@pytest.mark.parametrize('line', [
+    '2018-10-18 12:00:00,123 - atomic_reactor.plugin - INFO - running plugin',
+    '2018',
+    '"quoted"',
+    '[1, 2]',
+    '{"a": 1} and text',
+    'null',
+])
+def test_decode_line_not_object(line):
+    decoder = JSONStreamDecoder()
+    assert decoder.feed(line + '\n') == [line]
+    if not line.startswith('{'):
+        # objects at start of incomplete line are decoded right away
+        assert decoder.feed(line) == []
+        assert decoder.close() == [line]
+
+
+def test_decode_passes_items_through():
+    stream = [b'{"a": 1}\r\n{"b"', {'decoded': True}, b'{"c": 3}']
+    # incomplete item can't be finished after decoded one
+    assert list(decode_json_stream(stream)) == [{'a': 1}, '{"b"', {'decoded': True}, {'c': 3}]
+
+
+def test_big_stream():
+    # few megabytes, as for pull of big image
+    items = make_pull_items()
+    data = ''.join(json.dumps(item) + '\r\n' for item in items).encode('utf-8')
+    assert len(data) > 2 * 1024 ** 2
+    chunks = split_randomly(data)
+    assert list(decode_json_stream(chunks)) == items
+    # docker-py strips whitespace at the end of chunks, even inside of strings
+    decoded = [item for item in json_stream(chunks) if 'progress' not in item]
+    assert decoded == [item for item in items if 'progress' not in item]
+
+
+@pytest.mark.parametrize(('item', 'expected'), [
+    ({'stream': 'Step 3/10 : RUN make\n'}, (EVENT_STEP, None, 3, 10, 'RUN make')),
+    ({'stream': 'Step 1 : FROM fedora'}, (EVENT_STEP, None, 1, None, 'FROM fedora')),
+    ({'stream': ' ---> Running in 3600c91d1c40'}, None),
+    ({'stream': ' ---> Using cache\n'}, (EVENT_STEP_CACHED, None, None, None, None)),
+    ({'stream': ' ---> 3600c91d1c40\n'}, (EVENT_STEP_IMAGE, None, None, None, '3600c91d1c40')),
+    ({'status': 'Pulling fs layer', 'progressDetail': {}, 'id': 'a'},
+     (EVENT_LAYER_STARTED, 'a', None, None, 'Pulling fs layer')),
+    ({'status': 'Downloading', 'progressDetail': {'current': 1}, 'progress': '[>]', 'id': 'a'},
+     (EVENT_LAYER_PROGRESS, 'a', None, None, '[>]')),
+    ({'status': 'Pull complete', 'progressDetail': {}, 'id': 'a'},
+     (EVENT_LAYER_DONE, 'a', None, None, 'Pull complete')),
+    ({'status': 'Mounted from ns/other', 'progressDetail': {}, 'id': 'a'},
+     (EVENT_LAYER_DONE, 'a', None, None, 'Mounted from ns/other')),
+    ({'status': 'Waiting', 'progressDetail': {}, 'id': 'a'}, None),
+    ({'status': 'Digest: sha256:123'}, None),
+    ({'error': 'failed', 'errorDetail': {'message': 'failed'}},
+     (EVENT_ERROR, None, None, None, 'failed')),
+    ({'errorDetail': {'message': 'failed'}}, (EVENT_ERROR, None, None, None, 'failed')),
+    ('not JSON', None),
+])
+def test_get_event(item, expected):
+    event = get_event(item, now=42)
+    if expected is None:
+        assert event is None
+    else:
+        kind, layer, step, steps, message = expected
+        assert event == StreamEvent(kind, 42, layer, step, steps, message)
+
+
+def test_progress_logger():
+    log = flexmock()
+    logger = ProgressLogger(interval=5, log=log)
+    log.should_receive('debug').times(4)
+    for now in range(10):
+        logger.handle(StreamEvent(EVENT_LAYER_PROGRESS, now, 'a', None, None, '[>]'))
+    logger.handle(StreamEvent(EVENT_LAYER_DONE, 10, 'a', None, None, 'Pull complete'))
+    # progress after layer is done is logged again
+    logger.handle(StreamEvent(EVENT_LAYER_PROGRESS, 11, 'a', None, None, '[>]'))
+
+
+def test_instruction_timings():
+    events = [
+        StreamEvent(EVENT_LAYER_DONE, 0, 'a', None, None, 'Pull complete'),
+        StreamEvent(EVENT_STEP, 1, None, 1, 3, 'FROM fedora'),
+        StreamEvent(EVENT_STEP_IMAGE, 1.5, None, None, None, 'aaaaaaaaaaaa'),
+        StreamEvent(EVENT_STEP, 2, None, 2, 3, 'RUN yum install -y make'),
+        StreamEvent(EVENT_STEP_CACHED, 2, None, None, None, None),
+        StreamEvent(EVENT_STEP_IMAGE, 2, None, None, None, 'bbbbbbbbbbbb'),
+        StreamEvent(EVENT_STEP, 2.5, None, 3, 3, 'RUN make'),
+        StreamEvent(EVENT_STEP_IMAGE, 10, None, None, None, 'cccccccccccc'),
+    ]
+    history = [
+        {'Id': 'sha256:' + 'c' * 64, 'Size': 300},
+        {'Id': 'sha256:' + 'b' * 64, 'Size': 200},
+        {'Id': 'sha256:' + 'a' * 64, 'Size': 100},
+        {'Id': '<missing>', 'Size': 1000},
+    ]
+    timings = get_instruction_timings(events, 12, history)
+    assert [(timing['step'], timing['duration'], timing['cached'], timing['size'])
+            for timing in timings] == [(1, 1, False, None), (2, 0.5, True, 200),
+                                       (3, 9.5, False, 300)]
+    assert timings[1]['instruction'] == 'RUN yum install -y make'
+    assert timings[1]['image_id'] == 'bbbbbbbbbbbb'
+
+    # failed build, no history
+    timings = get_instruction_timings(events[:7], 3)
+    assert [(timing['duration'], timing['image_id'], timing['size'])
+            for timing in timings] == [(1, 'aaaaaaaaaaaa', None), (0.5, 'bbbbbbbbbbbb', None),
+                                       (0.5, None, None)]
+    assert get_instruction_timings([], 3) == []
+
+
+def test_wait_for_command_raw_stream():
+    items = [{'stream': 'Step 1/2 : FROM fedora\n'}, {'stream': ' ---> 123\n'},
+             {'stream': 'Step 2/2 : RUN make\n'}] + make_pull_items(layers=2, progress=3)
+    data = ''.join(json.dumps(item) + '\r\n' for item in items).encode('utf-8')
+    result = wait_for_command(iter(split_randomly(data, 10)))
+    assert list(result.logs) == ['Step 1/2 : FROM fedora', '---> 123', 'Step 2/2 : RUN make']
+    assert [(event.kind, event.step or event.layer) for event in result.events] == [
+        (EVENT_STEP, 1), (EVENT_STEP, 2),
+        (EVENT_LAYER_STARTED, 'l0'), (EVENT_LAYER_STARTED, 'l1'),
+        (EVENT_LAYER_DONE, 'l0'), (EVENT_LAYER_DONE, 'l1'),
+    ]
+    assert not result.is_failed()
+
+
+def test_wait_for_command_plain_text():
+    # e.g. logs of container running atomic-reactor inside
+    lines = ['2018-10-18 12:00:00,%03d - atomic_reactor.plugin - INFO - line %d' % (index, index)
+             for index in range(100)]
+    lines.insert(50, '{"stream": "Step 1/1 : FROM fedora\\n"}')
+    data = ''.join(line + '\n' for line in lines).encode('utf-8')
+    result = wait_for_command(iter(split_randomly(data, 10)))
+    expected = lines[:50] + ['Step 1/1 : FROM fedora'] + lines[51:]
+    assert list(result.logs) == expected
+    assert not result.is_failed()
+
+
+def test_benchmark(capsys):
+    data = make_pull_stream(layers=2, progress=10)
+    assert benchmark(data, 0)['items'] == benchmark(data, 100)['items'] == 2 + 2 * 10 + 3
+    main(['--chunk-size', '0', '--chunk-size', '4096'])
+    output = capsys.readouterr()[0].splitlines()
+    assert len(output) == 3
+    assert output[1].split()[0] == 'line'
@@ -0,0 +1,266 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import threading
+
+import pytest
+
+from atomic_reactor.image_catalog import ImageCatalog
+from atomic_reactor.util import ImageName
+
+DIGEST = 'sha256:' + 'd' * 64
+
+
+def make_image(image_id, repo_tags, repo_digests=None):
+    return {
+        'Id': 'sha256:' + image_id * 64,
+        'RepoTags': repo_tags,
+        'RepoDigests': repo_digests,
+        'Size': 0,
+    }
+
+
+class FakeDocker(object):
+    def __init__(self, images):
+        self.images_list = images
+        self.calls = []
+
+    def images(self, name=None):
+        self.calls.append(name)
+        if name is None:
+            return list(self.images_list)
+        return [image for image in self.images_list
+                if any(tag.startswith(name + ':') or tag.startswith(name + '@')
+                       for tag in (image['RepoTags'] or []) + (image['RepoDigests'] or []))]
+
+
+@pytest.fixture
+def docker_client():
+    return FakeDocker([
+        make_image('a', ['fedora:27', 'fedora:latest'], ['fedora@' + DIGEST]),
+        make_image('b', ['registry.example.com/ns/app:1.0']),
+        make_image('c', ['<none>:<none>'], None),
+    ])
+
+
+def test_lookups_from_single_listing(docker_client):
+    catalog = ImageCatalog(docker_client, watch_events=False)
+    assert catalog.get_by_id('sha256:' + 'a' * 64)['RepoTags'] == ['fedora:27', 'fedora:latest']
+    assert catalog.get_by_id('b' * 64)['Id'] == 'sha256:' + 'b' * 64
+    assert catalog.get_by_id('c' * 64) is not None
+    assert catalog.get_by_name('fedora')['Id'] == 'sha256:' + 'a' * 64
+    assert catalog.get_by_name(ImageName.parse('registry.example.com/ns/app:1.0')) is not None
+    assert catalog.get_by_name('fedora@' + DIGEST)['Id'] == 'sha256:' + 'a' * 64
+    assert catalog.get_by_name(DIGEST)['Id'] == 'sha256:' + 'a' * 64
+    assert len(catalog.get_by_repo('fedora')) == 1
+    assert catalog.get_by_id('e' * 64) is None
+    assert docker_client.calls == [None]
+
+
+def test_miss_lists_repository_once(docker_client):
+    catalog = ImageCatalog(docker_client, watch_events=False)
+    assert catalog.get_by_name('fedora:28') is None
+    # built behind our back
+    docker_client.images_list.append(make_image('e', ['app:1']))
+    assert catalog.get_by_name('app:1') is not None
+    assert catalog.get_by_name('app:2') is None
+    assert catalog.get_by_name('app:2') is None
+    assert docker_client.calls == [None, 'fedora', 'app']
+
+
+def test_tag_and_remove(docker_client):
+    catalog = ImageCatalog(docker_client, watch_events=False)
+    catalog.get_by_id('a' * 64)
+
+    catalog.add_name('fedora:27', ImageName.parse('app:1'))
+    assert catalog.get_by_name('app:1')['Id'] == 'sha256:' + 'a' * 64
+    # tag moved to other image
+    catalog.add_name('sha256:' + 'b' * 64, ImageName.parse('app:1'))
+    assert catalog.get_by_name('app:1')['Id'] == 'sha256:' + 'b' * 64
+    assert 'app:1' not in catalog.get_by_id('a' * 64)['RepoTags']
+
+    # removing one of names only untags image
+    catalog.remove('fedora:latest')
+    assert catalog.get_by_id('a' * 64)['RepoTags'] == ['fedora:27']
+    assert catalog.get_by_name('fedora:27') is not None
+    catalog.remove('sha256:' + 'a' * 64)
+    assert catalog.get_by_id('a' * 64) is None
+    assert docker_client.calls == [None]
+
+    del docker_client.images_list[0]
+    assert catalog.get_by_name(DIGEST) is None
+    # miss of name
+    assert catalog.get_by_name('fedora:27') is None
+    assert docker_client.calls == [None, 'fedora']
+
+
+def test_invalidate(docker_client):
+    catalog = ImageCatalog(docker_client, watch_events=False)
+    catalog.get_by_id('a' * 64)
+
+    # pulled new image
+    docker_client.images_list[0] = make_image('e', ['fedora:27'])
+    catalog.invalidate(ImageName.parse('fedora:27'))
+    assert catalog.get_by_name('fedora:27')['Id'] == 'sha256:' + 'e' * 64
+    assert catalog.get_by_name('fedora:latest') is None
+    assert docker_client.calls == [None, 'fedora']
+
+    catalog.invalidate()
+    catalog.get_by_id('a' * 64)
+    assert docker_client.calls == [None, 'fedora', None]
+
+    catalog.ttl = -1
+    catalog.get_by_id('a' * 64)
+    assert docker_client.calls == [None, 'fedora', None, None]
+
+
+@pytest.mark.parametrize(('event', 'calls'), [
+    ({'Type': 'image', 'Action': 'tag',
+      'Actor': {'ID': 'sha256:' + 'a' * 64, 'Attributes': {'name': 'fedora:latest'}}},
+     [None]),
+    ({'Type': 'image', 'Action': 'tag',
+      'Actor': {'ID': 'sha256:' + 'b' * 64, 'Attributes': {'name': 'fedora:latest'}}},
+     [None, 'fedora']),
+    ({'Type': 'image', 'Action': 'pull',
+      'Actor': {'ID': 'fedora:latest', 'Attributes': {'name': 'fedora'}}},
+     [None, 'fedora']),
+    ({'Type': 'image', 'Action': 'delete', 'Actor': {'ID': 'sha256:' + 'e' * 64}},
+     [None]),
+    ({'Type': 'image', 'Action': 'untag', 'Actor': {'ID': 'sha256:' + 'a' * 64}},
+     [None, None]),
+    ({'Type': 'image', 'Action': 'load', 'Actor': {'ID': 'app:1'}},
+     [None, None]),
+    ({'Type': 'container', 'Action': 'start', 'Actor': {'ID': 'abc'}},
+     [None]),
+])
+def test_handle_event(docker_client, event, calls):
+    catalog = ImageCatalog(docker_client, watch_events=False)
+    catalog.get_by_id('a' * 64)
+    catalog.handle_event(event)
+    catalog.get_by_id('a' * 64)
+    assert docker_client.calls == calls
+
+
+def test_watch_events(docker_client):
+    events = [{'Type': 'image', 'Action': 'load', 'Actor': {'ID': 'app:1'}}]
+    docker_client.events = lambda **kwargs: iter(events)
+    catalog = ImageCatalog(docker_client)
+    catalog.get_by_id('a' * 64)
+    catalog._events_thread.join(1)
+    catalog.get_by_id('a' * 64)
+    assert docker_client.calls == [None, None]
+
+
+def test_inspect_cache(docker_client):
+    inspected = []
+
+    def inspect_image(image):
+        inspected.append(image)
+        image_id = 'a' * 64 if image.startswith('fedora') else 'b' * 64
+        return {'Id': 'sha256:' + image_id, 'Config': {'Labels': {}}}
+
+    docker_client.inspect_image = inspect_image
+    catalog = ImageCatalog(docker_client, watch_events=False)
+
+    data = catalog.inspect(ImageName.parse('fedora:27'))
+    data['Config']['Labels']['changed'] = 'by caller'
+    assert catalog.inspect('fedora:27') == {'Id': 'sha256:' + 'a' * 64,
+                                            'Config': {'Labels': {}}}
+    assert catalog.inspect('sha256:' + 'a' * 64)['Id'] == 'sha256:' + 'a' * 64
+    assert catalog.inspect('a' * 64)['Id'] == 'sha256:' + 'a' * 64
+    assert inspected == ['fedora:27']
+
+    # name points to other image now
+    catalog.add_name('sha256:' + 'b' * 64, 'fedora:27')
+    catalog.inspect('fedora:27')
+    # pulled or built
+    catalog.invalidate('fedora:latest')
+    catalog.inspect('fedora:27')
+    assert inspected == ['fedora:27'] * 3
+
+    catalog.remove('fedora:27')
+    catalog.inspect('fedora:27')
+    catalog.invalidate()
+    catalog.inspect('sha256:' + 'a' * 64)
+    assert inspected == ['fedora:27'] * 4 + ['sha256:' + 'a' * 64]
+    # images were never listed
+    assert docker_client.calls == []
+
+
+def test_inspect_cache_watches_events(docker_client):
+    inspected = []
+
+    def inspect_image(image):
+        inspected.append(image)
+        return {'Id': 'sha256:' + 'a' * 64}
+
+    tagged = threading.Event()
+
+    def events(**kwargs):
+        # image is tagged once it was inspected
+        tagged.wait(1)
+        yield {'Type': 'image', 'Action': 'tag',
+               'Actor': {'ID': 'sha256:' + 'b' * 64, 'Attributes': {'name': 'fedora:27'}}}
+
+    docker_client.inspect_image = inspect_image
+    docker_client.events = events
+    catalog = ImageCatalog(docker_client)
+
+    # images weren't listed, events are watched anyway
+    catalog.inspect('fedora:27')
+    tagged.set()
+    catalog._events_thread.join(1)
+    catalog.inspect('fedora:27')
+    assert inspected == ['fedora:27'] * 2
+    assert docker_client.calls == []
+
+
+def test_inspect_cache_expires(docker_client):
+    inspected = []
+
+    def inspect_image(image):
+        inspected.append(image)
+        return {'Id': 'sha256:' + 'a' * 64}
+
+    docker_client.inspect_image = inspect_image
+    catalog = ImageCatalog(docker_client, watch_events=False)
+
+    catalog.inspect('fedora:27')
+    catalog.inspect('fedora:27')
+    assert inspected == ['fedora:27']
+
+    # whole catalog is listed again
+    catalog.get_by_id('a' * 64)
+    catalog.inspect('fedora:27')
+    assert inspected == ['fedora:27'] * 2
+
+    catalog.ttl = -1
+    catalog.inspect('fedora:27')
+    assert inspected == ['fedora:27'] * 3
+    # looked up by id
+    catalog.inspect('a' * 64)
+    assert inspected == ['fedora:27'] * 3
+
+
+def test_inspect_changed_while_inspecting(docker_client):
+    inspected = []
+
+    def inspect_image(image):
+        inspected.append(image)
+        # e.g. event about image being pulled arrives meanwhile
+        catalog.invalidate(image)
+        return {'Id': 'sha256:' + 'a' * 64}
+
+    docker_client.inspect_image = inspect_image
+    catalog = ImageCatalog(docker_client, watch_events=False)
+
+    catalog.inspect('fedora:27')
+    catalog.inspect('fedora:27')
+    assert inspected == ['fedora:27'] * 2
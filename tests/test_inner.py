@@ -11,7 +11,6 @@ from __future__ import unicode_literals
 from collections import defaultdict
 import json
 import os
-import time
 import docker
 from dockerfile_parse import DockerfileParser
 
@@ -33,7 +32,6 @@ import signal
 
 from atomic_reactor.inner import BuildResults, BuildResultsEncoder, BuildResultsJSONDecoder
 from atomic_reactor.inner import DockerBuildWorkflow
-from atomic_reactor.inner import FSWatcher
 from atomic_reactor.constants import INSPECT_ROOTFS, INSPECT_ROOTFS_LAYERS
 
 
@@ -342,6 +340,9 @@ def test_workflow():
                                                       'watcher': watch_exit
                                                   }}],
                                    plugin_files=[this_file])
+    # connections to registries are closed and registry cache is dropped after build
+    flexmock(atomic_reactor.inner).should_receive('clear_registry_sessions').once()
+    flexmock(atomic_reactor.inner).should_receive('set_registry_cache').with_args(None).once()
 
     workflow.build_docker_image()
 
@@ -353,6 +354,76 @@ def test_workflow():
     assert workflow.base_image_inspect == {}
 
 
+def test_workflow_trace(tmpdir):
+    """
+    Test trace of plugins is written at the end of build.
+    """
+
+    flexmock(DockerfileParser, content='df_content')
+    this_file = inspect.getfile(PreWatched)
+    mock_docker()
+    fake_builder = MockInsideBuilder()
+    flexmock(InsideBuilder).new_instances(fake_builder)
+    trace_file = str(tmpdir.join('trace.json'))
+    workflow = DockerBuildWorkflow(MOCK_SOURCE, 'test-image',
+                                   prebuild_plugins=[{'name': 'pre_watched',
+                                                      'args': {
+                                                          'watcher': Watcher()
+                                                      }}],
+                                   buildstep_plugins=[{'name': 'buildstep_watched',
+                                                       'args': {
+                                                           'watcher': Watcher()
+                                                       }}],
+                                   exit_plugins=[{'name': 'exit_watched',
+                                                  'args': {
+                                                      'watcher': Watcher()
+                                                  }}],
+                                   plugin_files=[this_file],
+                                   trace=True,
+                                   trace_file=trace_file)
+
+    workflow.build_docker_image()
+
+    with open(trace_file) as f:
+        trace = json.load(f)
+    spans = [event['name'] for event in trace['traceEvents'] if event['cat'] == 'plugin']
+    assert spans == ['pre_watched', 'buildstep_watched', 'exit_watched']
+    assert not atomic_reactor.inner.tracer.enabled
+
+
+def test_workflow_build_timeout():
+    """
+    Test plugins are not run once build deadline passed, except exit plugins.
+    """
+
+    flexmock(DockerfileParser, content='df_content')
+    this_file = inspect.getfile(PreWatched)
+    mock_docker()
+    fake_builder = MockInsideBuilder()
+    flexmock(InsideBuilder).new_instances(fake_builder)
+    watch_pre = Watcher()
+    watch_exit = Watcher()
+    workflow = DockerBuildWorkflow(MOCK_SOURCE, 'test-image',
+                                   prebuild_plugins=[{'name': 'pre_watched',
+                                                      'is_allowed_to_fail': False,
+                                                      'args': {
+                                                          'watcher': watch_pre
+                                                      }}],
+                                   exit_plugins=[{'name': 'exit_watched',
+                                                  'args': {
+                                                      'watcher': watch_exit
+                                                  }}],
+                                   plugin_files=[this_file],
+                                   build_timeout=0.000001)
+
+    with pytest.raises(PluginFailedException) as exc:
+        workflow.build_docker_image()
+    assert 'no time left' in str(exc.value)
+    assert workflow.deadline is not None
+    assert not watch_pre.was_called()
+    assert watch_exit.was_called()
+
+
 def test_workflow_base_images():
     """
     Test workflow for base images
@@ -403,6 +474,24 @@ def test_workflow_base_images():
         assert workflow.base_image_inspect
 
 
+def test_workflow_base_image_inspect():
+    mock_docker()
+    fake_builder = MockInsideBuilder()
+    flexmock(InsideBuilder).new_instances(fake_builder)
+    workflow = DockerBuildWorkflow(MOCK_SOURCE, 'test-image')
+    workflow.builder = fake_builder
+    (flexmock(fake_builder.tasker)
+        .should_receive('inspect_image')
+        .replace_with(lambda image: {'Id': str(image)})
+        .twice())
+
+    assert workflow.base_image_inspect == {'Id': 'Fedora:22'}
+    assert workflow.base_image_inspect == {'Id': 'Fedora:22'}
+    # e.g. pull_base_image plugin changed it
+    fake_builder.base_image = ImageName(repo='Fedora', tag='23')
+    assert workflow.base_image_inspect == {'Id': 'Fedora:23'}
+
+
 class FakeLogger(object):
     def __init__(self):
         self.debugs = []
@@ -1349,32 +1438,3 @@ def test_layer_sizes():
     ]
 
     assert workflow.layer_sizes == expected
-
-
-def test_fs_watcher_update(monkeypatch):
-
-    # check that using the actual os call does not choke
-    assert type(FSWatcher._update({})) is dict
-
-    # check that the data actually gets updated
-    stats = flexmock(
-        f_frsize=1000,  # pretend blocks are 1000 bytes to make mb come out right
-        f_blocks=101 * 1000,
-        f_bfree=99 * 1000,
-        f_files=1, f_ffree=1,
-    )
-    data = dict(mb_total=101, mb_free=100)
-    monkeypatch.setattr(os, "statvfs", stats)
-    assert type(FSWatcher._update(data)) is dict
-    assert data["mb_used"] == 2
-    assert data["mb_free"] == 99
-
-
-def test_fs_watcher(monkeypatch):
-    w = FSWatcher()
-    monkeypatch.setattr(time, "sleep", lambda x: x)  # don't waste a second of test time
-    w.start()
-    w.finish()
-    w.join(0.1)  # timeout if thread still running
-    assert not w.is_alive()
-    assert "mb_used" in w.get_usage_data()
@@ -29,6 +29,7 @@ from atomic_reactor.koji_util import (koji_login, create_koji_session,
                                       TaskWatcher, tag_koji_build)
 from atomic_reactor import koji_util
 from atomic_reactor.plugin import BuildCanceledException
+from atomic_reactor.tracing import tracer
 import flexmock
 import pytest
 
@@ -112,6 +113,24 @@ class TestCreateKojiSession(object):
             url, opts={'krb_rdns': False}).and_return(session))
         assert create_koji_session(url, {}) == session
 
+    def test_create_traced_session(self, request):
+        url = 'https://koji-hub-url.com'
+
+        class Session(object):
+            def _callMethod(self, name, args, kwargs=None):
+                return name
+
+        session = Session()
+        (flexmock(koji_util.koji).should_receive('ClientSession').with_args(
+            url, opts={'krb_rdns': False}).and_return(session))
+        tracer.clear()
+        tracer.enable()
+        request.addfinalizer(tracer.disable)
+        assert create_koji_session(url) == session
+        assert session._callMethod('getBuild', (1, )) == 'getBuild'
+        assert [event['name'] for event in tracer.get_events()] == ['koji.getBuild']
+        tracer.clear()
+
 
 class TestStreamTaskOutput(object):
     def test_output_as_generator(self):
@@ -160,6 +179,24 @@ class TestTaskWatcher(object):
         assert task.wait() == exp_state
         assert task.failed() == exp_failed
 
+    def test_wait_async(self):
+        session = flexmock()
+        task_ids = [1234, 1235]
+        for task_id in task_ids:
+            (session.should_receive('taskFinished')
+                .with_args(task_id)
+                .and_return(False)
+                .and_return(True))
+            (session.should_receive('getTaskInfo')
+                .with_args(task_id, request=True)
+                .once()
+                .and_return({'state': koji.TASK_STATES['CLOSED']}))
+
+        tasks = [TaskWatcher(session, task_id, poll_interval=0) for task_id in task_ids]
+        results = [task.wait_async() for task in tasks]
+        assert [result.get() for result in results] == ['CLOSED', 'CLOSED']
+        assert not any(task.failed() for task in tasks)
+
     def test_cancel(self):
         session = flexmock()
         task_id = 1234
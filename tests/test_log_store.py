@@ -0,0 +1,72 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import os
+
+from atomic_reactor.log_store import LogStore
+
+
+def test_tail_in_memory(tmpdir):
+    logs = LogStore(tail_size=3, spill_dir=str(tmpdir))
+    assert not logs
+    for index in range(3):
+        logs.append('line %d' % index)
+    assert list(logs) == ['line 0', 'line 1', 'line 2']
+    assert len(logs) == 3
+    assert 'line 1' in logs
+    # nothing spilled yet
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_spill(tmpdir):
+    logs = LogStore(tail_size=10, spill_dir=str(tmpdir))
+    for index in range(25):
+        logs.append('line \u017e %d' % index)
+    assert len(logs) == 25
+    assert logs.tail() == ['line \u017e %d' % index for index in range(15, 25)]
+    assert logs.tail(2) == ['line \u017e 23', 'line \u017e 24']
+    assert len(os.listdir(str(tmpdir))) == 1
+    expected = ['line \u017e %d' % index for index in range(25)]
+    assert list(logs) == expected
+
+    # keeps spilling after it was read
+    for index in range(25, 40):
+        logs.append('line \u017e %d' % index)
+    expected += ['line \u017e %d' % index for index in range(25, 40)]
+    assert list(logs) == expected
+    assert "\n".join(logs) == "\n".join(expected)
+
+    logs.close()
+    assert os.listdir(str(tmpdir)) == []
+    assert list(logs) == []
+
+
+def test_json_entries(tmpdir):
+    logs = LogStore(tail_size=1, spill_dir=str(tmpdir), json_entries=True)
+    items = [{'status': 'Pulling'}, 'not json', {'stream': 'Step 1'}]
+    for item in items:
+        logs.append(item)
+    assert list(logs) == items
+
+
+def test_collapse(tmpdir):
+    logs = LogStore(tail_size=3, spill_dir=str(tmpdir))
+    logs.append('a 1', collapse_key='a')
+    logs.append('b 1', collapse_key='b')
+    logs.append('a 2', collapse_key='a')
+    assert list(logs) == ['a 2', 'b 1']
+
+    logs.release(lambda key: key == 'a')
+    logs.append('a 3', collapse_key='a')
+    logs.append('c', collapse_key='c')
+    # 'a 2' spilled, can't be replaced any more
+    logs.append('a 4', collapse_key='a')
+    logs.append('c', collapse_key='c')
+    assert list(logs) == ['a 2', 'b 1', 'a 4', 'c']
@@ -147,6 +147,22 @@ def test_wait_for_compose(odcs_client, final_state_id, final_state_name, expect_
         odcs_client.wait_for_compose(COMPOSE_ID)
 
 
+@responses.activate
+def test_wait_for_compose_async(odcs_client):
+    compose_ids = [COMPOSE_ID, COMPOSE_ID + 1]
+    for compose_id in compose_ids:
+        responses.add(responses.GET, '{}composes/{}'.format(ODCS_URL, compose_id),
+                      body=compose_json(2, 'done', compose_id=compose_id))
+
+    results = [odcs_client.wait_for_compose_async(compose_id) for compose_id in compose_ids]
+    assert [result.get()['id'] for result in results] == compose_ids
+
+    responses.add(responses.GET, '{}composes/{}'.format(ODCS_URL, 1),
+                  body=compose_json(4, 'failed'))
+    with pytest.raises(RuntimeError):
+        odcs_client.wait_for_compose_async(1).get()
+
+
 @responses.activate
 def test_renew_compose(odcs_client):
     new_compose_id = COMPOSE_ID + 1
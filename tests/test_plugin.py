@@ -10,7 +10,27 @@ from __future__ import unicode_literals
 
 import json
 import os
+import pstats
+import signal
+import threading
 import time
+from textwrap import dedent
+
+try:
+    import koji
+except ImportError:
+    import inspect
+    import sys
+
+    # Find our mocked koji module
+    import tests.koji as koji
+    mock_koji_path = os.path.dirname(inspect.getfile(koji.ClientSession))
+    if mock_koji_path not in sys.path:
+        sys.path.append(os.path.dirname(mock_koji_path))
+
+    # Now load it properly, the same way the module we're testing will
+    del koji
+    import koji  # noqa
 
 from dockerfile_parse import DockerfileParser
 from flexmock import flexmock
@@ -18,14 +38,23 @@ import pytest
 
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.build import BuildResult
+from atomic_reactor.concurrency import get_default_executor
 from atomic_reactor.plugin import (BuildPluginsRunner, PreBuildPluginsRunner,
                                    PostBuildPluginsRunner, InputPluginsRunner,
                                    PluginFailedException, PrePublishPluginsRunner,
                                    ExitPluginsRunner, BuildStepPluginsRunner,
                                    PluginsRunner, InappropriateBuildStepError,
-                                   BuildStepPlugin, PreBuildPlugin,
-                                   PreBuildSleepPlugin)
+                                   BuildStepPlugin, PreBuildPlugin, BuildCanceledException,
+                                   PreBuildSleepPlugin, get_plugin_dependencies,
+                                   results_resource, plugin_registry)
+from atomic_reactor.plugins.exit_delete_from_registry import DeleteFromRegistryPlugin
+from atomic_reactor.plugins.exit_koji_import import KojiImportPlugin
+from atomic_reactor.plugins.exit_koji_tag_build import KojiTagBuildPlugin
+from atomic_reactor.plugins.exit_remove_built_image import GarbageCollectionPlugin
+from atomic_reactor.plugins.exit_sendmail import SendMailPlugin
+from atomic_reactor.plugins.exit_store_metadata_in_osv3 import StoreMetadataInOSv3Plugin
 from atomic_reactor.plugins.pre_add_yum_repo_by_url import AddYumRepoByUrlPlugin
+from atomic_reactor.tracing import tracer
 from atomic_reactor.util import ImageName
 
 from tests.fixtures import docker_tasker  # noqa
@@ -101,6 +130,355 @@ def test_load_plugins(docker_tasker, runner_type, tmpdir):
     assert len(runner.plugin_classes) > 0
 
 
+PLUGIN_FILE = """
+from atomic_reactor.constants import PLUGIN_KOJI_PARENT_KEY
+from atomic_reactor.plugin import PreBuildPlugin
+from atomic_reactor.plugins.pre_add_labels_in_df import AddLabelsPlugin
+
+MY_KEY = 'my_plugin'
+
+
+class MyPlugin(PreBuildPlugin):
+    key = MY_KEY
+
+    def run(self):
+        return 'my result'
+
+
+class MyKojiParentPlugin(PreBuildPlugin):
+    key = PLUGIN_KOJI_PARENT_KEY
+
+    def run(self):
+        return 'my koji parent'
+
+
+class MySubclassedPlugin(AddLabelsPlugin):
+    pass
+"""
+
+
+def test_load_plugins_lazily(docker_tasker, tmpdir):  # noqa
+    """
+    plugin files are imported only when their plugins are needed, and once
+    for all runners
+    """
+    plugin_file = tmpdir.join('my_plugins.py')
+    plugin_file.write(PLUGIN_FILE)
+
+    imports_count = plugin_registry.imports_count
+    for _ in range(5):
+        runner = PreBuildPluginsRunner(docker_tasker, mock_workflow(tmpdir),
+                                       [{'name': 'my_plugin'}],
+                                       plugin_files=[str(plugin_file)])
+        assert 'my_plugin' in runner.plugin_classes
+        assert 'no_such_plugin' not in runner.plugin_classes
+        assert runner.run() == {'my_plugin': 'my result'}
+    assert plugin_registry.imports_count - imports_count == 1
+
+    # plugin files given later take precedence, even for keys defined as constants
+    assert runner.plugin_classes['koji_parent'].__name__ == 'MyKojiParentPlugin'
+    # key is inherited
+    assert runner.plugin_classes['add_labels_in_dockerfile'].__name__ == 'MySubclassedPlugin'
+
+    # listing all plugins imports the remaining plugin files
+    assert 'pull_base_image' in dict(runner.plugin_classes.items())
+    assert runner.plugin_classes['my_plugin'].__name__ == 'MyPlugin'
+
+
+def test_load_plugins_base_outside_plugin_files(docker_tasker, tmpdir, monkeypatch):  # noqa
+    """
+    plugin file whose classes inherit from classes the index can't find is imported
+    """
+    tmpdir.join('my_base_plugins.py').write(dedent("""\
+        from atomic_reactor.plugin import PreBuildPlugin
+
+
+        class MyBasePlugin(PreBuildPlugin):
+            def run(self):
+                return 'derived result'
+        """))
+    plugin_file = tmpdir.join('my_derived_plugins.py')
+    plugin_file.write(dedent("""\
+        from my_base_plugins import MyBasePlugin
+
+
+        class MyDerivedPlugin(MyBasePlugin):
+            key = 'my_derived'
+        """))
+    monkeypatch.syspath_prepend(str(tmpdir))
+
+    imports_count = plugin_registry.imports_count
+    runner = PreBuildPluginsRunner(docker_tasker, mock_workflow(tmpdir),
+                                   [{'name': 'my_derived'}],
+                                   plugin_files=[str(plugin_file)])
+    assert 'my_derived' in runner.plugin_classes
+    assert runner.run() == {'my_derived': 'derived result'}
+    # other plugin files are still loaded lazily
+    assert plugin_registry.imports_count - imports_count == 1
+
+
+@pytest.mark.parametrize('pstats_dump', [True, False])
+@pytest.mark.parametrize('plugin_timeout', [None, 3600])
+def test_profile_plugins(docker_tasker, tmpdir, pstats_dump, plugin_timeout):  # noqa
+    flexmock(PluginsRunner, load_plugins=lambda x: {PreBuildSleepPlugin.key: PreBuildSleepPlugin})
+    workflow = mock_workflow(tmpdir)
+    workflow.profile_plugins = True
+    workflow.profile_plugins_pstats = pstats_dump
+    runner = PreBuildPluginsRunner(docker_tasker, workflow,
+                                   [{'name': PreBuildSleepPlugin.key, 'args': {'seconds': 0}}],
+                                   plugin_timeout=plugin_timeout)
+    runner.run()
+
+    profile = workflow.plugins_profiles[PreBuildSleepPlugin.key]
+    assert 'cpu_user' in profile
+    assert profile['http_calls'] == 0
+    if pstats_dump:
+        assert os.path.dirname(profile['pstats']) == workflow.source.workdir
+        assert os.path.exists(profile['pstats'])
+        # plugin is profiled in thread it runs in
+        functions = [function for _, _, function in pstats.Stats(profile['pstats']).stats]
+        assert 'run' in functions
+    else:
+        assert 'pstats' not in profile
+
+
+@pytest.mark.parametrize('plugin_timeout', [None, 3600])
+def test_plugin_span_in_plugin_thread(docker_tasker, tmpdir, plugin_timeout):  # noqa
+    class TracedPlugin(PreBuildPlugin):
+        key = 'traced'
+
+        def run(self):
+            with tracer.span('child', 'test'):
+                return threading.current_thread().ident
+
+    flexmock(PluginsRunner, load_plugins=lambda x: {TracedPlugin.key: TracedPlugin})
+    workflow = mock_workflow(tmpdir)
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, [{'name': TracedPlugin.key}],
+                                   plugin_timeout=plugin_timeout)
+    tracer.clear()
+    tracer.enable()
+    try:
+        thread_id = runner.run()[TracedPlugin.key]
+        events = {event['name']: event for event in tracer.get_events()}
+    finally:
+        tracer.disable()
+        tracer.clear()
+
+    # child span is nested in span of plugin
+    assert events[TracedPlugin.key]['tid'] == events['child']['tid'] == thread_id
+    assert events[TracedPlugin.key]['ts'] <= events['child']['ts']
+
+
+def test_plugins_not_profiled_by_default(docker_tasker, tmpdir):  # noqa
+    flexmock(PluginsRunner, load_plugins=lambda x: {PreBuildSleepPlugin.key: PreBuildSleepPlugin})
+    workflow = mock_workflow(tmpdir)
+    runner = PreBuildPluginsRunner(docker_tasker, workflow,
+                                   [{'name': PreBuildSleepPlugin.key, 'args': {'seconds': 0}}])
+    runner.run()
+    assert workflow.plugins_profiles == {}
+
+
+def test_plugins_share_runner_executor(docker_tasker, tmpdir):  # noqa
+    executors = []
+
+    class FanOutPlugin(PreBuildPlugin):
+        key = 'fan_out'
+
+        def run(self):
+            executors.append(self.executor)
+            return self.executor.map(lambda x: x * 2, [1, 2, 3])
+
+    class OtherFanOutPlugin(FanOutPlugin):
+        key = 'other_fan_out'
+
+    flexmock(PluginsRunner, load_plugins=lambda x: {
+        FanOutPlugin.key: FanOutPlugin,
+        OtherFanOutPlugin.key: OtherFanOutPlugin,
+    })
+    workflow = mock_workflow(tmpdir)
+    runner = PreBuildPluginsRunner(docker_tasker, workflow,
+                                   [{'name': FanOutPlugin.key},
+                                    {'name': OtherFanOutPlugin.key}],
+                                   async_workers=2)
+    flexmock(runner.executor).should_call('shutdown').once()
+    results = runner.run()
+    assert results == {FanOutPlugin.key: [2, 4, 6], OtherFanOutPlugin.key: [2, 4, 6]}
+    assert executors == [runner.executor, runner.executor]
+    assert runner.executor.max_workers == 2
+
+    # plugin created outside of runner uses the default executor
+    assert FanOutPlugin(docker_tasker, workflow).executor is get_default_executor()
+
+
+class PollingPlugin(PreBuildPlugin):
+    key = 'polling'
+    is_allowed_to_fail = False
+
+    def __init__(self, tasker, workflow, stopped):
+        super(PollingPlugin, self).__init__(tasker, workflow)
+        self.stopped = stopped
+
+    def run(self):
+        try:
+            while True:
+                self.check_deadline()
+                time.sleep(0.01)
+        finally:
+            self.stopped.set()
+
+
+@pytest.mark.parametrize(('runner_kwargs', 'request_timeout'), [
+    ({'plugin_timeout': 0.2}, None),
+    ({'plugin_timeout': 3600}, 0.2),
+    ({'deadline': time.time() + 3600}, 0.2),
+])
+def test_plugin_timeout(docker_tasker, tmpdir, runner_kwargs, request_timeout):  # noqa
+    flexmock(PluginsRunner, load_plugins=lambda x: {PollingPlugin.key: PollingPlugin})
+    workflow = mock_workflow(tmpdir)
+    stopped = threading.Event()
+    plugin_request = {'name': PollingPlugin.key, 'args': {'stopped': stopped}}
+    if request_timeout is not None:
+        plugin_request['timeout'] = request_timeout
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, [plugin_request], **runner_kwargs)
+
+    start = time.time()
+    with pytest.raises(PluginFailedException) as exc_info:
+        runner.run()
+    assert time.time() - start < 10
+    assert 'PluginTimeoutException' in str(exc_info.value)
+    assert workflow.plugins_errors[PollingPlugin.key]
+    # plugin noticed it ran out of time
+    assert stopped.wait(10)
+
+
+class SleepingPlugin(PreBuildPlugin):
+    key = 'sleeping'
+    is_allowed_to_fail = False
+    # exceptions which stopped plugin
+    stopped = []
+    # threading.Event set once plugin is running
+    started = None
+
+    def run(self):
+        try:
+            if self.started is not None:
+                self.started.set()
+            self.sleep(3600)
+        except Exception as ex:
+            self.stopped.append(ex)
+            raise
+
+
+def test_plugin_timeout_cancels_plugin(docker_tasker, tmpdir):  # noqa
+    flexmock(PluginsRunner, load_plugins=lambda x: {SleepingPlugin.key: SleepingPlugin})
+    workflow = mock_workflow(tmpdir)
+    stopped = []
+    flexmock(SleepingPlugin, stopped=stopped)
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, [{'name': SleepingPlugin.key}],
+                                   plugin_timeout=0.2)
+    with pytest.raises(PluginFailedException):
+        runner.run()
+    # plugin stopped before runner moved on
+    assert len(stopped) == 1
+    assert 'PluginTimeoutException' in repr(stopped[0])
+
+
+@pytest.mark.parametrize('runner_kwargs', [
+    {'plugin_timeout': 3600},
+    {'max_workers': 2},
+])
+def test_build_canceled_cancels_plugins(docker_tasker, tmpdir, runner_kwargs):  # noqa
+    flexmock(PluginsRunner, load_plugins=lambda x: {SleepingPlugin.key: SleepingPlugin})
+    workflow = mock_workflow(tmpdir)
+    stopped = []
+    started = threading.Event()
+    flexmock(SleepingPlugin, stopped=stopped, started=started)
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, [{'name': SleepingPlugin.key}],
+                                   **runner_kwargs)
+
+    def cancel_build(*args):
+        raise BuildCanceledException('Build was canceled')
+
+    def send_signal():
+        # cancel build only once plugin is running
+        if started.wait(10):
+            os.kill(os.getpid(), signal.SIGALRM)
+
+    # like SIGTERM handler of DockerBuildWorkflow, runs in main thread
+    previous_handler = signal.signal(signal.SIGALRM, cancel_build)
+    sender = threading.Thread(target=send_signal)
+    sender.start()
+    try:
+        # sequential runner reports it as failure of plugin, like when plugin runs
+        # in main thread
+        with pytest.raises((BuildCanceledException, PluginFailedException)) as exc:
+            runner.run()
+    finally:
+        sender.join()
+        signal.signal(signal.SIGALRM, previous_handler)
+
+    assert 'Build was canceled' in str(exc.value)
+    assert len(stopped) == 1
+    assert isinstance(stopped[0], BuildCanceledException)
+
+
+def test_build_deadline_passed(docker_tasker, tmpdir):  # noqa
+    flexmock(PluginsRunner, load_plugins=lambda x: {PreBuildSleepPlugin.key: PreBuildSleepPlugin})
+    workflow = mock_workflow(tmpdir)
+    plugins = [{'name': PreBuildSleepPlugin.key, 'args': {'seconds': 0},
+                'is_allowed_to_fail': False}]
+    flexmock(PreBuildSleepPlugin).should_receive('run').never()
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, plugins, deadline=time.time() - 1)
+    with pytest.raises(PluginFailedException) as exc_info:
+        runner.run()
+    assert 'no time left' in str(exc_info.value)
+
+
+@pytest.mark.parametrize('fail', [True, False])
+def test_plugin_with_deadline_result(docker_tasker, tmpdir, fail):  # noqa
+    class ResultPlugin(PreBuildPlugin):
+        key = 'result'
+        is_allowed_to_fail = False
+
+        def run(self):
+            assert self.remaining_time() > 0
+            if fail:
+                raise ValueError('plugin failed')
+            return 'result'
+
+    flexmock(PluginsRunner, load_plugins=lambda x: {ResultPlugin.key: ResultPlugin})
+    workflow = mock_workflow(tmpdir)
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, [{'name': ResultPlugin.key}],
+                                   plugin_timeout=3600)
+    if fail:
+        with pytest.raises(PluginFailedException) as exc_info:
+            runner.run()
+        assert 'plugin failed' in str(exc_info.value)
+    else:
+        assert runner.run() == {ResultPlugin.key: 'result'}
+
+
+def test_get_plugin_deadline(docker_tasker, tmpdir):  # noqa
+    flexmock(PluginsRunner, load_plugins=lambda x: {})
+    workflow = mock_workflow(tmpdir)
+    plugins = [{'name': 'default'}, {'name': 'longer', 'timeout': 100}, {'name': 'no_timeout'}]
+    now = time.time()
+    flexmock(time).should_receive('time').and_return(now)
+
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, plugins)
+    assert runner.get_plugin_deadline('default') is None
+    assert runner.get_plugin_deadline('longer') == now + 100
+
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, plugins, plugin_timeout=10)
+    assert runner.get_plugin_deadline('default') == now + 10
+    assert runner.get_plugin_deadline('longer') == now + 100
+
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, plugins, plugin_timeout=10,
+                                   deadline=now + 50)
+    assert runner.get_plugin_deadline('default') == now + 10
+    assert runner.get_plugin_deadline('longer') == now + 50
+
+
 class X(object):
     pass
 
@@ -291,6 +669,128 @@ def test_which_buildstep_plugin_configured(
     assert runner.plugins_conf == expected
 
 
+class TestConcurrentPlugins(object):
+
+    def make_plugin(self, plugin_key, reads=None, writes=None, run=None,
+                    allowed_to_fail=True):
+        return type(str(plugin_key), (PreBuildPlugin, ), {
+            'key': plugin_key,
+            'reads': reads,
+            'writes': writes,
+            'is_allowed_to_fail': allowed_to_fail,
+            'run': run or (lambda self: self.key),
+        })
+
+    @pytest.mark.parametrize(('declarations', 'expected'), [
+        ([(None, None), ((), ())], [set(), {0}]),
+        ([((), ()), (None, None)], [set(), {0}]),
+        ([(('a', ), ()), (('a', ), ())], [set(), set()]),
+        ([((), ('a', )), (('a', ), ())], [set(), {0}]),
+        ([(('a', ), ()), ((), ('a', ))], [set(), {0}]),
+        ([((), ('a', )), ((), ('a', ))], [set(), {0}]),
+        ([((), ()), ((), ()), ((results_resource('plugin0'), ), ())],
+         [set(), set(), {0}]),
+        ([((), ('a', )), ((), ('b', )), (('a', 'b'), ())], [set(), set(), {0, 1}]),
+    ])
+    def test_get_plugin_dependencies(self, declarations, expected):
+        plugin_classes = [self.make_plugin('plugin%d' % index, reads=reads, writes=writes)
+                          for index, (reads, writes) in enumerate(declarations)]
+        assert get_plugin_dependencies(plugin_classes) == expected
+
+    def test_exit_plugins_dependencies(self):
+        plugin_classes = [
+            DeleteFromRegistryPlugin,
+            KojiImportPlugin,
+            KojiTagBuildPlugin,
+            StoreMetadataInOSv3Plugin,
+            GarbageCollectionPlugin,
+            SendMailPlugin,
+        ]
+        assert get_plugin_dependencies(plugin_classes) == [
+            set(),
+            # koji_import lists registries left in push_conf
+            {0},
+            # koji_tag_build tags imported build
+            {1},
+            # store_metadata stores metadata of all plugins before it
+            {0, 1, 2},
+            # image removal waits for plugins inspecting images, not for registry deletion
+            {1, 3},
+            # sendmail reports koji build and stored metadata
+            {1, 3},
+        ]
+
+    def test_independent_plugins_overlap(self, tmpdir, docker_tasker):  # noqa
+        started = threading.Event()
+
+        def wait_for_other(self):
+            return started.wait(5)
+
+        def start(self):
+            started.set()
+            return True
+
+        waiting = self.make_plugin('waiting', reads=(), writes=(), run=wait_for_other)
+        starting = self.make_plugin('starting', reads=(), writes=(), run=start)
+        flexmock(PluginsRunner, load_plugins=lambda x: {waiting.key: waiting,
+                                                        starting.key: starting})
+        workflow = mock_workflow(tmpdir)
+        runner = PreBuildPluginsRunner(docker_tasker, workflow,
+                                       [{'name': waiting.key}, {'name': starting.key}],
+                                       max_workers=2)
+        results = runner.run()
+        assert results == {'waiting': True, 'starting': True}
+        assert set(workflow.plugins_durations) == {'waiting', 'starting'}
+
+    def test_dependencies_are_respected(self, tmpdir, docker_tasker):  # noqa
+        order = []
+
+        def record(self):
+            order.append(self.key)
+            return self.key
+
+        first = self.make_plugin('first', reads=(), writes=('a', ), run=record)
+        second = self.make_plugin('second', reads=('a', ), writes=(), run=record)
+        undeclared = self.make_plugin('undeclared', run=record)
+        flexmock(PluginsRunner, load_plugins=lambda x: {first.key: first,
+                                                        second.key: second,
+                                                        undeclared.key: undeclared})
+        runner = PreBuildPluginsRunner(docker_tasker, mock_workflow(tmpdir),
+                                       [{'name': first.key}, {'name': second.key},
+                                        {'name': undeclared.key}],
+                                       max_workers=4)
+        runner.run()
+        assert order == ['first', 'second', 'undeclared']
+
+    @pytest.mark.parametrize('keep_going', [True, False])
+    def test_failure(self, tmpdir, docker_tasker, keep_going):  # noqa
+        def fail(self):
+            raise RuntimeError('failed')
+
+        failing = self.make_plugin('failing', reads=(), writes=('a', ), run=fail,
+                                   allowed_to_fail=False)
+        tolerated = self.make_plugin('tolerated', reads=(), writes=(), run=fail)
+        dependent = self.make_plugin('dependent', reads=('a', ), writes=())
+        flexmock(PluginsRunner, load_plugins=lambda x: {failing.key: failing,
+                                                        tolerated.key: tolerated,
+                                                        dependent.key: dependent})
+        workflow = mock_workflow(tmpdir)
+        runner = PreBuildPluginsRunner(docker_tasker, workflow,
+                                       [{'name': failing.key}, {'name': tolerated.key},
+                                        {'name': dependent.key}],
+                                       max_workers=3)
+        with pytest.raises(PluginFailedException) as exc:
+            runner.run(keep_going=keep_going)
+
+        assert "plugin 'failing' raised an exception" in str(exc.value)
+        assert workflow.plugin_failed
+        assert isinstance(workflow.prebuild_results['tolerated'], RuntimeError)
+        if keep_going:
+            assert workflow.prebuild_results['dependent'] == 'dependent'
+        else:
+            assert 'dependent' not in workflow.prebuild_results
+
+
 class TestBuildPluginsRunner(object):
 
     @pytest.mark.parametrize(('params'), [
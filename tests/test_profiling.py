@@ -0,0 +1,70 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import pstats
+
+import pytest
+import requests
+import responses
+
+from atomic_reactor.profiling import PluginProfiler, read_proc_io, tracemalloc
+
+
+def test_read_proc_io(tmpdir):
+    proc_io = tmpdir.join('io')
+    proc_io.write('rchar: 100\nwchar: 20\nread_bytes: 4096\nwrite_bytes: 0\n')
+    assert read_proc_io(str(proc_io)) == {
+        'rchar': 100,
+        'wchar': 20,
+        'read_bytes': 4096,
+        'write_bytes': 0,
+    }
+
+    assert read_proc_io(str(tmpdir.join('missing'))) == {}
+
+
+@responses.activate
+@pytest.mark.parametrize('pstats_dump', [True, False])
+def test_plugin_profiler(tmpdir, pstats_dump):
+    url = 'https://registry.example.com/v2/'
+    responses.add(responses.GET, url, json={})
+    pstats_path = str(tmpdir.join('plugin.pstats')) if pstats_dump else None
+
+    profiler = PluginProfiler(pstats_path=pstats_path)
+    assert profiler.get_summary() is None
+    profiler.start()
+    data = [str(i) * 100 for i in range(1000)]
+    tmpdir.join('data').write(''.join(data))
+    for _ in range(3):
+        requests.get(url)
+    profiler.stop()
+
+    summary = profiler.get_summary()
+    assert summary['http_calls'] == 3
+    assert summary['docker_api_calls'] == 0
+    assert summary['cpu_user'] >= 0
+    assert summary['cpu_system'] >= 0
+    assert summary['max_rss_delta'] >= 0
+    if os.path.exists('/proc/self/io'):
+        assert summary['io']['wchar'] > 0
+
+    if tracemalloc is None:
+        assert 'top_allocations' not in summary
+    else:
+        assert summary['top_allocations']
+        assert all(allocation['size'] > 0 for allocation in summary['top_allocations'])
+        assert not tracemalloc.is_tracing()
+
+    if pstats_dump:
+        assert summary['pstats'] == pstats_path
+        assert pstats.Stats(pstats_path).total_calls > 0
+    else:
+        assert 'pstats' not in summary
@@ -0,0 +1,107 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+
+from flexmock import flexmock
+import pytest
+
+from atomic_reactor.registry_cache import RegistryCache
+
+MEDIA_TYPE = 'application/vnd.docker.distribution.manifest.v2+json'
+
+
+def make_digest(content):
+    return 'sha256:' + hashlib.sha256(content).hexdigest()
+
+
+def test_put_and_get(tmpdir):
+    cache = RegistryCache(str(tmpdir.join('cache')))
+    content = b'{"schemaVersion": 2}'
+    digest = make_digest(content)
+    assert cache.get(digest) is None
+
+    assert cache.put(digest, content, MEDIA_TYPE)
+    assert cache.get(digest) == (content, MEDIA_TYPE)
+    # shared with other builds
+    assert RegistryCache(str(tmpdir.join('cache'))).get(digest) == (content, MEDIA_TYPE)
+    assert (cache.hits, cache.misses) == (1, 1)
+    # readable by builds running as other users
+    path = os.path.join(str(tmpdir.join('cache')), 'sha256', digest[7:9], digest[7:])
+    assert os.stat(path).st_mode & 0o777 == 0o644
+
+
+@pytest.mark.parametrize('digest', [
+    make_digest(b'other content'),
+    'sha256:../../../etc/passwd',
+    'md5:' + 'a' * 32,
+    None,
+])
+def test_put_wrong_digest(tmpdir, digest):
+    cache = RegistryCache(str(tmpdir))
+    assert not cache.put(digest, b'content', MEDIA_TYPE)
+    assert cache.get(digest) is None
+    assert tmpdir.listdir() == []
+
+
+def test_corrupted_entry(tmpdir):
+    cache = RegistryCache(str(tmpdir))
+    content = b'{"config": {}}'
+    digest = make_digest(content)
+    cache.put(digest, content, 'application/octet-stream')
+
+    path, = [os.path.join(dirpath, filename) for dirpath, _, filenames in os.walk(str(tmpdir))
+             for filename in filenames]
+    with open(path, 'ab') as f:
+        f.write(b'garbage')
+    assert cache.get(digest) is None
+    assert not os.path.exists(path)
+
+
+def test_evict_least_recently_used(tmpdir):
+    contents = [('{"index": %d}' % index).encode('utf-8') * 10 for index in range(4)]
+    digests = [make_digest(content) for content in contents]
+    # room for three entries
+    cache = RegistryCache(str(tmpdir), max_size=3 * (len(contents[0]) + len(MEDIA_TYPE) + 1))
+
+    for index, (digest, content) in enumerate(zip(digests[:3], contents[:3])):
+        cache.put(digest, content, MEDIA_TYPE)
+        path = cache._get_path(digest)[0]
+        os.utime(path, (index, index))
+    # use the oldest one
+    assert cache.get(digests[0]) is not None
+
+    cache.put(digests[3], contents[3], MEDIA_TYPE)
+    # shrunk below limit, so that next put doesn't have to evict again
+    assert cache.get(digests[1]) is None
+    assert cache.get(digests[2]) is None
+    assert all(cache.get(digest) for digest in (digests[0], digests[3]))
+
+
+def test_put_walks_cache_only_when_full(tmpdir):
+    contents = [('{"index": %d}' % index).encode('utf-8') for index in range(4)]
+    entry_size = len(contents[0]) + len(MEDIA_TYPE) + 1
+    cache = RegistryCache(str(tmpdir), max_size=3 * entry_size)
+    walks = []
+    walk = os.walk
+
+    def counting_walk(path):
+        walks.append(path)
+        return walk(path)
+
+    flexmock(os).should_receive('walk').replace_with(counting_walk)
+    for content in contents[:3]:
+        cache.put(make_digest(content), content, MEDIA_TYPE)
+    # size is estimated once cache was walked first time
+    assert len(walks) == 1
+    cache.put(make_digest(contents[3]), contents[3], MEDIA_TYPE)
+    assert len(walks) == 2
+    assert cache._size < 3 * entry_size
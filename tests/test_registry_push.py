@@ -0,0 +1,281 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+
+import pytest
+import requests
+import responses
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from atomic_reactor.concurrency import AsyncExecutor
+from atomic_reactor.constants import (MEDIA_TYPE_DOCKER_V2_SCHEMA2, MEDIA_TYPE_DOCKER_V2_CONFIG,
+                                      MEDIA_TYPE_DOCKER_V2_LAYER_GZIP, MEDIA_TYPE_OCI_V1)
+from atomic_reactor.registry_push import RegistryPusher, read_docker_archive, read_oci_layout
+from atomic_reactor.util import RegistrySession
+
+REGISTRY = 'registry.example.com'
+# blobs are uploaded to another host
+UPLOAD_HOST = 'upload.example.com'
+
+
+def make_digest(content):
+    return 'sha256:' + hashlib.sha256(content).hexdigest()
+
+
+class UploadingRegistry(object):
+    """
+    Blob uploads and manifest pushes of Docker Registry HTTP API V2
+    """
+
+    def __init__(self, upload_host=UPLOAD_HOST):
+        self.upload_host = upload_host
+        # repository -> {digest: content}
+        self.blobs = {}
+        # repository -> {tag or digest: content}
+        self.manifests = {}
+        self.uploads = {}
+        self.requests = []
+        # (host, path, Authorization header)
+        self.authorizations = []
+        base = r'^https://' + REGISTRY
+        responses.add_callback(responses.HEAD, re.compile(base + r'/v2/(.+)/blobs/([^/]+)$'),
+                               self._head_blob)
+        responses.add_callback(responses.POST, re.compile(base + r'/v2/(.+)/blobs/uploads/'),
+                               self._start_upload)
+        upload_base = r'^https://' + upload_host
+        responses.add_callback(responses.PATCH, re.compile(upload_base + r'/upload/(\d+)'),
+                               self._upload_chunk)
+        responses.add_callback(responses.PUT, re.compile(upload_base + r'/upload/(\d+)'),
+                               self._finish_upload)
+        responses.add_callback(responses.PUT, re.compile(base + r'/v2/(.+)/manifests/([^/]+)$'),
+                               self._put_manifest)
+
+    def _match(self, request, pattern):
+        self.requests.append((request.method, urlparse(request.url).path))
+        url = urlparse(request.url)
+        self.authorizations.append((url.netloc, url.path, request.headers.get('Authorization')))
+        return re.search(pattern, urlparse(request.url).path).groups()
+
+    def _head_blob(self, request):
+        repository, digest = self._match(request, r'/v2/(.+)/blobs/([^/]+)$')
+        if digest in self.blobs.get(repository, {}):
+            return 200, {}, ''
+        return 404, {}, ''
+
+    def _start_upload(self, request):
+        repository, = self._match(request, r'/v2/(.+)/blobs/uploads/')
+        query = parse_qs(urlparse(request.url).query)
+        if 'mount' in query:
+            digest = query['mount'][0]
+            source = self.blobs.get(query['from'][0], {})
+            if digest in source:
+                self.blobs.setdefault(repository, {})[digest] = source[digest]
+                return 201, {}, ''
+        upload_id = str(len(self.uploads))
+        self.uploads[upload_id] = (repository, [])
+        # absolute Location
+        location = 'https://{}/upload/{}?state=0'.format(self.upload_host, upload_id)
+        return 202, {'Location': location}, ''
+
+    def _upload_chunk(self, request):
+        upload_id, = self._match(request, r'/upload/(\d+)')
+        chunks = self.uploads[upload_id][1]
+        offset = sum(len(chunk) for chunk in chunks)
+        assert request.headers['Content-Range'] == '{}-{}'.format(offset,
+                                                                  offset + len(request.body) - 1)
+        chunks.append(request.body)
+        # relative Location
+        return 202, {'Location': '/upload/{}?state={}'.format(upload_id, len(chunks))}, ''
+
+    def _finish_upload(self, request):
+        upload_id, = self._match(request, r'/upload/(\d+)')
+        repository, chunks = self.uploads.pop(upload_id)
+        content = b''.join(chunks + [request.body or b''])
+        digest = parse_qs(urlparse(request.url).query)['digest'][0]
+        if make_digest(content) != digest:
+            return 400, {}, ''
+        self.blobs.setdefault(repository, {})[digest] = content
+        return 201, {}, ''
+
+    def _put_manifest(self, request):
+        repository, ref = self._match(request, r'/v2/(.+)/manifests/([^/]+)$')
+        for blob in json.loads(request.body.decode('utf-8'))['layers']:
+            assert blob['digest'] in self.blobs[repository]
+        self.manifests.setdefault(repository, {})[ref] = request.body
+        return 201, {'Docker-Content-Digest': make_digest(request.body)}, ''
+
+
+def add_file(tar, name, content):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+
+
+@pytest.fixture
+def docker_archive(tmpdir):
+    path = str(tmpdir.join('image.tar'))
+    with tarfile.open(path, 'w') as tar:
+        add_file(tar, 'config.json', b'{"rootfs": {}}')
+        add_file(tar, 'base/layer.tar', b'base layer' * 1000)
+        add_file(tar, 'top/layer.tar', b'top layer')
+        add_file(tar, 'manifest.json', json.dumps([{
+            'Config': 'config.json',
+            'RepoTags': ['image:latest'],
+            'Layers': ['base/layer.tar', 'top/layer.tar', 'top/layer.tar'],
+        }]).encode('utf-8'))
+    return path
+
+
+def test_read_docker_archive(tmpdir, docker_archive):
+    tmpdir.mkdir('layers')
+    image = read_docker_archive(docker_archive, str(tmpdir.join('layers')),
+                                executor=AsyncExecutor(max_workers=2))
+    assert image.media_type == MEDIA_TYPE_DOCKER_V2_SCHEMA2
+
+    manifest = json.loads(image.manifest.decode('utf-8'))
+    assert manifest['config'] == {
+        'mediaType': MEDIA_TYPE_DOCKER_V2_CONFIG,
+        'size': len(b'{"rootfs": {}}'),
+        'digest': make_digest(b'{"rootfs": {}}'),
+    }
+    assert [layer['mediaType'] for layer in manifest['layers']] == \
+        [MEDIA_TYPE_DOCKER_V2_LAYER_GZIP] * 3
+    # top layer is listed twice, but compressed once
+    assert [blob.digest for blob in image.blobs] == \
+        [manifest['config']['digest']] + [layer['digest'] for layer in manifest['layers'][:2]]
+
+    for blob, content in zip(image.blobs[1:], [b'base layer' * 1000, b'top layer']):
+        with open(blob.path, 'rb') as f:
+            compressed = f.read()
+        assert make_digest(compressed) == blob.digest
+        assert len(compressed) == blob.size
+        assert gzip.GzipFile(fileobj=io.BytesIO(compressed)).read() == content
+
+    # digests of layers don't depend on time of compression
+    again = read_docker_archive(docker_archive, str(tmpdir.join('layers')))
+    assert again.manifest == image.manifest
+
+
+def test_read_compressed_docker_archive(tmpdir, docker_archive):
+    path = str(tmpdir.join('image.tar.gz'))
+    with open(docker_archive, 'rb') as archive, gzip.open(path, 'wb') as compressed:
+        compressed.write(archive.read())
+    with pytest.raises(RuntimeError):
+        read_docker_archive(path, str(tmpdir))
+
+
+def make_oci_layout(path, ref_name):
+    blobs = os.path.join(path, 'blobs', 'sha256')
+    os.makedirs(blobs)
+
+    def add_blob(content):
+        digest = make_digest(content)
+        with open(os.path.join(blobs, digest.split(':')[1]), 'wb') as f:
+            f.write(content)
+        return {'digest': digest, 'size': len(content)}
+
+    config = add_blob(b'{}')
+    layer = add_blob(b'layer')
+    manifest = json.dumps({
+        'schemaVersion': 2,
+        'mediaType': MEDIA_TYPE_OCI_V1,
+        'config': dict(config, mediaType='application/vnd.oci.image.config.v1+json'),
+        'layers': [
+            dict(layer, mediaType='application/vnd.oci.image.layer.v1.tar'),
+            {'mediaType': 'application/vnd.oci.image.layer.nondistributable.v1.tar',
+             'digest': make_digest(b'foreign'), 'size': 7,
+             'urls': ['https://example.com/layer']},
+        ],
+    }).encode('utf-8')
+    descriptor = add_blob(manifest)
+    descriptor['mediaType'] = MEDIA_TYPE_OCI_V1
+    descriptor['annotations'] = {'org.opencontainers.image.ref.name': ref_name}
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump({'schemaVersion': 2, 'manifests': [descriptor]}, f)
+    return manifest
+
+
+def test_read_oci_layout(tmpdir):
+    manifest = make_oci_layout(str(tmpdir), 'app/x86_64/master')
+    image = read_oci_layout(str(tmpdir), 'app/x86_64/master')
+    assert image.manifest == manifest
+    assert image.media_type == MEDIA_TYPE_OCI_V1
+    # non-distributable layer isn't pushed
+    assert [blob.digest for blob in image.blobs] == [make_digest(b'{}'), make_digest(b'layer')]
+    assert read_oci_layout(str(tmpdir)) == image
+
+    with pytest.raises(RuntimeError):
+        read_oci_layout(str(tmpdir), 'runtime/x86_64/master')
+
+
+@pytest.mark.parametrize('chunk_size', [4, 1024 ** 2])
+@responses.activate
+def test_push(tmpdir, docker_archive, chunk_size):
+    registry = UploadingRegistry()
+    image = read_docker_archive(docker_archive, str(tmpdir))
+    config, base, top = image.blobs
+    # pushed by an earlier build
+    registry.blobs['ns/app'] = {base.digest: b'base'}
+
+    pusher = RegistryPusher(RegistrySession(REGISTRY), executor=AsyncExecutor(max_workers=4),
+                            chunk_size=chunk_size)
+    digest = pusher.push(image, 'ns/app', ['latest', '1.0', '1.0-1'])
+    assert digest == make_digest(image.manifest)
+    assert registry.manifests['ns/app'] == {tag: image.manifest
+                                            for tag in ('latest', '1.0', '1.0-1')}
+    for blob in (config, top):
+        with open(blob.path, 'rb') as f:
+            f.seek(blob.offset)
+            assert registry.blobs['ns/app'][blob.digest] == f.read(blob.size)
+    assert not registry.uploads
+    assert ('POST', '/v2/ns/app/blobs/uploads/') in registry.requests
+    patches = [request for request in registry.requests if request[0] == 'PATCH']
+    if chunk_size == 4:
+        assert patches
+    else:
+        assert not patches
+
+    # other repository of the same registry
+    del registry.requests[:]
+    pusher.push(image, 'ns/other', ['latest'], mount_from='ns/app')
+    assert set(registry.blobs['ns/other']) == {config.digest, base.digest, top.digest}
+    assert registry.manifests['ns/other'] == {'latest': image.manifest}
+    assert all(method != 'PATCH' for method, _ in registry.requests)
+
+
+@pytest.mark.parametrize('upload_host', [REGISTRY, UPLOAD_HOST])
+@responses.activate
+def test_push_credentials(tmpdir, docker_archive, upload_host):
+    registry = UploadingRegistry(upload_host=upload_host)
+    image = read_docker_archive(docker_archive, str(tmpdir))
+    session = RegistrySession(REGISTRY)
+    session.auth = requests.auth.HTTPBasicAuth('user', 'password')
+
+    RegistryPusher(session, executor=AsyncExecutor(max_workers=4)).push(image, 'ns/app',
+                                                                        ['latest'])
+    uploads = [authorization for _, path, authorization in registry.authorizations
+               if path.startswith('/upload/')]
+    others = [authorization for _, path, authorization in registry.authorizations
+              if path.startswith('/v2/')]
+    assert len(uploads) == 3
+    if upload_host == REGISTRY:
+        assert all(uploads)
+    else:
+        # credentials aren't sent to other hosts
+        assert not any(uploads)
+    assert others and all(others)
+    assert not registry.uploads
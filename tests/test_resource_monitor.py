@@ -0,0 +1,116 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import os
+
+from flexmock import flexmock
+
+from atomic_reactor import resource_monitor
+from atomic_reactor.resource_monitor import (ResourceMonitor, get_disk_usage, get_rss,
+                                             get_network_bytes)
+
+NET_DEV = """\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:  999999      10    0    0    0     0          0         0   999999      10    0    0    0     0       0          0
+  eth0: 2000000     100    0    0    0     0          0         0  1000000      50    0    0    0     0       0          0
+  eth1: 1000000     100    0    0    0     0          0         0        0       0    0    0    0     0       0          0
+"""  # noqa
+
+
+def test_get_disk_usage(monkeypatch):
+    # check that using the actual os call does not choke
+    assert 'mb_used' in get_disk_usage('/')
+    assert get_disk_usage('/non/existent') is None
+
+    stats = flexmock(
+        f_frsize=1000,  # pretend blocks are 1000 bytes to make mb come out right
+        f_blocks=101 * 1000,
+        f_bfree=99 * 1000,
+        f_files=1, f_ffree=1,
+    )
+    monkeypatch.setattr(os, "statvfs", lambda path: stats)
+    usage = get_disk_usage('/')
+    assert usage['mb_used'] == 2
+    assert usage['mb_free'] == 99
+    assert usage['mb_total'] == 101
+
+
+def test_get_rss(tmpdir):
+    statm = tmpdir.join('statm')
+    statm.write('1000 200 50 1 0 100 0\n')
+    assert get_rss(str(statm)) == 200 * os.sysconf('SC_PAGE_SIZE')
+    assert get_rss(str(tmpdir.join('missing'))) is None
+
+
+def test_get_network_bytes(tmpdir):
+    net_dev = tmpdir.join('dev')
+    net_dev.write(NET_DEV)
+    assert get_network_bytes(str(net_dev)) == (3000000, 1000000)
+    assert get_network_bytes(str(tmpdir.join('missing'))) is None
+
+
+def test_plugin_attribution(tmpdir, monkeypatch):
+    rss = [100, 300, 200, 500, 100]
+    network = [(0, 0), (1000000, 0), (3000000, 2000000), (3000000, 2000000), (4000000, 2000000)]
+    monkeypatch.setattr(resource_monitor, 'get_rss', lambda: rss.pop(0) * 1000 ** 2)
+    monkeypatch.setattr(resource_monitor, 'get_network_bytes', lambda: network.pop(0))
+
+    monitor = ResourceMonitor()
+    monitor.add_path('workdir', str(tmpdir))
+    monitor.add_path('missing', '/non/existent')
+    monitor.plugin_started('first')
+    monitor.plugin_started('second')
+    monitor.plugin_finished('first')
+    monitor.plugin_finished('second')
+    monitor.sample()
+
+    peaks = monitor.get_report()['peaks']
+    assert set(peaks) == {'first', 'second'}
+    assert peaks['first']['rss_mb'] == 300
+    assert peaks['second']['rss_mb'] == 500
+    assert peaks['first']['net_rx_mb'] == 3
+    assert peaks['first']['net_tx_mb'] == 2
+    assert peaks['second']['net_rx_mb'] == 2
+    assert peaks['second']['net_tx_mb'] == 2
+    assert set(peaks['first']['disk_mb']) == {'root', 'workdir'}
+    assert peaks['first'].get('cpu', 0) >= 0
+
+    assert monitor.get_usage_data()['mb_used'] > 0
+
+
+def test_report_series():
+    monitor = ResourceMonitor()
+    for index in range(10):
+        if index == 4:
+            monitor.plugin_started('plugin')
+        monitor.sample()
+    monitor.plugin_finished('plugin')
+
+    series = monitor.get_report(max_points=4)['series']
+    assert len(series['time']) == 4
+    assert series['time'] == sorted(series['time'])
+    assert series['plugins'] == [[], ['plugin'], ['plugin'], ['plugin']]
+    assert len(series['rss_mb']) == 4
+    assert len(series['disk_mb']['root']) == 4
+    # first sample has no CPU usage, but the others merged into the point do
+    assert series['cpu'][0] is not None
+
+    series = ResourceMonitor().get_report()['series']
+    assert series['time'] == []
+
+
+def test_resource_monitor_thread():
+    monitor = ResourceMonitor(interval=0.01)
+    monitor.start()
+    monitor.finish()
+    monitor.join(1)  # timeout if thread still running
+    assert not monitor.is_alive()
+    assert "mb_used" in monitor.get_usage_data()
@@ -328,6 +328,30 @@ def test_get_version():
     assert isinstance(response, dict)
 
 
+def test_get_info_and_version_cached():
+    if MOCK:
+        mock_docker()
+
+    t = DockerTasker()
+    info, version = t.get_info(), t.get_version()
+    (flexmock(t.d.wrapped)
+        .should_receive('info')
+        .and_return({'changed': True})
+        .once())
+    (flexmock(t.d.wrapped)
+        .should_receive('version')
+        .never())
+    assert t.get_info() == info
+    assert t.get_version() == version
+    assert t.get_info(refresh=True) == {'changed': True}
+
+    # cached responses can't be modified by callers
+    t.get_info()['changed'] = False
+    t.get_version()['Version'] = 'modified'
+    assert t.get_info() == {'changed': True}
+    assert t.get_version() == version
+
+
 @pytest.mark.parametrize(('timeout', 'expected_timeout'), [
     (None, 120),
     (60, 60),
@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2018 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import json
+
+import pytest
+
+from atomic_reactor.tracing import Tracer, tracer, traced, traced_methods
+
+
+@pytest.fixture
+def enabled_tracer(request):
+    tracer.clear()
+    tracer.enable()
+
+    def disable():
+        tracer.disable()
+        tracer.clear()
+
+    request.addfinalizer(disable)
+    return tracer
+
+
+def test_disabled_tracer():
+    disabled = Tracer()
+    with disabled.span('name', 'category'):
+        pass
+    assert disabled.get_events() == []
+
+
+def test_span(enabled_tracer, tmpdir):
+    with enabled_tracer.span('outer', 'plugin', key='value'):
+        with enabled_tracer.span('inner', 'docker'):
+            pass
+        with pytest.raises(ValueError):
+            with enabled_tracer.span('failing', 'docker'):
+                raise ValueError('oops')
+
+    inner, failing, outer = enabled_tracer.get_events()
+    assert outer['name'] == 'outer'
+    assert outer['cat'] == 'plugin'
+    assert outer['ph'] == 'X'
+    assert outer['args'] == {'key': 'value'}
+    assert 'args' not in inner
+    assert failing['args'] == {'exception': repr(ValueError('oops'))}
+    # spans of one thread nest by time
+    assert outer['tid'] == inner['tid']
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+
+    trace_file = str(tmpdir.join('trace.json'))
+    enabled_tracer.export(trace_file)
+    with open(trace_file) as f:
+        assert json.load(f)['traceEvents'] == enabled_tracer.get_events()
+
+
+def test_traced(enabled_tracer):
+    @traced('docker')
+    def function(arg):
+        return arg
+
+    @traced('docker', name='generator')
+    def generator_function():
+        yield 1
+        yield 2
+
+    assert function(5) == 5
+    generator = generator_function()
+    assert [event['name'] for event in enabled_tracer.get_events()] == ['function']
+    assert list(generator) == [1, 2]
+    assert [event['name'] for event in enabled_tracer.get_events()] == ['function', 'generator']
+
+
+def test_traced_methods(enabled_tracer):
+    @traced_methods('pulp')
+    class Handler(object):
+        def public(self):
+            return self._private()
+
+        def _private(self):
+            return 'result'
+
+    assert Handler().public() == 'result'
+    assert Handler.public.__name__ == 'public'
+    events = enabled_tracer.get_events()
+    assert [(event['name'], event['cat']) for event in events] == [('Handler.public', 'pulp')]
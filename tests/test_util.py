@@ -8,9 +8,12 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import unicode_literals
 
+import errno
+import hashlib
 import json
 import logging
 import os
+import re
 import tempfile
 import pytest
 import requests
@@ -23,22 +26,26 @@ from collections import namedtuple
 from tempfile import mkdtemp
 from textwrap import dedent
 from flexmock import flexmock
+from six.moves.urllib.parse import parse_qs, urlparse
 
 from collections import OrderedDict
 import docker
 import yaml
 from atomic_reactor.build import BuildResult
+from atomic_reactor.concurrency import AsyncExecutor
 from atomic_reactor.constants import (IMAGE_TYPE_DOCKER_ARCHIVE, IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR)
 from atomic_reactor.inner import DockerBuildWorkflow
+from atomic_reactor.registry_cache import RegistryCache, set_registry_cache
 from atomic_reactor.util import (ImageName, wait_for_command, clone_git_repo,
                                  LazyGit, figure_out_build_file,
                                  render_yum_repo, process_substitutions,
-                                 get_checksums, print_version_of_tools,
+                                 get_checksums, HashingWriter, print_version_of_tools,
                                  get_version_of_tools,
                                  human_size, CommandResult,
                                  registry_hostname, Dockercfg, RegistrySession,
+                                 get_registry_session, clear_registry_sessions,
                                  get_manifest_digests, ManifestDigest,
-                                 get_manifest_list,
+                                 get_manifest_list, get_config_from_registry,
                                  get_build_json, is_scratch_build, df_parser,
                                  are_plugins_in_order, LabelFormatter,
                                  guess_manifest_media_type,
@@ -49,7 +56,7 @@ from atomic_reactor.util import (ImageName, wait_for_command, clone_git_repo,
                                  split_module_spec, ModuleSpec,
                                  read_yaml, read_yaml_from_file_path, OSBSLogs,
                                  get_platforms_in_limits)
-from atomic_reactor import util
+from atomic_reactor import registry_cache, util
 from tests.constants import (DOCKERFILE_GIT, DOCKERFILE_SHA1,
                              INPUT_IMAGE, MOCK, MOCK_SOURCE,
                              REACTOR_CONFIG_MAP)
@@ -148,11 +155,40 @@ class TestCommandResult(object):
 
         ('this is not valid JSON',
          'this is not valid JSON'),
+
+        (2018, '2018'),
     ])
     def test_parse_item(self, item, expected):
         cr = CommandResult()
         cr.parse_item(item)
-        assert cr.logs == [expected]
+        assert list(cr.logs) == [expected]
+
+    def test_progress_collapsed(self):
+        cr = CommandResult()
+        items = [
+            {'status': 'Pulling fs layer', 'progressDetail': {}, 'id': 'a'},
+            {'status': 'Pulling fs layer', 'progressDetail': {}, 'id': 'b'},
+        ]
+        items += [{'status': 'Downloading', 'progressDetail': {'current': current}, 'id': layer}
+                  for current in range(100) for layer in 'ab']
+        items += [
+            {'status': 'Download complete', 'progressDetail': {}, 'id': 'a'},
+            {'status': 'Downloading', 'progressDetail': {'current': 100}, 'id': 'a'},
+            {'status': 'Digest: sha256:123'},
+        ]
+        for item in items:
+            cr.parse_item(item)
+
+        assert list(cr.parsed_logs) == [
+            {'status': 'Pulling fs layer', 'progressDetail': {}, 'id': 'a'},
+            {'status': 'Pulling fs layer', 'progressDetail': {}, 'id': 'b'},
+            {'status': 'Downloading', 'progressDetail': {'current': 99}, 'id': 'a'},
+            {'status': 'Downloading', 'progressDetail': {'current': 99}, 'id': 'b'},
+            {'status': 'Download complete', 'progressDetail': {}, 'id': 'a'},
+            {'status': 'Downloading', 'progressDetail': {'current': 100}, 'id': 'a'},
+            {'status': 'Digest: sha256:123'},
+        ]
+        assert list(cr.logs) == []
 
 
 @requires_internet
@@ -297,6 +333,39 @@ def test_get_hexdigests(tmpdir, content, algorithms, expected):
         assert checksums == expected
 
 
+@pytest.mark.parametrize('chunks', [
+    [],
+    [b'abc'],
+    [b'a', bytearray(b'b'), memoryview(b'c'), b''],
+    [b'x' * 1024 ** 2] * 100,
+])
+def test_hashing_writer(tmpdir, chunks):
+    path = str(tmpdir.join('image.tar'))
+    with HashingWriter(path) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+        with pytest.raises(RuntimeError):
+            writer.checksums  # noqa
+        assert writer.tell() == sum(len(chunk) for chunk in chunks)
+    with pytest.raises(ValueError):
+        writer.write(b'more')
+
+    assert writer.checksums == get_checksums(path, ['md5', 'sha256'])
+    assert writer.size == os.path.getsize(path)
+    with open(path, 'rb') as f:
+        assert f.read() == b''.join(bytes(chunk) for chunk in chunks)
+
+
+def test_hashing_writer_algorithms(tmpdir):
+    path = str(tmpdir.join('image.tar'))
+    with HashingWriter(path, algorithms=['sha256']) as writer:
+        writer.write(b'abc')
+    assert writer.checksums == {
+        'sha256sum': 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad',
+    }
+    assert writer.hexdigest('sha256') == writer.checksums['sha256sum']
+
+
 @pytest.mark.parametrize('path, image_type, expected', [
     ('foo.tar', IMAGE_TYPE_DOCKER_ARCHIVE, 'docker-image-XXX.x86_64.tar'),
     ('foo.tar.gz', IMAGE_TYPE_DOCKER_ARCHIVE, 'docker-image-XXX.x86_64.tar.gz'),
@@ -422,6 +491,185 @@ def test_registry_session(tmpdir, registry, insecure, method, responses_method):
     assert res.text == 'A-OK'
 
 
+@pytest.mark.parametrize(('method', 'responses_method'), [
+    (RegistrySession.get_async, responses.GET),
+    (RegistrySession.head_async, responses.HEAD),
+])
+@responses.activate
+def test_registry_session_async(method, responses_method):
+    session = RegistrySession('https://example.com')
+    executor = AsyncExecutor(max_workers=4)
+    paths = ['/v2/test/image/manifests/{}'.format(tag) for tag in range(8)]
+    for path in paths:
+        responses.add(responses_method, 'https://example.com' + path)
+
+    results = [method(session, path, executor=executor) for path in paths]
+    urls = ['https://example.com' + path for path in paths]
+    assert [result.get().url for result in results] == urls
+    executor.shutdown()
+
+
+@responses.activate
+def test_get_registry_session(tmpdir):
+    tmpdir.join('.dockercfg').write('{}')
+    clear_registry_sessions()
+    session = get_registry_session('registry.example.com', insecure=True)
+    assert get_registry_session('registry.example.com', insecure=True) is session
+    assert get_registry_session('registry.example.com') is not session
+    assert get_registry_session('registry.example.com', insecure=True,
+                                dockercfg_path=str(tmpdir)) is not session
+
+    # scheme is probed only once for all users
+    path = '/v2/test/image/manifests/latest'
+    responses.add(responses.GET, 'https://registry.example.com' + path, body=ConnectionError())
+    responses.add(responses.GET, 'http://registry.example.com' + path)
+    get_registry_session('registry.example.com', insecure=True).get(path)
+    get_registry_session('registry.example.com', insecure=True).get(path)
+    assert [call.request.url for call in responses.calls] == [
+        'https://registry.example.com' + path,
+        'http://registry.example.com' + path,
+        'http://registry.example.com' + path,
+    ]
+
+    assert get_registry_session('registry.example.com', insecure=True, pool_size=4) is session
+    assert session.pool_size == 10
+    # adapters of shared session aren't replaced, the whole session is
+    requests_session = session.session
+    get_registry_session('registry.example.com', insecure=True, pool_size=32)
+    assert session.pool_size == 32
+    assert session.session is not requests_session
+    assert session.session.get_adapter('http://registry.example.com')._pool_maxsize == 32
+    assert requests_session.get_adapter('http://registry.example.com')._pool_maxsize == 10
+
+    # pool is sized when session is created
+    other = get_registry_session('other.example.com', pool_size=16)
+    assert other.pool_size == 16
+    assert other.session.get_adapter('https://other.example.com')._pool_maxsize == 16
+
+    flexmock(requests_session).should_receive('close').once()
+    flexmock(session.session).should_receive('close').once()
+    clear_registry_sessions()
+    assert get_registry_session('registry.example.com', insecure=True) is not session
+
+
+class TokenAuthRegistry(object):
+    """
+    Registry requiring bearer tokens, issued for requested scopes
+    """
+
+    realm = 'https://auth.example.com/token'
+
+    def __init__(self, expires_in=300):
+        self.expires_in = expires_in
+        # token -> scopes
+        self.tokens = {}
+        self.token_requests = []
+        self.requests = []
+        responses.add_callback(responses.GET, re.compile(re.escape(self.realm)), self._token)
+        for method in (responses.GET, responses.HEAD, responses.PUT, responses.POST):
+            responses.add_callback(method, re.compile(r'https://registry.example.com/v2/.*'),
+                                   self._request)
+
+    def _token(self, request):
+        query = parse_qs(urlparse(request.url).query)
+        assert query['service'] == ['registry.example.com']
+        # let concurrent requests pile up
+        time.sleep(0.05)
+        token = 'token-{}'.format(len(self.tokens))
+        self.tokens[token] = set(query.get('scope', []))
+        self.token_requests.append((request.headers.get('Authorization'), query.get('scope')))
+        return 200, {}, json.dumps({'token': token, 'expires_in': self.expires_in})
+
+    def _request(self, request):
+        path = urlparse(request.url).path
+        repository = re.match(r'/v2/(.+?)/(manifests|blobs)/', path).group(1)
+        actions = 'pull' if request.method in ('GET', 'HEAD') else 'pull,push'
+        scope = 'repository:{}:{}'.format(repository, actions)
+        authorization = request.headers.get('Authorization', '')
+        self.requests.append((request.method, path, authorization))
+
+        token = authorization[len('Bearer '):]
+        if scope not in self.tokens.get(token, set()):
+            challenge = ('Bearer realm="{}",service="registry.example.com",scope="{}"'
+                         .format(self.realm, scope))
+            return 401, {'WWW-Authenticate': challenge}, ''
+        return 200, {}, ''
+
+
+@responses.activate
+def test_registry_session_token_auth(tmpdir):
+    tmpdir.join('.dockercfg').write(json.dumps({
+        'registry.example.com': {'username': 'john.doe', 'password': 'letmein'},
+    }))
+    registry = TokenAuthRegistry()
+    session = RegistrySession('registry.example.com', dockercfg_path=str(tmpdir))
+
+    path = '/v2/ns/image/manifests/latest'
+    assert session.get(path).status_code == 200
+    assert [method for method, _, _ in registry.requests] == ['GET', 'GET']
+    # token is fetched with credentials from .dockercfg
+    assert registry.token_requests == [
+        (requests.auth._basic_auth_str('john.doe', 'letmein'),
+         ['repository:ns/image:pull']),
+    ]
+
+    # token is sent right away
+    del registry.requests[:]
+    executor = AsyncExecutor(max_workers=8)
+    results = [session.head_async('/v2/ns/image/blobs/sha256:{}'.format(i), executor=executor)
+               for i in range(8)]
+    assert all(result.get().status_code == 200 for result in results)
+    assert len(registry.requests) == 8
+    assert len(registry.token_requests) == 1
+
+    # concurrent requests of other repository share token fetch
+    del registry.requests[:]
+    results = [session.get_async('/v2/ns/other/manifests/{}'.format(i), executor=executor)
+               for i in range(8)]
+    assert all(result.get().status_code == 200 for result in results)
+    assert len(registry.requests) == 8
+    assert len(registry.token_requests) == 2
+    executor.shutdown()
+
+    # push token is used for pulls as well
+    assert session.put(path, data=b'{}').status_code == 200
+    assert registry.token_requests[-1][1] == ['repository:ns/image:pull,push']
+    del registry.requests[:]
+    assert session.get(path).status_code == 200
+    assert session.put(path, data=b'{}').status_code == 200
+    assert len(registry.requests) == 2
+    assert len(registry.token_requests) == 3
+
+    # blob mounts need access to both repositories
+    mount = '/v2/ns/image/blobs/uploads/?mount=sha256:1&from=ns/other'
+    assert session.post(mount).status_code == 200
+    assert registry.token_requests[-1][1] == ['repository:ns/image:pull,push',
+                                              'repository:ns/other:pull']
+
+
+@responses.activate
+def test_registry_session_token_expiration():
+    registry = TokenAuthRegistry(expires_in=1)
+    session = RegistrySession('registry.example.com')
+    path = '/v2/ns/image/manifests/latest'
+
+    session.get(path)
+    session.get(path)
+    # anonymous tokens, expired before they're used again
+    assert registry.token_requests == [(None, ['repository:ns/image:pull'])] * 2
+    # the second one was renewed before the request
+    assert [auth for _, _, auth in registry.requests] == ['', 'Bearer token-0', 'Bearer token-1']
+
+    # token revoked by registry
+    registry.expires_in = 300
+    session.get(path)
+    registry.tokens.clear()
+    del registry.requests[:]
+    assert session.get(path).status_code == 200
+    assert len(registry.requests) == 2
+    assert len(registry.token_requests) == 4
+
+
 @pytest.mark.parametrize(('version', 'expected'), [
     ('v1', 'application/vnd.docker.distribution.manifest.v1+json'),
     ('v2', 'application/vnd.docker.distribution.manifest.v2+json'),
@@ -752,6 +1000,69 @@ def test_get_manifest_digests_connection_error(tmpdir):
         get_manifest_digests(**kwargs)
 
 
+def fake_registry_manifest(stored, accepted):
+    """
+    :return: version of manifest docker registry returns for accepted versions
+             when tag points to stored one, None if none can be returned
+    """
+    if stored in accepted:
+        return stored
+    if stored == 'v2_list':
+        # platform's manifest
+        stored = 'v2'
+        if stored in accepted:
+            return stored
+    if stored == 'v2':
+        # converted to schema 1 even if not accepted
+        return 'v1'
+    if stored == 'oci_index' and 'oci' in accepted:
+        return 'oci'
+    return 'v1' if stored == 'v1' else None
+
+
+@pytest.mark.parametrize('stored', [None, 'v1', 'v2', 'v2_list', 'oci', 'oci_index'])
+@responses.activate
+def test_get_manifest_digests_head(stored):
+    media_types = dict((media_type, version)
+                       for version, media_type in ManifestDigest.content_type.items())
+    url = 'https://registry.example.com/v2/spam/manifests/latest'
+
+    methods = []
+
+    def request_callback(request):
+        methods.append(request.method)
+        accepted = [media_types[media_type] for media_type in request.headers['Accept'].split(', ')]
+        version = fake_registry_manifest(stored, accepted)
+        body = '' if request.method == 'HEAD' else '{}'
+        if version is None:
+            return (404, {}, body)
+        headers = {'Content-Type': ManifestDigest.content_type[version],
+                   'Docker-Content-Digest': 'sha256:' + version}
+        return (200, headers, body)
+
+    responses.add_callback(responses.GET, url, callback=request_callback)
+    responses.add_callback(responses.HEAD, url, callback=request_callback)
+
+    image = ImageName.parse('spam')
+    registry = 'https://registry.example.com'
+    if stored is None:
+        with pytest.raises(requests.HTTPError):
+            get_manifest_digests(image, registry)
+        with pytest.raises(requests.HTTPError):
+            get_manifest_digests(image, registry, use_head=True)
+        return
+
+    expected = get_manifest_digests(image, registry)
+    assert methods == ['GET'] * 5
+    del methods[:]
+
+    executor = AsyncExecutor(max_workers=4)
+    assert get_manifest_digests(image, registry, use_head=True, executor=executor) == expected
+    executor.shutdown()
+    # probe, and requests for versions registry may return
+    assert methods == ['HEAD'] * {'v1': 1, 'v2': 2, 'v2_list': 3, 'oci': 1, 'oci_index': 2}[stored]
+
+
 @pytest.mark.parametrize('namespace,repo,explicit,expected', [
     ('foo', 'bar', False, 'foo/bar'),
     ('foo', 'bar', True, 'foo/bar'),
@@ -1165,6 +1476,64 @@ def test_get_manifest_list(tmpdir, image, registry, insecure, creds, path):
     assert manifest_list
 
 
+@responses.activate
+def test_get_config_from_registry_cached(tmpdir):
+    config = json.dumps({'config': {'Labels': {'release': '1'}}}).encode('utf-8')
+    config_digest = 'sha256:' + hashlib.sha256(config).hexdigest()
+    manifest = json.dumps({'schemaVersion': 2, 'config': {'digest': config_digest}})
+    manifest = manifest.encode('utf-8')
+    digest = 'sha256:' + hashlib.sha256(manifest).hexdigest()
+    registry = 'https://registry.example.com'
+    responses.add(responses.GET, registry + '/v2/spam/manifests/' + digest, body=manifest,
+                  content_type='application/vnd.docker.distribution.manifest.v2+json')
+    responses.add(responses.GET, registry + '/v2/spam/blobs/' + config_digest, body=config,
+                  content_type='application/octet-stream')
+
+    set_registry_cache(RegistryCache(str(tmpdir)))
+    try:
+        image = ImageName.parse('spam')
+        for _ in range(3):
+            config_blob = get_config_from_registry(image, registry, digest)
+            assert config_blob['config']['Labels'] == {'release': '1'}
+        # fetched only once
+        assert len(responses.calls) == 2
+    finally:
+        set_registry_cache(None)
+
+
+@responses.activate
+def test_get_config_from_registry_read_only_cache(tmpdir):
+    config = json.dumps({'config': {'Labels': {'release': '1'}}}).encode('utf-8')
+    config_digest = 'sha256:' + hashlib.sha256(config).hexdigest()
+    manifest = json.dumps({'schemaVersion': 2, 'config': {'digest': config_digest}})
+    manifest = manifest.encode('utf-8')
+    digest = 'sha256:' + hashlib.sha256(manifest).hexdigest()
+    registry = 'https://registry.example.com'
+    responses.add(responses.GET, registry + '/v2/spam/manifests/' + digest, body=manifest,
+                  content_type='application/vnd.docker.distribution.manifest.v2+json')
+    responses.add(responses.GET, registry + '/v2/spam/blobs/' + config_digest, body=config,
+                  content_type='application/octet-stream')
+
+    cache_dir = tmpdir.mkdir('cache')
+    cache_dir.chmod(0o555)
+    if os.geteuid() == 0:
+        # permissions don't apply to root
+        (flexmock(registry_cache.tempfile)
+            .should_receive('NamedTemporaryFile')
+            .and_raise(OSError(errno.EACCES, 'Permission denied')))
+    set_registry_cache(RegistryCache(str(cache_dir)))
+    try:
+        image = ImageName.parse('spam')
+        for _ in range(2):
+            config_blob = get_config_from_registry(image, registry, digest)
+            assert config_blob['config']['Labels'] == {'release': '1'}
+        # nothing was cached
+        assert len(responses.calls) == 4
+    finally:
+        set_registry_cache(None)
+        cache_dir.chmod(0o755)
+
+
 @pytest.mark.parametrize(('valid'), [
     True,
     False